@@ -1,4 +1,4 @@
-from scipy.special import betaln
+from scipy.special import betaln, gammaln, logsumexp
 from scipy.special import beta as beta_function
 from scipy.stats import beta, binom
 from scipy.optimize import minimize
@@ -332,6 +332,210 @@ def bayes_binomtest(k, n, p=0.5, a=1, b=1, verbose=True):
     return BF_out, pval_out
 
 
+def log_beta_binom_ml(k, n, a, b):
+    """
+    Compute the log marginal likelihood of a Beta-Binomial model for arrays of tests.
+
+    Vectorized counterpart of `beta_binom_ml`: all the arguments are broadcast against each
+    other and the beta functions are evaluated with log-gamma array operations.
+
+    Parameters
+    ----------
+    k : array-like of int
+        Number of observed successes of each test.
+    n : int or array-like of int
+        Number of trials of each test.
+    a : float or array-like
+        Alpha parameter(s) of the Beta prior.
+    b : float or array-like
+        Beta parameter(s) of the Beta prior.
+
+    Returns
+    -------
+    ndarray
+        log(Beta(a+k, b+n-k) / Beta(a, b)) for each test.
+    """
+    k, n, a, b = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in (k, n, a, b)])
+    return (gammaln(a + k) + gammaln(b + n - k) - gammaln(a + b + n)
+            - gammaln(a) - gammaln(b) + gammaln(a + b))
+
+
+def null_posterior_batch(p, n, alpha_0=1000, beta_0=1000, cap=5000):
+    """
+    Compute the posterior Beta parameters of the empirical null of each test location.
+
+    Vectorized counterpart of `compute_null_posterior` followed by `cap_beta_params`.
+
+    Parameters
+    ----------
+    p : ndarray
+        Empirical null accuracies in [0,1], of shape test_shape + (M,).
+    n : int or array-like of int
+        Number of trials of each test, broadcastable to test_shape.
+    alpha_0 : float, optional
+        Prior alpha parameter, by default 1000.
+    beta_0 : float, optional
+        Prior beta parameter, by default 1000.
+    cap : float, optional
+        Maximum allowed value for alpha or beta, by default 5000.
+
+    Returns
+    -------
+    alpha_post, beta_post : ndarray, ndarray
+        Capped posterior parameters of each test location.
+    """
+    p = np.asarray(p, dtype=float)
+    n = np.asarray(n)
+    successes = np.floor(np.sum(p * n[..., None], axis=-1))
+    alpha_post = successes + alpha_0
+    beta_post = beta_0 + p.shape[-1] * n - successes
+    scale = np.minimum(1., cap / np.maximum(alpha_post, beta_post))
+    return alpha_post * scale, beta_post * scale
+
+
+def binomtest_pval_batch(k, n, p=0.5):
+    """
+    Compute the two-sided binomial test p-values of arrays of tests.
+
+    Vectorized counterpart of scipy.stats.binomtest(k, n, p).pvalue: the outcomes of the other tail that are
+    at most as likely as k are found with a binary search over the support of each test, run for all the tests
+    at once.
+
+    Parameters
+    ----------
+    k : array-like of int
+        Number of observed successes of each test.
+    n : int or array-like of int
+        Number of trials of each test.
+    p : float, optional
+        Probability of success under the null, by default 0.5.
+
+    Returns
+    -------
+    ndarray
+        Two-sided p-value of each test.
+    """
+    k, n = np.broadcast_arrays(np.asarray(k, dtype=int), np.asarray(n, dtype=int))
+    d = binom.pmf(k, n, p)
+    rerr = 1 + 1e-7
+    lower = k < p * n
+    # The other tail is ceil(p*n)..n (decreasing pmf) if k is below the mean, 0..floor(p*n) (increasing pmf)
+    # otherwise. Search the first outcome of the other tail at which pmf <= d*rerr (resp. pmf > d*rerr) becomes true:
+    left = np.where(lower, np.ceil(p * n), 0).astype(int)
+    right = np.where(lower, n, np.floor(p * n)).astype(int) + 1
+    while np.any(left < right):
+        mid = (left + right) // 2
+        at_most_as_likely = binom.pmf(mid, n, p) <= d * rerr
+        found = np.where(lower, at_most_as_likely, ~at_most_as_likely) & (left < right)
+        right = np.where(found, mid, right)
+        left = np.where(found | (left >= right), left, mid + 1)
+    # Number of outcomes of the other tail that are at most as likely as k:
+    y = np.where(lower, n + 1 - left, left)
+    pval = np.where(lower, binom.cdf(k, n, p) + binom.sf(n - y, n, p),
+                    binom.cdf(y - 1, n, p) + binom.sf(k - 1, n, p))
+    return np.where(k == p * n, 1., np.minimum(1., pval))
+
+
+def compute_bf_batch(k, n, a, b, p=0.5, alpha_0=1000, beta_0=1000):
+    """
+    Compute the Bayes factors of arrays of test locations.
+
+    Vectorized counterpart of `compute_bf`: the marginal likelihoods are computed for all the tests
+    at once in log space.
+
+    Parameters
+    ----------
+    k : array-like of int
+        Number of observed successes of each test.
+    n : int or array-like of int
+        Number of trials of each test.
+    a : float
+        Alpha parameter of the alternative prior Beta(a, b).
+    b : float
+        Beta parameter of the alternative prior Beta(a, b).
+    p : float or array-like
+        If float, a point null hypothesis at p.
+        If array-like, empirical null samples of shape k.shape + (M,), from which a Beta
+        distribution is fitted for each test.
+
+    Returns
+    -------
+    ndarray
+        Bayes factor (BF10) of each test.
+    """
+    k = np.asarray(k)
+    log_m1 = log_beta_binom_ml(k, n, a, b)
+    if np.isscalar(p):
+        # Point null: binomial likelihood of k (without the binomial coefficient, as in the beta-binomial):
+        log_m0 = k * np.log(p) + (n - k) * np.log1p(-p)
+    else:
+        a_null, b_null = null_posterior_batch(p, n, alpha_0=alpha_0, beta_0=beta_0)
+        log_m0 = log_beta_binom_ml(k, n, a_null, b_null)
+    return np.exp(log_m1 - log_m0)
+
+
+def bayes_binomtest_batch(k, n, p=0.5, a=1, b=1):
+    """
+    Compute Bayes factors and p-values of binomial tests of any number of test locations at once.
+
+    Vectorized counterpart of `bayes_binomtest`, for instance to get the Bayes factors of a whole
+    time resolved decoding accuracy trace or temporal generalization matrix in one call.
+
+    Parameters
+    ----------
+    k : array-like
+        Observed number of successes or observed accuracy, of any shape. If values are between 0 and 1,
+        they are interpreted as probabilities of success and converted to counts by multiplying by n and rounding.
+    n : int or array-like of int
+        Number of trials, broadcastable to the shape of k.
+    p : float or array-like, default=0.5
+        Null hypothesis definition:
+        - If float: point null at p.
+        - If array-like: must have p.shape = k.shape + (M,), the null samples of each test location.
+    a : float, optional
+        Alpha parameter for the alternative Beta prior, by default 1.
+    b : float, optional
+        Beta parameter for the alternative Beta prior, by default 1.
+
+    Returns
+    -------
+    BF10 : ndarray
+        Bayes factor of each test location, matching the shape of `k`.
+    pvals : ndarray
+        P-value of each test location, matching the shape of `k`.
+
+    Raises
+    ------
+    ValueError
+        If k is out of allowed range.
+        If `p` is array-like but p.shape[:-1] != k.shape.
+    """
+    k = np.asarray(k)
+    k, n = np.broadcast_arrays(k, np.asarray(n))
+
+    # Convert probabilities to counts if needed
+    if np.issubdtype(k.dtype, np.floating):
+        if not np.all((k >= 0) & (k <= 1)):
+            raise ValueError("Values must be int or floats between 0 and 1!")
+        successes = k * n
+        if not np.allclose(successes, np.round(successes), atol=1e-7):
+            warnings.warn("Some values of k*n are not integers. Rounding to nearest integer.", UserWarning)
+        successes = np.round(successes).astype(int)
+    else:
+        successes = k.astype(int)
+
+    if np.isscalar(p):
+        pvals = binomtest_pval_batch(successes, n, p=p)
+    else:
+        p = np.asarray(p)
+        if p.shape[:-1] != k.shape:
+            raise ValueError("The shape of p (except last dim) must match k.shape.")
+        # Same as _pval_from_histogram with a two-tailed test:
+        pvals = np.mean(np.abs(p) >= np.abs(successes / n)[..., None], axis=-1)
+
+    return compute_bf_batch(successes, n, a, b, p=p), pvals
+
+
 def bayes_ttest(x, y=0, paired=False, alternative='two-sided', r=0.707, return_pval=False):
     """
     Compute Bayes Factors from a t-test using Pingouin's JZS method, applied to 
@@ -787,6 +991,119 @@ def kendall_bf_from_data(x, y, kappa=1.0, var=1.0):
     return tau_val, res['p-val'].values[0], bf_result
 
 
+def _gauss_legendre(lims, n_nodes):
+    """Gauss-Legendre nodes and weights on the interval lims."""
+    nodes, weights = np.polynomial.legendre.leggauss(n_nodes)
+    half_width = (lims[1] - lims[0]) / 2
+    return lims[0] + half_width * (nodes + 1), half_width * weights
+
+
+def _log_kendall_marginals(kentau, n, kappa=1.0, var=1.0, n_nodes=200):
+    """
+    Compute, for arrays of observed tau and sample sizes, the log of the integrals of p(T_star|tau)*p(tau)
+    over the negative and positive tau, relative to the likelihood at tau=0. The integrals are evaluated with
+    the same Gauss-Legendre nodes for all the tests.
+    """
+    kentau, n = np.broadcast_arrays(np.asarray(kentau, dtype=float), np.asarray(n, dtype=float))
+    var = min(1.0, var)
+    T_star = (kentau * ((n * (n - 1)) / 2.0)) / np.sqrt(n * (n - 1) * (2 * n + 5) / 18.0)
+    log_marginals = []
+    for lims in [(-1, 0), (0, 1)]:
+        nodes, weights = _gauss_legendre(lims, n_nodes)
+        # log(p(T_star|tau) / p(T_star|0)) at each node:
+        mean = 1.5 * nodes * np.sqrt(n[..., None])
+        log_lik_ratio = (2 * T_star[..., None] * mean - mean ** 2) / (2 * var)
+        log_marginals.append(logsumexp(log_lik_ratio, b=weights * prior_tau(nodes, kappa), axis=-1))
+    return log_marginals
+
+
+def bf_kendall_tau_batch(tau, n, kappa=1.0, var=1.0, n_nodes=200):
+    """
+    Compute Bayes factors for arrays of Kendall's tau and sample sizes.
+
+    Vectorized counterpart of `bf_kendall_tau`: the posterior is integrated with fixed Gauss-Legendre
+    nodes shared by all the tests, in log space.
+
+    Parameters
+    ----------
+    tau : float or array-like
+        Observed Kendall's tau of each test.
+    n : int or array-like of int
+        Sample size of each test, broadcastable to the shape of tau.
+    kappa : float, optional
+        Parameter controlling the prior shape, by default 1.0.
+    var : float, optional
+        Variance parameter for the likelihood, by default 1.0.
+    n_nodes : int, optional
+        Number of Gauss-Legendre nodes on each half of the tau range, by default 200.
+
+    Returns
+    -------
+    dict
+        A dictionary with keys 'n', 'r', 'bf10', 'bfPlus0', and 'bfMin0' representing sample size,
+        observed tau, and the three Bayes factors of each test respectively.
+    """
+    tau, n = np.broadcast_arrays(np.asarray(tau, dtype=float), np.asarray(n))
+    log_neg, log_pos = _log_kendall_marginals(tau, n, kappa=kappa, var=var, n_nodes=n_nodes)
+    # The prior density at 0 cancels out: BF = integral of p(T_star|tau)*p(tau) / p(T_star|0)
+    return {
+        'n': n,
+        'r': tau,
+        'bf10': np.exp(np.logaddexp(log_neg, log_pos)),
+        'bfPlus0': 2 * np.exp(log_pos),
+        'bfMin0': 2 * np.exp(log_neg)
+    }
+
+
+def posterior_tau_batch(tau, kentau, n, kappa=1.0, var=1.0, test="two-sided", n_nodes=200):
+    """
+    Compute the normalized posterior density p(tau|data) for arrays of observed tau and sample sizes.
+
+    Vectorized counterpart of `posterior_tau`, normalizing the posterior with fixed Gauss-Legendre nodes.
+
+    Parameters
+    ----------
+    tau : float or ndarray
+        Kendall's tau value(s) at which to evaluate the posterior.
+    kentau : float or array-like
+        Observed Kendall's tau of each test.
+    n : int or array-like of int
+        Sample size of each test, broadcastable to the shape of kentau.
+    kappa : float, optional
+        Parameter controlling prior shape, by default 1.0.
+    var : float, optional
+        Variance parameter for the likelihood (min(1,var) used), by default 1.0.
+    test : str, optional
+        Type of test: "two-sided", "positive", or "negative", by default "two-sided".
+    n_nodes : int, optional
+        Number of Gauss-Legendre nodes on each half of the tau range, by default 200.
+
+    Returns
+    -------
+    ndarray
+        Posterior density, of shape broadcast(kentau, n).shape + tau.shape.
+    """
+    tau = np.asarray(tau, dtype=float)
+    kentau, n = np.broadcast_arrays(np.asarray(kentau, dtype=float), np.asarray(n, dtype=float))
+    var = min(1.0, var)
+    log_neg, log_pos = _log_kendall_marginals(kentau, n, kappa=kappa, var=var, n_nodes=n_nodes)
+    if test == "two-sided":
+        prior, log_marginal = prior_tau(tau, kappa), np.logaddexp(log_neg, log_pos)
+    elif test == "positive":
+        prior, log_marginal = 2 * prior_tau(tau, kappa) * ((tau >= 0) & (tau <= 1)), np.log(2) + log_pos
+    elif test == "negative":
+        prior, log_marginal = 2 * prior_tau(tau, kappa) * ((tau >= -1) & (tau <= 0)), np.log(2) + log_neg
+    else:
+        raise ValueError("test must be 'two-sided', 'positive', or 'negative'.")
+    T_star = (kentau * ((n * (n - 1)) / 2.0)) / np.sqrt(n * (n - 1) * (2 * n + 5) / 18.0)
+    extra_dims = (1,) * tau.ndim
+    T_star, n, log_marginal = [v.reshape(v.shape + extra_dims) for v in (T_star, n, log_marginal)]
+    # Likelihood relative to the one at tau=0, as the marginals:
+    mean = 1.5 * tau * np.sqrt(n)
+    log_lik_ratio = (2 * T_star * mean - mean ** 2) / (2 * var)
+    return np.exp(log_lik_ratio - log_marginal) * prior
+
+
 if __name__ == "__main__":
     # Example usage
     yourKendallTauValue = -0.3
@@ -0,0 +1,136 @@
+import numpy as np
+from scipy.stats import gamma
+
+
+def sim_times(t0, tmax, sfreq):
+    """
+    Time points of the simulated decoding accuracies, as in `sim_decoding_binomial`.
+
+    Parameters
+    ----------
+    t0 : int
+        Start time of the simulation (in seconds).
+    tmax : int
+        End time of the simulation (in seconds).
+    sfreq : int
+        Sampling frequency (number of samples per second).
+
+    Returns
+    -------
+    numpy.ndarray
+        Time points of the simulation.
+    """
+    return np.linspace(t0, tmax, int(round(sfreq * (tmax - t0))))
+
+
+def effect_profile(times, onset=0., offset=None, shape="gamma", width=0.2):
+    """
+    Compute the time course of a decoding effect, scaled to a peak of 1.
+
+    Parameters
+    ----------
+    times : ndarray
+        Time points (in seconds).
+    onset : float or ndarray
+        Onset of the effect (in seconds). If array-like, one time course is returned per onset,
+        e.g. one per subject.
+    offset : float or None, optional
+        Offset of the effect (in seconds), after which the effect is 0. By default None (no offset).
+    shape : str or callable, optional
+        Shape of the effect:
+        - "gamma": gamma density with shape 3 and scale `width` starting at the onset, as in
+          `sim_decoding_binomial`, peaking 2 * width after the onset.
+        - "boxcar": constant effect between the onset and the offset.
+        - callable: function of the time relative to the onset, returning values in [0, 1].
+        By default "gamma".
+    width : float, optional
+        Scale of the gamma shape (in seconds), by default 0.2.
+
+    Returns
+    -------
+    numpy.ndarray
+        Effect time course, of shape onset.shape + times.shape.
+
+    Raises
+    ------
+    ValueError
+        If the shape is not supported.
+    """
+    times = np.asarray(times, dtype=float)
+    onset = np.asarray(onset, dtype=float)
+    latency = times - onset[..., None]
+    if shape == "gamma":
+        # Normalized by the density at the mode, for the peak to be 1 whatever the onset:
+        profile = gamma.pdf(latency, 3, scale=width) / gamma.pdf(2 * width, 3, scale=width)
+    elif shape == "boxcar":
+        profile = (latency >= 0).astype(float)
+    elif callable(shape):
+        profile = np.where(latency >= 0, shape(latency), 0.)
+    else:
+        raise ValueError("shape must be 'gamma', 'boxcar' or a callable.")
+    if offset is not None:
+        profile = np.where(times > offset, 0., profile)
+    return profile
+
+
+def sim_decoding_cohort(n_subjects, t0, tmax, sfreq, effect_size=0.1, onset=0., offset=None, shape="gamma",
+                        width=0.2, ntrials=100, chance=0.5, effect_jitter=0., onset_jitter=0., generalization=False,
+                        seed=None):
+    """
+    Simulate the decoding accuracies of a whole cohort using a binomial distribution.
+
+    Vectorized counterpart of `sim_decoding_binomial` and `sim_decoding_binomial_2d`: the true accuracies
+    of all the subjects are computed at once and the number of successes is drawn in a single binomial
+    sample from the seed.
+
+    Parameters
+    ----------
+    n_subjects : int
+        Number of subjects.
+    t0 : int
+        Start time of the simulation (in seconds).
+    tmax : int
+        End time of the simulation (in seconds).
+    sfreq : int
+        Sampling frequency (number of samples per second).
+    effect_size : float, optional
+        Peak accuracy above chance, by default 0.1 (1 / scale_factor in `sim_decoding_binomial`).
+    onset : float, optional
+        Onset of the effect (in seconds), by default 0.
+    offset : float or None, optional
+        Offset of the effect (in seconds), by default None (no offset).
+    shape : str or callable, optional
+        Shape of the effect, see `effect_profile`. By default "gamma".
+    width : float, optional
+        Scale of the gamma shape (in seconds), by default 0.2.
+    ntrials : int, optional
+        Number of trials for the binomial distribution, by default 100.
+    chance : float, optional
+        Chance level, by default 0.5.
+    effect_jitter : float, optional
+        Standard deviation of the effect size across subjects, by default 0.
+    onset_jitter : float, optional
+        Scale of the half normal delay of each subject's onset, by default 0.
+    generalization : bool, optional
+        Whether to simulate temporal generalization matrices (subjects x time x time) instead of
+        time series (subjects x time), by default False.
+    seed : None, int or numpy.random.Generator, optional
+        Seed of the simulation, by default None.
+
+    Returns
+    -------
+    k : numpy.ndarray
+        Simulated number of successes, subjects x time (x time).
+    accuracy : numpy.ndarray
+        True accuracy the successes were drawn from, of the same shape.
+    """
+    rng = np.random.default_rng(seed)
+    times = sim_times(t0, tmax, sfreq)
+    subjects_effect = rng.normal(effect_size, effect_jitter, size=n_subjects)
+    subjects_onset = onset + np.abs(rng.normal(0, onset_jitter, size=n_subjects))
+    profile = effect_profile(times, onset=subjects_onset, offset=offset, shape=shape, width=width)
+    if generalization:
+        profile = profile[:, :, None] * profile[:, None, :]
+    accuracy = np.clip(chance + subjects_effect.reshape((-1,) + (1,) * (profile.ndim - 1)) * profile, 0, 1)
+    k = rng.binomial(ntrials, accuracy)
+    return k, accuracy
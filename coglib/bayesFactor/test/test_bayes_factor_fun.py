@@ -0,0 +1,69 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_allclose
+from scipy.stats import binomtest
+from bayes_factor_fun import (bayes_binomtest, bayes_binomtest_batch, binomtest_pval_batch, compute_bf,
+                              compute_bf_batch, bf_kendall_tau, bf_kendall_tau_batch, posterior_tau,
+                              posterior_tau_batch)
+
+
+class TestBinomialBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_binomtest_pval_mixed_n(self):
+        k, n = np.array([10, 10, 5, 30]), np.array([40, 80, 40, 40])
+        assert_allclose(binomtest_pval_batch(k, n), [binomtest(int(ki), int(ni)).pvalue for ki, ni in zip(k, n)])
+        for p in [0.3, 0.5, 0.62]:
+            n = self.rng.integers(1, 200, size=300)
+            k = self.rng.integers(0, n + 1)
+            expected = [binomtest(int(ki), int(ni), p=p).pvalue for ki, ni in zip(k, n)]
+            assert_allclose(binomtest_pval_batch(k, n, p=p), expected, rtol=1e-9)
+
+    def test_bayes_binomtest_mixed_n(self):
+        # Each test against the scalar function, with its own number of trials:
+        n = np.array([40, 80, 40, 100, 7])
+        k = np.array([10, 10, 5, 61, 7])
+        for p in [0.5, 0.3]:
+            bf, pval = bayes_binomtest_batch(k, n, p=p)
+            for i in range(k.shape[0]):
+                expected_bf, expected_pval = bayes_binomtest(k[i], int(n[i]), p=p, verbose=False)
+                assert_allclose([bf[i], pval[i]], [expected_bf, expected_pval], rtol=1e-6)
+        # Accuracies are converted to counts with the number of trials of each test:
+        bf, pval = bayes_binomtest_batch([0.25, 0.25], [40, 80])
+        assert_allclose(pval, [binomtest(10, 40).pvalue, binomtest(20, 80).pvalue])
+
+    def test_empirical_null(self):
+        k = self.rng.integers(40, 70, size=(3, 4))
+        null = self.rng.uniform(0.4, 0.6, size=(3, 4, 50))
+        bf, pval = bayes_binomtest_batch(k / 100, 100, p=null)
+        expected_bf, expected_pval = bayes_binomtest(k / 100, 100, p=null, verbose=False)
+        assert_allclose(bf, expected_bf, rtol=1e-6)
+        assert_allclose(pval, expected_pval)
+        for idx in np.ndindex(k.shape):
+            assert_allclose(compute_bf_batch(k[idx], 100, 1, 1, p=null[idx]), compute_bf(int(k[idx]), 100, 1, 1,
+                                                                                        p=null[idx]), rtol=1e-6)
+
+
+class TestKendallBatch(unittest.TestCase):
+
+    def test_bf_kendall_tau(self):
+        tau, n = np.array([-0.3, 0.05, 0.4, 0.1]), np.array([20, 10, 60, 300])
+        bf = bf_kendall_tau_batch(tau, n)
+        for i in range(tau.shape[0]):
+            expected = bf_kendall_tau(tau[i], n[i])
+            for key in ["bf10", "bfPlus0", "bfMin0"]:
+                assert_allclose(bf[key][i], np.squeeze(expected[key]), rtol=1e-6)
+
+    def test_posterior_tau(self):
+        grid = np.linspace(-1, 1, 9)
+        posterior = posterior_tau_batch(grid, [-0.3, 0.2], [20, 50], test="two-sided")
+        self.assertEqual(posterior.shape, (2, 9))
+        for test in ["two-sided", "positive", "negative"]:
+            assert_allclose(posterior_tau_batch(grid, 0.2, 50, test=test), posterior_tau(grid, 0.2, 50, test=test),
+                            rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from decoding_simulation import sim_times, effect_profile, sim_decoding_cohort
+
+
+class TestEffectProfile(unittest.TestCase):
+
+    def setUp(self):
+        self.times = np.round(np.arange(-0.2, 1.0, 0.01), 2)
+
+    def test_gamma_peak(self):
+        # Peak of 1, 2 * width after each onset, and no effect before the onset:
+        onsets = np.array([0., 0.1, 0.25])
+        profile = effect_profile(self.times, onset=onsets, shape="gamma", width=0.1)
+        self.assertEqual(profile.shape, (3, self.times.shape[0]))
+        assert_allclose(profile.max(axis=1), 1)
+        assert_allclose(self.times[profile.argmax(axis=1)], onsets + 0.2)
+        for i, onset in enumerate(onsets):
+            assert_array_equal(profile[i, self.times <= onset], 0)
+
+    def test_offset(self):
+        profile = effect_profile(self.times, onset=0.1, offset=0.5, shape="boxcar")
+        assert_array_equal(profile, ((self.times >= 0.1) & (self.times <= 0.5)).astype(float))
+        profile = effect_profile(self.times, onset=0., offset=0.3, shape="gamma", width=0.2)
+        assert_array_equal(profile[self.times > 0.3], 0)
+        self.assertTrue(np.all(profile[(self.times > 0) & (self.times <= 0.3)] > 0))
+
+    def test_callable_shape(self):
+        profile = effect_profile(self.times, onset=0.2, shape=lambda latency: np.exp(-latency))
+        assert_array_equal(profile[self.times < 0.2], 0)
+        assert_allclose(profile[self.times >= 0.2], np.exp(-(self.times[self.times >= 0.2] - 0.2)))
+        with self.assertRaises(ValueError):
+            effect_profile(self.times, shape="triangle")
+
+
+class TestSimDecodingCohort(unittest.TestCase):
+
+    def test_shapes(self):
+        n_times = sim_times(-0.2, 1, 50).shape[0]
+        k, accuracy = sim_decoding_cohort(7, -0.2, 1, 50, ntrials=40, seed=0)
+        self.assertEqual(k.shape, (7, n_times))
+        self.assertEqual(accuracy.shape, (7, n_times))
+        self.assertTrue(np.all((k >= 0) & (k <= 40)))
+        k, accuracy = sim_decoding_cohort(7, -0.2, 1, 50, generalization=True, seed=0)
+        self.assertEqual(k.shape, (7, n_times, n_times))
+        self.assertEqual(accuracy.shape, (7, n_times, n_times))
+
+    def test_accuracy(self):
+        # Without jitter, every subject peaks at chance + effect size and is at chance outside of the effect:
+        times = sim_times(-0.2, 1, 50)
+        _, accuracy = sim_decoding_cohort(5, -0.2, 1, 50, effect_size=0.1, onset=0.1, offset=0.6, chance=0.25,
+                                          seed=0)
+        assert_allclose(accuracy, 0.25 + 0.1 * effect_profile(times, onset=0.1, offset=0.6)[None].repeat(5, 0))
+        assert_allclose(accuracy[:, (times <= 0.1) | (times > 0.6)], 0.25)
+        # The onset jitter only delays the effect:
+        _, accuracy = sim_decoding_cohort(50, -0.2, 1, 50, onset=0.1, onset_jitter=0.05, seed=0)
+        assert_allclose(accuracy[:, times <= 0.1], 0.5)
+
+    def test_seed(self):
+        kwargs = dict(effect_size=0.05, effect_jitter=0.02, onset_jitter=0.05)
+        k1, accuracy1 = sim_decoding_cohort(10, -0.2, 1, 50, seed=3, **kwargs)
+        k2, accuracy2 = sim_decoding_cohort(10, -0.2, 1, 50, seed=np.random.default_rng(3), **kwargs)
+        assert_array_equal(k1, k2)
+        assert_array_equal(accuracy1, accuracy2)
+        k3, accuracy3 = sim_decoding_cohort(10, -0.2, 1, 50, seed=4, **kwargs)
+        self.assertFalse(np.array_equal(k1, k3))
+        self.assertFalse(np.array_equal(accuracy1, accuracy3))
+
+
+if __name__ == '__main__':
+    unittest.main()
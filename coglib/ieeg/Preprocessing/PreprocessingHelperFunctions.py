@@ -13,17 +13,18 @@ import math
 import mne
 from mne.viz import plot_alignment, snapshot_brain_montage
 from mne.datasets import fetch_fsaverage
-from nibabel.freesurfer.io import read_geometry
 
 import matplotlib.pyplot as plt
 
-from scipy.stats import median_abs_deviation, linregress
+from scipy import fft as sp_fft
+from scipy import sparse
 import pandas as pd
 
 import shutil
 import subprocess
 
 from general_helper_functions.pathHelperFunctions import find_files
+from general_helper_functions.spatial_index import nearest_surface_vertices, get_montage_volume_labels
 
 
 def path_generator(root, step, signal=None, previous_steps_list=None, figure=False):
@@ -335,8 +336,70 @@ def manual_signal_inspection(raw, subject_info, instructions=""):
     return raw
 
 
+def robust_zscore(x, axis=None):
+    """
+    This function computes the absolute robust z score of each value, i.e. the absolute deviation from the median
+    divided by the median absolute deviation
+    :param x: (np array) data
+    :param axis: (int or None) axis along which to compute the median and the MAD. None to pool all values
+    :return: (np array) absolute robust z score of each value, same shape as x
+    """
+    deviation = np.abs(x - np.median(x, axis=axis, keepdims=True))
+    return deviation / np.median(deviation, axis=axis, keepdims=True)
+
+
+def psd_slopes(freqs, log_psd, fmin=10, fmax=100):
+    """
+    This function computes the slope of the log PSD of all channels between two frequencies with a single least
+    square solve
+    :param freqs: (np array) frequencies of the PSD
+    :param log_psd: (np array) channels x frequencies log PSD
+    :param fmin: (float) lowest frequency of the fit
+    :param fmax: (float) highest frequency of the fit. To be consistent with previous versions, the highest frequency
+    below fmax is excluded from the fit
+    :return: (np array) slope of each channel
+    """
+    ind_1, ind_2 = np.where(freqs >= fmin)[0][0], np.where(freqs <= fmax)[0][-1]
+    design = np.stack([freqs[ind_1:ind_2], np.ones(ind_2 - ind_1)], axis=1)
+    coefs = np.linalg.lstsq(design, log_psd[:, ind_1:ind_2].T, rcond=None)[0]
+    return coefs[0]
+
+
+def segments_range_and_slope(raw, picks, epoch_length=1.0, block_size=60):
+    """
+    This function segments the raw data in consecutive non-overlapping segments and computes the range (microV) and
+    max slope (microV / millisec) in each segment of each channel. The data are loaded block of segments by block of
+    segments, such that the memory does not depend on the duration of the recording. Segments overlapping with bad
+    annotations are discarded, like mne.make_fixed_length_epochs(..., reject_by_annotation=True)
+    :param raw: (mne raw object) raw data
+    :param picks: (list) channels to use
+    :param epoch_length: (float) duration of the segments in sec
+    :param block_size: (int) number of segments loaded at once
+    :return: segments_range, segments_max_slope: (np arrays) segments x channels
+    """
+    seg_samples = int(np.round(epoch_length * raw.info["sfreq"]))
+    n_segments = raw.n_times // seg_samples
+    segments_range = []
+    segments_max_slope = []
+    for seg_start in range(0, n_segments, block_size):
+        n_seg = min(block_size, n_segments - seg_start)
+        data = raw.get_data(picks=picks, start=seg_start * seg_samples, stop=(seg_start + n_seg) * seg_samples,
+                            reject_by_annotation="NaN") * 10 ** 6
+        data = data.reshape(data.shape[0], n_seg, seg_samples).transpose(1, 0, 2)
+        # Discard the segments overlapping with bad annotations:
+        good_segments = ~np.any(np.isnan(data), axis=(1, 2))
+        data = data[good_segments]
+        # Compute segments range:
+        segments_range.append(np.ptp(data, axis=-1))
+        # Compute the max slope (microV / millisec) in each segment (i.e. diff between every successive samples
+        # x the interval between two samples):
+        segments_max_slope.append(np.max(np.abs(np.diff(data, axis=-1) * (1000 / raw.info["sfreq"])), axis=-1))
+    return np.concatenate(segments_range, axis=0), np.concatenate(segments_max_slope, axis=0)
+
+
 def automated_bad_channel_detection(raw, method="psd_based", epoch_length=1.0, mad_thresh=4,
-                                    segment_proportion_cutoff=0.1, channel_types=None, reject_bad_channels=False):
+                                    segment_proportion_cutoff=0.1, channel_types=None, reject_bad_channels=False,
+                                    block_size=60):
     """
     This function detects bad channels automatically according to criterion detailed here:
     https://doi.org/10.1016/j.celrep.2021.109585 with slight adaptation
@@ -356,6 +419,8 @@ def automated_bad_channel_detection(raw, method="psd_based", epoch_length=1.0, m
     :param channel_types: (dict) channels type to include in this
     :param reject_bad_channels: (bool) whether or not to add the information about the channels being bad to the raw
     object to be ignored from here on
+    :param block_size: (int) number of segments loaded at once to compute the range and slopes. Only considered for
+    activation_based method
     :return:
     raw: mne raw object
     detected_bad_channels: list of channels names considered as bad
@@ -382,42 +447,26 @@ def automated_bad_channel_detection(raw, method="psd_based", epoch_length=1.0, m
             psd, freqs = mne.time_frequency.psd_welch(raw, picks=ch_names, average="mean")
             # Log transforming the psd:
             log_psd = np.log(psd)
-            # Mean center the PSD:
-            mean_cent_psd = np.array(log_psd.T - np.mean(log_psd, axis=-1)).T
             # Compute the average of the mean centered PSD:
-            avg_mean_cent_psd = np.mean(mean_cent_psd, axis=-1)
+            avg_mean_cent_psd = np.mean(log_psd - np.mean(log_psd, axis=-1, keepdims=True), axis=-1)
             # Compute the median absolute deviation of the mean centered psd:
-            mean_psd_mad = np.array([np.abs(avg_mean_cent_psd[i] - np.median(avg_mean_cent_psd)) /
-                                     median_abs_deviation(avg_mean_cent_psd, axis=0)
-                                     for i in range(avg_mean_cent_psd.shape[0])])
+            mean_psd_mad = robust_zscore(avg_mean_cent_psd)
             # Compute the psd slope for each channel from 10 to 100Hz:
-            ind_1, ind_2 = np.where(freqs >= 10)[0][0], np.where(freqs <= 100)[0][-1]
-            log_psd_slopes = np.array([linregress(freqs[ind_1:ind_2], log_psd[i, ind_1:ind_2]).slope
-                                       for i in range(log_psd.shape[0])])
+            log_psd_slopes = psd_slopes(freqs, log_psd, fmin=10, fmax=100)
             # Compute the MAD of the slope:
-            log_slope_mad = np.array([np.abs(log_psd_slopes[i] - np.median(log_psd_slopes)) /
-                                      median_abs_deviation(log_psd_slopes, axis=None)
-                                      for i in range(log_psd_slopes.shape[0])])
+            log_slope_mad = robust_zscore(log_psd_slopes)
             # Binarize both MAD:
             slopes_bin = log_slope_mad > mad_thresh
             mean_bin = mean_psd_mad > mad_thresh
             # Find the channels that have either weird slopes or weird mean centered mean
             bad_channels.extend([ch_names[i] for i in np.where(np.logical_or(slopes_bin, mean_bin))[0]])
         if method.lower() == "activation_based" or method.lower() == "both":
-            # Generate epochs of fixed length:
-            epochs = mne.make_fixed_length_epochs(raw, duration=epoch_length, preload=True,
-                                                  reject_by_annotation=True, overlap=0.0,
-                                                  verbose=False).pick(ch_names)
-            # Extract the data:
-            data = epochs.get_data() * 10 ** 6
-            # Compute segments range:
-            segments_range = np.ptp(data, axis=-1)
-            # Compute the max slope (microV / millisec) in each segment (i.e. diff between every successive samples
-            # x the interval between two samples):
-            segments_max_slope = np.max(np.abs(np.diff(data, axis=-1) * (1000 / epochs.info["sfreq"])), axis=-1)
+            # Compute the range and max slope of each segment, streaming the raw data block by block:
+            segments_range, segments_max_slope = segments_range_and_slope(raw, ch_names, epoch_length=epoch_length,
+                                                                          block_size=block_size)
             # Compute zscore of each segment:
-            range_mad = np.abs(median_abs_deviation(segments_range, axis=None))
-            slope_mad = np.abs(median_abs_deviation(segments_max_slope, axis=None))
+            range_mad = robust_zscore(segments_range)
+            slope_mad = robust_zscore(segments_max_slope)
             # Compare channels against the z score threshold:
             range_bin = range_mad > mad_thresh
             slope_bin = slope_mad > mad_thresh
@@ -736,8 +785,71 @@ def find_interruption_index(events, event_dict, interuption_landmark, interrupti
     return interruption_index
 
 
+def filter_bank_envelope(data, sfreq, bins, do_baseline_normalization=True, interruption_index=None, chunk_size=16,
+                         njobs=1):
+    """
+    This function computes the average envelope across several frequency bands. Each channel is Fourier transformed
+    once, and the band pass filter of each band is applied in the frequency domain together with the analytic signal
+    mask before an inverse FFT. The band pass filters are the default mne FIR filters, such that the envelopes are the
+    same as with raw.filter(...).apply_hilbert(envelope=True), except for the signal edges. The channels are processed
+    in chunks and the bands one at a time, the average across bands being accumulated in place, such that only the
+    analytic signal of one band of the current chunk is held in memory.
+    :param data: (np array) channels x time data
+    :param sfreq: (float) sampling frequency of the data
+    :param bins: (list of lists) low and high frequency of each band, for instance [[70, 80], [80, 90]]
+    :param do_baseline_normalization: (bool) whether to divide the envelope of each band by its average (channel wise)
+    before averaging across bands, to account for the 1/f
+    :param interruption_index: (int) index of the sample at which the recording was interrupted. The normalization is
+    done separately before and after
+    :param chunk_size: (int) number of channels processed at once
+    :param njobs: (int) number of workers of the FFTs
+    :return: (np array) channels x time average envelope across bands
+    """
+    if not isinstance(data, np.ndarray) or data.ndim != 2:
+        raise TypeError('The data should be a two dimensional ndarray!')
+    n_times = data.shape[1]
+    # mne FIR band pass filter of each band:
+    kernels = [mne.filter.create_filter(None, sfreq, freq_bin[0], freq_bin[1], verbose="error") for freq_bin in bins]
+    # Zero padding to avoid wrapping the filtered signal around:
+    n_fft = sp_fft.next_fast_len(n_times + max([h.shape[0] for h in kernels]))
+    freqs = sp_fft.rfftfreq(n_fft, 1 / sfreq)
+    # Zero phase frequency response of each filter, compensating the delay of the linear phase kernel:
+    masks = np.zeros((len(bins), freqs.shape[0]))
+    for i, h in enumerate(kernels):
+        masks[i] = np.real(sp_fft.rfft(h, n_fft) * np.exp(2j * np.pi * np.arange(freqs.shape[0]) * (h.shape[0] // 2)
+                                                          / n_fft))
+    # Analytic signal: positive frequencies doubled, DC and Nyquist unchanged, negative frequencies removed:
+    masks[:, 1:(n_fft + 1) // 2] *= 2
+    if do_baseline_normalization:
+        print('Divide by average')
+        if interruption_index is None:
+            segments = [slice(0, n_times)]
+        else:
+            segments = [slice(0, interruption_index), slice(interruption_index, n_times)]
+
+    frequency_band = np.zeros(data.shape)
+    for ch_start in range(0, data.shape[0], chunk_size):
+        chunk = slice(ch_start, min(ch_start + chunk_size, data.shape[0]))
+        spectrum = sp_fft.rfft(data[chunk], n_fft, axis=-1, workers=njobs)
+        # One analytic signal buffer per chunk, the negative frequencies staying at 0:
+        analytic = np.zeros((spectrum.shape[0], n_fft), dtype=complex)
+        for mask in masks:
+            np.multiply(mask, spectrum, out=analytic[:, :freqs.shape[0]])
+            envelope = np.abs(sp_fft.ifft(analytic, axis=-1, workers=njobs)[:, :n_times])
+            if do_baseline_normalization:
+                # Dividing the amplitude of each band by its mean, channel wise:
+                for segment in segments:
+                    envelope[:, segment] /= envelope[:, segment].mean(axis=-1, keepdims=True)
+            frequency_band[chunk] += envelope
+    # Average across bands:
+    frequency_band /= len(bins)
+
+    return frequency_band
+
+
 def frequency_bands_computations(raw, frequency_range=None, njobs=1, bands_width=10, channel_types=None,
-                                 method="filter_bank", do_baseline_normalization=True, interruption_index=None):
+                                 method="filter_bank", do_baseline_normalization=True, interruption_index=None,
+                                 chunk_size=16):
     """
     This function computes the envelope in specified frequency band. It further has the option to compute envelope
     in specified bands within the passed frequency to then do baseline normalization to account for 1/f noise.
@@ -752,35 +864,14 @@ def frequency_bands_computations(raw, frequency_range=None, njobs=1, bands_width
     across those envelopes
     band_pass_filter: compute the envelope of the signal band passed in the set freqs
     :param do_baseline_normalization: (bool) whether or not to do baseline normalization
+    :param interruption_index: (int) index of the sample at which the recording was interrupted. The normalization is
+    done separately before and after
+    :param chunk_size: (int) number of channels processed at once by the filter bank. Larger chunks are faster but use
+    more memory
     :return: frequency_band_signal: (mne raw object) dictionary containing raw objects with high gamma in the different
     frequency bands
     """
 
-    def divide_by_average(data, int_ind):
-        print('Dividing channels amplitude by average amplitude')
-        if not isinstance(data, np.ndarray):
-            raise TypeError('Input value must be an ndarray')
-        if data.ndim != 2:
-            raise TypeError('The data should have two dimensions!')
-        else:
-            if int_ind is None:
-                norm_data = data / data.mean(axis=1)[:, None]
-                # Check that the normalized data are indeed what they should be. We are dividing the data by a constant.
-                # So if we divide the normalized data by the original data, we should get a constant:
-                if len(np.unique((data[0, :] / norm_data[0, :]).round(decimals=15))) != 1:
-                    raise Exception(
-                        "The normalization of the frequency band went wrong! The division of normalized vs non "
-                        "normalized data returned several numbers, which shouldn't be the case!")
-                return norm_data
-            else:
-                data_before_int = data[:, 0:int_ind]
-                norm_data_before_int = data_before_int / \
-                                       data_before_int.mean(axis=1)[:, None]
-                data_after_int = data[:, int_ind:]
-                norm_data_after_int = data_after_int / \
-                                      data_after_int.mean(axis=1)[:, None]
-                return np.concatenate([norm_data_before_int, norm_data_after_int], axis=1)
-
     if channel_types is None:
         channel_types = {"seeg": True, "ecog": True}
     if frequency_range is None:
@@ -794,57 +885,23 @@ def frequency_bands_computations(raw, frequency_range=None, njobs=1, bands_width
         # Getting the index of the channels for which the frequency band should NOT be computed
         not_picks = [ind for ind, ch in enumerate(
             raw.info["ch_names"]) if ind not in picks]
-        # Creating copies of the raw for the channels for which the frequency band should be computed, and another for
-        # the channels for which it shouldn't be computed, to avoid messing up the channels indices:
-        freq_band_raw = raw.copy().pick(picks)
+        # Creating a copy of the raw for the channels for which the frequency band shouldn't be computed, to avoid
+        # messing up the channels indices:
         if len(not_picks) != 0:
             rest_raw = raw.copy().pick(not_picks)
 
-        # We first create the dictionary to store the final data:
-        bands_amp = []
         # We then create the frequency bins to loop over:
         bins = []
         for i, freq in enumerate(range(frequency_range[0], frequency_range[1], bands_width)):
             bins.append([freq, freq + bands_width])
+        print('Computing the envelope amplitude in the bands: ' + str(bins))
+        # All the bands are computed from a single FFT of each channel, and averaged chunk of channels by chunk:
+        frequency_band = filter_bank_envelope(raw.get_data(picks=picks), raw.info["sfreq"], bins,
+                                              do_baseline_normalization=do_baseline_normalization,
+                                              interruption_index=interruption_index, chunk_size=chunk_size,
+                                              njobs=njobs)
+        info = mne.pick_info(raw.info, picks)
 
-        for freq_bin in bins:
-            print('')
-            print('-' * 40)
-            print('Computing the frequency in band: ' + str(freq_bin))
-            print('changes are enacted')
-            # Filtering the signal and apply the hilbert:
-            print('Computing the envelope amplitude')
-            band_power = \
-                freq_band_raw.copy().filter(
-                    freq_bin[0], freq_bin[1], n_jobs=njobs).apply_hilbert(envelope=True)
-
-            # Now, dividing the amplitude by the mean, channel wise:
-            if do_baseline_normalization:
-                print('Divide by average')
-                bands_amp.append(divide_by_average(
-                    band_power[:][0], interruption_index))
-            else:
-                bands_amp.append(band_power[:][0])
-
-        # Deleting unused variables to make some space:
-        del band_power
-        info = freq_band_raw.info
-
-        # Converting this to 3D numpy array:
-        bands_amp = np.array(bands_amp)
-        # Finally, all the bands must be averaged back together:
-        frequency_band = bands_amp.mean(axis=0)
-        # Checking that the averaging across frequency bands works as we want it and if not raise an error:
-        for i in range(0, 100):
-            ch_ind = np.random.randint(0, bands_amp.shape[1])
-            sample_ind = np.random.randint(0, bands_amp.shape[2])
-            # Extracting the data of all each freq band and compute the mean thereof:
-            test_avg = np.mean(bands_amp[:, ch_ind, sample_ind])
-            observer_avg = frequency_band[ch_ind, sample_ind]
-            if (test_avg - observer_avg).round(decimals=14) != 0:
-                print(test_avg - observer_avg)
-                raise Exception("There was an issue in the averaging across frequency bands in the frequency "
-                                "bands computations!")
         # Recreating mne raw object:
         frequency_band_signal = mne.io.RawArray(frequency_band, info)
         # Adding back the untouched channels:
@@ -1040,7 +1097,6 @@ def ieeg_t12mni(mne_obj, subjects_dir, subject, template='fsaverage_sym', ch_typ
     import nibabel as nib
     if ch_types is None:
         ch_types = ["ecog", "seeg"]
-    from scipy.spatial import KDTree
     # Prepare dict to save channels loc:
     mni_coords = {ch: None for ch in mne_obj.ch_names}
     # Looping through each channel type:
@@ -1059,26 +1115,18 @@ def ieeg_t12mni(mne_obj, subjects_dir, subject, template='fsaverage_sym', ch_typ
             ch_pos = ecog_obj.get_montage().get_positions()['ch_pos']
             # When extracting the position directly, they get returned in meters, convert to mm:
             ch_pos = {ch: ch_pos[ch] * 1e3 for ch in ch_pos.keys()}
-            # create lookup tables for each hemisphere
-            lookup_vertices = {}
-            for hemi in ['lh', 'rh']:
-                fname = str(Path(subjects_dir, subject, 'surf', hemi + '.pial'))
-                vertices, _ = mne.read_surface(fname)
-                lookup_vertices[hemi] = KDTree(vertices)
+            # Find the nearest pial vertex of all channels at once (the hemisphere is determined by the x-coordinate,
+            # x < 0 = 'lh'):
+            _, nearest_vertices, hemis = nearest_surface_vertices(np.array(list(ch_pos.values())), subjects_dir,
+                                                                  subject, surf="pial")
 
             # Convert each channel to mni:
-            for ch in ch_pos.keys():
+            for ch, nearest_vertex_index, hemi in zip(ch_pos.keys(), nearest_vertices, hemis):
                 # If there are spaces in the channel name, removing it for freesurfer:
                 ch_fs = ch.replace(" ", "")
                 if np.isnan(ch_pos[ch][0]):
                     mni_coords[ch] = np.array([np.nan, np.nan, np.nan])
                     continue
-                if ch_pos[ch][0] < 0:
-                    hemi = 'lh'  # this can be determined by the x-coordinate (x < 0 = 'lh')
-                else:
-                    hemi = 'rh'
-
-                _, nearest_vertex_index = lookup_vertices[hemi].query(ch_pos[ch])
 
                 # write a label file to a temporary directory
                 label_file = str(Path(os.getcwd(), 'ch.{}.label'.format(ch_fs)))
@@ -1223,7 +1271,6 @@ def roi_mapping(mne_object, list_parcellations, subject_id, fs_dir, step,
     generate the save directory
     :return: labels_df: (dict of dataframe) one data frame per parcellation with the mapping between roi and channels
     """
-    from freesurfer.wang_labels import get_montage_volume_labels_wang
     labels_df = {parcellation: pd.DataFrame()
                  for parcellation in list_parcellations}
     for parcellation in list_parcellations:
@@ -1233,19 +1280,13 @@ def roi_mapping(mne_object, list_parcellations, subject_id, fs_dir, step,
             # Convert the montge from mni to mri:
             montage = mne_object.get_montage()
             montage.apply_trans(mne.transforms.Transform(fro='mni_tal', to='mri', trans=np.eye(4)))
-            if parcellation == "wang15_mplbl":
-                labels, _ = get_montage_volume_labels_wang(montage, "fsaverage", subjects_dir=None,
-                                                           aseg='wang15_mplbl', dist=2)
-            else:
-                labels, _ = \
-                    mne.get_montage_volume_labels(montage, "fsaverage", subjects_dir=subjects_dir, aseg=parcellation)
+            # The wang atlas is looked up in the SUBJECTS_DIR fsaverage:
+            labels = get_montage_volume_labels(montage, "fsaverage",
+                                               None if parcellation == "wang15_mplbl" else subjects_dir,
+                                               aseg=parcellation, dist=2)
         else:
-            if parcellation == "wang15_mplbl":
-                labels, _ = get_montage_volume_labels_wang(mne_object.get_montage(), subject_id, subjects_dir=fs_dir,
-                                                           aseg=parcellation, dist=2)
-            else:
-                labels, _ = mne.get_montage_volume_labels(
-                    mne_object.get_montage(), subject_id, subjects_dir=fs_dir, aseg=parcellation)
+            labels = get_montage_volume_labels(mne_object.get_montage(), subject_id, fs_dir, aseg=parcellation,
+                                               dist=2)
         # Appending the electrodes roi to the table:
         for ind, channel in enumerate(labels.keys()):
             labels_df[parcellation] = labels_df[parcellation].append(
@@ -1429,6 +1470,32 @@ def laplace_ref_fun(to_ref, ref_1=None, ref_2=None):
     return referenced_data
 
 
+def laplace_reference_matrix(reference_mapping, ch_names):
+    """
+    This function compiles the laplace reference mapping into a sparse matrix of dimension [channels to reference,
+    channels], such that the referenced data are the product of this matrix with the data. The row of each channel has
+    1 for the channel itself and -1/n for each of its n references. The channels with a single reference (edges) are
+    therefore referenced to that one only, same as with the nanmean of the reference and a channel of NaN in
+    laplace_ref_fun. The channels without any reference get NaN.
+    :param reference_mapping: (dict) contains the mapping between channels to reference and which channels to use to do
+    the reference. Format: {ch_name: {"ref_1": ch, "ref_2": ch or None}}
+    :param ch_names: (list of string) name of the channels, in the order of the rows of the data
+    :return: (scipy sparse csr matrix) referencing matrix
+    """
+    rows, cols, weights = [], [], []
+    for row, ch in enumerate(reference_mapping.keys()):
+        refs = [ref for ref in [reference_mapping[ch]["ref_1"], reference_mapping[ch]["ref_2"]] if ref is not None]
+        rows.append(row)
+        cols.append(ch_names.index(ch))
+        weights.append(1. if len(refs) > 0 else np.nan)
+        for ref in refs:
+            rows.append(row)
+            cols.append(ch_names.index(ref))
+            weights.append(-1 / len(refs))
+    # Duplicate entries (a channel being its own reference for example) are summed:
+    return sparse.csr_matrix((weights, (rows, cols)), shape=(len(reference_mapping), len(ch_names)))
+
+
 def project_elec_to_surf(raw, subjects_dir, subject, montage_space="T1"):
     """
     This function project surface electrodes onto the brain surface to avoid having them floating a little.
@@ -1439,18 +1506,13 @@ def project_elec_to_surf(raw, subjects_dir, subject, montage_space="T1"):
     If MNI, will be done to fsaverage surface.
     :return:
     """
-    # Loading the left and right pial surfaces:
-    if montage_space == "T1":
-        left_surf = read_geometry(Path(subjects_dir, subject, "surf", "lh.pial"))
-        right_surf = read_geometry(Path(subjects_dir, subject, "surf", "rh.pial"))
-    elif montage_space == "MNI":
+    # Get the surface to project to:
+    if montage_space == "MNI":
         sample_path = mne.datasets.sample.data_path()
         subjects_dir = Path(sample_path, 'subjects')
         fetch_fsaverage(subjects_dir=subjects_dir, verbose=True)  # Downloading the data if needed
         subject = "fsaverage"
-        left_surf = read_geometry(Path(subjects_dir, subject, "surf", "lh.pial"))
-        right_surf = read_geometry(Path(subjects_dir, subject, "surf", "rh.pial"))
-    else:
+    elif montage_space != "T1":
         raise Exception("You have passed a montage space that is not supported! Either MNI or T1!")
 
     # Getting the surface electrodes:
@@ -1458,39 +1520,16 @@ def project_elec_to_surf(raw, subjects_dir, subject, montage_space="T1"):
     ecog_channels = [raw.ch_names[pick] for pick in ecog_picks]
     # Get the montage:
     montage = raw.get_montage()
-    # Looping through each of these channels:
-    for channel in ecog_channels:
-        # Get the channel index
-        ch_ind = montage.ch_names.index(channel)
-        # Get the channel coordinates:
-        ch_coord = montage.dig[ch_ind]["r"]
-        # Checking if the coordinates are NAN:
-        if math.isnan(ch_coord[0]):
+    # Get the channels coordinates, in mm like the surface:
+    ch_inds = [montage.ch_names.index(channel) for channel in ecog_channels]
+    ch_coords = np.array([montage.dig[ch_ind]["r"] for ch_ind in ch_inds]) * 1000
+    # Find the nearest vertex of all channels at once:
+    vertices_coords, _, _ = nearest_surface_vertices(ch_coords, subjects_dir, subject, surf="pial")
+    for ch_ind, vertex_coords in zip(ch_inds, vertices_coords):
+        # Channels with NAN coordinates are left as is:
+        if math.isnan(vertex_coords[0]):
             continue
-        if ch_coord[0] < 0:
-            # Compute x y and z distances to each vertex in the surface:
-            b_x = np.absolute(left_surf[0][:, 0] - ch_coord[0] * 1000)
-            b_y = np.absolute(left_surf[0][:, 1] - ch_coord[1] * 1000)
-            b_z = np.absolute(left_surf[0][:, 2] - ch_coord[2] * 1000)
-            # Find the shortest distance:
-            d = np.sqrt(np.sum([np.square(b_x), np.square(b_y), np.square(b_z)], axis=0))
-            # Get the index of the smallest one:
-            min_vert_ind = np.argmin(d)
-            montage.dig[ch_ind]["r"] = np.squeeze(np.array(
-                [left_surf[0][min_vert_ind, 0] * 0.001, left_surf[0][min_vert_ind, 1] * 0.001,
-                 left_surf[0][min_vert_ind, 2] * 0.001]))
-        else:
-            # Compute x y and z distances to each vertex in the surface:
-            b_x = np.absolute(right_surf[0][:, 0] - ch_coord[0] * 1000)
-            b_y = np.absolute(right_surf[0][:, 1] - ch_coord[1] * 1000)
-            b_z = np.absolute(right_surf[0][:, 2] - ch_coord[2] * 1000)
-            # Find the shortest distance:
-            d = np.sqrt(np.sum([np.square(b_x), np.square(b_y), np.square(b_z)], axis=0))
-            # Get the index of the smallest one:
-            min_vert_ind = np.argmin(d)
-            montage.dig[ch_ind]["r"] = np.squeeze(np.array(
-                [right_surf[0][min_vert_ind, 0] * 0.001, right_surf[0][min_vert_ind, 1] * 0.001,
-                 right_surf[0][min_vert_ind, 2] * 0.001]))
+        montage.dig[ch_ind]["r"] = vertex_coords * 0.001
     # Adding the montage back to the raw object:
     raw.set_montage(montage, on_missing="warn")
 
@@ -1499,7 +1538,7 @@ def project_elec_to_surf(raw, subjects_dir, subject, montage_space="T1"):
 
 def laplacian_referencing(raw, reference_mapping, channel_types=None,
                           n_jobs=1, relocate_edges=True,
-                          subjects_dir=None, subject=None, montage_space=None):
+                          subjects_dir=None, subject=None, montage_space=None, chunk_size=100000):
     """
     This function performs laplacian referencing by subtracting the average of two neighboring electrodes to the
     central one. So for example, if you have electrodes G1, G2, G3, you can reference G2 as G2 = G2 - mean(G1, G2).
@@ -1518,13 +1557,14 @@ def laplacian_referencing(raw, reference_mapping, channel_types=None,
     :param reference_mapping: (dict or None) dict of the format described above or None. If None, then the user will
     have the opportunity to create it manually
     :param channel_types: (dict) which channel to consider for the referencing
-    :param n_jobs: (int) n_jobs to compute the mapping. Not really useful as we loop through each channel independently
-    so setting it to more than 1 will not really do anything. But might be improved in the future.
+    :param n_jobs: (int) not used anymore, the referencing of all channels is a single sparse matrix product. Kept for
+    compatibility
     :param relocate_edges: (boolean) whether or not to relocate the electrodes that have only one ref!
     :param subjects_dir: (string) directory to the freesurfer data. This is necessary, as the edges get relocated,
     the ecog channels need to be projected to the brain surface.
     :param subject: (string) Name of the subject to access the right surface
     :param montage_space: (string) name of the montage space of the electrodes, either T1 or MNI
+    :param chunk_size: (int) number of samples referenced at once
     :return:
     mne raw object: with laplace referencing performed.
     """
@@ -1540,50 +1580,34 @@ def laplacian_referencing(raw, reference_mapping, channel_types=None,
 
     # ------------------------------------------------------------------------------------------------------------------
     # Performing the laplace reference:
-    # Extract data to get the references and avoid issue with changing in place when looping:
-    ref_data = raw.get_data()
-    data_chs = raw.ch_names
-    # Get the size of a channel matrix to handle the absence of ref_2 for corners:
-    mat_shape = np.squeeze(raw.get_data(picks=0)).shape
-    empty_mat = np.empty(mat_shape)
-    empty_mat[:] = np.nan
-    # performing the laplace referencing:
-    for ch in reference_mapping.keys():
-        if reference_mapping[ch]["ref_1"] is None:
-            ref_1 = empty_mat
-        else:
-            # Get the index of the reference channel:
-            ind = data_chs.index(reference_mapping[ch]["ref_1"])
-            ref_1 = np.squeeze(ref_data[ind, :])
-        if reference_mapping[ch]["ref_2"] is None:
-            ref_2 = empty_mat
-        else:
-            # Get the index of the reference channel:
-            ind = data_chs.index(reference_mapping[ch]["ref_2"])
-            ref_2 = np.squeeze(ref_data[ind, :])
-        raw.apply_function(laplace_ref_fun, picks=[ch], n_jobs=n_jobs, verbose=None,
-                           ref_1=ref_1, ref_2=ref_2,
-                           channel_wise=True)
-        # Relocating if needed:
-        if relocate_edges:
-            # If one of the two reference is only Nan, then there was one ref missing, in which case the channel must
-            # be replaced, (bitwise or because only if one of the two is true)
-            if np.isnan(ref_1).all() ^ np.isnan(ref_2).all():
-                print("Relocating channel " + ch)
-                montage = raw.get_montage()
-                # Get the indices of the current channel
-                ch_ind = montage.ch_names.index(ch)
-                # Get the single reference:
-                ref = reference_mapping[ch]["ref_1"] if reference_mapping[ch]["ref_1"] is not None \
-                    else reference_mapping[ch]["ref_2"]
-                ref_ind = montage.ch_names.index(ref)
-                # Compute the center between the two:
-                x, y, z = (montage.dig[ch_ind]["r"][0] + montage.dig[ref_ind]["r"][0]) / 2, \
-                          (montage.dig[ch_ind]["r"][1] + montage.dig[ref_ind]["r"][1]) / 2, \
-                          (montage.dig[ch_ind]["r"][2] + montage.dig[ref_ind]["r"][2]) / 2,
-                montage.dig[ch_ind]["r"] = np.array([x, y, z])
-                # Adding the montage back:
-                raw.set_montage(montage, on_missing="warn")
+    # Compile the mapping into a sparse matrix, applied to the data in chunks of samples. The product only reads the data
+    # before they are referenced, so the references are always the original data:
+    ref_matrix = laplace_reference_matrix(reference_mapping, raw.ch_names)
+    ref_picks = [raw.ch_names.index(ch) for ch in reference_mapping.keys()]
+    # Using _data instead of get_data, because that enables modifying data in place:
+    data = raw._data
+    for start in range(0, data.shape[-1], chunk_size):
+        data[ref_picks, start:start + chunk_size] = ref_matrix @ data[:, start:start + chunk_size]
+
+    # Relocating the channels with only one reference to the middle between the channel and its reference:
+    if relocate_edges:
+        edge_channels = [ch for ch in reference_mapping.keys()
+                         if (reference_mapping[ch]["ref_1"] is None) ^ (reference_mapping[ch]["ref_2"] is None)]
+        if len(edge_channels) > 0:
+            print("Relocating channels " + ", ".join(edge_channels))
+            montage = raw.get_montage()
+            # Get the indices of the channels and of their single reference:
+            ch_inds = [montage.ch_names.index(ch) for ch in edge_channels]
+            ref_inds = [montage.ch_names.index(reference_mapping[ch]["ref_1"]
+                                               if reference_mapping[ch]["ref_1"] is not None
+                                               else reference_mapping[ch]["ref_2"]) for ch in edge_channels]
+            # Compute the centers from the original positions, before changing any:
+            centers = (np.array([montage.dig[ind]["r"] for ind in ch_inds]) +
+                       np.array([montage.dig[ind]["r"] for ind in ref_inds])) / 2
+            for ind, center in zip(ch_inds, centers):
+                montage.dig[ind]["r"] = center
+            # Adding the montage back:
+            raw.set_montage(montage, on_missing="warn")
 
     # Projecting the ecog channels to the surface if they were relocated:
     if relocate_edges:
@@ -131,6 +131,23 @@ class TestAutomatedBadChannelDetection(unittest.TestCase):
                                                                      channel_types={"seeg": True},
                                                                      reject_bad_channels=False)
 
+    def test_activation_based_simulated(self):
+        """
+        A channel with large transients in many segments should be detected, whatever the number of segments loaded
+        at once
+        :return:
+        """
+        sfreq = 500
+        info = create_mne_info(sfreq, 5, ch_types="ecog")
+        data = np.random.default_rng(0).normal(size=(10, sfreq * 60)) * 10 ** -5
+        data[2, ::sfreq // 2] += 10 ** -3
+        raw = mne.io.RawArray(data, info, verbose=False)
+        for block_size in [1, 7, 60]:
+            raw, detected_bad_channels = automated_bad_channel_detection(raw, method="activation_based",
+                                                                         channel_types={"ecog": True},
+                                                                         block_size=block_size)
+            self.assertEqual(detected_bad_channels, ["ECOG3"])
+
 
 class TestCustomCar(unittest.TestCase):
 
@@ -439,6 +456,50 @@ class TestLaplaceReference(unittest.TestCase):
         observed_data = raw.get_data(picks=[ch for ch in raw.ch_names if ch not in raw.info["bads"]])
         self.assertTrue(np.array_equal(observed_data, ref_data, equal_nan=True))
 
+    def test_laplace_reference_matrix(self):
+        # The sparse matrix product should give the same as the laplace_ref_fun, including for the edges:
+        data = np.random.default_rng(0).normal(size=(5, 1000))
+        ch_names = ['G1', 'G2', 'G3', 'G4', 'G5']
+        ref_matrix = laplace_reference_matrix(self.reference_mapping, ch_names)
+        nan_mat = np.full(data.shape[1], np.nan)
+        for row, ch in enumerate(self.reference_mapping.keys()):
+            refs = [data[ch_names.index(self.reference_mapping[ch][ref])]
+                    if self.reference_mapping[ch][ref] is not None else nan_mat for ref in ["ref_1", "ref_2"]]
+            expected_output = laplace_ref_fun(data[ch_names.index(ch)], ref_1=refs[0], ref_2=refs[1])
+            np.testing.assert_allclose(ref_matrix[row] @ data, expected_output[np.newaxis], atol=1e-12)
+
+
+class TestFrequencyBandsComputations(unittest.TestCase):
+
+    def test_filter_bank_vs_mne(self):
+        """
+        The envelope of the filter bank should be the same as filtering and applying the hilbert in mne, except at the
+        edges
+        :return:
+        """
+        sfreq = 512
+        info = create_mne_info(sfreq, 3)
+        info['bads'] = []
+        raw = mne.io.RawArray(np.random.default_rng(0).normal(size=(9, sfreq * 30)), info, verbose=False)
+        # Computing the envelope of each band with mne:
+        bands_amp = []
+        for freq in range(70, 150, 10):
+            bands_amp.append(raw.copy().filter(freq, freq + 10, verbose=False).apply_hilbert(envelope=True).get_data())
+        bands_amp = np.array(bands_amp)
+        # The edge effects of the hilbert transform of mne decay slowly, hence the tolerance (the envelopes are ~0.4):
+        ref_data = np.mean(bands_amp, axis=0)
+        observed_data = frequency_bands_computations(raw, frequency_range=[70, 150], bands_width=10,
+                                                     channel_types={"seeg": True, "ecog": True},
+                                                     do_baseline_normalization=False).get_data()
+        np.testing.assert_allclose(observed_data[:, sfreq:-sfreq], ref_data[:, sfreq:-sfreq], atol=1e-3)
+        # With the normalization, the edges also affect the mean of each band:
+        ref_data = np.mean(bands_amp / bands_amp.mean(axis=-1, keepdims=True), axis=0)
+        for chunk_size in [1, 4, 16]:
+            observed_data = frequency_bands_computations(raw, frequency_range=[70, 150], bands_width=10,
+                                                         channel_types={"seeg": True, "ecog": True},
+                                                         chunk_size=chunk_size).get_data()
+            np.testing.assert_allclose(observed_data[:, sfreq:-sfreq], ref_data[:, sfreq:-sfreq], atol=2e-3)
+
 
 if __name__ == '__main__':
     unittest.main()
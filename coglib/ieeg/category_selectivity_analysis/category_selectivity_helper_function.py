@@ -9,12 +9,12 @@ This script contains all helper functions to the category selectivity script
 
 import numpy as np
 import pandas as pd
-from joblib import Parallel, delayed
-from scipy.stats import ttest_ind, ranksums
 from mne.stats.cluster_level import _pval_from_histogram
 
 from general_helper_functions.data_general_utilities import (compute_dependent_variable,
                                                              load_epochs)
+from general_helper_functions.batch_stats import (pivot_trials, ranksums_batch, ttest_ind_batch,
+                                                  fdr_correction as correct_pvalues)
 
 
 def compute_d_prime(data, labels, condition):
@@ -46,11 +46,42 @@ def compute_d_prime(data, labels, condition):
     return d_prime
 
 
+def batch_d_prime(data, label_codes, n_categories, chunk_size=256):
+    """
+    This function computes the d primes of each category (see compute_d_prime) for several channels and several labels
+    orders at once. The labels are one-hot encoded, such that the mean and variance of each category in each channel
+    and labels order are obtained with matrix products
+    :param data: (2D numpy array) single trial observations, channels * trials
+    :param label_codes: (2D numpy array of int) category index of each trial, for each labels order (for instance the
+    observed labels and their permutations), orders * trials
+    :param n_categories: (int) number of categories
+    :param chunk_size: (int) number of labels orders processed at once
+    :return:
+    d_prime: (3D numpy array) d prime of each category, orders * channels * categories
+    """
+    # Centering each channel, for the variances to be computed accurately from the sums of squares:
+    data = data - np.mean(data, axis=1, keepdims=True)
+    d_primes = []
+    # The orders are processed in chunks, to bound the size of the one-hot arrays:
+    for start in range(0, label_codes.shape[0], chunk_size):
+        one_hot = (label_codes[start:start + chunk_size, :, np.newaxis] == np.arange(n_categories)).astype(float)
+        counts = np.sum(one_hot, axis=1)[:, np.newaxis, :]
+        means = (data @ one_hot) / counts
+        variances = ((data ** 2) @ one_hot) / counts - means ** 2
+        # Mean and variance of the other categories, averaged across them:
+        mean_i = (np.sum(means, axis=-1, keepdims=True) - means) / (n_categories - 1)
+        var_i = (np.sum(variances, axis=-1, keepdims=True) - variances) / (n_categories - 1)
+        d_primes.append((means - mean_i) / np.sqrt(0.5 * (variances + var_i)))
+    return np.concatenate(d_primes, axis=0)
+
+
 def dprime_test(data_df, groups="channel", n_perm=1024, tail=0, p_val=0.05, n_jobs=1):
     """
     This function determines selectivity using the method described here:
     https://journals.plos.org/plosone/article?id=10.1371/journal.pone.0157109
-    Dprimes are computed for each category and compared to a null distribution generated by shuffling the labels n times
+    Dprimes are computed for each category and compared to a null distribution generated by shuffling the labels n times.
+    The channels of a given subject that share the same trials are tested together, with the same label permutations
+    for all of them and all categories
     :param data_df: (pandas data frame) contains the data to be tested. The dataframe should have a column called
     value containing the values to compare, a column called condition containing a string describing to which condition
     a given value belongs. Furthermore, the dataframe should have a column named
@@ -62,57 +93,67 @@ def dprime_test(data_df, groups="channel", n_perm=1024, tail=0, p_val=0.05, n_jo
     :param n_perm: (int) number of permutations to use
     :param tail: (-1, 0 or 1) tail of the test
     :param p_val: (float) pvalue threshold to consider something significant
-    :param n_jobs: (int) how many jobs to use. Relevant as we have permutations
+    :param n_jobs: (int) not used anymore, the permutations are computed in a single batch
     :return:
     pandas data frame: contains the results of the dprime test
     """
     print("=" * 40)
     print("Welcome to dprime_test")
-    # Table for results:
-    results_df = pd.DataFrame()
-    # Looping through each group:
+    # Gather the groups sharing the same labels, to test them in one batch:
+    batches = {}
     for group in data_df[groups].unique():
-        print("Compute {} dprime_test".format(group))
-        # Extract the data of this group:
-        group_data = data_df.loc[data_df[groups] == group]
         # Extract the relevant info:
-        data = group_data["value"].to_numpy()
+        group_data = data_df.loc[data_df[groups] == group]
         labels = group_data["condition"].to_numpy()
+        key = (group.split("-")[0], tuple(labels))
+        batches.setdefault(key, {"labels": labels, "groups": [], "data": []})
+        batches[key]["groups"].append(group)
+        batches[key]["data"].append(group_data["value"].to_numpy())
+
+    results = {}
+    for batch in batches.values():
+        print("Compute {} dprime_test".format(batch["groups"]))
         # Get the unique categories:
-        categories = np.unique(labels)
-        # Compute the observed d primes:
-        for cate in categories:
-            obs_dprime = compute_d_prime(data, labels, cate)
-            # Compute the null distribution, shuffling the labels n times:
-            null = Parallel(n_jobs=n_jobs)(delayed(compute_d_prime)(
-                data, labels[np.random.permutation(len(labels))], cate)
-                                           for i in range(n_perm))
-            # Append the observed value to the null to ground it:
-            null.append(obs_dprime)
-            # Generate the p value:
-            pvalue = _pval_from_histogram(np.array([obs_dprime]), np.array(null), tail=tail)
-            if pvalue < p_val:
-                reject = True
-            else:
-                reject = False
-            # Add to the results data frame:
-            results_df = results_df.append(pd.DataFrame({
-                "subject": group.split("-")[0],
-                "channel": group,
-                "metric": None,
-                "reject": reject,
-                "condition": cate,
-                "stat": obs_dprime,
-                "pval": pvalue,
-                "effect_strength": obs_dprime
-            }, index=[0]))
+        categories, codes = np.unique(batch["labels"], return_inverse=True)
+        # The observed labels followed by the permutations:
+        label_codes = np.stack([codes] + [codes[np.random.permutation(len(codes))] for _ in range(n_perm)])
+        d_primes = batch_d_prime(np.array(batch["data"]), label_codes, len(categories))
+        for ch_ind, group in enumerate(batch["groups"]):
+            results[group] = []
+            for cate_ind, cate in enumerate(categories):
+                obs_dprime = d_primes[0, ch_ind, cate_ind]
+                # The null distribution, with the observed value appended to ground it:
+                null = np.append(d_primes[1:, ch_ind, cate_ind], obs_dprime)
+                # Generate the p value:
+                pvalue = _pval_from_histogram(np.array([obs_dprime]), null, tail=tail)[0]
+                if pvalue < p_val:
+                    reject = True
+                else:
+                    reject = False
+                results[group].append({
+                    "subject": group.split("-")[0],
+                    "channel": group,
+                    "metric": None,
+                    "reject": reject,
+                    "condition": cate,
+                    "stat": obs_dprime,
+                    "pval": pvalue,
+                    "effect_strength": obs_dprime
+                })
+    # Table for results, in the order of the groups:
+    results = [row for group in data_df[groups].unique() for row in results[group]]
+    results_df = pd.DataFrame(results, index=[0] * len(results))
 
     return results_df
 
 
-def highest_vs_second(data_df, groups="channel", test="wilcoxon", p_val=0.05):
+def highest_condition_test(data_df, groups="channel", test="wilcoxon", p_val=0.05, versus="second",
+                           fdr_correction=None):
     """
-    This function compares activation of the highest condition vs the second highest condition.
+    This function compares the activation of the highest condition (average) vs the second highest condition or vs all
+    other conditions, for all groups at once. The data are pivoted into an array of groups * trials * conditions, from
+    which the condition averages, the d primes and the rank sum or t-tests of all groups are computed in vectorized
+    form.
     :param data_df: (pandas data frame) contains the data to be tested. The dataframe should have a column called
     value containing the values to compare, a column called condition containing a string describing to which condition
     a given value belongs. Furthermore, the dataframe should have a column named
@@ -124,59 +165,69 @@ def highest_vs_second(data_df, groups="channel", test="wilcoxon", p_val=0.05):
     :param test: (string) name of the test. Shouuld be either "t_test" or "wilcoxon", other tests are not supported as
     of now.
     :param p_val: (float) p value threshold to consider something significant.
+    :param versus: (string) "second" to compare the highest condition to the second highest, "all" to compare it to
+    all other conditions
+    :param fdr_correction: (string or None) method of the multiple comparisons correction across groups, performed
+    separately for each preferred condition (see statsmodels multipletests). The uncorrected p-values and decisions are
+    stored in the orig_pval and orig_reject columns
     :return:
     pandas df: contains the results of the test
     """
-    # Looping through each group:
-    results_df = pd.DataFrame()
-    for group in data_df[groups].unique():
-        # Extract the data of this group:
-        group_data = data_df.loc[data_df[groups] == group]
-        # Find the highest condition (average):
-        cond_avg = {}
-        for cond in group_data["condition"].unique():
-            cond_avg[cond] = np.mean(group_data.loc[group_data["condition"] == cond, "value"].to_list())
-        # Find which is the max:
-        max_cond = [cond for cond in cond_avg if cond_avg[cond] == max([cond_avg[key] for key in cond_avg])][0]
-        # Get the values of the one condition:
-        max_cond_val = group_data.loc[group_data["condition"] == max_cond, "value"].to_list()
-        # Get the values of the second max condition other conditions:
-        other_cond = [cond for cond in list(group_data["condition"].unique()) if cond != max_cond]
-        second_cond = [cond for cond in other_cond if cond_avg[cond] == max([cond_avg[key] for key in other_cond])][0]
-        second_cond_values = group_data.loc[group_data["condition"] == second_cond, "value"].to_list()
-        # perform the test:
-        if test == "wilcoxon":
-            statistic, pvalue = ranksums(max_cond_val, second_cond_values, alternative="greater")
-        elif test.lower() == "t-test" or test.lower() == "t_test" or test.lower() == "t test":
-            statistic, pvalue = ttest_ind(max_cond_val, second_cond_values, alternative="greater")
-        else:
-            raise Exception("You have passed a test that is not supported!")
+    values, group_names, conditions = pivot_trials(data_df, groups=groups)
+    n_trials = np.sum(~np.isnan(values), axis=1)
+    present = n_trials > 0
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cond_avg = np.where(present, np.nansum(values, axis=1) / n_trials, -np.inf)
+        cond_var = np.nansum((values - cond_avg[:, np.newaxis, :]) ** 2, axis=1) / n_trials
+    # Find the max condition and the second max condition:
+    max_ind = np.argmax(cond_avg, axis=1)
+    is_max = np.arange(len(conditions))[np.newaxis, :] == max_ind[:, np.newaxis]
+    others = present & ~is_max
+    second_ind = np.argmax(np.where(others, cond_avg, -np.inf), axis=1)
+    rows = np.arange(len(group_names))
+    max_cond_val = values[rows, :, max_ind]
+    if versus == "second":
+        other_cond_values = values[rows, :, second_ind]
+    elif versus == "all":
+        other_cond_values = np.where(others[:, np.newaxis, :], values, np.nan).reshape(len(group_names), -1)
+    else:
+        raise Exception("The highest condition can only be compared to the second or to all other conditions!")
+    # perform the test:
+    if test == "wilcoxon":
+        statistic, pvalue = ranksums_batch(max_cond_val, other_cond_values, alternative="greater")
+    elif test.lower() == "t-test" or test.lower() == "t_test" or test.lower() == "t test":
+        statistic, pvalue = ttest_ind_batch(max_cond_val, other_cond_values, alternative="greater")
+    else:
+        raise Exception("You have passed a test that is not supported!")
+    # Compute the dprime of the max condition relative to all others (see compute_d_prime):
+    n_others = np.sum(others, axis=1)
+    mean_i = np.sum(np.where(others, cond_avg, 0), axis=1) / n_others
+    var_i = np.sum(np.where(others, cond_var, 0), axis=1) / n_others
+    dprime = (cond_avg[rows, max_ind] - mean_i) / np.sqrt(0.5 * (cond_var[rows, max_ind] + var_i))
 
-        # Now computing the d':
-        if pvalue < p_val:
-            reject = True
-        else:
-            reject = False
-        # Compute the dprime:
-        dprime = compute_d_prime(group_data["value"].to_numpy(), group_data["condition"].to_numpy(), max_cond)
-        fav_cond = max_cond
-
-        results_df = results_df.append(pd.DataFrame({
-            "subject": group.split("-")[0],
-            "channel": group,
-            "metric": None,
-            "reject": reject,
-            "condition": fav_cond,
-            "stat": statistic,
-            "pval": pvalue,
-            "effect_strength": dprime
-        }, index=[0]))
-    return results_df.reset_index(drop=True)
+    results_df = pd.DataFrame({
+        "subject": [group.split("-")[0] for group in group_names],
+        "channel": group_names,
+        "metric": None,
+        "reject": pvalue < p_val,
+        "condition": conditions[max_ind],
+        "stat": statistic,
+        "pval": pvalue,
+        "effect_strength": dprime
+    })
+    # Perform FDR separately for each category if required:
+    if fdr_correction is not None:
+        results_df["orig_pval"] = results_df["pval"]
+        results_df["orig_reject"] = results_df["reject"]
+        results_df["reject"], results_df["pval"] = correct_pvalues(results_df["pval"], alpha=p_val,
+                                                                   method=fdr_correction,
+                                                                   groups=results_df["condition"])
+    return results_df
 
 
-def highest_vs_all(data_df, groups="channel", test="wilcoxon", p_val=0.05):
+def highest_vs_second(data_df, groups="channel", test="wilcoxon", p_val=0.05, fdr_correction=None):
     """
-    This function compares activation to the highest vs all other conditions.
+    This function compares activation of the highest condition vs the second highest condition.
     :param data_df: (pandas data frame) contains the data to be tested. The dataframe should have a column called
     value containing the values to compare, a column called condition containing a string describing to which condition
     a given value belongs. Furthermore, the dataframe should have a column named
@@ -188,53 +239,38 @@ def highest_vs_all(data_df, groups="channel", test="wilcoxon", p_val=0.05):
     :param test: (string) name of the test. Shouuld be either "t_test" or "wilcoxon", other tests are not supported as
     of now.
     :param p_val: (float) p value threshold to consider something significant.
+    :param fdr_correction: (string or None) method of the multiple comparisons correction across groups, performed
+    separately for each preferred condition (see statsmodels multipletests). The uncorrected p-values and decisions are
+    stored in the orig_pval and orig_reject columns
     :return:
     pandas df: contains the results of the test
     """
-    # Looping through each group:
-    results_df = pd.DataFrame()
-    for group in data_df[groups].unique():
-        # Extract the data of this group:
-        group_data = data_df.loc[data_df[groups] == group]
-        # Find the highest condition (average):
-        cond_avg = {}
-        for cond in group_data["condition"].unique():
-            cond_avg[cond] = np.mean(group_data.loc[group_data["condition"] == cond, "value"].to_list())
-        # Find which is the max:
-        max_cond = [cond for cond in cond_avg if cond_avg[cond] == max([cond_avg[key] for key in cond_avg])][0]
-        # Get the values of the one condition:
-        max_cond_val = group_data.loc[group_data["condition"] == max_cond, "value"].to_list()
-        # Get the values of all other conditions:
-        other_cond = [cond for cond in list(group_data["condition"].unique()) if cond != max_cond]
-        other_cond_values = group_data.loc[group_data["condition"].isin(other_cond), "value"].to_list()
-        # perform the test:
-        if test == "wilcoxon":
-            statistic, pvalue = ranksums(max_cond_val, other_cond_values, alternative="greater")
-        elif test.lower() == "t-test" or test.lower() == "t_test" or test.lower() == "t test":
-            statistic, pvalue = ttest_ind(max_cond_val, other_cond_values, alternative="greater")
-        else:
-            raise Exception("You have passed a test that is not supported!")
+    return highest_condition_test(data_df, groups=groups, test=test, p_val=p_val, versus="second",
+                                  fdr_correction=fdr_correction)
 
-        # Set whether we reject or not:
-        if pvalue < p_val:
-            reject = True
-        else:
-            reject = False
-        # Compute the dprime:
-        dprime = compute_d_prime(group_data["value"].to_numpy(), group_data["condition"].to_numpy(), max_cond)
-        fav_cond = max_cond
 
-        results_df = results_df.append(pd.DataFrame({
-            "subject": group.split("-")[0],
-            "channel": group,
-            "metric": None,
-            "reject": reject,
-            "condition": fav_cond,
-            "stat": statistic,
-            "pval": pvalue,
-            "effect_strength": dprime
-        }, index=[0]))
-    return results_df.reset_index(drop=True)
+def highest_vs_all(data_df, groups="channel", test="wilcoxon", p_val=0.05, fdr_correction=None):
+    """
+    This function compares activation to the highest vs all other conditions.
+    :param data_df: (pandas data frame) contains the data to be tested. The dataframe should have a column called
+    value containing the values to compare, a column called condition containing a string describing to which condition
+    a given value belongs. Furthermore, the dataframe should have a column named
+    whatever you like specified by the variable "groups" that contain a string describing to which group a set of values
+    belong to which a separate test should be performed. Practically, if you want to test baseline vs onset period
+    for  every electrode, the group can be "channels" to perform a test for each channel.
+    :param groups: (string) column name from the data_df containing the group to which the test should be fitted
+    separately.
+    :param test: (string) name of the test. Shouuld be either "t_test" or "wilcoxon", other tests are not supported as
+    of now.
+    :param p_val: (float) p value threshold to consider something significant.
+    :param fdr_correction: (string or None) method of the multiple comparisons correction across groups, performed
+    separately for each preferred condition (see statsmodels multipletests). The uncorrected p-values and decisions are
+    stored in the orig_pval and orig_reject columns
+    :return:
+    pandas df: contains the results of the test
+    """
+    return highest_condition_test(data_df, groups=groups, test=test, p_val=p_val, versus="all",
+                                  fdr_correction=fdr_correction)
 
 
 def prepare_test_data(root, signal, baseline_method, test_window, metric, cond_to_compare,
@@ -11,11 +11,10 @@ import argparse
 from pathlib import Path
 from joblib import Parallel, delayed
 
-from statsmodels.stats.multitest import multipletests
-
 from category_selectivity_analysis.category_selectivity_helper_function import *
 
 from general_helper_functions.pathHelperFunctions import find_files, path_generator, get_subjects_list
+from general_helper_functions.batch_stats import fdr_correction
 from category_selectivity_analysis.category_selectivity_parameters_class import CategorySelectivityAnalysisParameters
 from category_selectivity_analysis.plot_category_selectivity_results import plot_category_selectivity
 import warnings
@@ -118,10 +117,12 @@ def category_selectivity_master(subjects_list, save_folder="super"):
             # Perform the test:
             if analysis_parameters["test"] == "highest_vs_all":
                 results = highest_vs_all(data, groups="channel", test=analysis_parameters["stats_fun"],
-                                         p_val=analysis_parameters["p_val"])
+                                         p_val=analysis_parameters["p_val"],
+                                         fdr_correction=analysis_parameters["fdr_correction"])
             elif analysis_parameters["test"] == "highest_vs_second":
                 results = highest_vs_second(data, groups="channel", test=analysis_parameters["stats_fun"],
-                                            p_val=analysis_parameters["p_val"])
+                                            p_val=analysis_parameters["p_val"],
+                                            fdr_correction=analysis_parameters["fdr_correction"])
             elif analysis_parameters["test"] == "dprime_test":
                 results = dprime_test(data, groups="channel", n_perm=analysis_parameters["dprime_param"]["n_perm"],
                                       tail=analysis_parameters["dprime_param"]["tail"],
@@ -129,24 +130,15 @@ def category_selectivity_master(subjects_list, save_folder="super"):
             else:
                 raise Exception("You have passed a test that is not supported!")
 
-            # Perform FDR if required:
-            if analysis_parameters["fdr_correction"] is not None:
+            # Perform FDR if required (the highest vs second and highest vs all tests correct their p-values already):
+            if analysis_parameters["fdr_correction"] is not None and analysis_parameters["test"] == "dprime_test":
                 # Store the initial p_values:
                 results["orig_pval"] = results["pval"]
                 results["orig_reject"] = results["reject"]
                 # Perform FDR separately for each category:
-                results_fdr = pd.DataFrame()
-                for cond in list(results["condition"].unique()):
-                    # Extract the results of that  one condition:
-                    cond_results = results.loc[results["condition"] == cond]
-                    # Perform FDR:
-                    cond_results["reject"], cond_results["pval"], _, _ = \
-                        multipletests(cond_results["pval"], alpha=analysis_parameters["p_val"],
-                                      method=analysis_parameters["fdr_correction"])
-                    # Append to the data frame:
-                    results_fdr = results_fdr.append(cond_results, ignore_index=True)
-                # We can now overwrite the original results:
-                results = results_fdr
+                results["reject"], results["pval"] = \
+                    fdr_correction(results["pval"], alpha=analysis_parameters["p_val"],
+                                   method=analysis_parameters["fdr_correction"], groups=results["condition"])
 
             # The dprime test has the particularity of testing each category as opposed to only 1. This requires
             # special handling:
@@ -20,6 +20,7 @@ from general_helper_functions.pathHelperFunctions import find_files
 import mne
 
 from general_helper_functions.data_general_utilities import stack_evoked, mean_confidence_interval, load_epochs
+from general_helper_functions.spatial_index import get_montage_volume_labels
 
 import matplotlib.pyplot as plt
 
@@ -140,9 +141,8 @@ def plot_category_selectivity(configs, save_folder="super"):
             channels_labels = pd.DataFrame()
             for subject in epochs.keys():
                 # Get the labels of these channels:
-                labels, _ = mne.get_montage_volume_labels(
-                    epochs[subject].get_montage(), "sub-" + subject,
-                    subjects_dir=Path(param.BIDS_root, "derivatives", "fs"), aseg=param.aseg)
+                labels = get_montage_volume_labels(epochs[subject].get_montage(), "sub-" + subject,
+                                                   Path(param.BIDS_root, "derivatives", "fs"), aseg=param.aseg)
                 # Convert the labels to a dataframe:
                 subjects_label_df = pd.DataFrame()
                 for ind, channel in enumerate(labels.keys()):
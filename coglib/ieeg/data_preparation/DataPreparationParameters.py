@@ -33,6 +33,8 @@ class DataPreparationParameters:
         self.data_type = params['data_type']
         # Refresh rate of the screen:
         self.ref_rate_ms = params['ref_rate_ms']
+        # Maximal distance between the photodiode and log events to be matched:
+        self.alignment_tolerance_sec = params['alignment_tolerance_sec']
         self.line_freq = params['line_freq']
 
         # ---------------------------------------------------------------------
@@ -40,6 +42,8 @@ class DataPreparationParameters:
         self.HPC = params['HPC']
         self.debug = params['debug']
         self.show_check_plots = params['show_check_plots']
+        # Whether the user is prompted, or the data are processed headless:
+        self.interactive = params['interactive']
         self.save_output = False
 
     def save(self, file_path, file_prefix):
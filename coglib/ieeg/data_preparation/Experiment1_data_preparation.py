@@ -268,11 +268,8 @@ def load_logs(root_path, file_naming_pattern, file_extension=None):
     # Make sure they are in order:
     filesList.sort()
 
-    # Preparing to load the logs:
-    full_logs = pd.DataFrame()
-    # Looping through file list to load the logs:
-    for files in filesList:
-        full_logs = full_logs.append(pd.read_csv(files))
+    # Loading the logs:
+    full_logs = pd.concat([pd.read_csv(files) for files in filesList])
 
     full_logs = handle_duplicates(full_logs)
 
@@ -6,9 +6,9 @@ from collections import OrderedDict
 import pandas as pd
 import mne
 from mne.datasets import fetch_fsaverage
-from nibabel.freesurfer.io import read_geometry
 from mne_bids import (write_raw_bids, BIDSPath)
 from general_helper_functions.pathHelperFunctions import find_files
+from general_helper_functions.spatial_index import nearest_surface_vertices
 
 
 def channels_desc_validator(channels_desc_file, raw):
@@ -222,18 +222,13 @@ def project_elec_to_surf(raw, subjects_dir, subject, montage_space="T1"):
     If MNI, will be done to fsaverage surface.
     :return:
     """
-    # Loading the left and right pial surfaces:
-    if montage_space == "T1":
-        left_surf = read_geometry(Path(subjects_dir, subject, "surf", "lh.pial"))
-        right_surf = read_geometry(Path(subjects_dir, subject, "surf", "rh.pial"))
-    elif montage_space == "MNI":
+    # Get the surface to project to:
+    if montage_space == "MNI":
         sample_path = mne.datasets.sample.data_path()
         subjects_dir = Path(sample_path, 'subjects')
         fetch_fsaverage(subjects_dir=subjects_dir, verbose=True)  # Downloading the data if needed
         subject = "fsaverage"
-        left_surf = read_geometry(Path(subjects_dir, subject, "surf", "lh.pial"))
-        right_surf = read_geometry(Path(subjects_dir, subject, "surf", "rh.pial"))
-    else:
+    elif montage_space != "T1":
         raise Exception("You have passed a montage space that is not supported! Either MNI or T1!")
 
     # Getting the surface electrodes:
@@ -241,39 +236,16 @@ def project_elec_to_surf(raw, subjects_dir, subject, montage_space="T1"):
     ecog_channels = [raw.ch_names[pick] for pick in ecog_picks]
     # Get the montage:
     montage = raw.get_montage()
-    # Looping through each of these channels:
-    for channel in ecog_channels:
-        # Get the channel index
-        ch_ind = montage.ch_names.index(channel)
-        # Get the channel coordinates:
-        ch_coord = montage.dig[ch_ind]["r"]
-        # Checking if the coordinates are NAN:
-        if math.isnan(ch_coord[0]):
+    # Get the channels coordinates, in mm like the surface:
+    ch_inds = [montage.ch_names.index(channel) for channel in ecog_channels]
+    ch_coords = np.array([montage.dig[ch_ind]["r"] for ch_ind in ch_inds]) * 1000
+    # Find the nearest vertex of all channels at once:
+    vertices_coords, _, _ = nearest_surface_vertices(ch_coords, subjects_dir, subject, surf="pial")
+    for ch_ind, vertex_coords in zip(ch_inds, vertices_coords):
+        # Channels with NAN coordinates are left as is:
+        if math.isnan(vertex_coords[0]):
             continue
-        if ch_coord[0] < 0:
-            # Compute x y and z distances to each vertex in the surface:
-            b_x = np.absolute(left_surf[0][:, 0] - ch_coord[0] * 1000)
-            b_y = np.absolute(left_surf[0][:, 1] - ch_coord[1] * 1000)
-            b_z = np.absolute(left_surf[0][:, 2] - ch_coord[2] * 1000)
-            # Find the shortest distance:
-            d = np.sqrt(np.sum([np.square(b_x), np.square(b_y), np.square(b_z)], axis=0))
-            # Get the index of the smallest one:
-            min_vert_ind = np.argmin(d)
-            montage.dig[ch_ind]["r"] = np.squeeze(np.array(
-                [left_surf[0][min_vert_ind, 0] * 0.001, left_surf[0][min_vert_ind, 1] * 0.001,
-                 left_surf[0][min_vert_ind, 2] * 0.001]))
-        else:
-            # Compute x y and z distances to each vertex in the surface:
-            b_x = np.absolute(right_surf[0][:, 0] - ch_coord[0] * 1000)
-            b_y = np.absolute(right_surf[0][:, 1] - ch_coord[1] * 1000)
-            b_z = np.absolute(right_surf[0][:, 2] - ch_coord[2] * 1000)
-            # Find the shortest distance:
-            d = np.sqrt(np.sum([np.square(b_x), np.square(b_y), np.square(b_z)], axis=0))
-            # Get the index of the smallest one:
-            min_vert_ind = np.argmin(d)
-            montage.dig[ch_ind]["r"] = np.squeeze(np.array(
-                [right_surf[0][min_vert_ind, 0] * 0.001, right_surf[0][min_vert_ind, 1] * 0.001,
-                 right_surf[0][min_vert_ind, 2] * 0.001]))
+        montage.dig[ch_ind]["r"] = vertex_coords * 0.001
     # Adding the montage back to the raw object:
     raw.set_montage(montage, on_missing="warn")
 
@@ -0,0 +1,142 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal, assert_allclose
+from data_preparation.trigger_alignment import (debounce_onsets, classify_pd_onsets, align_pd_to_logs,
+                                                reconstruct_pd_onsets)
+
+
+def loop_classify_pd_onsets(pd_onsets_time, ref_rate_sec):
+    # Sequential parsing of the successive triggers, as previously done in clean_pd_onsets:
+    pd_onsets_diff = np.diff(pd_onsets_time)
+
+    def is_close(i):
+        return (pd_onsets_diff[i] <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & \
+            (pd_onsets_diff[i] >= ref_rate_sec * 3 - 0.5 * ref_rate_sec)
+
+    block_onsets_sample_nrs, block_offsets_sample_nrs, experiment_start_or_end_sample_nrs = [], [], []
+    i = 0
+    while i < len(pd_onsets_diff) - 2:
+        if is_close(i):
+            if is_close(i + 1):
+                if is_close(i + 2):
+                    block_onsets_sample_nrs.extend(range(i, i + 4))
+                    i += 3
+                else:
+                    experiment_start_or_end_sample_nrs.extend(range(i, i + 3))
+                    i += 2
+            else:
+                block_offsets_sample_nrs.extend(range(i, i + 2))
+                i += 1
+        i += 1
+    if len(experiment_start_or_end_sample_nrs) < 6 and is_close(-1) & is_close(-2):
+        experiment_start_or_end_sample_nrs.extend([-3, -2, -1])
+    return block_onsets_sample_nrs, block_offsets_sample_nrs, experiment_start_or_end_sample_nrs
+
+
+class TestPhotodiodeOnsets(unittest.TestCase):
+
+    def test_debounce_chatter(self):
+        # Photodiode flashes of 50 samples, the first and last ones crossing the threshold several times:
+        signal = np.zeros(1000)
+        for onset in [100, 400, 700]:
+            signal[onset:onset + 50] = 1
+        signal[[103, 105, 106, 747]] = 0
+        onsets_ind = np.where(np.diff((signal > 0.5).astype(int)) == 1)[0]
+        self.assertEqual(len(onsets_ind), 6)
+        assert_array_equal(debounce_onsets(onsets_ind, 75), [99, 399, 699])
+        # Without chatter, nothing is removed:
+        assert_array_equal(debounce_onsets([99, 399, 699], 75), [99, 399, 699])
+        # The interval is computed with respect to the previous detection, whether it was kept or not:
+        assert_array_equal(debounce_onsets([0, 50, 100, 300], 75), [0, 300])
+
+    def test_classify_pd_onsets(self):
+        ref_rate_sec = 1 / 60
+        pd_onsets_time = np.array([0, 0.05, 0.1,  # Experiment start
+                                   1, 1.05, 1.1, 1.15,  # Block onset
+                                   2, 3, 4,  # Trials
+                                   5, 5.05,  # Block offset
+                                   6, 6.05, 6.1, 6.15,  # Block onset
+                                   7, 8,  # Trials
+                                   9, 9.05,  # Block offset
+                                   10, 10.05, 10.1])  # Experiment end
+        block_onsets, block_offsets, experiment_start_or_end = classify_pd_onsets(pd_onsets_time, ref_rate_sec)
+        self.assertEqual(block_onsets, [3, 4, 5, 6, 12, 13, 14, 15])
+        self.assertEqual(block_offsets, [10, 11, 18, 19])
+        self.assertEqual(experiment_start_or_end, [0, 1, 2, -3, -2, -1])
+        # With a dropped trigger, the block onset sequence is taken for an experiment start or end, and the last 3
+        # triggers aren't checked anymore:
+        block_onsets, block_offsets, experiment_start_or_end = \
+            classify_pd_onsets(np.delete(pd_onsets_time, 13), ref_rate_sec)
+        self.assertEqual(block_onsets, [3, 4, 5, 6])
+        self.assertEqual(block_offsets, [10, 11, 17, 18])
+        self.assertEqual(experiment_start_or_end, [0, 1, 2, 12, 13, 14])
+
+    def test_classify_pd_onsets_vs_loop(self):
+        # Random sequences of trials and of 2 to 6 successive triggers, against the previous loop implementation:
+        ref_rate_sec = 1 / 60
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            n_triggers = rng.integers(1, 7, size=30)
+            pd_onsets_time = np.concatenate([i + 0.05 * np.arange(n) for i, n in enumerate(n_triggers)])
+            self.assertEqual(classify_pd_onsets(pd_onsets_time, ref_rate_sec),
+                             loop_classify_pd_onsets(pd_onsets_time, ref_rate_sec))
+
+
+class TestLogAlignment(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.sr = 512
+        self.log_times = np.cumsum(rng.uniform(0.5, 2, size=60))
+        # The photodiode clock starts later and drifts with respect to the log clock:
+        self.clock = (1.0001, 12.3)
+        self.true_pd_times = self.clock[0] * self.log_times + self.clock[1] + rng.uniform(-0.005, 0.005, size=60)
+        # Trigger 10 is dropped and an extra trigger is detected between the log events 30 and 31:
+        self.dropped = 10
+        extra_time = (self.true_pd_times[30] + self.true_pd_times[31]) / 2
+        self.pd_times = np.sort(np.append(np.delete(self.true_pd_times, self.dropped), extra_time))
+        self.extra = int(np.searchsorted(self.pd_times, extra_time))
+
+    def test_align_pd_to_logs(self):
+        alignment, clock = align_pd_to_logs(self.pd_times, self.log_times, tolerance=0.05)
+        assert_allclose(clock, self.clock, rtol=1e-4)
+        self.assertEqual(len(alignment), len(self.log_times) + 1)
+        dropped = alignment.loc[alignment["status"] == "dropped"]
+        assert_array_equal(dropped["log_index"], [self.dropped])
+        self.assertEqual(dropped["pd_index"].iloc[0], -1)
+        extra = alignment.loc[alignment["status"] == "extra"]
+        assert_array_equal(extra["pd_index"], [self.extra])
+        self.assertEqual(extra["log_index"].iloc[0], -1)
+        # Every other log event is matched to its own photodiode event:
+        matched = alignment.loc[alignment["status"] == "matched"]
+        self.assertEqual(len(matched), len(self.log_times) - 1)
+        assert_allclose(matched["pd_time"], self.true_pd_times[matched["log_index"]])
+        self.assertTrue(np.all(np.abs(matched["residual"]) <= 0.01))
+        # The table is sorted in the photodiode timeline, the extra trigger between the log events 30 and 31:
+        assert_array_equal(alignment["log_index"].iloc[29:33], [29, 30, -1, 31])
+
+    def test_clock_offset(self):
+        # A large offset between the clocks and missing triggers at the start of the recording:
+        pd_times = self.pd_times[5:] + 1000
+        alignment, clock = align_pd_to_logs(pd_times, self.log_times, tolerance=0.05)
+        assert_allclose(clock, (self.clock[0], self.clock[1] + 1000), rtol=1e-4)
+        dropped = alignment.loc[alignment["status"] == "dropped", "log_index"]
+        assert_array_equal(dropped, [0, 1, 2, 3, 4, self.dropped])
+
+    def test_reconstruct_pd_onsets(self):
+        alignment, _ = align_pd_to_logs(self.pd_times, self.log_times, tolerance=0.05)
+        pd_onsets_clean = reconstruct_pd_onsets(alignment, self.sr)
+        # One onset per log event, the extra trigger being removed and the dropped one reconstructed:
+        self.assertEqual(len(pd_onsets_clean["Time"]), len(self.log_times))
+        not_dropped = np.arange(len(self.log_times)) != self.dropped
+        assert_allclose(pd_onsets_clean["Time"][not_dropped], self.true_pd_times[not_dropped])
+        # The dropped trigger is placed at the log interval from the previous photodiode event:
+        expected = self.true_pd_times[self.dropped - 1] + self.log_times[self.dropped] - \
+            self.log_times[self.dropped - 1]
+        assert_allclose(pd_onsets_clean["Time"][self.dropped], expected)
+        self.assertLess(np.abs(pd_onsets_clean["Time"][self.dropped] - self.true_pd_times[self.dropped]), 0.02)
+        assert_array_equal(pd_onsets_clean["Sample_num"], np.round(pd_onsets_clean["Time"] * self.sr).astype(int))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@
 import os
 from pathlib import Path
 import numpy as np
+import pandas as pd
+from scipy.signal import correlate
 import matplotlib.pyplot as plt
 from matplotlib.widgets import RectangleSelector
 import mne
@@ -38,7 +40,8 @@ def detect_triggers(data_preparation_parameters, subject_info, raw):
         })
 
     # Clean trigger signal from calibration or other trigger noise
-    pd_signal_no_noise = clean_pd_signal_from_noise(pd_signal, subject_info)
+    pd_signal_no_noise = clean_pd_signal_from_noise(pd_signal, subject_info,
+                                                    interactive=data_preparation_parameters.interactive)
     pd_signal = pd_signal_no_noise
 
     # Get sampling rate
@@ -54,13 +57,15 @@ def detect_triggers(data_preparation_parameters, subject_info, raw):
     return pd_onsets, pd_onsets_clean, pd_signal, srate, raw
 
 
-def clean_pd_signal_from_noise(pd_signal, subject_info):
+def clean_pd_signal_from_noise(pd_signal, subject_info, interactive=True):
     """
     Cleaning the pd signal from the calibration screen light and other signal noise.
     When using Eyelink tracker, during the calibration, the background turns gray, and therefore the PD signal needs
     to be adjusted,
     :param: pd_signal: (Dictionary of np arrays) The raw photodiode signal and timestamps.
     :param: subject_info: (class subjectInfo) custom object containing information about the subject
+    :param: interactive: (bool) whether to ask the user for additional intervals to clean. If false, only the intervals
+    stored in the subject info are cleaned
     :return pd_signal: (Dictionary of np arrays) photodiode signal with removed noisy chunks
     """
 
@@ -70,8 +75,11 @@ def clean_pd_signal_from_noise(pd_signal, subject_info):
         for ind_start_noise, ind_end_noise in zip(subject_info.start_inds_trigger_noise,
                                                   subject_info.end_inds_trigger_noise):
             # Set the signal to "zero":
-            pd_signal['Amp'][0][ind_start_noise:ind_end_noise] = [(pd_signal['Amp'][0]).min()] * (
-                    ind_end_noise - ind_start_noise)
+            pd_signal['Amp'][0][ind_start_noise:ind_end_noise] = (pd_signal['Amp'][0]).min()
+
+    # In headless mode, only the stored intervals are used:
+    if not interactive:
+        return pd_signal
 
     # Otherwise request from user:
     choose_intervals = input("\nThe trigger signal may be cleaned by selecting sections of the signal for removal. "
@@ -196,6 +204,19 @@ def select_start_and_end(fig, ax, draw_type='line'):
     return int(x_ends[-2]), int(x_ends[-1])
 
 
+def debounce_onsets(onsets_ind, minimum_ind_diff):
+    """
+    This function removes the onsets that follow the previous detected onset by less than the minimum interval, i.e.
+    the double detections of a single photodiode flash due to a noisy signal
+    :param onsets_ind: (np array) sample number of the detected onsets, sorted
+    :param minimum_ind_diff: (int) minimum number of samples between two successive onsets
+    :return: (np array) sample number of the onsets with the double detections removed
+    """
+    onsets_ind = np.asarray(onsets_ind)
+    keep = np.concatenate([[True], np.diff(onsets_ind) >= minimum_ind_diff])
+    return onsets_ind[keep]
+
+
 def find_onset_pd(pd_raw, subject_info, data_preparation_parameters, srate):
     """
     This function detects the onset of the photodiode triggers
@@ -217,17 +238,9 @@ def find_onset_pd(pd_raw, subject_info, data_preparation_parameters, srate):
 
     # Make sure that you don't get false positives from noisy signal so that the same signal triggers the threshold
     # twice one photodiode signal is 3 ref rates ms and there are srate samples per second
-    pd_onsets_ind_no_fp = pd_onsets_ind
     minimum_ind_diff = int(
         (data_preparation_parameters.ref_rate_ms * 4.5 * srate) / 1000)
-    indices_to_remove = []
-    for i in range(1, len(pd_onsets_ind)):
-        onset_ind = pd_onsets_ind[i]
-        prev_onset_ind = pd_onsets_ind[i - 1]
-        if (onset_ind - prev_onset_ind) < minimum_ind_diff:
-            indices_to_remove.append(i)
-
-    pd_onsets_ind_no_fp = np.delete(pd_onsets_ind_no_fp, indices_to_remove)
+    pd_onsets_ind_no_fp = debounce_onsets(pd_onsets_ind, minimum_ind_diff)
 
     # Using the pd_onsets_ind, getting the time of the onsets of photodiode from pd_raw.time
     pd_onsets_time = pd_raw["time"][0, pd_onsets_ind_no_fp]
@@ -281,6 +294,50 @@ def find_onset_pd(pd_raw, subject_info, data_preparation_parameters, srate):
     return pd_onsets
 
 
+def classify_pd_onsets(pd_onsets_time, ref_rate_sec):
+    """
+    This function finds the photodiode triggers that are successive, i.e. separated by about 3 refresh rates, and
+    categorizes them as block onsets (4 consecutive), experiment onset and offsets (3 consecutives) or block offsets (2
+    consecutives). The sequences of successive triggers are parsed greedily from their first trigger, 4 by 4.
+    :param pd_onsets_time: (np array) time stamps of the photodiode triggers
+    :param ref_rate_sec: (float) screen refresh rate in seconds
+    :return: block_onsets_sample_nrs, block_offsets_sample_nrs, experiment_start_or_end_sample_nrs: (lists of int)
+    indices of the triggers of each category
+    """
+    pd_onsets_diff = np.diff(pd_onsets_time)
+    n_diff = len(pd_onsets_diff)
+    # Intervals between successive triggers of the same sequence:
+    close = (pd_onsets_diff <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & \
+            (pd_onsets_diff >= ref_rate_sec * 3 - 0.5 * ref_rate_sec)
+    padded = np.concatenate([[0], close.astype(int), [0]])
+    run_starts = np.where(np.diff(padded) == 1)[0]
+    run_lengths = np.where(np.diff(padded) == -1)[0] - run_starts
+    # Each sequence is parsed in chunks of 4 triggers, the remainder determining the category of the last chunk:
+    n_chunks = np.ceil(run_lengths / 4).astype(int)
+    chunk_run = np.repeat(np.arange(len(run_starts)), n_chunks)
+    chunk_ind = np.arange(n_chunks.sum()) - np.repeat(np.cumsum(n_chunks) - n_chunks, n_chunks)
+    chunk_start = run_starts[chunk_run] + 4 * chunk_ind
+    chunk_rem = run_lengths[chunk_run] - 4 * chunk_ind
+    # The last 2 intervals are not parsed:
+    chunk_valid = chunk_start < n_diff - 2
+    chunk_start, chunk_rem = chunk_start[chunk_valid], chunk_rem[chunk_valid]
+
+    def chunk_triggers(starts, n_triggers):
+        return (starts[:, None] + np.arange(n_triggers)).ravel().tolist()
+
+    block_onsets_sample_nrs = chunk_triggers(chunk_start[chunk_rem >= 3], 4)
+    experiment_start_or_end_sample_nrs = chunk_triggers(chunk_start[chunk_rem == 2], 3)
+    block_offsets_sample_nrs = chunk_triggers(chunk_start[chunk_rem == 1], 2)
+
+    # Did we find the experiment end yet?
+    if len(experiment_start_or_end_sample_nrs) < 6:
+        # Also evaluate the last 2 triggers which were not treated in the loop above
+        if close[-1] & close[-2]:
+            experiment_start_or_end_sample_nrs.extend([-3, -2, -1])
+
+    return block_onsets_sample_nrs, block_offsets_sample_nrs, experiment_start_or_end_sample_nrs
+
+
 def clean_pd_onsets(pd_onsets, data_preparation_parameters):
     """
     This function removes everything that is not needed from the PD signal: block onsets, block offsets...
@@ -293,68 +350,26 @@ def clean_pd_onsets(pd_onsets, data_preparation_parameters):
     # Converting the screen refresh rate from ms to sec:
     ref_rate_sec = data_preparation_parameters.ref_rate_ms * 0.001
 
-    # First, computing the diff on the photodiode timestamps:
-    pd_onsets_diff = np.diff(pd_onsets["Time"])
-
     # Find triggers that are successive and categorize as block onsets/offsets (4 consecutive)
     # or experiment onset and offsets (3 consecutives)
-    block_onsets_sample_nrs = []
-    block_offsets_sample_nrs = []
-
-    experiment_start_or_end_sample_nrs = []
-
-    # i is the sample nr
-    i = 0
-    while i < len(pd_onsets_diff) - 2:
-        if (pd_onsets_diff[i] <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & (
-                pd_onsets_diff[i] >= ref_rate_sec * 3 - 0.5 * ref_rate_sec):
-            # Now we have found two successive triggers. See if we have 2 or 3 more
-            if (pd_onsets_diff[i + 1] <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & (
-                    pd_onsets_diff[i + 1] >= ref_rate_sec * 3 - 0.5 * ref_rate_sec):
-                # Now we have found three. Let's see if we have one more. But first, check if we are at the end
-                if (pd_onsets_diff[i + 2] <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & (
-                        pd_onsets_diff[i + 2] >= ref_rate_sec * 3 - 0.5 * ref_rate_sec):
-                    # Yes we have 4 consecutive. Add them to block onset
-                    for j in range(i, i + 4):
-                        block_onsets_sample_nrs.append(j)
-                    i += 3
-                else:
-                    # No. Then we have 3 and are at experiment start or end
-                    for j in range(i, i + 3):
-                        experiment_start_or_end_sample_nrs.append(j)
-                    i += 2
-            else:
-                # Then it is a block offset:
-                for j in range(i, i + 2):
-                    block_offsets_sample_nrs.append(j)
-                i += 1
-        i += 1
-
-    # Did we find the experiment end yet?
-    if len(experiment_start_or_end_sample_nrs) < 6:
-        # Also evaluate the last 2 triggers which were not treated in the loop above
-        if (pd_onsets_diff[-1] <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & (
-                pd_onsets_diff[-1] >= ref_rate_sec * 3 - 0.5 * ref_rate_sec) \
-                & (pd_onsets_diff[-2] <= ref_rate_sec * 3 * 2 + ref_rate_sec * 2) & (
-                pd_onsets_diff[-2] >= ref_rate_sec * 3 - 0.5 * ref_rate_sec):
-            for j in [-3, -2, -1]:
-                experiment_start_or_end_sample_nrs.append(j)
+    block_onsets_sample_nrs, block_offsets_sample_nrs, experiment_start_or_end_sample_nrs = \
+        classify_pd_onsets(pd_onsets["Time"], ref_rate_sec)
 
-    # Plotting the results:
-    plt.figure(figsize=(8, 6))
-    plt.vlines(pd_onsets["Sample_num"], -1, 1)
-    plt.vlines(pd_onsets["Sample_num"]
-               [block_onsets_sample_nrs], -0.25, 0.75, colors="yellow")
-    plt.vlines(pd_onsets["Sample_num"]
-               [block_offsets_sample_nrs], -0.5, 0.5, colors="red")
-    plt.vlines(pd_onsets["Sample_num"]
-               [experiment_start_or_end_sample_nrs], -0.75, 0.25, colors="green")
-    plt.title(
-        'Blocking: green: experiment start, yellow: block start, red: block end')
-    plt.grid()
+    # Plotting the results (these plots are not saved, so they are only generated when shown):
     if data_preparation_parameters.show_check_plots:
+        plt.figure(figsize=(8, 6))
+        plt.vlines(pd_onsets["Sample_num"], -1, 1)
+        plt.vlines(pd_onsets["Sample_num"]
+                   [block_onsets_sample_nrs], -0.25, 0.75, colors="yellow")
+        plt.vlines(pd_onsets["Sample_num"]
+                   [block_offsets_sample_nrs], -0.5, 0.5, colors="red")
+        plt.vlines(pd_onsets["Sample_num"]
+                   [experiment_start_or_end_sample_nrs], -0.75, 0.25, colors="green")
+        plt.title(
+            'Blocking: green: experiment start, yellow: block start, red: block end')
+        plt.grid()
         plt.show()
-    plt.close()
+        plt.close()
 
     # Then, removing everything before the first trig begin, because they are spurious:
     pd_onsets_clean = ({
@@ -372,32 +387,33 @@ def clean_pd_onsets(pd_onsets, data_preparation_parameters):
         experiment_end_time = pd_onsets["Time"][experiment_start_or_end_sample_nrs[-1]]
         # Then, removing all photodiode triggers that occured before the first level start:
         pd_onsets_clean = {
-            "Sample_num": [onsets for onsets in pd_onsets_clean["Sample_num"] if
-                           block_onset_sample < onsets < experiment_end_sample],
-            "Time": [onsets for onsets in pd_onsets_clean["Time"] if block_onset_time < onsets < experiment_end_time]
+            "Sample_num": pd_onsets_clean["Sample_num"][(pd_onsets_clean["Sample_num"] > block_onset_sample) &
+                                                        (pd_onsets_clean["Sample_num"] < experiment_end_sample)],
+            "Time": pd_onsets_clean["Time"][(pd_onsets_clean["Time"] > block_onset_time) &
+                                            (pd_onsets_clean["Time"] < experiment_end_time)]
         }
     except IndexError:
         print("No experiment_start_or_end_sample_nrs found")
 
     # Plotting the results:
     # No triggers should appear where the colored lines are
-    plt.figure(figsize=(8, 6))
-    plt.vlines(pd_onsets_clean["Sample_num"], -1, 1, colors="black")
-    plt.vlines(pd_onsets["Sample_num"]
-               [block_onsets_sample_nrs], -0.25, 0.75, colors="yellow")
-    plt.vlines(pd_onsets["Sample_num"]
-               [block_offsets_sample_nrs], -0.5, 0.5, colors="red")
-
-    plt.vlines(pd_onsets["Sample_num"]
-               [experiment_start_or_end_sample_nrs], -0.75, 0.25, colors="green")
-
-    plt.title(
-        'Blocking after signal has been cleaned: No triggers should be visible at the places of the \n for the colored '
-        'bars \n green: experiment start, yellow: block start, red: block end')
-    plt.grid()
     if data_preparation_parameters.show_check_plots:
+        plt.figure(figsize=(8, 6))
+        plt.vlines(pd_onsets_clean["Sample_num"], -1, 1, colors="black")
+        plt.vlines(pd_onsets["Sample_num"]
+                   [block_onsets_sample_nrs], -0.25, 0.75, colors="yellow")
+        plt.vlines(pd_onsets["Sample_num"]
+                   [block_offsets_sample_nrs], -0.5, 0.5, colors="red")
+
+        plt.vlines(pd_onsets["Sample_num"]
+                   [experiment_start_or_end_sample_nrs], -0.75, 0.25, colors="green")
+
+        plt.title(
+            'Blocking after signal has been cleaned: No triggers should be visible at the places of the \n for the '
+            'colored bars \n green: experiment start, yellow: block start, red: block end')
+        plt.grid()
         plt.show()
-    plt.close()
+        plt.close()
     return pd_onsets_clean
 
 
@@ -663,20 +679,17 @@ def introduce_response(full_logs_clean, full_logs_with_resp):
     :param full_logs_with_resp: pandas data frame of the full log of the experiment with the responses
     :return:
     """
-    # Looping through the log file with the response
-    for row_ind, row in full_logs_with_resp.iterrows():
-        # If in the log file with the response, the current row is a response, the we add a row to the clean log:
-        if row.eventType == 'Response':
-            # Computing the delta t of the response between the previous event and the response
-            resp_delay = row["time"] - full_logs_with_resp.time[row_ind - 1]
-            # The response delay is added to the previous  photodiode timestamp. This generates the time stamps in the
-            # photodiode timeline for the response:
-            row["time_PD"] = full_logs_clean.time_PD[row_ind - 1] + resp_delay
-            # Now, the new row must be inserted
-            full_logs_clean = full_logs_clean.append(row)
-            # Finally, it needs to be reordered by the photodiode timestamp:
-            full_logs_clean = full_logs_clean.sort_values(
-                by=["time_PD"]).reset_index(drop=True)
+    # The responses are not in the clean logs, which otherwise have the same events in the same order:
+    is_response = (full_logs_with_resp["eventType"] == 'Response').to_numpy()
+    full_logs_resp = full_logs_with_resp.copy()
+    full_logs_resp["time_PD"] = np.nan
+    full_logs_resp.loc[~is_response, "time_PD"] = full_logs_clean["time_PD"].to_numpy()
+    # The response delay with respect to the previous non-response event is added to its photodiode timestamp. This
+    # generates the time stamps in the photodiode timeline for the responses:
+    pd_offset = (full_logs_resp["time_PD"] - full_logs_resp["time"]).ffill()
+    full_logs_resp.loc[is_response, "time_PD"] = full_logs_resp["time"][is_response] + pd_offset[is_response]
+    # Finally, it needs to be reordered by the photodiode timestamp:
+    full_logs_clean = full_logs_resp.sort_values(by=["time_PD"], kind="stable").reset_index(drop=True)
 
     # If things went well, the interval between events should be the same in the full logs with the response, and the
     # full logs in which we just introduced the response. But if for whatever reason that is no the case, raise an
@@ -688,6 +701,99 @@ def introduce_response(full_logs_clean, full_logs_with_resp):
     return full_logs_clean
 
 
+def align_pd_to_logs(pd_times, log_times, tolerance=0.05):
+    """
+    This function matches the photodiode events to the log files events. The offset between the photodiode and log
+    clocks is first estimated by cross-correlating the binned event trains, such that missing or extra triggers do not
+    shift the whole alignment. Each log event is then matched to its nearest photodiode event, the clock drift is
+    corrected by a linear fit on the matched pairs and the matching is repeated. Log events without photodiode events
+    within the tolerance are flagged as dropped triggers and unmatched photodiode events as extra triggers.
+    :param pd_times: (np array) time stamps of the photodiode events in seconds
+    :param log_times: (np array) time stamps of the log events in seconds
+    :param tolerance: (float) maximal distance in seconds between a log event, projected in the photodiode timeline,
+    and its photodiode event
+    :return: alignment: (pd.DataFrame) one row per log event and per extra photodiode event with the columns log_index,
+    pd_index (-1 if missing), log_time, pd_time, residual and status (matched, dropped or extra), sorted by time in the
+    photodiode timeline
+    :return: clock: (tuple) slope and intercept of the linear mapping from the log to the photodiode time
+    """
+    pd_times = np.asarray(pd_times, dtype=float)
+    log_times = np.asarray(log_times, dtype=float)
+
+    # Coarse offset from the cross correlation of the binned event trains:
+    pd_bins = np.round((pd_times - pd_times.min()) / tolerance).astype(int)
+    log_bins = np.round((log_times - log_times.min()) / tolerance).astype(int)
+    pd_train = np.zeros(pd_bins.max() + 3)
+    np.add.at(pd_train, pd_bins + 1, 1)
+    # Smear the photodiode train over neighbouring bins to tolerate rounding at the bins edges:
+    pd_train = np.convolve(pd_train, np.ones(3), mode="same")
+    log_train = np.zeros(log_bins.max() + 1)
+    np.add.at(log_train, log_bins, 1)
+    xcorr = correlate(pd_train, log_train, mode="full", method="fft")
+    lag = np.argmax(xcorr) - (len(log_train) - 1) - 1
+    clock = (1., pd_times.min() - log_times.min() + lag * tolerance)
+
+    def match(clock_param):
+        projected = clock_param[0] * log_times + clock_param[1]
+        # Nearest photodiode event of each log event:
+        right = np.clip(np.searchsorted(pd_times, projected), 1, len(pd_times) - 1)
+        left = right - 1
+        nearest = np.where(np.abs(pd_times[left] - projected) <= np.abs(pd_times[right] - projected), left, right)
+        residual = pd_times[nearest] - projected
+        matched = np.abs(residual) <= tolerance
+        # A photodiode event can only be matched to a single log event, the closest one:
+        order = np.lexsort((np.abs(residual), nearest))
+        first_of_pd = np.concatenate([[True], np.diff(nearest[order]) != 0])
+        unique_match = np.zeros(len(log_times), dtype=bool)
+        unique_match[order[first_of_pd]] = True
+        matched &= unique_match
+        return np.where(matched, nearest, -1), residual
+
+    pd_index, residual = match(clock)
+    # Correct the clock drift based on the matched pairs, and match again:
+    if np.sum(pd_index >= 0) > 1:
+        clock = tuple(np.polyfit(log_times[pd_index >= 0], pd_times[pd_index[pd_index >= 0]], 1))
+        pd_index, residual = match(clock)
+
+    alignment = pd.DataFrame({
+        "log_index": np.arange(len(log_times)),
+        "pd_index": pd_index,
+        "log_time": log_times,
+        "pd_time": np.where(pd_index >= 0, pd_times[np.maximum(pd_index, 0)], np.nan),
+        "residual": np.where(pd_index >= 0, residual, np.nan),
+        "status": np.where(pd_index >= 0, "matched", "dropped")
+    })
+    extra = np.setdiff1d(np.arange(len(pd_times)), pd_index[pd_index >= 0])
+    alignment = pd.concat([alignment, pd.DataFrame({
+        "log_index": -1,
+        "pd_index": extra,
+        "log_time": np.nan,
+        "pd_time": pd_times[extra],
+        "residual": np.nan,
+        "status": "extra"
+    })], ignore_index=True)
+    projected_time = alignment["pd_time"].fillna(clock[0] * alignment["log_time"] + clock[1])
+    alignment = alignment.iloc[np.argsort(projected_time.to_numpy(), kind="stable")].reset_index(drop=True)
+
+    return alignment, clock
+
+
+def reconstruct_pd_onsets(alignment, sr):
+    """
+    This function generates the photodiode onsets matching the log events one to one, based on the alignment: extra
+    photodiode triggers are removed and dropped ones are reconstructed from the interval in the log files with respect
+    to the previous matched event, as done when reconstructing the triggers manually
+    :param alignment: (pd.DataFrame) output of align_pd_to_logs
+    :param sr: (float) sampling rate of the signal
+    :return: pd_onsets_clean: (dict of np arrays) with one onset per log event
+    """
+    logs_alignment = alignment.loc[alignment["status"] != "extra"].sort_values("log_index")
+    # Offset between the photodiode and the log clock, propagated from the last matched event:
+    offset = (logs_alignment["pd_time"] - logs_alignment["log_time"]).ffill().bfill()
+    pd_time = logs_alignment["log_time"].to_numpy() + offset.to_numpy()
+    return {"Sample_num": np.round(pd_time * sr).astype(int), "Time": pd_time}
+
+
 def check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters, subject_info, sr):
     """
     This function checks the alignment between the logs files and the photodiode trigger to be able to create the
@@ -703,12 +809,11 @@ def check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters, sub
     """
 
     # Plot log to see that it looks reasonable
-    interval_logs = np.diff(full_logs.time)
-    plt.plot(range(len(full_logs.time)), full_logs.time)
-    plt.title('Log file time stamps. Check that it is monotonically growing')
     if data_preparation_parameters.show_check_plots:
+        plt.plot(range(len(full_logs.time)), full_logs.time)
+        plt.title('Log file time stamps. Check that it is monotonically growing')
         plt.show()
-    plt.close()
+        plt.close()
     # Removing log entries that do not have any matching photodiode entries
     full_logs_clean = full_logs.loc[(
             full_logs["eventType"] != "Save")].reset_index(drop=True)
@@ -722,15 +827,11 @@ def check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters, sub
     full_logs_clean = full_logs_clean.loc[(
             full_logs_clean["eventType"] != "Interruption")].reset_index(drop=True)
     # Removing the first jitter and fixation from each block, because there are not corresponding photodiode triggers:
-    indices_to_drop = []
-    mini_block_nr = 0
-    for i in range(len(full_logs_clean)):
-        mini_block_nr_now = full_logs_clean["miniBlock"][i]
-        # Now we are at the beginning of a new block:
-        if mini_block_nr_now != mini_block_nr:
-            indices_to_drop.append(i)
-            indices_to_drop.append(i + 1)
-        mini_block_nr = mini_block_nr_now
+    mini_block_nr = full_logs_clean["miniBlock"].to_numpy()
+    # Beginning of each new block:
+    block_starts = np.where(mini_block_nr != np.concatenate([[0], mini_block_nr[:-1]]))[0]
+    indices_to_drop = np.unique(np.concatenate([block_starts, block_starts + 1]))
+    indices_to_drop = indices_to_drop[indices_to_drop < len(full_logs_clean)]
 
     full_logs_clean.drop(full_logs_clean.index[indices_to_drop], inplace=True)
 
@@ -745,10 +846,34 @@ def check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters, sub
     # And in the photodiode signal:
     interval_pd = np.diff(pd_onsets_clean["Time"])
 
+    # Get the path where to save data
+    save_path = Path(subject_info.participant_save_root, "info", "figure")
+
+    if not os.path.isdir(save_path):
+        # Creating the directory:
+        os.makedirs(save_path)
+
+    # Matching the photodiode and log events to report all the dropped and extra triggers at once:
+    alignment, clock = align_pd_to_logs(pd_onsets_clean["Time"], full_logs_clean["time"].to_numpy(),
+                                        tolerance=data_preparation_parameters.alignment_tolerance_sec)
+    alignment.to_csv(Path(save_path, subject_info.files_prefix + "photodiode_log_alignment.csv"), index=False)
+    print("Photodiode vs logs alignment: {} matched, {} dropped triggers (log indices: {}), "
+          "{} extra triggers (photodiode indices: {})".format(
+              np.sum(alignment["status"] == "matched"),
+              np.sum(alignment["status"] == "dropped"),
+              alignment.loc[alignment["status"] == "dropped", "log_index"].to_list(),
+              np.sum(alignment["status"] == "extra"),
+              alignment.loc[alignment["status"] == "extra", "pd_index"].to_list()))
+
     # Making sure there are as many triggers as there are log entries
     print('Now trying to plot the full log entries vs the pd entries. ')
     print('If you get an error here, it means your triggers don\'t match the number of log entries')
-    if len(interval_logs) != len(interval_pd):
+    if not data_preparation_parameters.interactive and (alignment["status"] != "matched").any():
+        # In headless mode, the extra triggers are removed and the dropped ones reconstructed from the logs:
+        print("Removing the extra triggers and reconstructing the dropped ones from the log files")
+        pd_onsets_clean = reconstruct_pd_onsets(alignment, sr)
+        interval_pd = np.diff(pd_onsets_clean["Time"])
+    elif len(interval_logs) != len(interval_pd):
         print("The number of triggers was not equivalent between the logs and the photodiode. "
               + "\n Nr of detected triggers: " + str(len(interval_pd) + 1)
               + "\n Nr of log entries: " + str(len(interval_logs) + 1))
@@ -770,13 +895,6 @@ def check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters, sub
         print(
             "SUCCESS! There was the same number of photodiode and log files events and we will go straight to plotting")
 
-    # Get the path where to save data
-    save_path = Path(subject_info.participant_save_root, "info", "figure")
-
-    if not os.path.isdir(save_path):
-        # Creating the directory:
-        os.makedirs(save_path)
-
     # Finally, plotting the alignment:
     plt.figure(figsize=(8, 6))
     plt.plot(interval_logs, color="red")
@@ -802,9 +920,12 @@ def check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters, sub
                          "You must sort this out for this function to preprocessing!")
 
     if (full_logs_clean['duplicate'] == 1).any():
-        remove_aborted_data = \
-            input('It seems you have restarted the experiment. For the trials that were preprocessing twice,'
-                  ' \n would you like to keep only the more recent ones (afer restarting) [Yes, No]?')
+        # In headless mode, only the most recent trials are kept:
+        remove_aborted_data = "Yes"
+        if data_preparation_parameters.interactive:
+            remove_aborted_data = \
+                input('It seems you have restarted the experiment. For the trials that were preprocessing twice,'
+                      ' \n would you like to keep only the more recent ones (afer restarting) [Yes, No]?')
 
         if remove_aborted_data == 'yes' or remove_aborted_data == 'Yes':
             # Now, if there was a restart, we need to remove:
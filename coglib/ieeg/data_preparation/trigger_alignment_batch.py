@@ -0,0 +1,109 @@
+"""
+This script runs the photodiode trigger detection and alignment to the log files headless, for a batch of subjects.
+The subjects must have been through the data preparation once, such that their subject info json (photodiode
+channels, threshold and noise intervals) exist. The alignment of each subject and a summary table of the dropped and
+extra triggers across subjects are saved.
+    authors: Alex Lepauvre
+    alex.lepauvre@ae.mpg.de
+"""
+import os
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import matplotlib
+from joblib import Parallel, delayed
+
+from Preprocessing.SubjectInfo import SubjectInfo
+from data_preparation.DataPreparationParameters import DataPreparationParameters
+from data_preparation import trigger_alignment
+from data_preparation.Experiment1_data_preparation import load_signal, load_logs
+
+
+def subject_trigger_alignment(subject, data_preparation_parameters):
+    """
+    This function detects the photodiode triggers of one subject and aligns them to the log files, without any user
+    input
+    :param subject: (string) subject ID, for instance SE110
+    :param data_preparation_parameters: (DataPreparationParameters) data preparation parameters
+    :return: (dict) summary of the alignment of this subject
+    """
+    # Plots can't be shown nor the user prompted when running in batch:
+    data_preparation_parameters.show_check_plots = False
+    data_preparation_parameters.interactive = False
+    subject_info = SubjectInfo(subject, data_preparation_parameters, interactive=False)
+    if subject_info.TRIGGER_CHANNEL is None:
+        return {"subject": subject, "status": "no subject info"}
+    # Only the photodiode channels are needed, which the debug mode loads:
+    raw = load_signal(data_preparation_parameters.raw_root + os.sep + subject_info.SUBJ_ID,
+                      data_preparation_parameters.ecog_files_naming, subject_info,
+                      file_extension=data_preparation_parameters.ecog_files_extension,
+                      debug=True)
+    full_logs = load_logs(data_preparation_parameters.raw_root + os.sep + subject_info.SUBJ_ID,
+                          data_preparation_parameters.beh_files_naming,
+                          file_extension=data_preparation_parameters.beh_files_extension)
+    pd_onsets, pd_onsets_clean, _, _, raw = trigger_alignment.detect_triggers(data_preparation_parameters,
+                                                                              subject_info, raw)
+    full_logs_clean = trigger_alignment.check_alignment(pd_onsets_clean, full_logs, data_preparation_parameters,
+                                                        subject_info, raw.info['sfreq'])
+    # Load the alignment report saved by the check alignment:
+    alignment = pd.read_csv(Path(subject_info.participant_save_root, "info", "figure",
+                                 subject_info.files_prefix + "photodiode_log_alignment.csv"))
+    # Save the clean logs:
+    full_logs_clean.to_csv(Path(subject_info.participant_info_file,
+                                subject_info.files_prefix + "clean_logs_headless.csv"), index=False)
+    return {
+        "subject": subject,
+        "status": "aligned",
+        "n_pd_triggers": len(pd_onsets["Time"]),
+        "n_log_events": np.sum(alignment["status"] != "extra"),
+        "n_matched": np.sum(alignment["status"] == "matched"),
+        "n_dropped": np.sum(alignment["status"] == "dropped"),
+        "n_extra": np.sum(alignment["status"] == "extra"),
+        "max_abs_residual": np.nanmax(np.abs(alignment["residual"]))
+    }
+
+
+def trigger_alignment_batch(subjects_list, config_file, n_jobs=1):
+    """
+    This function runs the headless trigger alignment for all subjects and saves a summary table
+    :param subjects_list: (list of strings) subjects ID
+    :param config_file: (string) path to the data preparation config file
+    :param n_jobs: (int) number of subjects processed in parallel
+    :return: (pd.DataFrame) summary of the alignment of each subject
+    """
+    matplotlib.use("Agg")
+    data_preparation_parameters = DataPreparationParameters(config_file)
+
+    def run_subject(subject):
+        try:
+            return subject_trigger_alignment(subject, data_preparation_parameters)
+        except Exception as e:
+            print("Trigger alignment failed for sub-{}: {}".format(subject, e))
+            return {"subject": subject, "status": "failed: {}".format(e)}
+
+    summary = pd.DataFrame(Parallel(n_jobs=n_jobs)(delayed(run_subject)(subject) for subject in subjects_list))
+    save_root = Path(data_preparation_parameters.BIDS_root, "derivatives", "preprocessing")
+    if not os.path.isdir(save_root):
+        os.makedirs(save_root)
+    summary.to_csv(Path(save_root, "task-{}_desc-trigger_alignment_summary.csv".format(
+        data_preparation_parameters.task_name)), index=False)
+    print(summary.to_string())
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless trigger alignment for a batch of subjects")
+    parser.add_argument('--subjects', type=str, nargs="+", default=None,
+                        help="Subjects ID, for instance SE110 SF102. If none, all the subjects in the raw root")
+    parser.add_argument('--AnalysisParametersFile', type=str, default=None,
+                        help="Analysis parameters file (file name + path)")
+    parser.add_argument('--njobs', type=int, default=1,
+                        help="Number of subjects processed in parallel")
+    args = parser.parse_args()
+    subjects = args.subjects
+    if subjects is None:
+        raw_root = DataPreparationParameters(args.AnalysisParametersFile).raw_root
+        subjects = sorted([sub for sub in os.listdir(raw_root) if os.path.isdir(Path(raw_root, sub))])
+    trigger_alignment_batch(subjects, args.AnalysisParametersFile, n_jobs=args.njobs)
@@ -327,19 +327,16 @@ def decoding_analysis_iit_vs_iitgnw(subjects_list=None, save_folder="super"):
                 ax.fill_between(times, decoding_scores_comb.mean(0) - ci, decoding_scores_comb.mean(0) + ci, alpha=0.5)
             
                 # compute variance corrected p-values across the whole time window 
-                p_values_iit_v_comb = np.empty((len(times),))       # (iit vs. comb)
-                p_values_iit_v_iit_gnw = np.empty((len(times),))    # iit vs. iit+gnw
                 # degrees of freedom and train/test split counts
                 df = decoding_scores_iit.shape[0] - 1
                 n_train = len( cv_iter[0][0] )
                 n_test = len( cv_iter[0][1] )
-                for t, time in  enumerate(times):
-                    # perform a single-tailed test of the hypothesis that combined model is better than IIT-alone
-                    mdl_diff = decoding_scores_comb[:,t] - decoding_scores_iit[:,t]
-                    t_stat, p_values_iit_v_comb[t] = compute_corrected_ttest(mdl_diff, df, n_train, n_test)
-                    
-                    mdl_diff = decoding_scores_iit_gnw[:,t] - decoding_scores_iit[:,t]
-                    t_stat, p_values_iit_v_iit_gnw[t] = compute_corrected_ttest(mdl_diff, df, n_train, n_test)
+                # perform a single-tailed test of the hypothesis that combined model is better than IIT-alone, at all
+                # time points at once
+                t_stat, p_values_iit_v_comb = compute_corrected_ttest(decoding_scores_comb - decoding_scores_iit,
+                                                                      df, n_train, n_test, axis=0)  # (iit vs. comb)
+                t_stat, p_values_iit_v_iit_gnw = compute_corrected_ttest(decoding_scores_iit_gnw - decoding_scores_iit,
+                                                                         df, n_train, n_test, axis=0)  # iit vs. iit+gnw
                 
                 sig_mask = (p_values_iit_v_comb < 0.05)
                 ax.plot(times[sig_mask], np.ones_like(sig_mask)[sig_mask] * np.min(decoding_scores_iit.mean(0)), 'ko')
@@ -351,16 +348,15 @@ def decoding_analysis_iit_vs_iitgnw(subjects_list=None, save_folder="super"):
             
                 # bayesian analysis
                 p_values_bayes = np.empty((len(times),2))
-                for t, time in  enumerate(times):
-                    # perform a single-tailed test of the hypothesis that combined model (IIT+GNW) is better than IIT-alone
-                    mdl_diff = decoding_scores_comb[:,t] - decoding_scores_iit[:,t]
-                    # initialize random variable
-                    t_post = stats.t(
-                        df, loc=np.mean(mdl_diff), scale=corrected_std(mdl_diff, n_train, n_test)
-                    )
-                    better_prob = 1 - t_post.cdf(0)
-                    p_values_bayes[t,0] = better_prob
-                    p_values_bayes[t,1] = 1-better_prob
+                # perform a single-tailed test of the hypothesis that combined model (IIT+GNW) is better than IIT-alone
+                mdl_diff = decoding_scores_comb - decoding_scores_iit
+                # initialize random variable
+                t_post = stats.t(
+                    df, loc=np.mean(mdl_diff, axis=0), scale=corrected_std(mdl_diff, n_train, n_test, axis=0)
+                )
+                better_prob = 1 - t_post.cdf(0)
+                p_values_bayes[:,0] = better_prob
+                p_values_bayes[:,1] = 1-better_prob
                 
                 ax = plt.subplot(212)
                 ax.plot(times, p_values_bayes[:,1], label='IIT-only > IIT+GNW')  
@@ -17,6 +17,8 @@ from sklearn.linear_model import Perceptron
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.linear_model import LogisticRegression
 from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.base import clone
+from sklearn.metrics import get_scorer
 
 from skimage.measure import block_reduce
 
@@ -263,7 +265,7 @@ def find_channels_in_roi(roi, channels_labels):
     return roi_channels
 
 
-def compute_pseudotrials(x, y, groups=None, n_trials=5, pad_val=np.nan, permute_trials=True):
+def compute_pseudotrials(x, y, groups=None, n_trials=5, pad_val=np.nan, permute_trials=True, rng=None):
     """
     This function enables computation of pseudotrials. This consists in averaging n_trials together. The averaging
     of course happens separately for groups and y labels separately (i.e. only trials of matching groups are averaged).
@@ -281,11 +283,15 @@ def compute_pseudotrials(x, y, groups=None, n_trials=5, pad_val=np.nan, permute_
     :param permute_trials: (boolean) whether to shuffle the trials order before doing the averaging. If set to true,
     it averages the trials in the order they come in the arrays. But by setting it to true, the order is randomized,
     to avoid any sort of dependencies
+    :param rng: (np.random.RandomState or None) random generator used to shuffle the trials. If None, the numpy global
+    random generator is used
     :return:
     new_x: (np.array) x data averaged together. So it will be of the size of x but with first dimension / n_trials
     new_y:(np.array) decoding targets matching with the new_x dimensions
     new_groups: (np.array) groups matching with the new_x dimensions
     """
+    if rng is None:
+        rng = np.random
     # Print the original shape of the data:
     print("-" * 40)
     print("Welcome to pseudotrials computations")
@@ -316,7 +322,7 @@ def compute_pseudotrials(x, y, groups=None, n_trials=5, pad_val=np.nan, permute_
                 # Extract the data:
                 data = group_x[np.where(group_y == label)]
                 if permute_trials:
-                    data = np.take(data, np.random.permutation(data.shape[0]), axis=0)
+                    data = np.take(data, rng.permutation(data.shape[0]), axis=0)
                 avg_x = block_reduce(data, block_size=tuple([n_trials, *[1] * len(data.shape[1:])]),
                                      func=np.nanmean, cval=pad_val)
                 # Now generating the labels and group:
@@ -330,7 +336,7 @@ def compute_pseudotrials(x, y, groups=None, n_trials=5, pad_val=np.nan, permute_
             data = x[np.where(y == label)]
             # Permute if needed:
             if permute_trials:
-                data = np.take(data, np.random.permutation(data.shape[0]), axis=0)
+                data = np.take(data, rng.permutation(data.shape[0]), axis=0)
             # Apply block reduce function:
             avg_x = block_reduce(data, block_size=tuple([n_trials, *[1] * len(data.shape[1:])]),
                                  func=np.nanmean, cval=pad_val)
@@ -734,56 +740,161 @@ def temporal_generalization_decoding(clf, x, decoding_target, cross_validation_p
     return scores, coef
 
 
+def cross_validation_splits(y, cross_validation_parameters, train_group=None, test_group=None, groups=None):
+    """
+    This function generates the train and test trials indices of each fold, following the same options as
+    temporal_generalization_decoding: within group cross validation if train_group and test_group are the same, cross
+    task generalization otherwise
+    :param y: (np array) decoding targets
+    :param cross_validation_parameters: (dict) parameters of the cross validation, see temporal_generalization_decoding
+    :param train_group: (string or None) group on which to train the classifier
+    :param test_group: (string or None) group on which to test the classifier
+    :param groups: (np array) group of each trial
+    :return: (list of tuples) train and test indices of each fold
+    """
+    if train_group == test_group:
+        if cross_validation_parameters["n_folds"] is None:
+            raise Exception("If you are doing within task decoding, you must use cross fold validation to be able"
+                            "\nto test your trained decoding on something!")
+        if cross_validation_parameters["n_folds"] == "leave_one_out":
+            n_folds = len(y)
+        else:
+            n_folds = cross_validation_parameters["n_folds"]
+        return list(StratifiedKFold(n_splits=n_folds).split(np.zeros(len(y)), y))
+    train_ind = np.where(groups == train_group)[0]
+    test_ind = np.where(groups == test_group)[0]
+    if cross_validation_parameters["n_folds"] is None:
+        return [(train_ind, test_ind)]
+    skf = StratifiedKFold(n_splits=cross_validation_parameters["n_folds"])
+    train_splits = [train_ind[train] for train, _ in skf.split(np.zeros(len(train_ind)), y[train_ind])]
+    if cross_validation_parameters["split_generalization_set"]:
+        test_splits = [test_ind[test] for _, test in skf.split(np.zeros(len(test_ind)), y[test_ind])]
+    else:
+        test_splits = [test_ind] * len(train_splits)
+    return list(zip(train_splits, test_splits))
+
+
+def roi_decoding_scores(clf, x, decoding_target, roi_channels, cross_validation_parameters, metric="accuracy",
+                        train_group=None, test_group=None, groups=None, n_pseudotrials=None, shuffle_labels=False,
+                        random_state=None):
+    """
+    This function decodes the data of several ROIs in a single pass: the pseudotrials, the label shuffling and the cross
+    validation folds are generated once and shared by all ROIs, such that the scores of the different ROIs are paired
+    fold by fold and can be compared with compute_pairwise_corrected_ttest. The data of each ROI are flattened over
+    channels and time, i.e. one decoder per ROI on the whole time window
+    :param clf: (scikit learn pipeline object) pipeline to be used for the decoding
+    :param x: (np array) data, trials * channels * time points
+    :param decoding_target: (np array) decoding targets
+    :param roi_channels: (list of np arrays) indices of the channels of each ROI
+    :param cross_validation_parameters: (dict) parameters of the cross validation, see temporal_generalization_decoding
+    :param metric: (string) scikit learn scorer
+    :param train_group: (string or None) group on which to train the classifier
+    :param test_group: (string or None) group on which to test the classifier
+    :param groups: (np array) group of each trial
+    :param n_pseudotrials: (int or None) number of trials averaged in each pseudotrial
+    :param shuffle_labels: (boolean) whether to shuffle the labels, to generate a null distribution
+    :param random_state: (int or None) seed of the labels shuffling and of the pseudotrials. If None, the numpy global
+    random generator is used
+    :return:
+    scores: (np array) decoding score of each ROI in each fold, ROIs * folds
+    n_train, n_test: (int) number of trials in the train and test sets of the first fold
+    """
+    rng = np.random if random_state is None else np.random.RandomState(random_state)
+    if shuffle_labels:
+        decoding_target = decoding_target[rng.permutation(len(decoding_target))]
+    if n_pseudotrials is not None:
+        x, decoding_target, groups = compute_pseudotrials(x, decoding_target, groups, n_trials=n_pseudotrials, rng=rng)
+    splits = cross_validation_splits(decoding_target, cross_validation_parameters, train_group=train_group,
+                                     test_group=test_group, groups=groups)
+    scorer = get_scorer(metric)
+    scores = np.zeros((len(roi_channels), len(splits)))
+    for fold, (train_ind, test_ind) in enumerate(splits):
+        for roi_ind, chs in enumerate(roi_channels):
+            x_roi = x[:, chs, :].reshape(x.shape[0], -1)
+            estimator = clone(clf).fit(x_roi[train_ind], decoding_target[train_ind])
+            scores[roi_ind, fold] = scorer(estimator, x_roi[test_ind], decoding_target[test_ind])
+    return scores, len(splits[0][0]), len(splits[0][1])
+
+
 # compute variance-corrected ttests for model comparison
 # see: Statistical comparison of models using grid search, https://scikit-learn.org/stable/auto_examples/model_selection/plot_grid_search_stats.html
-def corrected_std(differences, n_train, n_test):
+def corrected_std(differences, n_train, n_test, axis=0):
     """Corrects standard deviation using Nadeau and Bengio's approach.
 
     Parameters
     ----------
-    differences : ndarray of shape (n_samples,)
-        Vector containing the differences in the score metrics of two models.
+    differences : ndarray of shape (n_samples,) or (..., n_samples, ...)
+        Differences in the score metrics of two models, along axis.
     n_train : int
         Number of samples in the training set.
     n_test : int
         Number of samples in the testing set.
+    axis : int
+        Axis of the model evaluations.
 
     Returns
     -------
-    corrected_std : float
+    corrected_std : float or ndarray
         Variance-corrected standard deviation of the set of differences.
     """
     # kr = k times r, r times repeated k-fold crossvalidation,
     # kr equals the number of times the model was evaluated
-    kr = len(differences)
-    corrected_var = np.var(differences, ddof=1) * (1 / kr + n_test / n_train)
+    kr = np.shape(differences)[axis]
+    corrected_var = np.var(differences, ddof=1, axis=axis) * (1 / kr + n_test / n_train)
     corrected_std = np.sqrt(corrected_var)
     return corrected_std
 
 
-def compute_corrected_ttest(differences, df, n_train, n_test):
+def compute_corrected_ttest(differences, df, n_train, n_test, axis=0):
     """Computes right-tailed paired t-test with corrected variance.
 
     Parameters
     ----------
-    differences : array-like of shape (n_samples,)
-        Vector containing the differences in the score metrics of two models.
+    differences : array-like of shape (n_samples,) or (..., n_samples, ...)
+        Differences in the score metrics of two models, along axis.
     df : int
         Degrees of freedom.
     n_train : int
         Number of samples in the training set.
     n_test : int
         Number of samples in the testing set.
+    axis : int
+        Axis of the model evaluations.
 
     Returns
     -------
-    t_stat : float
+    t_stat : float or ndarray
         Variance-corrected t-statistic.
-    p_val : float
+    p_val : float or ndarray
         Variance-corrected p-value.
     """
-    mean = np.mean(differences)
-    std = corrected_std(differences, n_train, n_test)
+    mean = np.mean(differences, axis=axis)
+    std = corrected_std(differences, n_train, n_test, axis=axis)
     t_stat = mean / std
     p_val = stats.t.sf(np.abs(t_stat), df)  # right-tailed t-test
     return t_stat, p_val
+
+
+def compute_pairwise_corrected_ttest(scores, n_train, n_test):
+    """Computes the corrected t-tests between all pairs of models.
+
+    Parameters
+    ----------
+    scores : ndarray of shape (n_models, n_repeats, n_folds) or (n_models, n_evaluations)
+        Scores of each model, evaluated on the same folds.
+    n_train : int
+        Number of samples in the training set.
+    n_test : int
+        Number of samples in the testing set.
+
+    Returns
+    -------
+    t_stat : ndarray of shape (n_models, n_models)
+        Variance-corrected t-statistic of the row model against the column model (NaN on the diagonal).
+    p_val : ndarray of shape (n_models, n_models)
+        Variance-corrected p-value.
+    """
+    scores = np.reshape(scores, (np.shape(scores)[0], -1))
+    differences = scores[:, np.newaxis, :] - scores[np.newaxis, :, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return compute_corrected_ttest(differences, scores.shape[1] - 1, n_train, n_test, axis=-1)
@@ -15,6 +15,8 @@ import pandas as pd
 
 from general_helper_functions.data_general_utilities import load_epochs, cluster_test, moving_average
 from general_helper_functions.pathHelperFunctions import find_files, path_generator, get_subjects_list
+from general_helper_functions.spatial_index import get_montage_volume_labels
+from general_helper_functions.sequential_permutation import sequential_permutation_test, permutation_seeds
 from decoding.decoding_analysis_parameters_class import DecodingAnalysisParameters
 from decoding.decoding_helper_functions import *
 
@@ -168,9 +170,8 @@ def decoding_analysis(subjects_list, save_folder="super"):
                     data.append(epochs_data[idx, :, :])
 
                     # % get the assigned roi (needed for ROI specificity analsysis)
-                    roi_, _ = mne.get_montage_volume_labels(
-                        epochs.get_montage(), "sub-" + subject, subjects_dir=Path(param.BIDS_root, "derivatives", "fs"),
-                        aseg=param.aseg)
+                    roi_ = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject,
+                                                     Path(param.BIDS_root, "derivatives", "fs"), aseg=param.aseg)
                     rois_ = []
                     for ch in roi_.keys():
                         # Looping through each label of this specific channel:
@@ -225,56 +226,76 @@ def decoding_analysis(subjects_list, save_folder="super"):
                     data = data[:, :, np.where((time >= tm[0]) & (time <= tm[1]))[0]]
                     rois_combined = np.unique(
                         [r.replace('ctx_lh_', '').replace('ctx_rh_', '') for r in param.rois[roi]])
-                    # Initialize the lists containing decoding scores for each roi
-                    decoding_scores = {}
-                    decoding_scores_shuffle = {}
-                    for i, r in enumerate(rois_combined):
+                    # Get the electrodes of each roi:
+                    roi_channels = {}
+                    for r in rois_combined:
                         # get all eletrodes in the roi
                         chs = np.where(np.core.defchararray.find(rois, r) > 0)[0]
                         print('%i chs in %s' % (len(chs), r))
                         if len(chs):
-                            data_ = np.reshape(data[:, chs, :], (np.size(data, 0), len(chs) * np.size(data, 2)))
-                            data_ = np.expand_dims(data_, 2)
-                            decoding_scores[rois_combined[i]], coefs = \
-                                zip(*Parallel(n_jobs=param.classifier_n_jobs)(delayed(
-                                    temporal_generalization_decoding)(clf, data_, y,
-                                                                      analysis_parameters[
-                                                                          "cross_validation_parameters"],
-                                                                      metric=classifier_parameters['metric'],
-                                                                      train_group=analysis_parameters["train_group"],
-                                                                      test_group=analysis_parameters["test_group"],
-                                                                      groups=groups,
-                                                                      n_pseudotrials=classifier_parameters['n_pseudotrials'],
-                                                                      do_only_diag=True,
-                                                                      classifier_n_jobs=1, verbose=False) for _ in tqdm(range(classifier_parameters['repeats']))))
-                            # roi_spec[r] = np.concatenate(decoding_scores, axis=0) 
-
-                            decoding_scores_shuffle[rois_combined[i]], _ = \
-                                zip(*Parallel(n_jobs=param.permutation_n_jobs)(delayed(
-                                    temporal_generalization_decoding)(clf, data_, y,
-                                                                      analysis_parameters[
-                                                                          "cross_validation_parameters"],
-                                                                      metric=classifier_parameters['metric'],
-                                                                      train_group=analysis_parameters["train_group"],
-                                                                      test_group=analysis_parameters["test_group"],
-                                                                      groups=groups,
-                                                                      n_pseudotrials=classifier_parameters['n_pseudotrials'],                                                                      
-                                                                      shuffle_labels=True,
-                                                                      do_only_diag=True,
-                                                                      classifier_n_jobs=1,
-                                                                      average_scores=True, verbose=False) for _ in tqdm(range(analysis_parameters["n_permutations"]))))
-
-                            # % convert from lists of decoding scores & save the results
-                    rois_combined = np.array(list(decoding_scores.keys()))
-                    decoding_scores = np.asarray([np.squeeze(decoding_scores[key]) for key in decoding_scores.keys()])
+                            roi_channels[r] = chs
+                    rois_combined = np.array(list(roi_channels.keys()))
+                    # All the rois are decoded on the same pseudotrials and folds, such that they can be compared
+                    # fold by fold:
+                    decoding_scores, n_train, n_test = \
+                        zip(*Parallel(n_jobs=param.classifier_n_jobs)(delayed(
+                            roi_decoding_scores)(clf, data, y, list(roi_channels.values()),
+                                                 analysis_parameters["cross_validation_parameters"],
+                                                 metric=classifier_parameters['metric'],
+                                                 train_group=analysis_parameters["train_group"],
+                                                 test_group=analysis_parameters["test_group"],
+                                                 groups=groups,
+                                                 n_pseudotrials=classifier_parameters['n_pseudotrials'])
+                                                                    for _ in tqdm(range(classifier_parameters['repeats']))))
+                    # rois x repeats x folds
+                    decoding_scores = np.stack(decoding_scores, axis=1)
+                    # corrected t-tests between each pair of rois (row roi > column roi)
+                    specificity_t_values, specificity_p_values = \
+                        compute_pairwise_corrected_ttest(decoding_scores, n_train[0], n_test[0])
+
+                    # % convert the decoding scores
                     # average across repeats, keeping folds
-                    decoding_scores = np.squeeze(decoding_scores.mean(1))
-                    decoding_scores_shuffle = np.asarray([np.squeeze(decoding_scores_shuffle[key])
-                                                          for key in decoding_scores_shuffle])
-                                                          
+                    decoding_scores = decoding_scores.mean(1)
+
+                    def draw_null(seeds, active):
+                        # Only the rois of which the p-value isn't decided yet are decoded,
+                        # average across folds: permutations x active rois
+                        active_channels = [chs for chs, is_active in zip(roi_channels.values(), active) if is_active]
+                        scores_shuffle, _, _ = \
+                            zip(*Parallel(n_jobs=param.permutation_n_jobs)(delayed(
+                                roi_decoding_scores)(clf, data, y, active_channels,
+                                                     analysis_parameters["cross_validation_parameters"],
+                                                     metric=classifier_parameters['metric'],
+                                                     train_group=analysis_parameters["train_group"],
+                                                     test_group=analysis_parameters["test_group"],
+                                                     groups=groups,
+                                                     n_pseudotrials=classifier_parameters['n_pseudotrials'],
+                                                     shuffle_labels=True, random_state=seed)
+                                                                        for seed in tqdm(seeds)))
+                        return np.stack(scores_shuffle, axis=0).mean(axis=-1)
+
+                    # The permutations are reproducible from this seed, in both the sequential and the full tests:
+                    permutations_random_state = analysis_parameters.get("permutations_random_state", 0)
 
                     # permutation stats
-                    p_values =  (np.sum((  np.mean( decoding_scores, axis=1, keepdims=True) < decoding_scores_shuffle ), axis=1)+1) /  ( np.size(decoding_scores_shuffle, 1)+1)
+                    sequential_parameters = analysis_parameters.get("sequential_permutations")
+                    if sequential_parameters is not None:
+                        # Permutations drawn in batches, until the p-value of each roi is decided:
+                        sequential_parameters = {"alpha": analysis_parameters["decoding_p_value"],
+                                                 "random_state": permutations_random_state, **sequential_parameters}
+                        p_values, n_permutations, decoding_scores_shuffle = \
+                            sequential_permutation_test(np.mean(decoding_scores, axis=1), draw_null,
+                                                        max_perm=analysis_parameters["n_permutations"],
+                                                        **sequential_parameters)
+                        # rois x permutations
+                        decoding_scores_shuffle = decoding_scores_shuffle.T
+                    else:
+                        # rois x permutations
+                        decoding_scores_shuffle = draw_null(permutation_seeds(analysis_parameters["n_permutations"],
+                                                                              random_state=permutations_random_state),
+                                                            np.ones(len(roi_channels), dtype=bool)).T
+                        p_values =  (np.sum((  np.mean( decoding_scores, axis=1, keepdims=True) < decoding_scores_shuffle ), axis=1)+1) /  ( np.size(decoding_scores_shuffle, 1)+1)
+                        n_permutations = np.full(p_values.shape, np.size(decoding_scores_shuffle, 1))
                     if analysis_parameters["fdr_correction"] is not None:
                         sig_mask, _, _, _ = \
                             multipletests(p_values, alpha=analysis_parameters["decoding_p_value"],
@@ -285,7 +306,9 @@ def decoding_analysis(subjects_list, save_folder="super"):
                     file_name = Path(save_path_results, param.files_prefix + roi + "_decoding_roi.npz")
                     np.savez(file_name, decoding_scores=decoding_scores,
                              decoding_scores_shuffle=decoding_scores_shuffle, rois=rois_combined,
-                             analysis_parameters=analysis_parameters, p_values=p_values, sig_mask=sig_mask, channels=channels)
+                             analysis_parameters=analysis_parameters, p_values=p_values, sig_mask=sig_mask, channels=channels,
+                             specificity_t_values=specificity_t_values, specificity_p_values=specificity_p_values,
+                             n_permutations=n_permutations)
 
                     # # % roi decoding plot
 #                     file_name = Path(save_path_fig, param.files_prefix + roi + "_decoding_specificity.png")
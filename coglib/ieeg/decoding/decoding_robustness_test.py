@@ -15,6 +15,7 @@ from tqdm import tqdm
 
 from general_helper_functions.data_general_utilities import load_epochs, cluster_test, moving_average
 from general_helper_functions.pathHelperFunctions import find_files, path_generator, get_subjects_list
+from general_helper_functions.spatial_index import get_montage_volume_labels
 from decoding.decoding_analysis_parameters_class import DecodingAnalysisParameters
 from decoding.decoding_helper_functions import *
 
@@ -149,9 +150,8 @@ def decoding_analysis(subjects_list, save_folder="super"):
                     data.append(epochs_data[idx, :, :])
 
                     # % get the assigned roi (needed for ROI specificity analsysis)
-                    roi_, _ = mne.get_montage_volume_labels(
-                        epochs.get_montage(), "sub-" + subject, subjects_dir=Path(param.BIDS_root, "derivatives", "fs"),
-                        aseg=param.aseg)
+                    roi_ = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject,
+                                                     Path(param.BIDS_root, "derivatives", "fs"), aseg=param.aseg)
                     rois_ = []
                     for ch in roi_.keys():
                         # Looping through each label of this specific channel:
@@ -216,27 +216,28 @@ def decoding_analysis(subjects_list, save_folder="super"):
                         rois_ = rois[chs_].tolist() 
                         data_ = data[:, chs_, :]    
                         
-                        # loop of possible rois
-                        for i, r in enumerate(rois_combined):
+                        # get the electrodes of each possible roi
+                        roi_channels = {}
+                        for r in rois_combined:
                             # get all eletrodes in the roi
                             chs = np.where(np.core.defchararray.find(rois_, r) > 0)[0]
                             print('%i chs in %s' % (len(chs), r))
                             if len(chs):
-                                data__ = np.reshape(data_[:, chs, :], (np.size(data, 0), len(chs) * np.size(data_, 2)))
-                                data__ = np.expand_dims(data__, 2)
-                                scores, coefs = \
-                                    zip(*Parallel(n_jobs=param.classifier_n_jobs)(delayed(
-                                        temporal_generalization_decoding)(clf, data__, y,
-                                                                          analysis_parameters[
-                                                                              "cross_validation_parameters"],
-                                                                          metric=classifier_parameters['metric'],
-                                                                          train_group=analysis_parameters["train_group"],
-                                                                          test_group=analysis_parameters["test_group"],
-                                                                          groups=groups,
-                                                                          do_only_diag=True,
-                                                                          classifier_n_jobs=1, verbose=False) for _ in range(classifier_parameters['repeats'])))
-                                # add the result to the appropriate roi list
-                                decoding_scores[ r ].append( np.mean( np.concatenate(scores, 0) ) )                                          
+                                roi_channels[r] = chs
+                        if len(roi_channels) == 0:
+                            continue
+                        scores, _, _ = \
+                            zip(*Parallel(n_jobs=param.classifier_n_jobs)(delayed(
+                                roi_decoding_scores)(clf, data_, y, list(roi_channels.values()),
+                                                     analysis_parameters["cross_validation_parameters"],
+                                                     metric=classifier_parameters['metric'],
+                                                     train_group=analysis_parameters["train_group"],
+                                                     test_group=analysis_parameters["test_group"],
+                                                     groups=groups) for _ in range(classifier_parameters['repeats'])))
+                        # add the result to the appropriate roi list
+                        scores = np.stack(scores, axis=1)
+                        for i, r in enumerate(roi_channels.keys()):
+                            decoding_scores[r].append(np.mean(scores[i]))
 
 
                     # % convert from lists of decoding scores & save the results
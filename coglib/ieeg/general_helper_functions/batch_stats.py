@@ -0,0 +1,201 @@
+""" This script contains the statistical tests of the single trial data of many channels at once. The long data tables
+(one row per trial) are pivoted once into NaN padded arrays, and the rank sum, signed rank and t-tests are computed for
+all the channels in vectorized form, with the same statistics and p-values as the scipy tests.
+    authors: Alex Lepauvre
+    alex.lepauvre@ae.mpg.de
+    contributors: Katarina Bendtz, Simon Henin
+    katarina.bendtz@tch.harvard.edu
+    Simon.Henin@nyulangone.org
+"""
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, t as t_dist, rankdata
+from statsmodels.stats.multitest import multipletests
+
+
+def pivot_trials(data_df, groups="channel", conditions_col="condition", value_col="value"):
+    """
+    This function pivots a long data table (one row per trial) into an array of groups * trials * conditions. The
+    groups and conditions are in the order of their first appearance in the table and the trials of each group and
+    condition in the order of the table. Groups with less trials in a condition are padded with NaN
+    :param data_df: (pandas data frame) data table, with one row per trial
+    :param groups: (string) name of the column containing the group (i.e. channel) of each trial
+    :param conditions_col: (string) name of the column containing the condition of each trial
+    :param value_col: (string) name of the column containing the value of each trial
+    :return:
+    values: (3D numpy array) values of each trial, groups * trials * conditions
+    group_names: (numpy array) name of each group
+    conditions: (numpy array) name of each condition
+    """
+    group_codes, group_names = pd.factorize(data_df[groups])
+    cond_codes, conditions = pd.factorize(data_df[conditions_col])
+    trial_codes = data_df.groupby([group_codes, cond_codes]).cumcount().to_numpy()
+    values = np.full((len(group_names), trial_codes.max() + 1 if len(trial_codes) > 0 else 0, len(conditions)),
+                     np.nan)
+    values[group_codes, trial_codes, cond_codes] = data_df[value_col].to_numpy(dtype=float)
+    return values, np.asarray(group_names), np.asarray(conditions)
+
+
+def _check_alternative(alternative):
+    if alternative not in ["two-sided", "greater", "less"]:
+        raise ValueError("alternative must be 'less', 'greater' or 'two-sided', not {}".format(alternative))
+
+
+def _pvalue(stat, alternative, sf, cdf):
+    if alternative == "greater":
+        return sf(stat)
+    elif alternative == "less":
+        return cdf(stat)
+    return np.minimum(2 * sf(np.abs(stat)), 1)
+
+
+def _ranks(x, method="average"):
+    # The NaN are ranked last, such that the ranks of the valid values are the same as without them:
+    return rankdata(np.where(np.isnan(x), np.inf, x), method=method, axis=-1)
+
+
+def ranksums_batch(x, y, alternative="two-sided"):
+    """
+    This function computes the Wilcoxon rank sum test of each row of x vs the same row of y, same as
+    scipy.stats.ranksums (normal approximation without ties correction). The NaN are ignored
+    :param x: (2D numpy array) values of the first sample, groups * trials
+    :param y: (2D numpy array) values of the second sample, groups * trials
+    :param alternative: (string) "two-sided", "greater" or "less"
+    :return:
+    statistic: (1D numpy array) z statistic of each group
+    pvalue: (1D numpy array) p-value of each group
+    """
+    _check_alternative(alternative)
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    n1, n2 = np.sum(~np.isnan(x), axis=-1), np.sum(~np.isnan(y), axis=-1)
+    ranks = _ranks(np.concatenate([x, y], axis=-1))[:, :x.shape[-1]]
+    s = np.sum(np.where(np.isnan(x), 0, ranks), axis=-1)
+    expected = n1 * (n1 + n2 + 1) / 2.0
+    z = (s - expected) / np.sqrt(n1 * n2 * (n1 + n2 + 1) / 12.0)
+    return z, _pvalue(z, alternative, norm.sf, norm.cdf)
+
+
+def ttest_ind_batch(x, y, alternative="two-sided"):
+    """
+    This function computes the independent samples t-test (equal variances) of each row of x vs the same row of y,
+    same as scipy.stats.ttest_ind. The NaN are ignored
+    :param x: (2D numpy array) values of the first sample, groups * trials
+    :param y: (2D numpy array) values of the second sample, groups * trials
+    :param alternative: (string) "two-sided", "greater" or "less"
+    :return:
+    statistic: (1D numpy array) t statistic of each group
+    pvalue: (1D numpy array) p-value of each group
+    """
+    _check_alternative(alternative)
+    x, y = np.atleast_2d(x), np.atleast_2d(y)
+    n1, n2 = np.sum(~np.isnan(x), axis=-1), np.sum(~np.isnan(y), axis=-1)
+    df = n1 + n2 - 2
+    pooled_var = ((n1 - 1) * np.nanvar(x, axis=-1, ddof=1) + (n2 - 1) * np.nanvar(y, axis=-1, ddof=1)) / df
+    t = (np.nanmean(x, axis=-1) - np.nanmean(y, axis=-1)) / np.sqrt(pooled_var * (1.0 / n1 + 1.0 / n2))
+    return t, _pvalue(t, alternative, lambda v: t_dist.sf(v, df), lambda v: t_dist.cdf(v, df))
+
+
+def ttest_rel_batch(x, y, alternative="two-sided"):
+    """
+    This function computes the paired samples t-test of each row of x vs the same row of y, same as
+    scipy.stats.ttest_rel. The pairs containing a NaN are ignored
+    :param x: (2D numpy array) values of the first sample, groups * trials
+    :param y: (2D numpy array) values of the second sample, paired with x, groups * trials
+    :param alternative: (string) "two-sided", "greater" or "less"
+    :return:
+    statistic: (1D numpy array) t statistic of each group
+    pvalue: (1D numpy array) p-value of each group
+    """
+    _check_alternative(alternative)
+    d = np.atleast_2d(x) - np.atleast_2d(y)
+    n = np.sum(~np.isnan(d), axis=-1)
+    df = n - 1
+    t = np.nanmean(d, axis=-1) / np.sqrt(np.nanvar(d, axis=-1, ddof=1) / n)
+    return t, _pvalue(t, alternative, lambda v: t_dist.sf(v, df), lambda v: t_dist.cdf(v, df))
+
+
+@lru_cache(maxsize=None)
+def _signed_rank_distribution(n):
+    """
+    Probability of each value of the signed rank statistic under the null hypothesis, for n observations without ties
+    (i.e. the number of subsets of 1..n of each sum, divided by 2 ** n)
+    """
+    counts = np.zeros(n * (n + 1) // 2 + 1)
+    counts[0] = 1
+    for k in range(1, n + 1):
+        counts[k:] = counts[k:] + counts[:-k].copy()
+    return counts / 2.0 ** n
+
+
+def wilcoxon_batch(d, alternative="two-sided", exact_max_n=25):
+    """
+    This function computes the Wilcoxon signed rank test of each row of d (i.e. the differences between paired
+    samples), same as scipy.stats.wilcoxon with the default "wilcox" zero method: the zeros are discarded. The p-values
+    are exact for the rows with up to exact_max_n observations without ties, and otherwise from the normal
+    approximation with ties correction. The NaN are ignored. The default exact_max_n of 25 is the switch of the
+    scipy version pinned in the environments (scipy < 1.9), scipy >= 1.9 switches at 50
+    :param d: (2D numpy array) differences between the paired samples, groups * trials
+    :param alternative: (string) "two-sided", "greater" or "less"
+    :param exact_max_n: (int) maximal number of observations for which the exact p-values are computed
+    :return:
+    statistic: (1D numpy array) sum of the ranks of the positive differences, or the minimum of the sums of the ranks
+    of the positive and negative differences in the two-sided case
+    pvalue: (1D numpy array) p-value of each group
+    """
+    _check_alternative(alternative)
+    d = np.atleast_2d(np.asarray(d, dtype=float))
+    valid = ~np.isnan(d) & (d != 0)
+    n = np.sum(valid, axis=-1)
+    abs_d = np.where(valid, np.abs(d), np.nan)
+    r_plus = np.sum(np.where(valid & (d > 0), _ranks(abs_d), 0), axis=-1)
+    r_minus = n * (n + 1) / 2.0 - r_plus
+    # Size of the ties group of each observation, from the span of its ranks:
+    ties = _ranks(abs_d, method="max") - _ranks(abs_d, method="min") + 1
+    ties_term = np.sum(np.where(valid, ties ** 2 - 1, 0), axis=-1)
+    statistic = np.minimum(r_plus, r_minus) if alternative == "two-sided" else r_plus
+
+    # Normal approximation:
+    se = np.sqrt(n * (n + 1) * (2 * n + 1) / 24.0 - ties_term / 48.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z = (r_plus - n * (n + 1) / 4.0) / se
+    pvalue = _pvalue(z, alternative, norm.sf, norm.cdf)
+
+    # Exact p-values for the rows without ties nor zeros:
+    exact = (n > 0) & (n <= exact_max_n) & (ties_term == 0) & (n == np.sum(~np.isnan(d), axis=-1))
+    for n_obs in np.unique(n[exact]):
+        rows = np.where(exact & (n == n_obs))[0]
+        pmf = _signed_rank_distribution(int(n_obs))
+        r = r_plus[rows].astype(int)
+        p_greater = np.cumsum(pmf[::-1])[::-1][r]
+        p_less = np.cumsum(pmf)[r]
+        if alternative == "greater":
+            pvalue[rows] = p_greater
+        elif alternative == "less":
+            pvalue[rows] = p_less
+        else:
+            pvalue[rows] = np.minimum(2 * np.minimum(p_greater, p_less), 1)
+    pvalue[n == 0] = np.nan
+    return statistic, pvalue
+
+
+def fdr_correction(pvalues, alpha=0.05, method="fdr_bh", groups=None):
+    """
+    This function corrects the p-values for multiple comparisons, separately within each group if groups are passed
+    :param pvalues: (1D array like) p-values to correct
+    :param alpha: (float) family wise error rate
+    :param method: (string) correction method, see statsmodels.stats.multitest.multipletests
+    :param groups: (1D array like or None) group of each p-value, for instance the condition of each test
+    :return:
+    reject: (1D numpy array of bool) whether the null hypothesis is rejected for each test
+    pvalues_corrected: (1D numpy array) corrected p-values
+    """
+    pvalues = np.asarray(pvalues, dtype=float)
+    groups = np.zeros(pvalues.shape[0]) if groups is None else np.asarray(groups)
+    reject = np.zeros(pvalues.shape[0], dtype=bool)
+    pvalues_corrected = np.zeros(pvalues.shape[0])
+    for group in pd.unique(groups):
+        mask = groups == group
+        reject[mask], pvalues_corrected[mask], _, _ = multipletests(pvalues[mask], alpha=alpha, method=method)
+    return reject, pvalues_corrected
@@ -5,6 +5,8 @@
     Simon.Henin@nyulangone.org
 """
 import os
+import json
+import hashlib
 from pathlib import Path
 
 import mne.time_frequency
@@ -14,8 +16,10 @@ import mne
 import scipy
 from mne.baseline import rescale
 from mne_bids import BIDSPath
+from joblib import Parallel, delayed
 
 from general_helper_functions.pathHelperFunctions import find_files
+from general_helper_functions.spatial_index import get_montage_volume_labels
 from mne.stats.cluster_level import _find_clusters, _cluster_indices_to_mask, _cluster_mask_to_indices, \
     _pval_from_histogram, _reshape_clusters
 
@@ -529,82 +533,40 @@ def epochs_mvavg(epochs, window_ms):
     return epochs
 
 
-def load_epochs(root, signal, subject, session="V1", task_name="Dur", preprocess_folder="epoching",
-                preprocess_steps="desbadcharej_notfil_autbadcharej_lapref", channel_types=None, condition=None,
-                baseline_method=None, baseline_time=(None, 0), crop_time=None,
-                select_vis_resp=False, vis_resp_folder="high_gamma_wilcoxon_onset_activation_no_fdr",
-                aseg="aparc.a2009s+aseg", montage_space="T1", get_mni_coord=False, picks_roi=None,
-                filtering_parameters=None, mvavg_window_ms=None):
+def epochs_cache_key(files, **kwargs):
     """
-    This function loads epochs data of a given participant according to the different passed parameters (session, folder
-    preprocessing steps...). It further performs some data preparation such as baseline correction, selecting specific
-    conditions. There is furthermore the option to load the roi for each electrode.
-    :param root: (string or pathlib object) path to the bids root
-    :param signal: (string) name of the signal to investigate
-    :param baseline_method: (string) name of the method to compute the baseline correction, see baseline_rescale from
-    mne for more details
-    :param subject: (string) name of the subject
-    :param baseline_time: (list of two floats) onset and offset for baseline correction
-    :param crop_time: (list of two floats) time points to crop the epochs
-    :param select_vis_resp: (boolean) whether or not to select only the visually responsive channels
-    :param vis_resp_folder: (string) name of the folder containing the visually responsiveness results. The visual resp
-    analysis can be ran in several different ways, you must choose which option you want!
-    :param condition: (string) name of the condition to use
-    :param session: (string) name of the session
-    :param task_name: (string) name of the task
-    :param preprocess_folder: (string) name of the preprocessing folder
-    :param preprocess_steps: (string) name of the preprocessing step to use
-    :param channel_types: (dict or None) channel_type: True for the channel types to load
-    :param aseg: (string) segmentation file to use from the freesufer folder
-    :param montage_space: (string) montage space: "T1" or "MNI"
-    :param get_mni_coord: (boolean) whether or not to return the mni coordinates of the electrodes for the given subject
-    :param picks_roi: (list of strings) contains a list of ROI according to the segmentation passed in aseg. If
-    something is passed (as opposed to None), only electrodes found within the said ROI will be selected!
-    :param filtering_parameters: (dict) contains the multitaper parameters. Must have the format:
-    {
-        "freq_range": [8, 13],
-        "step": 1,
-        "n_cycle_denom": 2,
-        "time_bandwidth": 4.0
-    }
-    :param mvavg_window_ms: (int or None) moving average window to smooth the data in a non-overlapping fashion
-    :return:
+    This function generates the key under which derived epochs are cached: a hash of the files they are computed from
+    (path, size and modification time) and of all the parameters of the computation
+    :param files: (list of strings or pathlib paths or None) files the epochs are computed from, None are ignored
+    :param kwargs: parameters of the computation, must be json serializable
+    :return: (string) hexadecimal hash
     """
-    print("=" * 40)
-    print("loading sub-{} epochs".format(subject))
-    if channel_types is None:
-        channel_types = {"seeg": True, "ecog": True}
-    file_dir = str(Path(root, "derivatives", "preprocessing", "sub-" + subject,
-                        "ses-" + session, "ieeg", preprocess_folder, signal, preprocess_steps))
-    data_file = find_files(file_dir,
-                           naming_pattern="*-epo", extension=".fif")
-    try:
-        epochs = mne.read_epochs(data_file[-1],
-                                 verbose='error', preload=True)
-    except IndexError:
-        raise Exception("No data found for sub-{}".format(subject))
+    key = {"files": [[str(f), os.stat(f).st_size, os.stat(f).st_mtime] for f in files if f is not None]}
+    key.update(kwargs)
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
 
-    # There is a bug from MNE such that the montage coordinate space is ignore and considered to be head always.
-    # Setting the montage to the correct coordinates frame:
-    from mne.io.constants import FIFF
-    for d in epochs.info["dig"]:
-        d['coord_frame'] = FIFF.FIFFV_COORD_MRI
+
+def derive_epochs(data_file, channel_types, condition=None, baseline_method=None, baseline_time=(None, 0),
+                  crop_time=None, vis_resp_file=None, subject=None, filtering_parameters=None, mvavg_window_ms=None):
+    """
+    This function reads the epochs file and derives the signal to analyze from it: channels and conditions selection,
+    baseline correction, band power and smoothing. See load_epochs for the parameters
+    :param data_file: (string or pathlib path) path to the epochs file
+    :param vis_resp_file: (string or None) path to the visual responsiveness results, to select only the visually
+    responsive channels
+    :return: (mne epochs object or None) derived epochs, None if there are no visually responsive channels
+    """
+    epochs = mne.read_epochs(data_file, verbose='error', preload=True)
 
     # Getting only the visual responsive channels if required:
-    if select_vis_resp:
-        # Generating the path to the visual responsiveness folder:
-        vis_resp_files = find_files(Path(root, "derivatives", "visual_responsiveness",
-                                         "sub-super", "ses-" + session, "ieeg", "results",
-                                         vis_resp_folder, preprocess_steps), naming_pattern="*vis_resp_all_results",
-                                    extension=".csv")
-        assert len(vis_resp_files) == 1, "ERROR: there was not 1 folder for visual responsiveness results!"
+    if vis_resp_file is not None:
         # Get the visually responsive channels:
-        picks = get_vis_resp_channels(subject, vis_resp_files[0])
+        picks = get_vis_resp_channels(subject, vis_resp_file)
         try:
             epochs.pick(picks)
         except ValueError:
             print("WARNING: For sub-{} there were not onset responsive electrodes".format(subject))
-            return None, None
+            return None
     # Get the picks:
     picks = mne.pick_types(epochs.info, **channel_types)
     epochs.pick(picks)
@@ -660,6 +622,124 @@ def load_epochs(root, signal, subject, session="V1", task_name="Dur", preprocess
     if mvavg_window_ms is not None:
         epochs = epochs_mvavg(epochs, mvavg_window_ms)
 
+    return epochs
+
+
+def load_subjects_epochs(root, signal, subjects, n_jobs=1, **kwargs):
+    """
+    This function loads the epochs of several subjects concurrently, in a pool of threads
+    :param root: (string or pathlib object) path to the bids root
+    :param signal: (string) name of the signal to investigate
+    :param subjects: (list of strings) name of the subjects
+    :param n_jobs: (int) number of subjects loaded in parallel
+    :param kwargs: parameters of load_epochs
+    :return:
+    epochs: (dict) epochs of each subject
+    mni_coord: (dict) mni coordinates of each subject
+    """
+    results = Parallel(n_jobs=n_jobs, prefer="threads")(delayed(load_epochs)(root, signal, subject, **kwargs)
+                                                        for subject in subjects)
+    epochs = {subject: res[0] for subject, res in zip(subjects, results)}
+    mni_coord = {subject: res[1] for subject, res in zip(subjects, results)}
+    return epochs, mni_coord
+
+
+def load_epochs(root, signal, subject, session="V1", task_name="Dur", preprocess_folder="epoching",
+                preprocess_steps="desbadcharej_notfil_autbadcharej_lapref", channel_types=None, condition=None,
+                baseline_method=None, baseline_time=(None, 0), crop_time=None,
+                select_vis_resp=False, vis_resp_folder="high_gamma_wilcoxon_onset_activation_no_fdr",
+                aseg="aparc.a2009s+aseg", montage_space="T1", get_mni_coord=False, picks_roi=None,
+                filtering_parameters=None, mvavg_window_ms=None, use_cache=True):
+    """
+    This function loads epochs data of a given participant according to the different passed parameters (session, folder
+    preprocessing steps...). It further performs some data preparation such as baseline correction, selecting specific
+    conditions. There is furthermore the option to load the roi for each electrode.
+    :param root: (string or pathlib object) path to the bids root
+    :param signal: (string) name of the signal to investigate
+    :param baseline_method: (string) name of the method to compute the baseline correction, see baseline_rescale from
+    mne for more details
+    :param subject: (string) name of the subject
+    :param baseline_time: (list of two floats) onset and offset for baseline correction
+    :param crop_time: (list of two floats) time points to crop the epochs
+    :param select_vis_resp: (boolean) whether or not to select only the visually responsive channels
+    :param vis_resp_folder: (string) name of the folder containing the visually responsiveness results. The visual resp
+    analysis can be ran in several different ways, you must choose which option you want!
+    :param condition: (string) name of the condition to use
+    :param session: (string) name of the session
+    :param task_name: (string) name of the task
+    :param preprocess_folder: (string) name of the preprocessing folder
+    :param preprocess_steps: (string) name of the preprocessing step to use
+    :param channel_types: (dict or None) channel_type: True for the channel types to load
+    :param aseg: (string) segmentation file to use from the freesufer folder
+    :param montage_space: (string) montage space: "T1" or "MNI"
+    :param get_mni_coord: (boolean) whether or not to return the mni coordinates of the electrodes for the given subject
+    :param picks_roi: (list of strings) contains a list of ROI according to the segmentation passed in aseg. If
+    something is passed (as opposed to None), only electrodes found within the said ROI will be selected!
+    :param filtering_parameters: (dict) contains the multitaper parameters. Must have the format:
+    {
+        "freq_range": [8, 13],
+        "step": 1,
+        "n_cycle_denom": 2,
+        "time_bandwidth": 4.0
+    }
+    :param mvavg_window_ms: (int or None) moving average window to smooth the data in a non-overlapping fashion
+    :param use_cache: (boolean) whether to save and reuse the epochs filtered in the frequency band. They are saved in
+    derivatives/epochs_cache, under a hash of the data file and of all the parameters affecting them, such that any
+    change of the data or of the parameters leads to a new computation
+    :return:
+    """
+    print("=" * 40)
+    print("loading sub-{} epochs".format(subject))
+    if channel_types is None:
+        channel_types = {"seeg": True, "ecog": True}
+    file_dir = str(Path(root, "derivatives", "preprocessing", "sub-" + subject,
+                        "ses-" + session, "ieeg", preprocess_folder, signal, preprocess_steps))
+    data_file = find_files(file_dir,
+                           naming_pattern="*-epo", extension=".fif")
+    if len(data_file) == 0:
+        raise Exception("No data found for sub-{}".format(subject))
+    vis_resp_file = None
+    if select_vis_resp:
+        # Generating the path to the visual responsiveness folder:
+        vis_resp_files = find_files(Path(root, "derivatives", "visual_responsiveness",
+                                         "sub-super", "ses-" + session, "ieeg", "results",
+                                         vis_resp_folder, preprocess_steps), naming_pattern="*vis_resp_all_results",
+                                    extension=".csv")
+        assert len(vis_resp_files) == 1, "ERROR: there was not 1 folder for visual responsiveness results!"
+        vis_resp_file = vis_resp_files[0]
+
+    # The band power transform is the costly part, its output is cached:
+    cache_file = None
+    if use_cache and filtering_parameters is not None:
+        cache_key = epochs_cache_key([data_file[-1], vis_resp_file], channel_types=channel_types,
+                                     condition=condition, baseline_method=baseline_method,
+                                     baseline_time=baseline_time, crop_time=crop_time,
+                                     filtering_parameters=filtering_parameters, mvavg_window_ms=mvavg_window_ms)
+        cache_file = Path(root, "derivatives", "epochs_cache", "sub-" + subject, "ses-" + session, "ieeg",
+                          cache_key + "-epo.fif")
+    if cache_file is not None and cache_file.is_file():
+        print("Loading the cached epochs {}".format(cache_file))
+        epochs = mne.read_epochs(cache_file, verbose='error', preload=True)
+    else:
+        epochs = derive_epochs(data_file[-1], channel_types=channel_types, condition=condition,
+                               baseline_method=baseline_method, baseline_time=baseline_time, crop_time=crop_time,
+                               vis_resp_file=vis_resp_file, subject=subject,
+                               filtering_parameters=filtering_parameters, mvavg_window_ms=mvavg_window_ms)
+        if epochs is None:
+            return None, None
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            # Saved under a temporary name first, for concurrent jobs to never read a partial file:
+            tmp_file = cache_file.with_name("{}_{}-epo.fif".format(cache_key, os.getpid()))
+            epochs.save(tmp_file, fmt="double", overwrite=True, verbose="error")
+            os.replace(tmp_file, cache_file)
+
+    # There is a bug from MNE such that the montage coordinate space is ignore and considered to be head always.
+    # Setting the montage to the correct coordinates frame:
+    from mne.io.constants import FIFF
+    for d in epochs.info["dig"]:
+        d['coord_frame'] = FIFF.FIFFV_COORD_MRI
+
     bids_path = BIDSPath(root=root, subject=subject,
                          session=session,
                          datatype="ieeg",
@@ -677,8 +757,8 @@ def load_epochs(root, signal, subject, session="V1", task_name="Dur", preprocess
     # Getting the ROI if required:
     if picks_roi is not None:
         # Now get the labels:
-        labels, _ = mne.get_montage_volume_labels(
-            epochs.get_montage(), "sub-" + subject, subjects_dir=Path(root, "derivatives", "fs"), aseg=aseg)
+        labels = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject, Path(root, "derivatives", "fs"),
+                                           aseg=aseg)
         roi_picks = find_channels_in_roi(picks_roi, labels)
         if len(roi_picks) < 1:
             print("WARNING: For sub-{} there were not electroodes found in the following regions {}".format(subject,
@@ -712,21 +792,15 @@ def get_mni_coordinates(bids_path, picks):
         recon_file[0], sep='\t')  # Loading the coordinates
     channel_info = pd.read_csv(channel_info_file[0], sep='\t')
 
-    selected_channels = channels_coordinates.loc[channels_coordinates["name"].isin(picks)]
-    mni_coordinates = pd.DataFrame()
-    for channel in picks:
-        x = selected_channels.loc[selected_channels["name"] == channel, "x"].item()
-        y = selected_channels.loc[selected_channels["name"] == channel, "y"].item()
-        z = selected_channels.loc[selected_channels["name"] == channel, "z"].item()
-        channels_types = channel_info.loc[channel_info["name"] == channel, "type"].item()
-        mni_coordinates = mni_coordinates.append(pd.DataFrame({
-            "channels": channel,
-            "ch_types": channels_types,
-            "x": x,
-            "y": y,
-            "z": z
-        }, index=[0]))
-    mni_coordinates = mni_coordinates.reset_index(drop=True)
+    # Look up all the channels at once, in the order of the picks:
+    selected_channels = channels_coordinates.set_index("name").loc[picks]
+    mni_coordinates = pd.DataFrame({
+        "channels": picks,
+        "ch_types": channel_info.set_index("name").loc[picks, "type"].to_numpy(),
+        "x": selected_channels["x"].to_numpy(),
+        "y": selected_channels["y"].to_numpy(),
+        "z": selected_channels["z"].to_numpy()
+    })
     return mni_coordinates
 
 
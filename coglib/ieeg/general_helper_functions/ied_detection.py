@@ -2,104 +2,249 @@
 Port of Janca, 2014 IED detection algorithm
 https://link.springer.com/article/10.1007/s10548-014-0379-1
 
+All steps operate on (channels x samples) arrays, such that blocks of channels are processed at once, and blocks are
+spread across processes in Janca_IED_Detection.
+
 @author: Simon Henin
 simon.henin@nyulangone.org
 """
-# %% 
+# %%
 from scipy import signal
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
 import numpy as np
+from joblib import Parallel, delayed
 from mne.filter import resample
 import pandas as pd
 
 
 # %%
-def local_maxima_detection(envelope, prah_int, fs, polyspike_union_time=0.12):
-    marker1 = np.zeros_like(envelope);
-    marker1[np.where(envelope > prah_int)[0]] = 1;  # crossing of high threshold
+def _find_runs(marker):
+    """
+    Find the runs of consecutive non-zero samples in each row of a 2D marker array
+    :param marker: (np array) channels x samples
+    :return: rows, starts, ends: (np arrays) channel, first and last (inclusive) sample of each run, ordered by
+    channel and time
+    """
+    padded = np.zeros((marker.shape[0], marker.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = marker != 0
+    d = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(d > 0)  # strat crossing
+    _, ends = np.nonzero(d < 0)  # end crossing
+    return rows, starts, ends - 1
+
+
+def _first_argmax_per_run(values, run_ids, n_runs):
+    """
+    Position of the first maximum of each run, values and run_ids being the concatenation of all runs samples
+    """
+    run_max = np.full(n_runs, -np.inf)
+    np.maximum.at(run_max, run_ids, values)
+    is_max = values == run_max[run_ids]
+    _, first = np.unique(run_ids[is_max], return_index=True)
+    return np.nonzero(is_max)[0][first]
+
+
+def _run_samples(starts, ends):
+    """
+    Samples offsets of each run relative to the first run sample, along with the run index of each sample
+    """
+    lengths = ends - starts + 1
+    run_ids = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return run_ids, offsets
 
-    #
-    point1 = np.where(np.diff(np.concatenate((np.array((0,)), marker1), 0)) > 0)[0]  # strat crossing
-    point2 = np.where(np.diff(np.concatenate((marker1, np.array((0,))), 0)) < 0)[0]  # end crossing
-    point = np.stack((point1, point2), axis=1)
 
-    # switch ti_switch
-    #     case 2
-    #         envelope=abs(d_decim);
-    # end
+def local_maxima_detection(envelope, prah_int, fs, polyspike_union_time=0.12):
+    """
+    Detection of the local maxima of the envelope crossing the threshold curve. Accepts a single channel (samples) or
+    several channels at once (channels x samples)
+    """
+    one_dim = envelope.ndim == 1
+    envelope = np.atleast_2d(envelope)
+    prah_int = np.atleast_2d(prah_int)
+    n_chans, n_samples = envelope.shape
+    # crossing of high threshold
+    rows, p1, p2 = _find_runs(envelope > prah_int)
 
     marker1 = np.zeros_like(envelope)  # false(size(envelope));
-    for k in range(point.shape[0]):  # 1:size(point,1)
-        # detection of local maxima in section which crossed threshold curve
-        if (point[k, 1] - point[k, 0] > 2):
-            seg = envelope[point[k, 0]:point[k, 1] + 1]
-            seg_s = np.diff(seg);
-            seg_s = np.sign(seg_s);
-            seg_s = np.where(np.diff(np.concatenate((np.array((0,)), seg_s))) < 0)[
-                0]  # positions of local maxima in the section
-
-            marker1[point[k, 0] + seg_s - 1] = 1
-        elif (point[k, 1] - point[k, 1] <= 2):
-            seg = envelope[point[k, 0]:point[k, 1] + 1]
-            s_max = np.argmax(seg)  # positions of local maxima in the section
-            marker1[point[k, 0] + s_max - 1] = 1
+    # detection of local maxima in section which crossed threshold curve.
+    # Long sections: positions of local maxima from the sign of the derivative. Note that the original port marks the
+    # sample preceding the maximum, which is kept for consistency:
+    seg_sign = np.sign(np.diff(envelope, axis=1))
+    long_runs = p2 - p1 > 2
+    run_ids, offsets = _run_samples(p1[long_runs], p2[long_runs] - 1)
+    ch = rows[long_runs][run_ids]
+    pos = p1[long_runs][run_ids] + offsets
+    prev_sign = np.where(offsets == 0, 0, seg_sign[ch, np.maximum(pos - 1, 0)])
+    is_max = seg_sign[ch, pos] - prev_sign < 0
+    marker1[ch[is_max], (pos[is_max] - 1) % n_samples] = 1
+    # Short sections: position of the maximum of the section:
+    short_rows, short_p1, short_p2 = rows[~long_runs], p1[~long_runs], p2[~long_runs]
+    cand = short_p1[:, None] + np.arange(3)
+    cand_val = np.where(cand <= short_p2[:, None],
+                        envelope[short_rows[:, None], np.minimum(cand, n_samples - 1)], -np.inf)
+    s_max = np.argmax(cand_val, axis=1)
+    marker1[short_rows, (short_p1 + s_max - 1) % n_samples] = 1
 
     # union of section, where local maxima are close together <(1/f_low + 0.02 sec.)~ 120 ms
-    pointer = np.where(marker1 == 1)[0]  # index of local maxima
-    state_previous = False
-    for k in range(len(pointer)):
-        if np.ceil(pointer[k] + polyspike_union_time * fs) > np.size(marker1, 0):
-            seg = marker1[pointer[k] + 1:-1];
-        else:
-            seg = marker1[pointer[k] + 1:int(np.ceil(pointer[k] + polyspike_union_time * fs) + 1)];
-
-        if state_previous:
-            if np.sum(seg) > 0:
-                state_previous = True;
-            else:
-                state_previous = False;
-                marker1[start:pointer[k]] = 1;
-        else:
-            if np.sum(seg) > 0:
-                state_previous = True
-                start = pointer[k]
+    ptr_rows, pointer = np.nonzero(marker1 == 1)  # index of local maxima
+    window_end = np.ceil(pointer + polyspike_union_time * fs)
+    seg_end = np.where(window_end > n_samples, n_samples - 1, window_end + 1)
+    # A maxima is followed by another one within the union time if the next maxima of the same channel falls within
+    # the segment:
+    has_next = np.zeros(pointer.shape[0], dtype=bool)
+    same_ch = ptr_rows[1:] == ptr_rows[:-1]
+    has_next[:-1] = same_ch & (pointer[1:] < seg_end[:-1])
+    # Chains of maxima are united from the first to the last maxima of the chain:
+    prev_next = np.concatenate([[False], has_next[:-1] & same_ch])
+    chain_start = np.nonzero(has_next & ~prev_next)[0]
+    chain_end = np.nonzero(~has_next & prev_next)[0]
+    fill = np.zeros((n_chans, n_samples + 1))
+    np.add.at(fill, (ptr_rows[chain_start], pointer[chain_start]), 1)
+    np.add.at(fill, (ptr_rows[chain_end], pointer[chain_end]), -1)
+    marker1[np.cumsum(fill, axis=1)[:, :-1] > 0] = 1
 
     # finding of the highes maxima of the section with local maxima
-    point1 = np.where(np.diff(np.concatenate((np.array((0,)), marker1), 0)) > 0)[0]  # strat crossing
-    point2 = np.where(np.diff(np.concatenate((marker1, np.array((0,))), 0)) < 0)[0]  # end crossing
-    point = np.stack((point1, point2), axis=1)
-
+    rows, q1, q2 = _find_runs(marker1)
     # local maxima with gradient in souroundings
-    for k in range(np.size(point, 0)):
-        if point[k, 1] - point[k, 0] > 1:
-            lokal_max = pointer[(pointer >= point[k, 0]) & (pointer <= point[k, 1])];  # index of local maxima
-            marker1[point[k, 0]:point[k, 1]] = 0;
-            lokal_max_val = envelope[lokal_max];  # envelope magnitude in local maxima
-            lokal_max_poz = np.where(
-                np.diff(np.sign(np.diff(np.concatenate((np.array((0,)), lokal_max_val, np.array((0,)))))) < 0) > 0)[0]
-            marker1[lokal_max[lokal_max_poz]] = 1
-
-    return marker1
+    sections = q2 - q1 > 1
+    run_ids, offsets = _run_samples(q1[sections], q2[sections] - 1)
+    marker1[rows[sections][run_ids], q1[sections][run_ids] + offsets] = 0
+    # Section of each local maxima:
+    ptr_flat = ptr_rows * n_samples + pointer
+    sec_first = np.searchsorted(ptr_flat, rows[sections] * n_samples + q1[sections], side="left")
+    sec_last = np.searchsorted(ptr_flat, rows[sections] * n_samples + q2[sections], side="right") - 1
+    valid = sec_last >= sec_first
+    run_ids, offsets = _run_samples(sec_first[valid], sec_last[valid])
+    lokal_max = sec_first[valid][run_ids] + offsets
+    lokal_max_val = envelope[ptr_rows[lokal_max], pointer[lokal_max]]  # envelope magnitude in local maxima
+    is_first = lokal_max == sec_first[valid][run_ids]
+    is_last = lokal_max == sec_last[valid][run_ids]
+    prev_val = np.where(is_first, 0, envelope[ptr_rows[lokal_max - 1], pointer[lokal_max - 1]])
+    next_val = np.where(is_last, 0,
+                        envelope[ptr_rows[np.minimum(lokal_max + 1, len(pointer) - 1)],
+                                 pointer[np.minimum(lokal_max + 1, len(pointer) - 1)]])
+    # Changes of the sign of the gradient between neighbouring maxima:
+    lokal_max_poz = (lokal_max_val - prev_val < 0) != (next_val - lokal_max_val < 0)
+    marker1[ptr_rows[lokal_max[lokal_max_poz]], pointer[lokal_max[lokal_max_poz]]] = 1
+
+    return marker1[0] if one_dim else marker1
 
 
 def detection_union(marker1, envelope, union_samples):
+    """
+    Union of the detections closer than union_samples, keeping the position of the envelope maximum of each united
+    section. Accepts a single channel (samples) or several channels at once (channels x samples)
+    """
+    one_dim = marker1.ndim == 1
+    marker1 = np.atleast_2d(marker1)
+    envelope = np.atleast_2d(envelope)
     # do the union
+    union_samples = int(union_samples)
     if np.mod(union_samples, 2) == 0:
         union_samples = union_samples + 1
 
-    MASK = np.ones((union_samples,))
-    marker1 = (np.convolve(marker1, MASK, 'same') > 0);  # dilatation
-    marker1 = np.logical_not(np.convolve(np.logical_not(marker1), MASK, 'same'))  # erosion
+    marker1 = maximum_filter1d(marker1 > 0, union_samples, axis=1, mode="constant", cval=0)  # dilatation
+    marker1 = minimum_filter1d(marker1, union_samples, axis=1, mode="constant", cval=1)  # erosion
 
     marker2 = np.zeros_like(marker1)  # false(size(marker1));
-    point1 = np.where(np.diff(np.concatenate((np.array((0,)), marker1), 0)) > 0)[0]  # strat crossing
-    point2 = np.where(np.diff(np.concatenate((marker1, np.array((0,))), 0)) < 0)[0]  # end crossing
-    point = np.stack((point1, point2), axis=1)
+    rows, p1, p2 = _find_runs(marker1)
+    run_ids, offsets = _run_samples(p1, p2)
+    maxp = _first_argmax_per_run(envelope[rows[run_ids], p1[run_ids] + offsets], run_ids, len(p1))
+    marker2[rows[run_ids[maxp]], p1[run_ids[maxp]] + offsets[maxp]] = 1
+
+    return marker2[0] if one_dim else marker2
+
+
+def background_thresholds(envelope, fs, k, k3=0., winlength=5., overlap=4.):
+    """
+    Threshold curves from the log-normal distribution of the envelope in overlapping windows, computed for all
+    channels at once with cumulative sums of the log envelope
+    :param envelope: (np array) channels x samples envelope
+    :param fs: sampling frequency
+    :param k: (list of float) threshold factors for which to compute the threshold curves
+    :param k3: decrease the threshold value
+    :param winlength: size of segment in seconds around spike for background definition
+    :param overlap: overlap of segment in seconds
+    :return: (list of np arrays) channels x samples threshold curve for each k
+    """
+    n_chans, n_samples = envelope.shape
+    winsize = int(winlength * fs)
+    noverlap = int(overlap * fs)
+    index = np.arange(0, n_samples - winsize, winsize - noverlap, dtype=int)
+    if len(index) < 2:
+        raise ValueError("The signal is too short for the background window length and overlap!")
+    # log-mean and log-std of each window, from the cumulative sums of the (centered) log envelope:
+    log_env = np.log(envelope)
+    log_mean = np.mean(log_env, axis=1, keepdims=True)
+    log_env -= log_mean
+    csum = np.zeros((n_chans, n_samples + 1))
+    csum_sq = np.zeros((n_chans, n_samples + 1))
+    np.cumsum(log_env, axis=1, out=csum[:, 1:])
+    np.cumsum(log_env ** 2, axis=1, out=csum_sq[:, 1:])
+    win_mean = (csum[:, index + winsize] - csum[:, index]) / winsize
+    win_var = (csum_sq[:, index + winsize] - csum_sq[:, index]) / winsize - win_mean ** 2
+    phat = np.stack([win_mean + log_mean,
+                     np.sqrt(np.maximum(win_var, 0))], axis=-1)
+
+    r = n_samples / len(index)
+    n_average = winsize / fs
+
+    if round(n_average * fs / r) > 1:
+        phat = signal.filtfilt(np.ones((int(np.round(n_average * fs / r)),)) / (np.round(n_average * fs / r)), 1,
+                               phat, axis=1)
+
+    # % interpolation of thresholds value to threshold curve (like background), shared weights for all channels
+    xp = index + np.round(winsize / 2)
+    x = np.arange(xp[0], xp[-1])
+    right = np.clip(np.searchsorted(xp, x, side="right"), 1, len(xp) - 1)
+    weight = (x - xp[right - 1]) / (xp[right] - xp[right - 1])
+    phat_int = phat[:, right - 1] * (1 - weight[None, :, None]) + phat[:, right] * weight[None, :, None]
+    n_before = int(np.floor(winsize / 2))
+    n_after = int(n_samples - (phat_int.shape[1] + np.floor(winsize / 2)))
+    phat_int = np.concatenate((np.repeat(phat_int[:, :1], n_before, axis=1), phat_int,
+                               np.repeat(phat_int[:, -1:], n_after, axis=1)), axis=1)
+
+    lognormal_mode = np.exp(phat_int[..., 0] - phat_int[..., 1] ** 2)
+    lognormal_median = np.exp(phat_int[..., 0])
+    lognormal_mean = np.exp(phat_int[..., 0] + (phat_int[..., 1] ** 2) / 2)
+
+    return [k_ * (lognormal_mode + lognormal_median) - k3 * (lognormal_mean - lognormal_mode) for k_ in k]
 
-    for i in range(np.size(point, 0)):
-        maxp = np.argmax(envelope[point[i, 0]:point[i, 1] + 1])
-        marker2[point[i, 0] + maxp] = 1
 
-    return marker2
+def multi_channel_detect(envelope, fs, k1=3.65, k2=3.65, k3=0., winlength=5., overlap=4.,
+                         polyspike_union_time=0.12):
+    """
+    IED detection on several channels at once:
+        envelope: hilbert envelope of the signal to analyze (channels x samples)
+        fs: sampling frequency
+        k1, k2, k3, winlength, overlap, polyspike_union_time: see one_channel_detect
+
+        returns:
+            markers_high - channels x samples timecourse of unambigious spikes (1=spike, 0=nospike) (based on k1
+            threshold)
+            markers_low - channels x samples ambigioius spikes (controlled by k2 threshold)
+    """
+    envelope = np.atleast_2d(envelope)
+    prah_int = background_thresholds(envelope, fs, [k1, k2] if k2 != k1 else [k1], k3=k3, winlength=winlength,
+                                     overlap=overlap)
+
+    markers_high = local_maxima_detection(envelope, prah_int[0], fs, polyspike_union_time)
+    markers_high = detection_union(markers_high, envelope, int(polyspike_union_time * fs))
+
+    if (k2 != k1):
+        markers_low = local_maxima_detection(envelope, prah_int[1], fs, polyspike_union_time)
+        markers_low = detection_union(markers_low, envelope, int(polyspike_union_time * fs))
+    else:
+        markers_low = markers_high
+
+    # first and last second is not analyzed (filter time response etc.) -------
+    markers_high[:, :int(fs)] = 0
+    markers_high[:, markers_high.shape[1] - int(fs):] = 0
+    markers_low[:, :int(fs)] = 0
+    markers_low[:, markers_low.shape[1] - int(fs):] = 0
+
+    return markers_high, markers_low
 
 
 def one_channel_detect(envelope, fs, k1=3.65, k2=3.65, k3=0., winlength=5., overlap=4., polyspike_union_time=0.12):
@@ -108,13 +253,13 @@ def one_channel_detect(envelope, fs, k1=3.65, k2=3.65, k3=0., winlength=5., over
         envelope: hilbert envelope of the signal to analyze
         fs: sampling frequency
         k1: threshold value for obvious spike decision ('-k1 3.65' DEFAULT)
-        k2: defines ambiguous spike treshold. Ambiguous 
-            spike is accepted, when simultaneous obvious detection is in other 
+        k2: defines ambiguous spike treshold. Ambiguous
+            spike is accepted, when simultaneous obvious detection is in other
             channel k1 >= k2 (k1 in DEFAULT)
         k3: decrease the threshold value (0 in DEFAULT) k1*(mode+median)-k3*(mean-mode);
         winlength: size of segment in seconds around spike for background
                         definition (5 seconds DEFAULT)
-        overlap: overlap of segment in seconds 
+        overlap: overlap of segment in seconds
                         (4 seconds DEFAULT)
         polyspike union time: spike in same channel nearest then time will
             be united
@@ -123,68 +268,33 @@ def one_channel_detect(envelope, fs, k1=3.65, k2=3.65, k3=0., winlength=5., over
             markers_high - timecourse of unambigious spikes (1=spike, 0=nospike) (based on k1 threshold)
             markers_low - ambigioius spikes (controlled by k2 threshold)
     """
+    markers_high, markers_low = multi_channel_detect(envelope[None, :], fs, k1=k1, k2=k2, k3=k3,
+                                                     winlength=winlength, overlap=overlap,
+                                                     polyspike_union_time=polyspike_union_time)
+    return markers_high[0], markers_low[0]
 
-    winsize = int(winlength * fs)
-    noverlap = int(overlap * fs)
-    index = np.arange(0, len(envelope) - winsize, winsize - noverlap, dtype=int)
-    phat = []
-    for ind in index:
-        seg_ = envelope[ind:ind + winsize]
-        phat.append([np.mean(np.log(seg_)), np.std(np.log(seg_))])
-    phat = np.asarray(phat)
-
-    r = envelope.shape[0] / len(index);
-    n_average = winsize / fs;
-
-    if round(n_average * fs / r) > 1:
-        phat[:, 0] = signal.filtfilt(np.ones((int(np.round(n_average * fs / r)),)) / (np.round(n_average * fs / r)), 1,
-                                     phat[:, 0])
-        phat[:, 1] = signal.filtfilt(np.ones((int(np.round(n_average * fs / r)),)) / (np.round(n_average * fs / r)), 1,
-                                     phat[:, 1])
-
-    # % interpolation of thresholds value to threshold curve (like background)
-    x = np.arange(index[0] + np.round(winsize / 2), index[-1] + np.round(winsize / 2))
-    if phat.shape[0] > 1:
-        phat_int1 = np.interp(x, index + np.round(winsize / 2), phat[:, 0]);
-        phat_int2 = np.interp(x, index + np.round(winsize / 2), phat[:, 1]);
-    phat_int = np.stack((phat_int1, phat_int2), axis=1)
-    phat_int = np.concatenate((np.ones((int(np.floor(winsize / 2)), 2)) * phat_int[0, :], phat_int, np.ones(
-        (int(np.size(envelope, 0) - (np.size(phat_int, 0) + np.floor(winsize / 2))), 2)) * phat_int[-1, :]));
-
-    lognormal_mode = np.exp(phat_int[:, 0] - phat_int[:, 1] ** 2);
-    lognormal_median = np.exp(phat_int[:, 0]);
-    lognormal_mean = np.exp(phat_int[:, 0] + (phat_int[:, 1] ** 2) / 2);
-
-    prah_int = np.zeros_like(phat_int)
-    prah_int[:, 0] = k1 * (lognormal_mode + lognormal_median) - k3 * (lognormal_mean - lognormal_mode)
-    if k2 != k1:
-        prah_int[:, 1] = k2 * (lognormal_mode + lognormal_median) - k3 * (lognormal_mean - lognormal_mode)
-
-    markers_high = local_maxima_detection(envelope, prah_int[:, 0], fs)
-    markers_high = detection_union(markers_high, envelope, int(polyspike_union_time * fs))
-
-    if (k2 != k1):
-        markers_low = local_maxima_detection(envelope, prah_int[:, 1], fs, polyspike_union_time)
-        markers_low = detection_union(markers_low, envelope, polyspike_union_time * fs)
-    else:
-        markers_low = markers_high
-
-    # first and last second is not analyzed (filter time response etc.) -------
-    markers_high[np.arange(fs, dtype=int)] = 0;
-    markers_high[np.arange(len(markers_high) - fs, len(markers_high), dtype=int)] = 0
-    markers_low[np.arange(fs, dtype=int)] = 0;
-    markers_low[np.arange(len(markers_high) - fs, len(markers_high), dtype=int)] = 0
 
-    return markers_high, markers_low
+def _detect_channels_block(data, fs, decim, k1, k2, k3, winlength, overlap, polyspike_union_time):
+    """
+    Envelope computation and IED detection of a block of channels (samples x channels)
+    """
+    d = data.T
+    if decim is not None:
+        d = resample(d, down=decim, axis=-1)
+    envelope = np.abs(signal.hilbert(d, axis=-1))
+    return multi_channel_detect(envelope, fs, k1=k1, k2=k2, k3=k3, winlength=winlength, overlap=overlap,
+                                polyspike_union_time=polyspike_union_time)
 
 
 def Janca_IED_Detection(data, fs=None, k1=3.65, k2=3.65, k3=0., winlength=5., overlap=4., polyspike_union_time=0.12,
-                        downsample_fs=200):
+                        downsample_fs=200, n_jobs=1, block_size=16, return_markers=False):
     """
     main wrapper function for IED detection
+        data: samples x channels signal
+        n_jobs: number of processes across which the blocks of channels are spread
+        block_size: number of channels processed at once in each process
+        return_markers: whether to also return the channels x samples markers_high and markers_low
     """
-    ieds = pd.DataFrame({'time': [], 'chan': []})
-
     decim = None
     if downsample_fs is not None:
         decim = fs / downsample_fs
@@ -194,18 +304,16 @@ def Janca_IED_Detection(data, fs=None, k1=3.65, k2=3.65, k3=0., winlength=5., ov
         data = np.expand_dims(data, 1)
 
     nchans = np.size(data, 1)
-    for ch in range(nchans):
-        d = data[:, ch]
-        if decim is not None:
-            d = resample(d, down=decim)
-        envelope = np.abs(signal.hilbert(d))
-        spikes = one_channel_detect(envelope, fs, k1=k1, k2=k2, k3=k3, winlength=winlength, overlap=overlap,
-                                    polyspike_union_time=polyspike_union_time)
-
-        # store ied times in a dataframe
-        ieds_ = np.where(spikes[0])[0] / fs
-        if len(ieds_) > 0:
-            df = pd.DataFrame({'time': ieds_, 'chan': np.tile(ch, len(ieds_))})
-            ieds = pd.concat((ieds, df), ignore_index=True)
-
+    blocks = [np.arange(start, min(start + block_size, nchans)) for start in range(0, nchans, block_size)]
+    markers = Parallel(n_jobs=n_jobs)(delayed(_detect_channels_block)(
+        data[:, block], fs, decim, k1, k2, k3, winlength, overlap, polyspike_union_time) for block in blocks)
+    markers_high = np.concatenate([block_markers[0] for block_markers in markers], axis=0)
+    markers_low = np.concatenate([block_markers[1] for block_markers in markers], axis=0)
+
+    # store ied times in a dataframe
+    chans, samples = np.nonzero(markers_high)
+    ieds = pd.DataFrame({'time': samples / fs, 'chan': chans.astype(float)})
+
+    if return_markers:
+        return ieds, markers_high, markers_low
     return ieds
@@ -0,0 +1,98 @@
+""" This script contains the sequential permutation tests: the permutations are drawn in batches and each test stops as
+soon as its p-value is decided relative to alpha, instead of always drawing the full number of permutations. Two
+stopping rules are combined:
+- Besag and Clifford (1991): a test stops once its null statistics exceeded the observed one max_exceedances times,
+the p-value is then the number of exceedances over the number of permutations
+- Clopper-Pearson bounds of the p-value: a test stops once the confidence interval of its p-value is entirely above or
+below alpha. The confidence level of each look at the data is adjusted for the number of looks, such that the
+probability that the decision differs from the one of an infinite number of permutations (resampling risk) is below
+the risk parameter
+    authors: Alex Lepauvre
+    alex.lepauvre@ae.mpg.de
+    contributors: Simon Henin
+    Simon.Henin@nyulangone.org
+"""
+import numpy as np
+from scipy.stats import beta
+
+
+def permutation_seeds(n_perm, random_state=None):
+    """
+    This function generates one seed per permutation, such that each permutation is reproducible whatever the number
+    of permutations drawn at once and the number of jobs
+    :param n_perm: (int) number of permutations
+    :param random_state: (int or None) seed from which the permutations seeds are derived
+    :return: (numpy array) seed of each permutation
+    """
+    return np.random.SeedSequence(random_state).generate_state(n_perm)
+
+
+def clopper_pearson_interval(k, n, risk):
+    """
+    This function computes the Clopper-Pearson confidence interval of a binomial proportion
+    :param k: (numpy array) number of successes
+    :param n: (numpy array) number of draws
+    :param risk: (float) probability that the proportion is outside of the interval
+    :return:
+    lower: (numpy array) lower bound of the interval
+    upper: (numpy array) upper bound of the interval
+    """
+    k, n = np.asarray(k, dtype=float), np.asarray(n, dtype=float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lower = np.where(k > 0, beta.ppf(risk / 2, k, n - k + 1), 0.)
+        upper = np.where(k < n, beta.ppf(1 - risk / 2, k + 1, n - k), 1.)
+    return lower, upper
+
+
+def sequential_permutation_test(observed, draw_null, alpha=0.05, max_perm=1000, batch_size=50, risk=1e-3,
+                                max_exceedances=None, random_state=None):
+    """
+    This function performs upper tail permutation tests of several statistics at once, drawing the permutations in
+    batches until each test is decided relative to alpha (see the stopping rules at the top of this script) or max_perm
+    permutations were drawn. The permutations are generated from one seed each, such that the results are
+    reproducible from the random state
+    :param observed: (1D numpy array) observed statistic of each test
+    :param draw_null: (callable) function taking a list of seeds and the boolean mask of the tests that aren't decided
+    yet, and returning the null statistics of each of these tests only for each seed, in an array of seeds * active
+    tests. The decided tests are never computed again
+    :param alpha: (float) significance level the p-values are decided against
+    :param max_perm: (int) maximal number of permutations of each test
+    :param batch_size: (int) number of permutations drawn at once
+    :param risk: (float) bound of the resampling risk, i.e. the probability of a different decision than with an
+    infinite number of permutations
+    :param max_exceedances: (int or None) number of exceedances of the observed statistic after which a test stops
+    (Besag-Clifford rule). If None, only the confidence bounds are used
+    :param random_state: (int or None) seed of the permutations
+    :return:
+    p_values: (1D numpy array) p-value of each test
+    n_perm: (1D numpy array of int) number of permutations used for each test
+    null: (2D numpy array) null statistics, permutations * tests. The permutations drawn after a test was decided are
+    NaN for this test
+    """
+    observed = np.atleast_1d(np.asarray(observed, dtype=float))
+    seeds = permutation_seeds(max_perm, random_state=random_state)
+    # The risk is shared between all the looks at the data:
+    look_risk = risk / int(np.ceil(max_perm / batch_size))
+    exceedances = np.zeros(observed.shape[0], dtype=int)
+    n_perm = np.zeros(observed.shape[0], dtype=int)
+    active = np.ones(observed.shape[0], dtype=bool)
+    besag_clifford = np.zeros(observed.shape[0], dtype=bool)
+    null = []
+    for start in range(0, max_perm, batch_size):
+        batch_seeds = seeds[start:start + batch_size]
+        batch = np.full((len(batch_seeds), observed.shape[0]), np.nan)
+        batch[:, active] = np.asarray(draw_null(batch_seeds, active.copy()), dtype=float).reshape(len(batch_seeds), -1)
+        null.append(batch)
+        exceedances[active] += np.sum(batch[:, active] > observed[active], axis=0)
+        n_perm[active] += batch.shape[0]
+        # Besag-Clifford stopping rule:
+        if max_exceedances is not None:
+            besag_clifford |= active & (exceedances >= max_exceedances)
+            active &= ~besag_clifford
+        # Stop the tests of which the p-value is decided:
+        lower, upper = clopper_pearson_interval(exceedances, n_perm, look_risk)
+        active &= ~((upper < alpha) | (lower > alpha))
+        if not np.any(active):
+            break
+    p_values = np.where(besag_clifford, exceedances / np.maximum(n_perm, 1), (exceedances + 1) / (n_perm + 1))
+    return p_values, n_perm, np.concatenate(null, axis=0)
@@ -0,0 +1,128 @@
+""" This script contains the spatial lookups of the electrodes: nearest surface vertex and atlas labels. The KD-tree of
+each surface is built once per process, and the atlas labels of each contact are saved next to the parcellation, such
+that they are only computed the first time a contact is looked up in a given parcellation.
+    authors: Alex Lepauvre
+    alex.lepauvre@ae.mpg.de
+    contributors: Simon Henin
+    Simon.Henin@nyulangone.org
+"""
+import os
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+import mne
+from nibabel.freesurfer.io import read_geometry
+from scipy.spatial import cKDTree
+
+
+@lru_cache(maxsize=None)
+def get_surface_tree(subjects_dir, subject, hemi, surf="pial"):
+    """
+    This function reads a freesurfer surface and builds the KD-tree of its vertices. The trees are cached, such that
+    each surface is only read once per process
+    :param subjects_dir: (string or pathlib path) path to the freesurfer subjects directory
+    :param subject: (string) name of the subject in the freesurfer directory
+    :param hemi: (string) hemisphere, "lh" or "rh"
+    :param surf: (string) name of the surface
+    :return: (scipy cKDTree) tree of the vertices coordinates (in mm, the vertices are in tree.data)
+    """
+    vertices, _ = read_geometry(str(Path(subjects_dir, subject, "surf", hemi + "." + surf)))
+    return cKDTree(vertices)
+
+
+def nearest_surface_vertices(coords, subjects_dir, subject, surf="pial"):
+    """
+    This function finds the nearest vertex of the surface for each contact, in the left hemisphere for the contacts with
+    negative x and in the right one otherwise. All the contacts of a hemisphere are looked up in a single query
+    :param coords: (numpy array) contacts coordinates in mm, dimension [contacts, 3]
+    :param subjects_dir: (string or pathlib path) path to the freesurfer subjects directory
+    :param subject: (string) name of the subject in the freesurfer directory
+    :param surf: (string) name of the surface
+    :return:
+    vertices_coords: (numpy array) coordinates of the nearest vertex of each contact in mm, NaN for contacts with NaN
+    coordinates
+    vertices: (numpy array) index of the nearest vertex of each contact in its hemisphere, -1 for NaN coordinates
+    hemis: (numpy array of strings) hemisphere of each contact
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 3)
+    vertices_coords = np.full(coords.shape, np.nan)
+    vertices = np.full(coords.shape[0], -1)
+    hemis = np.where(coords[:, 0] < 0, "lh", "rh")
+    valid = ~np.isnan(coords).any(axis=1)
+    for hemi in ["lh", "rh"]:
+        mask = valid & (hemis == hemi)
+        if not mask.any():
+            continue
+        tree = get_surface_tree(subjects_dir, subject, hemi, surf=surf)
+        _, vertices[mask] = tree.query(coords[mask])
+        vertices_coords[mask] = tree.data[vertices[mask]]
+
+    return vertices_coords, vertices, hemis
+
+
+def _labels_key(coord):
+    # Contacts are identified by their position rounded to the micrometer:
+    return ",".join(["nan" if np.isnan(c) else "{:.3f}".format(c * 1e3) for c in coord])
+
+
+def _aseg_signature(subjects_dir, subject, aseg):
+    stat = os.stat(Path(subjects_dir, subject, "mri", aseg + ".mgz"))
+    return [stat.st_size, stat.st_mtime]
+
+
+@lru_cache(maxsize=None)
+def _read_labels_cache(cache_file, signature):
+    if not os.path.isfile(cache_file):
+        return {}
+    with open(cache_file) as f:
+        cache = json.load(f)
+    # A new parcellation file invalidates the labels computed from the previous one:
+    if cache["signature"] != list(signature):
+        return {}
+    return cache["labels"]
+
+
+def get_montage_volume_labels(montage, subject, subjects_dir, aseg="aparc.a2009s+aseg", dist=2):
+    """
+    This function returns the labels of the parcellation within dist mm of each channel of the montage, same as
+    mne.get_montage_volume_labels (or get_montage_volume_labels_wang for the wang15_mplbl parcellation). The labels of
+    each contact are saved in the mri folder of the subject, such that only the contacts that were never looked up in
+    this parcellation are computed, in a single call for all of them
+    :param montage: (mne DigMontage) montage of the channels, in the mri coordinates frame
+    :param subject: (string) name of the subject in the freesurfer directory
+    :param subjects_dir: (string or pathlib path or None) path to the freesurfer subjects directory. If None, the
+    SUBJECTS_DIR environment variable is used
+    :param aseg: (string) name of the parcellation file, without the .mgz extension
+    :param dist: (float) distance in mm to use for identifying the regions of interest
+    :return: (dict) list of the labels of each channel
+    """
+    from freesurfer.wang_labels import get_montage_volume_labels_wang
+    subjects_dir = mne.utils.get_subjects_dir(subjects_dir, raise_error=True)
+    positions = montage.get_positions()
+    ch_pos = positions["ch_pos"]
+    keys = {ch: _labels_key(ch_pos[ch]) for ch in montage.ch_names}
+    cache_file = str(Path(subjects_dir, subject, "mri", "{}_dist-{}_labels.json".format(aseg, dist)))
+    signature = tuple(_aseg_signature(subjects_dir, subject, aseg))
+    cached_labels = dict(_read_labels_cache(cache_file, signature))
+
+    missing = [ch for ch in montage.ch_names if keys[ch] not in cached_labels]
+    if len(missing) > 0:
+        missing_montage = mne.channels.make_dig_montage(ch_pos={ch: ch_pos[ch] for ch in missing},
+                                                        coord_frame=positions["coord_frame"])
+        if aseg == "wang15_mplbl":
+            labels, _ = get_montage_volume_labels_wang(missing_montage, subject, subjects_dir=subjects_dir,
+                                                       aseg=aseg, dist=dist)
+        else:
+            labels, _ = mne.get_montage_volume_labels(missing_montage, subject, subjects_dir=subjects_dir,
+                                                      aseg=aseg, dist=dist)
+        cached_labels.update({keys[ch]: sorted(labels[ch]) for ch in missing})
+        # Written under a temporary name first, for concurrent jobs to never read a partial file:
+        tmp_file = cache_file + ".{}.tmp".format(os.getpid())
+        with open(tmp_file, "w") as f:
+            json.dump({"signature": list(signature), "labels": cached_labels}, f)
+        os.replace(tmp_file, cache_file)
+        _read_labels_cache.cache_clear()
+
+    return {ch: list(cached_labels[keys[ch]]) for ch in montage.ch_names}
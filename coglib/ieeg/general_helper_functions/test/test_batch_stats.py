@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+import pandas as pd
+from numpy.testing import assert_array_equal, assert_allclose
+from scipy import stats
+from general_helper_functions.batch_stats import (pivot_trials, ranksums_batch, ttest_ind_batch, ttest_rel_batch,
+                                                  wilcoxon_batch)
+
+
+class TestBatchStats(unittest.TestCase):
+
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_pivot_trials(self):
+        data_df = pd.DataFrame({"channel": ["a", "b", "a", "a", "b"],
+                                "condition": ["face", "face", "object", "face", "object"],
+                                "value": [1., 2., 3., 4., 5.]})
+        values, group_names, conditions = pivot_trials(data_df)
+        assert_array_equal(group_names, ["a", "b"])
+        assert_array_equal(conditions, ["face", "object"])
+        assert_array_equal(values[0], [[1., 3.], [4., np.nan]])
+        assert_array_equal(values[1], [[2., 5.], [np.nan, np.nan]])
+
+    def test_two_samples_tests(self):
+        x = self.rng.normal(0.3, 1, size=(10, 40))
+        y = self.rng.normal(0, 1, size=(10, 50))
+        y[:5, -10:] = np.nan
+        for alternative in ["two-sided", "greater", "less"]:
+            for batch_fun, scipy_fun in [(ranksums_batch, stats.ranksums), (ttest_ind_batch, stats.ttest_ind)]:
+                statistic, pvalue = batch_fun(x, y, alternative=alternative)
+                for i in range(x.shape[0]):
+                    expected = scipy_fun(x[i], y[i][~np.isnan(y[i])], alternative=alternative)
+                    assert_allclose([statistic[i], pvalue[i]], [expected[0], expected[1]])
+            statistic, pvalue = ttest_rel_batch(x, y[:, :40], alternative=alternative)
+            for i in range(5, x.shape[0]):
+                expected = stats.ttest_rel(x[i], y[i, :40], alternative=alternative)
+                assert_allclose([statistic[i], pvalue[i]], [expected[0], expected[1]])
+
+    def test_wilcoxon(self):
+        # Exact p-values without ties, normal approximation with ties and zeros or above 25 observations, as in the
+        # pinned scipy:
+        for n, decimals, method in [(15, 6, "exact"), (25, 6, "exact"), (26, 6, "asymptotic"), (40, 0, "asymptotic"),
+                                    (80, 6, "asymptotic")]:
+            d = np.round(self.rng.normal(0.3, 1, size=(10, n)), decimals)
+            for alternative in ["two-sided", "greater", "less"]:
+                statistic, pvalue = wilcoxon_batch(d, alternative=alternative)
+                for i in range(d.shape[0]):
+                    expected = stats.wilcoxon(d[i], alternative=alternative, method=method)
+                    assert_allclose([statistic[i], pvalue[i]], [expected.statistic, expected.pvalue])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,8 @@
+import os
+import shutil
+import tempfile
 import unittest
+from pathlib import Path
 import mne
 from mne.datasets import sample
 from general_helper_functions.data_general_utilities import cluster_test
@@ -434,5 +438,52 @@ class TestMovingAverage(unittest.TestCase):
         assert_almost_equal(observed_output, expected_output)
 
 
+class TestLoadEpochsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        info = mne.create_info(["LA{}".format(i) for i in range(3)], 256, "seeg")
+        data = np.random.default_rng(0).normal(size=(10, 3, 256))
+        epochs = mne.EpochsArray(data, info, tmin=-0.5, events=np.array([[i * 300, 0, 1] for i in range(10)]),
+                                 event_id={"stim": 1}, verbose="error")
+        epochs.set_montage(mne.channels.make_dig_montage(ch_pos={ch: [0.01 * i, 0, 0]
+                                                                 for i, ch in enumerate(epochs.ch_names)},
+                                                         coord_frame="head"))
+        file_dir = Path(self.root, "derivatives", "preprocessing", "sub-SF100", "ses-V1", "ieeg", "epoching",
+                        "broadband", "steps")
+        file_dir.mkdir(parents=True)
+        epochs.save(Path(file_dir, "sub-SF100_ses-V1_task-Dur_desc-epoching_ieeg-epo.fif"), verbose="error")
+        self.filtering_parameters = {"freq_range": [8, 13], "step": 1, "n_cycle_denom": 2, "method": "wavelet",
+                                     "baseline_mode": None, "baseline_win": None}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def load(self, **kwargs):
+        epochs, _ = data_general_utilities.load_epochs(self.root, "broadband", "SF100", preprocess_steps="steps",
+                                                       channel_types={"seeg": True}, **kwargs)
+        return epochs
+
+    def test_cache(self):
+        epochs = self.load(filtering_parameters=self.filtering_parameters)
+        cache_dir = Path(self.root, "derivatives", "epochs_cache", "sub-SF100", "ses-V1", "ieeg")
+        self.assertEqual(len(os.listdir(cache_dir)), 1)
+        cached_epochs = self.load(filtering_parameters=self.filtering_parameters)
+        assert_array_equal(epochs.get_data(), cached_epochs.get_data())
+        # The sampling frequency is saved in single precision:
+        assert_almost_equal(epochs.times, cached_epochs.times)
+        self.assertEqual(epochs.ch_names, cached_epochs.ch_names)
+        # Any change of the parameters leads to a new computation:
+        self.load(filtering_parameters=self.filtering_parameters, crop_time=[0, 0.2])
+        self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+    def test_parallel(self):
+        epochs = self.load(filtering_parameters=self.filtering_parameters, use_cache=False)
+        sub_epochs, _ = data_general_utilities.load_subjects_epochs(
+            self.root, "broadband", ["SF100", "SF100"], n_jobs=2, preprocess_steps="steps",
+            channel_types={"seeg": True}, filtering_parameters=self.filtering_parameters, use_cache=False)
+        assert_array_equal(epochs.get_data(), sub_epochs["SF100"].get_data())
+
+
 if __name__ == '__main__':
     unittest.main()
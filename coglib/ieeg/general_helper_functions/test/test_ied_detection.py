@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+from scipy import signal
+from general_helper_functions.ied_detection import one_channel_detect, multi_channel_detect, Janca_IED_Detection
+
+
+def simulate_spikes(n_channels, n_samples, fs, n_spikes=20, seed=0):
+    """
+    Generates white noise with sharp transients of large amplitude at random times
+    :param n_channels: number of channels
+    :param n_samples: number of samples
+    :param fs: sampling frequency
+    :param n_spikes: number of spikes per channel
+    :param seed: seed of the random generator
+    :return: data (channels x samples) and spikes onsets (channels x n_spikes)
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.normal(size=(n_channels, n_samples))
+    onsets = np.stack([np.sort(rng.choice(np.arange(2 * fs, n_samples - 2 * fs, fs // 2), n_spikes, replace=False))
+                       for _ in range(n_channels)])
+    for ch in range(n_channels):
+        for onset in onsets[ch]:
+            data[ch, onset:onset + 4] += 30
+    return data, onsets
+
+
+class TestIedDetection(unittest.TestCase):
+
+    def test_frozen_detections(self):
+        # Spikes of increasing amplitude every second, a polyspike at 10s on the first channel, a noisier second half on
+        # the second channel and negative spikes on the third one:
+        fs = 200
+        rng = np.random.default_rng(1)
+        data = rng.normal(size=(3, fs * 30))
+        data[1, fs * 15:] *= 3
+        for ch, sign in enumerate([1, 1, -1]):
+            for onset, amplitude in zip(np.arange(2 * fs, 28 * fs, fs), np.linspace(2, 12, 26)):
+                data[ch, onset:onset + 4] += sign * amplitude
+        data[0, 10 * fs + 20:10 * fs + 24] += 12
+        envelope = np.abs(signal.hilbert(data, axis=-1))
+        # Spikes detected by the previous channel by channel implementation:
+        expected = [[2022, 2202, 2400, 2600, 2799, 2999, 3199, 3399, 3599, 3802, 4002, 4202, 4400, 4602, 4802, 5002,
+                     5202, 5402],
+                    [1201, 1599, 1799, 2002, 2199, 2401, 2602, 2802, 4799],
+                    [1202, 1602, 1799, 2002, 2200, 2402, 2602, 2802, 2999, 3199, 3400, 3602, 3802, 4002, 4202, 4402,
+                     4602, 4802, 5002, 5202, 5402]]
+        markers_high, markers_low = multi_channel_detect(envelope, fs)
+        for ch in range(data.shape[0]):
+            assert_array_equal(np.flatnonzero(markers_high[ch]), expected[ch])
+            assert_array_equal(markers_low[ch], markers_high[ch])
+            ch_high, ch_low = one_channel_detect(envelope[ch], fs)
+            assert_array_equal(np.flatnonzero(ch_high), expected[ch])
+            assert_array_equal(np.flatnonzero(ch_low), expected[ch])
+
+    def test_detect_spikes(self):
+        fs = 200
+        data, onsets = simulate_spikes(4, fs * 60, fs)
+        ieds = Janca_IED_Detection(data.T, fs=fs, downsample_fs=None)
+        for ch in range(data.shape[0]):
+            detected = ieds.loc[ieds["chan"] == ch, "time"].to_numpy() * fs
+            # Each simulated spike should be found within 20ms:
+            self.assertTrue(all(np.min(np.abs(detected - onset)) <= 0.02 * fs for onset in onsets[ch]))
+
+    def test_blocks(self):
+        fs = 200
+        data, _ = simulate_spikes(5, fs * 60, fs)
+        ieds = Janca_IED_Detection(data.T, fs=fs, downsample_fs=None, block_size=5)
+        ieds_blocks = Janca_IED_Detection(data.T, fs=fs, downsample_fs=None, block_size=2, n_jobs=2)
+        assert_array_equal(ieds.to_numpy(), ieds_blocks.to_numpy())
+
+
+if __name__ == '__main__':
+    unittest.main()
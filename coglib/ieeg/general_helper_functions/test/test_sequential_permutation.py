@@ -0,0 +1,63 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+from general_helper_functions.sequential_permutation import sequential_permutation_test
+
+
+def draw_normal_null(seeds, active):
+    # Two tests with the same standard normal null distribution, only the active ones are returned:
+    return np.array([np.random.default_rng(seed).normal(size=2)[active] for seed in seeds])
+
+
+class TestSequentialPermutation(unittest.TestCase):
+
+    def test_early_stopping(self):
+        # A clearly significant and a clearly non significant test stop before the maximal number of permutations:
+        p_values, n_perm, null = sequential_permutation_test(np.array([4., -1.]), draw_normal_null, alpha=0.05,
+                                                             max_perm=2000, batch_size=100, random_state=0)
+        self.assertTrue(np.all(n_perm < 2000))
+        self.assertLess(p_values[0], 0.05)
+        self.assertGreater(p_values[1], 0.05)
+        self.assertEqual(null.shape[1], 2)
+        self.assertEqual(np.sum(~np.isnan(null[:, 1])), n_perm[1])
+
+    def test_decided_tests_not_drawn(self):
+        # Once the first test is decided, the null statistics are only drawn for the second one:
+        calls = []
+
+        def draw_null(seeds, active):
+            calls.append(active)
+            return draw_normal_null(seeds, active)
+
+        p_values, n_perm, null = sequential_permutation_test(np.array([4., 1.645]), draw_null, alpha=0.05,
+                                                             max_perm=1000, batch_size=100, random_state=0)
+        self.assertLess(n_perm[0], n_perm[1])
+        n_batches_0 = n_perm[0] // 100
+        self.assertTrue(all(active[0] for active in calls[:n_batches_0]))
+        self.assertFalse(any(active[0] for active in calls[n_batches_0:]))
+        # The null statistics of the second test are the same as when drawing both tests until the end:
+        _, _, full_null = sequential_permutation_test(np.array([1.645, 1.645]), draw_normal_null, alpha=0.05,
+                                                      max_perm=1000, batch_size=100, random_state=0)
+        assert_array_equal(null[:n_perm[1], 1], full_null[:n_perm[1], 1])
+
+    def test_besag_clifford(self):
+        p_values, n_perm, _ = sequential_permutation_test(np.array([-10., -10.]), draw_normal_null, max_perm=1000,
+                                                          batch_size=10, max_exceedances=10, random_state=0)
+        assert_array_equal(n_perm, [10, 10])
+        assert_array_equal(p_values, [1., 1.])
+
+    def test_reproducibility(self):
+        # The same permutations are drawn from the same random state, whatever the batch size, and all of them are
+        # drawn when no test can be decided:
+        results = [sequential_permutation_test(np.array([1.645, 1.645]), draw_normal_null, max_perm=200,
+                                               batch_size=batch_size, random_state=42)
+                   for batch_size in [20, 200]]
+        assert_array_equal(results[0][1], [200, 200])
+        for res_1, res_2 in zip(*results):
+            assert_array_equal(res_1, res_2)
+        null = results[0][2]
+        assert_array_equal(results[0][0], (np.sum(null > 1.645, axis=0) + 1) / 201)
+
+
+if __name__ == '__main__':
+    unittest.main()
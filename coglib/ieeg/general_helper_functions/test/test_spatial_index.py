@@ -0,0 +1,67 @@
+import os
+import unittest
+import tempfile
+from pathlib import Path
+import numpy as np
+import nibabel as nib
+import mne
+from nibabel.freesurfer.io import write_geometry
+from general_helper_functions.spatial_index import nearest_surface_vertices, get_montage_volume_labels
+
+
+class TestSpatialIndex(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # Create a subject with random surfaces and a parcellation made of two halves:
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.subjects_dir = cls.tmp_dir.name
+        cls.rng = np.random.default_rng(0)
+        os.makedirs(Path(cls.subjects_dir, "sub-01", "surf"))
+        os.makedirs(Path(cls.subjects_dir, "sub-01", "mri"))
+        cls.vertices = {}
+        for hemi, sign in zip(["lh", "rh"], [-1, 1]):
+            vertices = cls.rng.uniform(0, 60, size=(5000, 3)) * np.array([sign, 1, 1])
+            write_geometry(str(Path(cls.subjects_dir, "sub-01", "surf", hemi + ".pial")), vertices,
+                           np.zeros((1, 3), dtype=int))
+            cls.vertices[hemi] = vertices
+        aseg = np.zeros((64, 64, 64), dtype=np.int32)
+        aseg[:32] = 17  # Left-Hippocampus
+        aseg[32:] = 53  # Right-Hippocampus
+        nib.save(nib.MGHImage(aseg, np.eye(4)), str(Path(cls.subjects_dir, "sub-01", "mri", "aseg.mgz")))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_nearest_surface_vertices(self):
+        coords = self.rng.uniform(-60, 60, size=(50, 3))
+        coords[3] = np.nan
+        vertices_coords, vertices, hemis = nearest_surface_vertices(coords, self.subjects_dir, "sub-01")
+        for ind, coord in enumerate(coords):
+            if ind == 3:
+                self.assertTrue(np.isnan(vertices_coords[ind]).all())
+                continue
+            # Brute force distance to all the vertices of the hemisphere:
+            hemi = "lh" if coord[0] < 0 else "rh"
+            nearest = np.argmin(np.linalg.norm(self.vertices[hemi] - coord, axis=1))
+            self.assertEqual(hemis[ind], hemi)
+            self.assertEqual(vertices[ind], nearest)
+            np.testing.assert_allclose(vertices_coords[ind], self.vertices[hemi][nearest], rtol=1e-6)
+
+    def test_volume_labels_cache(self):
+        ch_pos = {"G{}".format(i): pos for i, pos in enumerate(self.rng.uniform(-0.025, 0.025, size=(10, 3)))}
+        montage = mne.channels.make_dig_montage(ch_pos=ch_pos, coord_frame="mri")
+        expected_labels, _ = mne.get_montage_volume_labels(montage, "sub-01", subjects_dir=self.subjects_dir,
+                                                           aseg="aseg")
+        labels = get_montage_volume_labels(montage, "sub-01", self.subjects_dir, aseg="aseg")
+        self.assertTrue(Path(self.subjects_dir, "sub-01", "mri", "aseg_dist-2_labels.json").is_file())
+        # The second time, the labels come from the cache:
+        labels_cached = get_montage_volume_labels(montage, "sub-01", self.subjects_dir, aseg="aseg")
+        for ch in ch_pos.keys():
+            self.assertEqual(sorted(expected_labels[ch]), labels[ch])
+            self.assertEqual(labels[ch], labels_cached[ch])
+
+
+if __name__ == '__main__':
+    unittest.main()
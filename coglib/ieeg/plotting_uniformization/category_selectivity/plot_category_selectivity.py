@@ -9,6 +9,7 @@ from scipy.ndimage import uniform_filter1d
 from plotters import plot_time_series, mm2inch
 import matplotlib.pyplot as plt
 from general_utilities import epochs_loader, corrected_sem
+from results_catalog import ResultsCatalog
 
 param = config.param
 bids_root = "/mnt/beegfs/XNAT/COGITATE/ECoG/phase_2/processed/bids"
@@ -40,60 +41,6 @@ colors = {
 }
 
 
-def get_rois(bids_root, subject_list, channels_list, atlas="",
-             folder="derivatives/preprocessing/sub-{}/ses-V1/ieeg/atlas_mapping/raw/desbadcharej_notfil_lapref"
-                    "/sub-{}_ses-V1_task-Dur_desc-elecmapping_{}_ieeg.csv", ignore_hemi=True):
-    channels_rois = []
-    for sub in subject_list:
-        # Get the channels of this subject:
-        sub_ch = [ch.split("-")[1] for ch in channels_list if ch.split("-")[0] == sub]
-        # Generate the path to the atlas mapping for this subject:
-        try:
-            atlas_map = pd.read_csv(Path(bids_root, folder.format(sub, sub, atlas)))
-            atlas_map = atlas_map.loc[atlas_map["channel"].isin(sub_ch)]
-        except FileNotFoundError:
-            print("Warning: for subject {}, atlas file {} not found".format(sub, atlas))
-            atlas_map = pd.DataFrame({
-                "channel": sub_ch,
-                "region": "Unknown"
-            })
-        if ignore_hemi:
-            atlas_map["region"] = [lbl.replace("ctx_lh_", "").replace("ctx_rh_",
-                                                                      "").replace("Right-", "").replace("Left-",
-                                                                                                        "") if
-                                   isinstance(lbl, str) else lbl
-                                   for lbl in atlas_map["region"].to_list()]
-        # Reformat the table output to remove the unknown and irrelevant labels:
-        atlas_map_clean = pd.DataFrame()
-        for ch in atlas_map["channel"].to_list():
-            try:
-                regions = atlas_map.loc[atlas_map["channel"] == ch, "region"].item().split("/")
-            except AttributeError:
-                print("No labels for ch-" + sub + "-" + ch)
-                continue
-            if len(regions) == 1:
-                atlas_map_clean = atlas_map_clean.append(pd.DataFrame({
-                    "channel": "-".join([sub, ch]),
-                    "region": regions[0]
-                }, index=[0]), ignore_index=True)
-            else:
-                reg = [region for region in regions if region != "Unknown" and "White-Matter" not in region]
-                if len(reg) == 0:
-                    atlas_map_clean = atlas_map_clean.append(pd.DataFrame({
-                        "channel": "-".join([sub, ch]),
-                        "region": regions[0]
-                    }, index=[0]), ignore_index=True)
-                else:
-                    atlas_map_clean = atlas_map_clean.append(pd.DataFrame({
-                        "channel": "-".join([sub, ch]),
-                        "region": reg[0]
-                    }, index=[0]), ignore_index=True)
-
-        channels_rois.append(atlas_map_clean)
-
-    return pd.concat(channels_rois, ignore_index=True)
-
-
 def plot_category_selectivity(epochs, channels_selectivity, output_dir_dict, patches=None):
     """
 
@@ -211,9 +158,13 @@ def category_selectivity_handler(result_tbls, subjects=None, save_root="", categ
     if categories is None:
         categories = ["face", "object", "letter", "false"]
 
-    # Read the results table table:
-    ti_results_table = pd.read_csv(result_tbls[0])
-    tr_results_table = pd.read_csv(result_tbls[1])
+    # Read the results table table, only for the columns used below:
+    catalog = ResultsCatalog(bids_root)
+    catalog.add("ti", result_tbls[0], analysis=analysis_name, signal=signal, task="ti")
+    catalog.add("tr", result_tbls[1], analysis=analysis_name, signal=signal, task="tr")
+    results_columns = ["subject", "channel", "condition", "effect_strength"]
+    ti_results_table = catalog.load("ti", columns=results_columns)
+    tr_results_table = catalog.load("tr", columns=results_columns)
 
     # List the subjects:
     if subjects is None:
@@ -231,77 +182,80 @@ def category_selectivity_handler(result_tbls, subjects=None, save_root="", categ
     ti_results_table = ti_results_table.loc[ti_results_table["channel"].isin(channels_list)]
     tr_results_table = tr_results_table.loc[tr_results_table["channel"].isin(channels_list)]
 
-    # Plot the d primes distribution:
-    dprimes_tbl = pd.DataFrame()
-    positions = {
-        "face": 1,
-        "object": 4,
-        "letter": 7,
-        "false": 10
-    }
-    for cate in ti_results_table["condition"].unique():
-        # Get the dprimes for this category:
-        ti_cate_dprimes = ti_results_table.loc[ti_results_table["condition"] == cate, "effect_strength"].to_list()
-        tr_cate_dprimes = tr_results_table.loc[tr_results_table["condition"] == cate, "effect_strength"].to_list()
-        dprimes_tbl = dprimes_tbl.append(pd.DataFrame({
-            "category": [cate + " TI"] * len(ti_cate_dprimes),
-            "position": positions[cate],
-            "d'": ti_cate_dprimes
-        }), ignore_index=True)
-        dprimes_tbl = dprimes_tbl.append(pd.DataFrame({
-            "category": [cate + " TR"] * len(ti_cate_dprimes),
-            "position": positions[cate] + 1,
-            "d'": tr_cate_dprimes
-        }), ignore_index=True)
+    # The d primes distribution is only plotted again if the results changed since it was saved:
+    if catalog.is_stale(["ti", "tr"], Path(save_root, "dprime_distribution.png"),
+                        Path(save_root, "dprime_distribution.svg"), sources=[__file__]):
+        # Plot the d primes distribution:
+        dprimes_tbl = pd.DataFrame()
+        positions = {
+            "face": 1,
+            "object": 4,
+            "letter": 7,
+            "false": 10
+        }
+        for cate in ti_results_table["condition"].unique():
+            # Get the dprimes for this category:
+            ti_cate_dprimes = ti_results_table.loc[ti_results_table["condition"] == cate, "effect_strength"].to_list()
+            tr_cate_dprimes = tr_results_table.loc[tr_results_table["condition"] == cate, "effect_strength"].to_list()
+            dprimes_tbl = dprimes_tbl.append(pd.DataFrame({
+                "category": [cate + " TI"] * len(ti_cate_dprimes),
+                "position": positions[cate],
+                "d'": ti_cate_dprimes
+            }), ignore_index=True)
+            dprimes_tbl = dprimes_tbl.append(pd.DataFrame({
+                "category": [cate + " TR"] * len(ti_cate_dprimes),
+                "position": positions[cate] + 1,
+                "d'": tr_cate_dprimes
+            }), ignore_index=True)
 
-    # Plot half violin:
-    fig, ax = plt.subplots(figsize=[mm2inch(fig_size[0]),
-                                    mm2inch(fig_size[0])])
-    palette = {1: [1, 1, 0],
-                          2: [1, 1, 0],
-                          3: [1, 0, 0],
-                          4: [1, 0, 0],
-                          5: [1, 0, 0],
-                          6: [0.3, 0.3, 0.3],
-                          7: [0.3, 0.3, 0.3],
-                          8: [0.3, 0.3, 0.3],
-                          9: [0.76, 0.09, 0.11],
-                          10: [0.93, 0.51, 0.93],
-                          11: [0.93, 0.51, 0.93]
-                          }
-    pt.RainCloud(x="position", y="d'", data=dprimes_tbl,
-                 palette={1: [1, 1, 0],
-                          2: [1, 1, 0],
-                          3: [1, 0, 0],
-                          4: [1, 0, 0],
-                          5: [1, 0, 0],
-                          6: [0.3, 0.3, 0.3],
-                          7: [0.3, 0.3, 0.3],
-                          8: [0.3, 0.3, 0.3],
-                          9: [0.76, 0.09, 0.11],
-                          10: [0.93, 0.51, 0.93],
-                          11: [0.93, 0.51, 0.93]
-                          },
-                 bw=0.2, order=range(1, 12), cloud_alpha=0,
-                 width_viol=0, rain_edgecolor="k", width_box=.5, ax=ax, orient="v", rain_linewidth=0.5)
-    ax.set_ylabel("d'")
-    ax.set_xlabel("")
-    ax.set_xlim([-1, 11])
-    ax.set_xticks([0, 1, 3, 4, 6, 7, 9, 10])
-    ax.set_xticklabels(["TI", "TR", "TI", "TR", "TI", "TR", "TI", "TR"])
-    plt.text(0.25, -0.65, 'Face')
-    plt.text(3.25, -0.65, 'Object')
-    plt.text(6.25, -0.65, 'Letter')
-    plt.text(9.25, -0.65, 'False')
-    # ax.set_xticklabels(ax.get_xticklabels(), rotation=20)
-    # plt.tight_layout()
-    # Save the figure:
-    filename = Path(save_root, "dprime_distribution.png")
-    plt.savefig(filename, transparent=True, bbox_inches="tight")
-    filename = Path(save_root, "dprime_distribution.svg")
-    plt.savefig(filename, transparent=True, bbox_inches="tight")
-    plt.savefig(filename, transparent=True, bbox_inches="tight")
-    plt.close()
+        # Plot half violin:
+        fig, ax = plt.subplots(figsize=[mm2inch(fig_size[0]),
+                                        mm2inch(fig_size[0])])
+        palette = {1: [1, 1, 0],
+                              2: [1, 1, 0],
+                              3: [1, 0, 0],
+                              4: [1, 0, 0],
+                              5: [1, 0, 0],
+                              6: [0.3, 0.3, 0.3],
+                              7: [0.3, 0.3, 0.3],
+                              8: [0.3, 0.3, 0.3],
+                              9: [0.76, 0.09, 0.11],
+                              10: [0.93, 0.51, 0.93],
+                              11: [0.93, 0.51, 0.93]
+                              }
+        pt.RainCloud(x="position", y="d'", data=dprimes_tbl,
+                     palette={1: [1, 1, 0],
+                              2: [1, 1, 0],
+                              3: [1, 0, 0],
+                              4: [1, 0, 0],
+                              5: [1, 0, 0],
+                              6: [0.3, 0.3, 0.3],
+                              7: [0.3, 0.3, 0.3],
+                              8: [0.3, 0.3, 0.3],
+                              9: [0.76, 0.09, 0.11],
+                              10: [0.93, 0.51, 0.93],
+                              11: [0.93, 0.51, 0.93]
+                              },
+                     bw=0.2, order=range(1, 12), cloud_alpha=0,
+                     width_viol=0, rain_edgecolor="k", width_box=.5, ax=ax, orient="v", rain_linewidth=0.5)
+        ax.set_ylabel("d'")
+        ax.set_xlabel("")
+        ax.set_xlim([-1, 11])
+        ax.set_xticks([0, 1, 3, 4, 6, 7, 9, 10])
+        ax.set_xticklabels(["TI", "TR", "TI", "TR", "TI", "TR", "TI", "TR"])
+        plt.text(0.25, -0.65, 'Face')
+        plt.text(3.25, -0.65, 'Object')
+        plt.text(6.25, -0.65, 'Letter')
+        plt.text(9.25, -0.65, 'False')
+        # ax.set_xticklabels(ax.get_xticklabels(), rotation=20)
+        # plt.tight_layout()
+        # Save the figure:
+        filename = Path(save_root, "dprime_distribution.png")
+        plt.savefig(filename, transparent=True, bbox_inches="tight")
+        filename = Path(save_root, "dprime_distribution.svg")
+        plt.savefig(filename, transparent=True, bbox_inches="tight")
+        plt.savefig(filename, transparent=True, bbox_inches="tight")
+        plt.close()
 
     # Create a dictionary storing for each channel the selectivitiy:
     channels_selectivity = {ch: ti_results_table.loc[ti_results_table["channel"] == ch, "condition"].item()
@@ -11,6 +11,7 @@ import pandas as pd
 from pathlib import Path
 from general_utilities import mean_confidence_interval, epochs_loader, get_channels_labels, corrected_sem
 from plotters import plot_time_series, plot_rasters, mm2inch
+from results_catalog import ResultsCatalog
 
 param = config.param
 bids_root = "/mnt/beegfs/XNAT/COGITATE/ECoG/phase_2/processed/bids"
@@ -316,6 +317,7 @@ def vis_resp_plot_handler(subjects, folders_list, save_root="", cond_to_plot="bo
     :param cond_to_plot:
     :return:
     """
+    catalog = ResultsCatalog(bids_root)
     # Loop through each subfolders:
     for folder in folders_list:
         results_path = Path(results_root, folder)
@@ -334,9 +336,23 @@ def vis_resp_plot_handler(subjects, folders_list, save_root="", cond_to_plot="bo
 
             # ==========================================================================
             # Load the data:
-            vis_resp_results = pd.read_csv(results_files[0])
             with open(confg_files[0], 'r') as f:
                 vis_resp_param = json.load(f)
+            cond_1 = vis_resp_param["analysis_parameters"][folder]["raster_parameters"]["conds_1"]
+            save_dir = Path(save_root, folder)
+            results_name = "_".join([folder, subdir.name])
+            catalog.add(results_name, results_files[0], analysis=analysis_name,
+                        signal=vis_resp_param["analysis_parameters"][folder]["signal"])
+            # The roi averages are only plotted again if the results changed since they were saved:
+            roi_averages_files = [Path(save_dir, "grand_average_task-{}_{}.png".format(cond.split("/")[-1], direction))
+                                  for cond in cond_1 for direction in ["activated", "deactivated"]]
+            if not catalog.is_stale([results_name], *roi_averages_files, sources=[__file__, confg_files[0]]):
+                print("The roi averages of {} are up to date".format(results_name))
+                continue
+            # Only the columns used for the plotting are read:
+            vis_resp_results = catalog.load(results_name, columns=[
+                "subject", "channel", "condition", "effect_strength-stimulus onset/Irrelevant"] +
+                ["latency-stimulus onset/" + cond for cond in cond_1])
             if subjects is None:
                 subjects = list(vis_resp_results["subject"].unique())
             # Extract the relevant infos:
@@ -356,11 +372,9 @@ def vis_resp_plot_handler(subjects, folders_list, save_root="", cond_to_plot="bo
             # Extract a couple extra info relevant for the plotting:
             time_windows = [vis_resp_param["analysis_parameters"][folder]["baseline_window"],
                             vis_resp_param["analysis_parameters"][folder]["test_window"]]
-            cond_1 = vis_resp_param["analysis_parameters"][folder]["raster_parameters"]["conds_1"]
             cond_2 = vis_resp_param["analysis_parameters"][folder]["raster_parameters"]["conds_2"]
 
             # Create the save root:
-            save_dir = Path(save_root, folder)
             if not os.path.exists(save_dir):
                 os.makedirs(save_dir)
             gen_file_name = "sub-{}_desc-{}_cond1-{}_cond2-{}.png"
@@ -0,0 +1,227 @@
+"""
+This script contains the results catalog of the summaries and plotting scripts. Each analysis results table is indexed
+by analysis, signal, roi, task and subject, and only loaded when it is used. The tables are converted to Parquet the
+first time they are loaded (and whenever the original file changes), such that they are then read back only for the
+columns that are needed. The channels regions from the atlas mapping files are cached in the same way.
+    authors: Alex Lepauvre
+    alex.lepauvre@ae.mpg.de
+"""
+import os
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_SUPPORT = True
+except ImportError:
+    PARQUET_SUPPORT = False
+
+CATALOG_KEYS = ["analysis", "signal", "roi", "task", "subject"]
+ATLAS_MAPPING_FILE = "derivatives/preprocessing/sub-{}/ses-V1/ieeg/atlas_mapping/raw/desbadcharej_notfil_lapref" \
+                     "/sub-{}_ses-V1_task-Dur_desc-elecmapping_{}_ieeg.csv"
+
+
+def file_signature(file):
+    """
+    Size and modification time of a file, to find out whether a file changed since it was last read
+    :param file: (string or pathlib path) path to the file
+    :return: (list) size and modification time of the file, None if the file doesn't exist
+    """
+    if not os.path.isfile(file):
+        return None
+    stat = os.stat(file)
+    return [stat.st_size, stat.st_mtime]
+
+
+class ResultsCatalog:
+    def __init__(self, bids_root, cache_root=None):
+        """
+        This class indexes the results tables of the different analyses. The tables are only read when loaded, and are
+        cached as Parquet files in the cache root (if pyarrow is installed, otherwise the csv are read directly)
+        :param bids_root: (string or pathlib path) path to the bids root. The relative files are relative to it
+        :param cache_root: (string or pathlib path) path to the directory where the Parquet tables are saved. By default
+        in derivatives/results_catalog of the bids root
+        """
+        self.bids_root = bids_root
+        self.cache_root = cache_root if cache_root is not None else Path(bids_root, "derivatives", "results_catalog")
+        self.entries = {}
+        self._tables = {}
+
+    def add(self, name, file, analysis, signal=None, roi=None, task=None, subject="super"):
+        """
+        This function adds a results table to the catalog
+        :param name: (string) unique name of the table in the catalog
+        :param file: (string or pathlib path) path to the csv file, absolute or relative to the bids root
+        :param analysis: (string) name of the analysis, i.e. visual_responsiveness, category_selectivity...
+        :param signal: (string) signal of the analysis, i.e. high_gamma, alpha, erp...
+        :param roi: (string) roi of the analysis, i.e. iit, gnw, allbrain...
+        :param task: (string) task relevance condition of the analysis, i.e. ti or tr
+        :param subject: (string) subject of the analysis
+        :return:
+        """
+        self.entries[name] = {"file": str(Path(self.bids_root, file)), "analysis": analysis, "signal": signal,
+                              "roi": roi, "task": task, "subject": subject}
+        self._tables = {key: table for key, table in self._tables.items() if key[0] != name}
+
+    def select(self, **keys):
+        """
+        This function returns the names of the tables matching the passed keys, for instance
+        catalog.select(analysis="duration_decoding", task="ti")
+        :param keys: values of the catalog keys (analysis, signal, roi, task, subject) to match
+        :return: (list) names of the matching tables
+        """
+        for key in keys:
+            if key not in CATALOG_KEYS:
+                raise KeyError("{} is not a catalog key! Must be one of {}".format(key, CATALOG_KEYS))
+        return [name for name, entry in self.entries.items()
+                if all(entry[key] == val for key, val in keys.items())]
+
+    def _parquet_file(self, name):
+        cache_file = Path(self.cache_root, name + ".parquet")
+        signature_file = Path(self.cache_root, name + ".json")
+        signature = file_signature(self.entries[name]["file"])
+        if signature is None:
+            raise FileNotFoundError("The results file of {} was not found: {}".format(name,
+                                                                                     self.entries[name]["file"]))
+        if os.path.isfile(cache_file) and os.path.isfile(signature_file):
+            with open(signature_file) as f:
+                if json.load(f) == signature:
+                    return cache_file
+        # The Parquet table is (re)generated from the csv:
+        if not os.path.isdir(self.cache_root):
+            os.makedirs(self.cache_root)
+        tmp_file = Path(self.cache_root, "{}.{}.tmp".format(name, os.getpid()))
+        pd.read_csv(self.entries[name]["file"]).to_parquet(tmp_file, index=False)
+        os.replace(tmp_file, cache_file)
+        with open(signature_file, "w") as f:
+            json.dump(signature, f)
+        return cache_file
+
+    def load(self, name, columns=None):
+        """
+        This function loads a results table, only reading the requested columns. The tables are kept in memory, such
+        that they are only read once
+        :param name: (string) name of the table in the catalog
+        :param columns: (list of strings or None) columns to read, all of them if None
+        :return: (pandas data frame) the results table
+        """
+        key = (name, None if columns is None else tuple(columns))
+        if key not in self._tables:
+            if PARQUET_SUPPORT:
+                self._tables[key] = pd.read_parquet(self._parquet_file(name), columns=columns)
+            else:
+                self._tables[key] = pd.read_csv(self.entries[name]["file"], usecols=columns)
+        return self._tables[key].copy()
+
+    def is_stale(self, names, *targets, sources=()):
+        """
+        This function checks whether outputs (figures, tables...) generated from results tables must be generated
+        again, i.e. whether any of the target files is missing or older than any of the results files or of the other
+        files they are generated from
+        :param names: (list of strings) names of the tables the targets are generated from
+        :param targets: (strings or pathlib paths) files generated from these tables
+        :param sources: (list of strings or pathlib paths) other files the targets are generated from, i.e. atlas
+        mapping, coordinates or the scripts themselves. The missing ones are ignored, as some are only alternatives
+        :return: (bool) whether the targets must be generated again
+        """
+        targets_signature = [file_signature(target) for target in targets]
+        if any(signature is None for signature in targets_signature):
+            return True
+        sources_signature = []
+        for name in names:
+            signature = file_signature(self.entries[name]["file"])
+            if signature is None:
+                raise FileNotFoundError("The results file of {} was not found: {}".format(name,
+                                                                                         self.entries[name]["file"]))
+            sources_signature.append(signature)
+        sources_signature.extend(signature for signature in map(file_signature, sources) if signature is not None)
+        if len(sources_signature) == 0:
+            return False
+        return max(signature[1] for signature in sources_signature) > min(signature[1]
+                                                                          for signature in targets_signature)
+
+
+def atlas_mapping_files(bids_root, subject_list, atlases, folder=ATLAS_MAPPING_FILE):
+    """
+    This function lists the atlas mapping files the channels regions are read from by get_rois
+    :param bids_root: (string or pathlib path) path to the bids root
+    :param subject_list: (list of strings) subjects
+    :param atlases: (list of strings) names of the atlases, i.e. aparc+aseg, aparc.a2009s+aseg, wang15_mplbl
+    :param folder: (string) path to the atlas mapping files relative to the bids root, formatted with the subject
+    twice and the atlas
+    :return: (list of strings) atlas mapping file of each subject and atlas
+    """
+    return [str(Path(bids_root, folder.format(sub, sub, atlas))) for sub in subject_list for atlas in atlases]
+
+
+def fsaverage_coord_files(bids_root, subject_list, ses="V1"):
+    """
+    This function lists the files the channels fsaverage coordinates are read from by load_fsaverage_coord: the
+    laplace relocated coordinates and the raw ones they fall back to
+    :param bids_root: (string or pathlib path) path to the bids root
+    :param subject_list: (list of strings) subjects
+    :param ses: (string) session
+    :return: (list of strings) coordinates files of each subject
+    """
+    coord_files = []
+    for sub in subject_list:
+        coord_file = "sub-{}_ses-{}_space-fsaverage_electrodes.tsv".format(sub, ses)
+        coord_files.append(str(Path(bids_root, "derivatives", "preprocessing", "sub-" + sub, "ses-" + ses, "ieeg",
+                                    "laplace_reference", "broadband", "desbadcharej_notfil_lapref", coord_file)))
+        coord_files.append(str(Path(bids_root, "sub-" + sub, "ses-" + ses, "ieeg", coord_file)))
+    return coord_files
+
+
+@lru_cache(maxsize=None)
+def _read_atlas_mapping(atlas_file, signature, ignore_hemi=True):
+    """
+    This function reads the atlas mapping of one subject and keeps one region per channel: the region itself if the
+    channel has a single one, otherwise the first one that isn't unknown nor white matter (None for the channels
+    without labels). The results are cached for as long as the file doesn't change
+    """
+    atlas_map = pd.read_csv(atlas_file)
+    regions = atlas_map["region"]
+    if ignore_hemi:
+        regions = regions.str.replace("ctx_lh_", "", regex=False).str.replace("ctx_rh_", "", regex=False) \
+            .str.replace("Right-", "", regex=False).str.replace("Left-", "", regex=False)
+    region = [None if not isinstance(reg, list) else reg[0] if len(reg) == 1 else
+              ([r for r in reg if r != "Unknown" and "White-Matter" not in r] + reg)[0]
+              for reg in regions.str.split("/")]
+    return pd.DataFrame({"channel": atlas_map["channel"].to_numpy(), "region": region})
+
+
+def get_rois(bids_root, subject_list, channels_list, atlas="", folder=ATLAS_MAPPING_FILE, ignore_hemi=True):
+    """
+    This function returns the region of each channel in the atlas. The atlas mapping file of each subject is only read
+    once and kept in memory
+    :param bids_root: (string or pathlib path) path to the bids root
+    :param subject_list: (list of strings) subjects
+    :param channels_list: (list of strings) channels, in the format subject-channel
+    :param atlas: (string) name of the atlas, i.e. aparc+aseg, aparc.a2009s+aseg, wang15_mplbl
+    :param folder: (string) path to the atlas mapping files relative to the bids root, formatted with the subject
+    twice and the atlas
+    :param ignore_hemi: (bool) whether to remove the hemisphere from the regions names
+    :return: (pandas data frame) channel and region of each channel
+    """
+    channels_rois = []
+    for sub in subject_list:
+        # Get the channels of this subject:
+        sub_ch = [ch.split("-")[1] for ch in channels_list if ch.split("-")[0] == sub]
+        atlas_file = str(Path(bids_root, folder.format(sub, sub, atlas)))
+        signature = file_signature(atlas_file)
+        if signature is None:
+            print("Warning: for subject {}, atlas file {} not found".format(sub, atlas))
+            atlas_map = pd.DataFrame({"channel": sub_ch, "region": "Unknown"})
+        else:
+            atlas_map = _read_atlas_mapping(atlas_file, tuple(signature), ignore_hemi=ignore_hemi)
+            atlas_map = atlas_map.loc[atlas_map["channel"].isin(sub_ch)]
+            for ch in atlas_map.loc[atlas_map["region"].isna(), "channel"]:
+                print("No labels for ch-" + sub + "-" + ch)
+            atlas_map = atlas_map.loc[atlas_map["region"].notna()]
+        channels_rois.append(pd.DataFrame({"channel": ["-".join([sub, ch]) for ch in atlas_map["channel"]],
+                                           "region": atlas_map["region"].to_list()}))
+
+    return pd.concat(channels_rois, ignore_index=True)
@@ -7,6 +7,7 @@ import theories_rois
 from pathlib import Path
 import matplotlib.pyplot as plt
 from general_utilities import load_fsaverage_coord
+from results_catalog import ResultsCatalog, get_rois, atlas_mapping_files, fsaverage_coord_files
 from matplotlib import font_manager
 import os
 
@@ -156,60 +157,6 @@ def truncate_colormap(cmap, minval=0.0, maxval=1.0, n=100):
 activation_cmap = plt.get_cmap("RdYlBu_r")
 
 
-def get_rois(bids_root, subject_list, channels_list, atlas="",
-             folder="derivatives/preprocessing/sub-{}/ses-V1/ieeg/atlas_mapping/raw/desbadcharej_notfil_lapref"
-                    "/sub-{}_ses-V1_task-Dur_desc-elecmapping_{}_ieeg.csv", ignore_hemi=True):
-    channels_rois = []
-    for sub in subject_list:
-        # Get the channels of this subject:
-        sub_ch = [ch.split("-")[1] for ch in channels_list if ch.split("-")[0] == sub]
-        # Generate the path to the atlas mapping for this subject:
-        try:
-            atlas_map = pd.read_csv(Path(bids_root, folder.format(sub, sub, atlas)))
-            atlas_map = atlas_map.loc[atlas_map["channel"].isin(sub_ch)]
-        except FileNotFoundError:
-            print("Warning: for subject {}, atlas file {} not found".format(sub, atlas))
-            atlas_map = pd.DataFrame({
-                "channel": sub_ch,
-                "region": "Unknown"
-            })
-        if ignore_hemi:
-            atlas_map["region"] = [lbl.replace("ctx_lh_", "").replace("ctx_rh_",
-                                                                      "").replace("Right-", "").replace("Left-",
-                                                                                                        "") if
-                                   isinstance(lbl, str) else lbl
-                                   for lbl in atlas_map["region"].to_list()]
-        # Reformat the table output to remove the unknown and irrelevant labels:
-        atlas_map_clean = pd.DataFrame()
-        for ch in atlas_map["channel"].to_list():
-            try:
-                regions = atlas_map.loc[atlas_map["channel"] == ch, "region"].item().split("/")
-            except AttributeError:
-                print("No labels for ch-" + sub + "-" + ch)
-                continue
-            if len(regions) == 1:
-                atlas_map_clean = atlas_map_clean.append(pd.DataFrame({
-                    "channel": "-".join([sub, ch]),
-                    "region": regions[0]
-                }, index=[0]), ignore_index=True)
-            else:
-                reg = [region for region in regions if region != "Unknown" and "White-Matter" not in region]
-                if len(reg) == 0:
-                    atlas_map_clean = atlas_map_clean.append(pd.DataFrame({
-                        "channel": "-".join([sub, ch]),
-                        "region": regions[0]
-                    }, index=[0]), ignore_index=True)
-                else:
-                    atlas_map_clean = atlas_map_clean.append(pd.DataFrame({
-                        "channel": "-".join([sub, ch]),
-                        "region": reg[0]
-                    }, index=[0]), ignore_index=True)
-
-        channels_rois.append(atlas_map_clean)
-
-    return pd.concat(channels_rois, ignore_index=True)
-
-
 # Set parameters:
 categories = ["face", "object", "letter", "false"]
 models = ["time_win_dur_iit", "time_win_dur_gnw", "time_win_dur_cate_iit", "time_win_dur_cate_gnw"]
@@ -355,72 +302,179 @@ onset_offset_false_tr_file = "/mnt/beegfs/XNAT/COGITATE/ECoG/phase_2/processed/b
                              "-V1/ieeg/results/onset_offset_high_gamma_gnw_false_tr/desbadcharej_notfil_lapref" \
                              "/sub-super_ses-V1_task-Dur_ana-activation_analysis_gnw_onset_offset_results.csv"
 
-# Load each:
-vis_resp = pd.read_csv(Path(bids_root, visual_responsiveness_file))
-bayes_vis_resp = pd.read_csv(Path(bids_root, bayes_visual_responsiveness_file))
-cate_sel_ti = pd.read_csv(Path(bids_root, category_selectivity_ti_file))
-cate_sel_tr = pd.read_csv(Path(bids_root, category_selectivity_tr_file))
-
-activation_analysis_iit_ti = pd.read_csv(Path(bids_root, activation_analysis_iit_ti_file))
-activation_analysis_iit_tr = pd.read_csv(Path(bids_root, activation_analysis_iit_tr_file))
-activation_analysis_gnw_ti = pd.read_csv(Path(bids_root, activation_analysis_gnw_ti_file))
-activation_analysis_gnw_tr = pd.read_csv(Path(bids_root, activation_analysis_gnw_tr_file))
-
-activation_analysis_alpha_iit_ti = pd.read_csv(Path(bids_root, activation_analysis_iit_ti_alpha_file))
-activation_analysis_alpha_iit_tr = pd.read_csv(Path(bids_root, activation_analysis_iit_tr_alpha_file))
-activation_analysis_alpha_gnw_ti = pd.read_csv(Path(bids_root, activation_analysis_gnw_ti_alpha_file))
-activation_analysis_alpha_gnw_tr = pd.read_csv(Path(bids_root, activation_analysis_gnw_tr_alpha_file))
-
-activation_analysis_erp_iit_ti = pd.read_csv(Path(bids_root, activation_analysis_iit_ti_erp_file))
-activation_analysis_erp_iit_tr = pd.read_csv(Path(bids_root, activation_analysis_iit_tr_erp_file))
-activation_analysis_erp_gnw_ti = pd.read_csv(Path(bids_root, activation_analysis_gnw_ti_erp_file))
-activation_analysis_erp_gnw_tr = pd.read_csv(Path(bids_root, activation_analysis_gnw_tr_erp_file))
-
-duration_decoding_face_ti_results = pd.read_csv(duration_decoding_face_ti_file)
-duration_decoding_object_ti_results = pd.read_csv(duration_decoding_object_ti_file)
-duration_decoding_letter_ti_results = pd.read_csv(duration_decoding_letter_ti_file)
-duration_decoding_false_ti_results = pd.read_csv(duration_decoding_false_ti_file)
-duration_decoding_face_tr_results = pd.read_csv(duration_decoding_face_tr_file)
-duration_decoding_object_tr_results = pd.read_csv(duration_decoding_object_tr_file)
-duration_decoding_letter_tr_results = pd.read_csv(duration_decoding_letter_tr_file)
-duration_decoding_false_tr_results = pd.read_csv(duration_decoding_false_tr_file)
-
-duration_tracking_face_ti_results = pd.read_csv(duration_tracking_face_ti_file)
-duration_tracking_object_ti_results = pd.read_csv(duration_tracking_object_ti_file)
-duration_tracking_letter_ti_results = pd.read_csv(duration_tracking_letter_ti_file)
-duration_tracking_false_ti_results = pd.read_csv(duration_tracking_false_ti_file)
-duration_tracking_face_tr_results = pd.read_csv(duration_tracking_face_tr_file)
-duration_tracking_object_tr_results = pd.read_csv(duration_tracking_object_tr_file)
-duration_tracking_letter_tr_results = pd.read_csv(duration_tracking_letter_tr_file)
-duration_tracking_false_tr_results = pd.read_csv(duration_tracking_false_tr_file)
-
-# Onset offset analysis results:
-onset_offset_face_ti_results = pd.read_csv(onset_offset_face_ti_file)
-onset_offset_object_ti_results = pd.read_csv(onset_offset_object_ti_file)
-onset_offset_letter_ti_results = pd.read_csv(onset_offset_letter_ti_file)
-onset_offset_false_ti_results = pd.read_csv(onset_offset_false_ti_file)
-onset_offset_face_tr_results = pd.read_csv(onset_offset_face_tr_file)
-onset_offset_object_tr_results = pd.read_csv(onset_offset_object_tr_file)
-onset_offset_letter_tr_results = pd.read_csv(onset_offset_letter_tr_file)
-onset_offset_false_tr_results = pd.read_csv(onset_offset_false_tr_file)
+# Index the results files, the tables are only read once needed:
+catalog = ResultsCatalog(bids_root)
+catalog.add("vis_resp", visual_responsiveness_file,
+            analysis="visual_responsiveness", signal="high_gamma")
+catalog.add("bayes_vis_resp", bayes_visual_responsiveness_file,
+            analysis="visual_responsiveness", signal="high_gamma")
+catalog.add("cate_sel_ti", category_selectivity_ti_file,
+            analysis="category_selectivity", signal="high_gamma", task="ti")
+catalog.add("cate_sel_tr", category_selectivity_tr_file,
+            analysis="category_selectivity", signal="high_gamma", task="tr")
+catalog.add("activation_analysis_iit_ti", activation_analysis_iit_ti_file,
+            analysis="activation_analysis", signal="high_gamma", roi="iit", task="ti")
+catalog.add("activation_analysis_iit_tr", activation_analysis_iit_tr_file,
+            analysis="activation_analysis", signal="high_gamma", roi="iit", task="tr")
+catalog.add("activation_analysis_gnw_ti", activation_analysis_gnw_ti_file,
+            analysis="activation_analysis", signal="high_gamma", roi="gnw", task="ti")
+catalog.add("activation_analysis_gnw_tr", activation_analysis_gnw_tr_file,
+            analysis="activation_analysis", signal="high_gamma", roi="gnw", task="tr")
+catalog.add("activation_analysis_alpha_iit_ti", activation_analysis_iit_ti_alpha_file,
+            analysis="activation_analysis", signal="alpha", roi="iit", task="ti")
+catalog.add("activation_analysis_alpha_iit_tr", activation_analysis_iit_tr_alpha_file,
+            analysis="activation_analysis", signal="alpha", roi="iit", task="tr")
+catalog.add("activation_analysis_alpha_gnw_ti", activation_analysis_gnw_ti_alpha_file,
+            analysis="activation_analysis", signal="alpha", roi="gnw", task="ti")
+catalog.add("activation_analysis_alpha_gnw_tr", activation_analysis_gnw_tr_alpha_file,
+            analysis="activation_analysis", signal="alpha", roi="gnw", task="tr")
+catalog.add("activation_analysis_erp_iit_ti", activation_analysis_iit_ti_erp_file,
+            analysis="activation_analysis", signal="erp", roi="iit", task="ti")
+catalog.add("activation_analysis_erp_iit_tr", activation_analysis_iit_tr_erp_file,
+            analysis="activation_analysis", signal="erp", roi="iit", task="tr")
+catalog.add("activation_analysis_erp_gnw_ti", activation_analysis_gnw_ti_erp_file,
+            analysis="activation_analysis", signal="erp", roi="gnw", task="ti")
+catalog.add("activation_analysis_erp_gnw_tr", activation_analysis_gnw_tr_erp_file,
+            analysis="activation_analysis", signal="erp", roi="gnw", task="tr")
+catalog.add("duration_decoding_face_ti_results", duration_decoding_face_ti_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="ti")
+catalog.add("duration_decoding_object_ti_results", duration_decoding_object_ti_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="ti")
+catalog.add("duration_decoding_letter_ti_results", duration_decoding_letter_ti_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="ti")
+catalog.add("duration_decoding_false_ti_results", duration_decoding_false_ti_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="ti")
+catalog.add("duration_decoding_face_tr_results", duration_decoding_face_tr_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="tr")
+catalog.add("duration_decoding_object_tr_results", duration_decoding_object_tr_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="tr")
+catalog.add("duration_decoding_letter_tr_results", duration_decoding_letter_tr_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="tr")
+catalog.add("duration_decoding_false_tr_results", duration_decoding_false_tr_file,
+            analysis="duration_decoding", signal="high_gamma", roi="allbrain", task="tr")
+catalog.add("duration_tracking_face_ti_results", duration_tracking_face_ti_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="ti")
+catalog.add("duration_tracking_object_ti_results", duration_tracking_object_ti_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="ti")
+catalog.add("duration_tracking_letter_ti_results", duration_tracking_letter_ti_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="ti")
+catalog.add("duration_tracking_false_ti_results", duration_tracking_false_ti_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="ti")
+catalog.add("duration_tracking_face_tr_results", duration_tracking_face_tr_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="tr")
+catalog.add("duration_tracking_object_tr_results", duration_tracking_object_tr_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="tr")
+catalog.add("duration_tracking_letter_tr_results", duration_tracking_letter_tr_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="tr")
+catalog.add("duration_tracking_false_tr_results", duration_tracking_false_tr_file,
+            analysis="duration_tracking", signal="high_gamma", roi="iit", task="tr")
+catalog.add("onset_offset_face_ti_results", onset_offset_face_ti_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="ti")
+catalog.add("onset_offset_object_ti_results", onset_offset_object_ti_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="ti")
+catalog.add("onset_offset_letter_ti_results", onset_offset_letter_ti_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="ti")
+catalog.add("onset_offset_false_ti_results", onset_offset_false_ti_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="ti")
+catalog.add("onset_offset_face_tr_results", onset_offset_face_tr_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="tr")
+catalog.add("onset_offset_object_tr_results", onset_offset_object_tr_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="tr")
+catalog.add("onset_offset_letter_tr_results", onset_offset_letter_tr_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="tr")
+catalog.add("onset_offset_false_tr_results", onset_offset_false_tr_file,
+            analysis="onset_offset", signal="high_gamma", roi="gnw", task="tr")
 
 # ====================================================================================================
-# Get the name of each channel and their loc and ROIs:
-channels_list = vis_resp["channel"].to_list()
+# Get the name of each channel and the files their ROIs and coordinates are read from:
+channels_list = catalog.load("vis_resp", columns=["channel"])["channel"].to_list()
 # Extract the list of subjects:
 subjects_list = list(set([ch.split("-")[0] for ch in channels_list]))
-# Get both the destrieux and wang labels:
-channels_rois_desikan = get_rois(bids_root, subjects_list, channels_list, atlas="aparc+aseg")
-channels_rois_destrieux = get_rois(bids_root, subjects_list, channels_list, atlas="aparc.a2009s+aseg")
-channels_rois_wang = get_rois(bids_root, subjects_list, channels_list, atlas="wang15_mplbl")
-# Finally, load the channels MNI coordinates:
-ch_coords = load_fsaverage_coord(bids_root, subjects_list, ses='V1', laplace_reloc=True)
-ch_coords = ch_coords.loc[ch_coords["name"].isin(channels_list)]
-ch_coords = ch_coords.rename(columns={"name": "channel"})
+atlas_files = atlas_mapping_files(bids_root, subjects_list, ["aparc+aseg", "aparc.a2009s+aseg", "wang15_mplbl"])
+coord_files = fsaverage_coord_files(bids_root, subjects_list, ses='V1')
+# Each output is only generated again if its results, the atlas mapping, the coordinates or the code changed:
+code_files = [__file__, config.__file__, theories_rois.__file__]
+
+# ====================================================================================================
+# The channels summary table is only generated again if any of the results changed since it was saved:
+channels_summary_file = Path(bids_root, "derivatives", "all_channels_info.csv")
+channels_summary_stale = catalog.is_stale(list(catalog.entries), channels_summary_file,
+                                          sources=atlas_files + coord_files + code_files)
+if channels_summary_stale:
+    # Load each, only reading the columns used below:
+    vis_resp = catalog.load("vis_resp", columns=["channel", "reject",
+                                                 "effect_strength-stimulus onset/Irrelevant",
+                                                 "effect_strength-stimulus onset/Relevant non-target",
+                                                 "latency-stimulus onset/Irrelevant",
+                                                 "latency-stimulus onset/Relevant non-target"])
+    bayes_vis_resp = catalog.load("bayes_vis_resp", columns=["channel", "reject"])
+    cate_sel_ti = catalog.load("cate_sel_ti", columns=["channel", "condition", "effect_strength"])
+    cate_sel_tr = catalog.load("cate_sel_tr", columns=["channel", "condition", "effect_strength"])
+
+    activation_analysis_iit_ti = catalog.load("activation_analysis_iit_ti", columns=["group", "model"])
+    activation_analysis_iit_tr = catalog.load("activation_analysis_iit_tr", columns=["group", "model"])
+    activation_analysis_gnw_ti = catalog.load("activation_analysis_gnw_ti", columns=["group", "model"])
+    activation_analysis_gnw_tr = catalog.load("activation_analysis_gnw_tr", columns=["group", "model"])
+
+    activation_analysis_alpha_iit_ti = catalog.load("activation_analysis_alpha_iit_ti", columns=["group", "model"])
+    activation_analysis_alpha_iit_tr = catalog.load("activation_analysis_alpha_iit_tr", columns=["group", "model"])
+    activation_analysis_alpha_gnw_ti = catalog.load("activation_analysis_alpha_gnw_ti", columns=["group", "model"])
+    activation_analysis_alpha_gnw_tr = catalog.load("activation_analysis_alpha_gnw_tr", columns=["group", "model"])
+
+    activation_analysis_erp_iit_ti = catalog.load("activation_analysis_erp_iit_ti", columns=["group", "model"])
+    activation_analysis_erp_iit_tr = catalog.load("activation_analysis_erp_iit_tr", columns=["group", "model"])
+    activation_analysis_erp_gnw_ti = catalog.load("activation_analysis_erp_gnw_ti", columns=["group", "model"])
+    activation_analysis_erp_gnw_tr = catalog.load("activation_analysis_erp_gnw_tr", columns=["group", "model"])
+
+    duration_decoding_face_ti_results = catalog.load("duration_decoding_face_ti_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_object_ti_results = catalog.load("duration_decoding_object_ti_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_letter_ti_results = catalog.load("duration_decoding_letter_ti_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_false_ti_results = catalog.load("duration_decoding_false_ti_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_face_tr_results = catalog.load("duration_decoding_face_tr_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_object_tr_results = catalog.load("duration_decoding_object_tr_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_letter_tr_results = catalog.load("duration_decoding_letter_tr_results", columns=["channel", "p-value", "decoding_score"])
+    duration_decoding_false_tr_results = catalog.load("duration_decoding_false_tr_results", columns=["channel", "p-value", "decoding_score"])
+
+    duration_tracking_face_ti_results = catalog.load("duration_tracking_face_ti_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_object_ti_results = catalog.load("duration_tracking_object_ti_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_letter_ti_results = catalog.load("duration_tracking_letter_ti_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_false_ti_results = catalog.load("duration_tracking_false_ti_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_face_tr_results = catalog.load("duration_tracking_face_tr_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_object_tr_results = catalog.load("duration_tracking_object_tr_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_letter_tr_results = catalog.load("duration_tracking_letter_tr_results", columns=["channel", "p-value", "tracking_accuracy"])
+    duration_tracking_false_tr_results = catalog.load("duration_tracking_false_tr_results", columns=["channel", "p-value", "tracking_accuracy"])
+
+    # Onset offset analysis results:
+    onset_offset_face_ti_results = catalog.load("onset_offset_face_ti_results", columns=["channel", "condition"])
+    onset_offset_object_ti_results = catalog.load("onset_offset_object_ti_results", columns=["channel", "condition"])
+    onset_offset_letter_ti_results = catalog.load("onset_offset_letter_ti_results", columns=["channel", "condition"])
+    onset_offset_false_ti_results = catalog.load("onset_offset_false_ti_results", columns=["channel", "condition"])
+    onset_offset_face_tr_results = catalog.load("onset_offset_face_tr_results", columns=["channel", "condition"])
+    onset_offset_object_tr_results = catalog.load("onset_offset_object_tr_results", columns=["channel", "condition"])
+    onset_offset_letter_tr_results = catalog.load("onset_offset_letter_tr_results", columns=["channel", "condition"])
+    onset_offset_false_tr_results = catalog.load("onset_offset_false_tr_results", columns=["channel", "condition"])
+
+    # ====================================================================================================
+    # Get both the destrieux and wang labels:
+    channels_rois_desikan = get_rois(bids_root, subjects_list, channels_list, atlas="aparc+aseg")
+    channels_rois_destrieux = get_rois(bids_root, subjects_list, channels_list, atlas="aparc.a2009s+aseg")
+    channels_rois_wang = get_rois(bids_root, subjects_list, channels_list, atlas="wang15_mplbl")
+    # Finally, load the channels MNI coordinates:
+    ch_coords = load_fsaverage_coord(bids_root, subjects_list, ses='V1', laplace_reloc=True)
+    ch_coords = ch_coords.loc[ch_coords["name"].isin(channels_list)]
+    ch_coords = ch_coords.rename(columns={"name": "channel"})
+    channels_summary_table = pd.DataFrame()
+else:
+    channels_summary_table = pd.read_csv(channels_summary_file, index_col=0)
+    # The missing labels are saved as empty values, set them back to None:
+    str_columns = channels_summary_table.select_dtypes(include="object").columns
+    channels_summary_table[str_columns] = channels_summary_table[str_columns].where(
+        channels_summary_table[str_columns].notna(), None)
+    # The saved table is up to date, no channel needs to be summarized again:
+    channels_list = []
 
 # ====================================================================================================
 # Loop through each channel to extract all the relevant info:
-channels_summary_table = pd.DataFrame()
 for ch in channels_list:
     if ch == "SE107-O2PH5":
         print("!")
@@ -894,525 +948,569 @@ for ch in channels_list:
     }, index=[0]), ignore_index=True)
 
 # Save the table:
-channels_summary_table.to_csv(Path(bids_root, "derivatives", "all_channels_info.csv"))
+if channels_summary_stale:
+    channels_summary_table.to_csv(channels_summary_file)
 
 # =====================================================================================
 # Generate summary tables:
-# Make a summary by counting how many of each group we have in each ROIs:
-destrieux_summaries = pd.DataFrame()
-for lbl in list(channels_summary_table["Destrieux label"].unique()):
-    # Extract only this label's channels:
-    lbl_data = channels_summary_table.loc[channels_summary_table["Destrieux label"] == lbl]
-    # Count how many responsive electrodes we have:
-    n_activated = lbl_data.loc[lbl_data["responsiveness"] == "activated"].shape[0]
-    n_deactivated = lbl_data.loc[lbl_data["responsiveness"] == "deactivated"].shape[0]
-    mean_lat_ti = np.nanmean(lbl_data["latency ti"].to_numpy())
-    mean_lat_tr = np.nanmean(lbl_data["latency tr"].to_numpy())
-    std_lat_ti = np.nanstd(lbl_data["latency ti"].to_numpy())
-    std_lat_tr = np.nanstd(lbl_data["latency tr"].to_numpy())
-    n_face_selective = lbl_data.loc[lbl_data["selectivity"] == "face"].shape[0]
-    n_object_selective = lbl_data.loc[lbl_data["selectivity"] == "object"].shape[0]
-    n_letter_selective = lbl_data.loc[lbl_data["selectivity"] == "letter"].shape[0]
-    n_false_selective = lbl_data.loc[lbl_data["selectivity"] == "false"].shape[0]
-    n_models_ti = {}
-    n_models_tr = {}
-    for model in models:
-        n_models_ti[model] = lbl_data.loc[lbl_data["model ti HGP"] == model].shape[0]
-        n_models_tr[model] = lbl_data.loc[lbl_data["model tr HGP"] == model].shape[0]
-
-    # Put everything together in the table:
-    destrieux_summaries = destrieux_summaries.append(pd.DataFrame({
-        "Destrieux label": lbl,
-        "# Activated": n_activated,
-        "# Deactivated": n_deactivated,
-        "Mean latency TI": mean_lat_ti,
-        "STD latency TI": std_lat_ti,
-        "Mean latency TR": mean_lat_tr,
-        "STD latency TR": std_lat_tr,
-        "# Face selective": n_face_selective,
-        "# Object selective": n_face_selective,
-        "# Letter selective": n_letter_selective,
-        "# False selective": n_false_selective,
-        **n_models_ti,
-        **n_models_tr,
-        "# All": lbl_data.shape[0]
-    }, index=[0]), ignore_index=True)
-
-# Save to file:
-destrieux_summaries.to_csv(Path(bids_root, "derivatives", "Destrieux_labels_summary.csv"))
-
-# Same for the WANG
-wang_summaries = pd.DataFrame()
-for lbl in list(channels_summary_table["Wang label"].unique()):
-    # Extract only this label's channels:
-    lbl_data = channels_summary_table.loc[channels_summary_table["Wang label"] == lbl]
-    # Count how many responsive electrodes we have:
-    n_activated = lbl_data.loc[lbl_data["responsiveness"] == "activated"].shape[0]
-    n_deactivated = lbl_data.loc[lbl_data["responsiveness"] == "deactivated"].shape[0]
-    mean_lat_ti = np.nanmean(lbl_data["latency ti"].to_numpy())
-    mean_lat_tr = np.nanmean(lbl_data["latency tr"].to_numpy())
-    std_lat_ti = np.nanstd(lbl_data["latency ti"].to_numpy())
-    std_lat_tr = np.nanstd(lbl_data["latency tr"].to_numpy())
-    n_face_selective = lbl_data.loc[lbl_data["selectivity"] == "face"].shape[0]
-    n_object_selective = lbl_data.loc[lbl_data["selectivity"] == "object"].shape[0]
-    n_letter_selective = lbl_data.loc[lbl_data["selectivity"] == "letter"].shape[0]
-    n_false_selective = lbl_data.loc[lbl_data["selectivity"] == "false"].shape[0]
-    n_models_ti = {}
-    n_models_tr = {}
-    for model in models:
-        n_models_ti[model] = lbl_data.loc[lbl_data["model ti HGP"] == model].shape[0]
-        n_models_tr[model] = lbl_data.loc[lbl_data["model tr HGP"] == model].shape[0]
-
-    # Put everything together in the table:
-    wang_summaries = wang_summaries.append(pd.DataFrame({
-        "Wang label": lbl,
-        "# Activated": n_activated,
-        "# Deactivated": n_deactivated,
-        "Mean latency TI": mean_lat_ti,
-        "STD latency TI": std_lat_ti,
-        "Mean latency TR": mean_lat_tr,
-        "STD latency TR": std_lat_tr,
-        "# Face selective": n_face_selective,
-        "# Object selective": n_face_selective,
-        "# Letter selective": n_letter_selective,
-        "# False selective": n_false_selective,
-        **n_models_ti,
-        **n_models_tr,
-        "# All": lbl_data.shape[0]
-    }, index=[0]), ignore_index=True)
-
-# Save to file:
-wang_summaries.to_csv(Path(bids_root, "derivatives", "Wang_labels_summary.csv"))
+label_summaries_tables = ["vis_resp"] + catalog.select(analysis="category_selectivity") + \
+    catalog.select(analysis="activation_analysis", signal="high_gamma")
+if catalog.is_stale(label_summaries_tables, Path(bids_root, "derivatives", "Destrieux_labels_summary.csv"),
+                    Path(bids_root, "derivatives", "Wang_labels_summary.csv"), sources=atlas_files + code_files):
+    # Make a summary by counting how many of each group we have in each ROIs:
+    destrieux_summaries = pd.DataFrame()
+    for lbl in list(channels_summary_table["Destrieux label"].unique()):
+        # Extract only this label's channels:
+        lbl_data = channels_summary_table.loc[channels_summary_table["Destrieux label"] == lbl]
+        # Count how many responsive electrodes we have:
+        n_activated = lbl_data.loc[lbl_data["responsiveness"] == "activated"].shape[0]
+        n_deactivated = lbl_data.loc[lbl_data["responsiveness"] == "deactivated"].shape[0]
+        mean_lat_ti = np.nanmean(lbl_data["latency ti"].to_numpy())
+        mean_lat_tr = np.nanmean(lbl_data["latency tr"].to_numpy())
+        std_lat_ti = np.nanstd(lbl_data["latency ti"].to_numpy())
+        std_lat_tr = np.nanstd(lbl_data["latency tr"].to_numpy())
+        n_face_selective = lbl_data.loc[lbl_data["selectivity"] == "face"].shape[0]
+        n_object_selective = lbl_data.loc[lbl_data["selectivity"] == "object"].shape[0]
+        n_letter_selective = lbl_data.loc[lbl_data["selectivity"] == "letter"].shape[0]
+        n_false_selective = lbl_data.loc[lbl_data["selectivity"] == "false"].shape[0]
+        n_models_ti = {}
+        n_models_tr = {}
+        for model in models:
+            n_models_ti[model] = lbl_data.loc[lbl_data["model ti HGP"] == model].shape[0]
+            n_models_tr[model] = lbl_data.loc[lbl_data["model tr HGP"] == model].shape[0]
+
+        # Put everything together in the table:
+        destrieux_summaries = destrieux_summaries.append(pd.DataFrame({
+            "Destrieux label": lbl,
+            "# Activated": n_activated,
+            "# Deactivated": n_deactivated,
+            "Mean latency TI": mean_lat_ti,
+            "STD latency TI": std_lat_ti,
+            "Mean latency TR": mean_lat_tr,
+            "STD latency TR": std_lat_tr,
+            "# Face selective": n_face_selective,
+            "# Object selective": n_face_selective,
+            "# Letter selective": n_letter_selective,
+            "# False selective": n_false_selective,
+            **n_models_ti,
+            **n_models_tr,
+            "# All": lbl_data.shape[0]
+        }, index=[0]), ignore_index=True)
+
+    # Save to file:
+    destrieux_summaries.to_csv(Path(bids_root, "derivatives", "Destrieux_labels_summary.csv"))
+
+    # Same for the WANG
+    wang_summaries = pd.DataFrame()
+    for lbl in list(channels_summary_table["Wang label"].unique()):
+        # Extract only this label's channels:
+        lbl_data = channels_summary_table.loc[channels_summary_table["Wang label"] == lbl]
+        # Count how many responsive electrodes we have:
+        n_activated = lbl_data.loc[lbl_data["responsiveness"] == "activated"].shape[0]
+        n_deactivated = lbl_data.loc[lbl_data["responsiveness"] == "deactivated"].shape[0]
+        mean_lat_ti = np.nanmean(lbl_data["latency ti"].to_numpy())
+        mean_lat_tr = np.nanmean(lbl_data["latency tr"].to_numpy())
+        std_lat_ti = np.nanstd(lbl_data["latency ti"].to_numpy())
+        std_lat_tr = np.nanstd(lbl_data["latency tr"].to_numpy())
+        n_face_selective = lbl_data.loc[lbl_data["selectivity"] == "face"].shape[0]
+        n_object_selective = lbl_data.loc[lbl_data["selectivity"] == "object"].shape[0]
+        n_letter_selective = lbl_data.loc[lbl_data["selectivity"] == "letter"].shape[0]
+        n_false_selective = lbl_data.loc[lbl_data["selectivity"] == "false"].shape[0]
+        n_models_ti = {}
+        n_models_tr = {}
+        for model in models:
+            n_models_ti[model] = lbl_data.loc[lbl_data["model ti HGP"] == model].shape[0]
+            n_models_tr[model] = lbl_data.loc[lbl_data["model tr HGP"] == model].shape[0]
+
+        # Put everything together in the table:
+        wang_summaries = wang_summaries.append(pd.DataFrame({
+            "Wang label": lbl,
+            "# Activated": n_activated,
+            "# Deactivated": n_deactivated,
+            "Mean latency TI": mean_lat_ti,
+            "STD latency TI": std_lat_ti,
+            "Mean latency TR": mean_lat_tr,
+            "STD latency TR": std_lat_tr,
+            "# Face selective": n_face_selective,
+            "# Object selective": n_face_selective,
+            "# Letter selective": n_letter_selective,
+            "# False selective": n_false_selective,
+            **n_models_ti,
+            **n_models_tr,
+            "# All": lbl_data.shape[0]
+        }, index=[0]), ignore_index=True)
+
+    # Save to file:
+    wang_summaries.to_csv(Path(bids_root, "derivatives", "Wang_labels_summary.csv"))
 
 # =============================================================================================
 # Single subject summary tables:
-single_subject_count = pd.DataFrame()
-for subject in list(channels_summary_table["subject"].unique()):
-    # Extract the data for this subject:
-    sub_data = channels_summary_table.loc[channels_summary_table["subject"] == subject]
-    # Count the electrodes showing significance in each of the relevant tests:
-    n_act_ch = sub_data.loc[sub_data["responsiveness"] == "activated"].shape[0]
-    n_deact_ch = sub_data.loc[sub_data["responsiveness"] == "deactivated"].shape[0]
-    n_face_sel_ch = sub_data.loc[sub_data["selectivity"] == "face"].shape[0]
-    n_object_sel_ch = sub_data.loc[sub_data["selectivity"] == "object"].shape[0]
-    n_letter_sel_ch = sub_data.loc[sub_data["selectivity"] == "letter"].shape[0]
-    n_false_sel_ch = sub_data.loc[sub_data["selectivity"] == "false"].shape[0]
-    n_iit = sub_data.loc[sub_data["Theory ROI"] == "iit"].shape[0]
-    n_gnw = sub_data.loc[sub_data["Theory ROI"] == "gnw"].shape[0]
-    n_all = sub_data.shape[0]
-    single_subject_count = single_subject_count.append(pd.DataFrame({
-        "subject": subject,
-        "# Activated": n_act_ch,
-        "# Deactivated": n_deact_ch,
-        "# Face selective": n_face_sel_ch,
-        "# Object selective": n_object_sel_ch,
-        "# Letter selective": n_letter_sel_ch,
-        "# False selective": n_false_sel_ch,
-        "# IIT": n_iit,
-        "# GNW": n_gnw,
-        "# All": n_all
-    }, index=[0]), ignore_index=True)
-# Save the table:
-single_subject_count.to_csv(Path(bids_root, "derivatives", "single_subject_counts.csv"))
+if catalog.is_stale(label_summaries_tables + catalog.select(analysis="activation_analysis", signal="erp"),
+                    Path(bids_root, "derivatives", "single_subject_counts.csv"), sources=code_files):
+    single_subject_count = pd.DataFrame()
+    for subject in list(channels_summary_table["subject"].unique()):
+        # Extract the data for this subject:
+        sub_data = channels_summary_table.loc[channels_summary_table["subject"] == subject]
+        # Count the electrodes showing significance in each of the relevant tests:
+        n_act_ch = sub_data.loc[sub_data["responsiveness"] == "activated"].shape[0]
+        n_deact_ch = sub_data.loc[sub_data["responsiveness"] == "deactivated"].shape[0]
+        n_face_sel_ch = sub_data.loc[sub_data["selectivity"] == "face"].shape[0]
+        n_object_sel_ch = sub_data.loc[sub_data["selectivity"] == "object"].shape[0]
+        n_letter_sel_ch = sub_data.loc[sub_data["selectivity"] == "letter"].shape[0]
+        n_false_sel_ch = sub_data.loc[sub_data["selectivity"] == "false"].shape[0]
+        n_iit = sub_data.loc[sub_data["Theory ROI"] == "iit"].shape[0]
+        n_gnw = sub_data.loc[sub_data["Theory ROI"] == "gnw"].shape[0]
+        n_all = sub_data.shape[0]
+        single_subject_count = single_subject_count.append(pd.DataFrame({
+            "subject": subject,
+            "# Activated": n_act_ch,
+            "# Deactivated": n_deact_ch,
+            "# Face selective": n_face_sel_ch,
+            "# Object selective": n_object_sel_ch,
+            "# Letter selective": n_letter_sel_ch,
+            "# False selective": n_false_sel_ch,
+            "# IIT": n_iit,
+            "# GNW": n_gnw,
+            "# All": n_all
+        }, index=[0]), ignore_index=True)
+    # Save the table:
+    single_subject_count.to_csv(Path(bids_root, "derivatives", "single_subject_counts.csv"))
 
 # =============================================================================================
 # Brain plots:
-# Theories rois:
-theory_roi_colors = pd.DataFrame()
-for theory in theories_rois.rois:
-    theory_color = param["colors"][theory]
-    theory_roi_colors = theory_roi_colors.append(pd.DataFrame({
-        "roi": [roi.replace("ctx_rh_", "").replace("ctx_lh_", "") for roi in theories_rois.rois[theory]],
-        "r": theory_color[0],
-        "g": theory_color[1],
-        "b": theory_color[2]
-    }), ignore_index=True)
-# Save to file:
-theory_roi_colors.to_csv("theory_rois_dict.csv")
-
-# IIT ROI:
-iit_roi_colors = pd.DataFrame()
-theory_color = param["colors"]["iit"]
-iit_roi_colors = iit_roi_colors.append(pd.DataFrame({
-    "roi": [roi.replace("ctx_rh_", "").replace("ctx_lh_", "") for roi in theories_rois.rois["iit"]],
-    "r": theory_color[0],
-    "g": theory_color[1],
-    "b": theory_color[2]
-}), ignore_index=True)
-# Save to file:
-iit_roi_colors.to_csv("iit_rois_dict.csv")
-
-anat_roi_colors = pd.DataFrame()
-for roi in rois:
-    theory_color = roi_colors[roi]
-    anat_roi_colors = anat_roi_colors.append(pd.DataFrame({
-        "roi": [roi.replace("ctx-rh-", "").replace("ctx-lh-", "") for roi in rois[roi]],
+if catalog.is_stale([], "theory_rois_dict.csv", "iit_rois_dict.csv", "anatomical_rois_dict.csv",
+                    sources=code_files):
+    # Theories rois:
+    theory_roi_colors = pd.DataFrame()
+    for theory in theories_rois.rois:
+        theory_color = param["colors"][theory]
+        theory_roi_colors = theory_roi_colors.append(pd.DataFrame({
+            "roi": [roi.replace("ctx_rh_", "").replace("ctx_lh_", "") for roi in theories_rois.rois[theory]],
+            "r": theory_color[0],
+            "g": theory_color[1],
+            "b": theory_color[2]
+        }), ignore_index=True)
+    # Save to file:
+    theory_roi_colors.to_csv("theory_rois_dict.csv")
+
+    # IIT ROI:
+    iit_roi_colors = pd.DataFrame()
+    theory_color = param["colors"]["iit"]
+    iit_roi_colors = iit_roi_colors.append(pd.DataFrame({
+        "roi": [roi.replace("ctx_rh_", "").replace("ctx_lh_", "") for roi in theories_rois.rois["iit"]],
         "r": theory_color[0],
         "g": theory_color[1],
         "b": theory_color[2]
     }), ignore_index=True)
-# Save to file:
-anat_roi_colors.to_csv("anatomical_rois_dict.csv")
+    # Save to file:
+    iit_roi_colors.to_csv("iit_rois_dict.csv")
+
+    anat_roi_colors = pd.DataFrame()
+    for roi in rois:
+        theory_color = roi_colors[roi]
+        anat_roi_colors = anat_roi_colors.append(pd.DataFrame({
+            "roi": [roi.replace("ctx-rh-", "").replace("ctx-lh-", "") for roi in rois[roi]],
+            "r": theory_color[0],
+            "g": theory_color[1],
+            "b": theory_color[2]
+        }), ignore_index=True)
+    # Save to file:
+    anat_roi_colors.to_csv("anatomical_rois_dict.csv")
 
 # ===============================================
 # Visual responsiveness:
-ch_coords = pd.DataFrame()
-ch_colors_ti = pd.DataFrame()
-ch_colors_tr = pd.DataFrame()
-# Get the dprime ranges for the channels radius:
-min_dprime = np.nanmin(np.concatenate([channels_summary_table["resp dprime ti"].to_numpy(),
-                                       channels_summary_table["resp dprime tr"].to_numpy()], axis=0))
-max_dprime = np.percentile(np.concatenate([channels_summary_table["resp dprime ti"].dropna().to_numpy(),
-                                           channels_summary_table["resp dprime tr"].dropna().to_numpy()], axis=0), 90)
-# Normalize the color bar:
-norm = mpl.colors.TwoSlopeNorm(vmin=min_dprime, vcenter=0, vmax=max_dprime)
-activation_scalar_map = cm.ScalarMappable(norm=norm, cmap=activation_cmap)
-
-# Plot the activation color bar:
-fig = plt.figure()
-ax = fig.add_axes([0.05, 0.80, 0.1, 0.9])
-cb = mpl.colorbar.ColorbarBase(ax, orientation='vertical',
-                               cmap=activation_cmap, norm=norm)
-cb.ax.set_yscale('linear')  # To make sure that the spacing is correct despite normalization
-plt.savefig("responsiveness_cbar.png", bbox_inches='tight', transparent=True)
-plt.savefig("responsiveness_cbar.svg", bbox_inches='tight', transparent=True)
-plt.close()
-# Loop through each channel:
-for ch in channels_summary_table["channel"].to_list():
-    # Get the channel info:
-    xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
-    # Responsiveness:
-    ch_responsiveness = channels_summary_table.loc[channels_summary_table["channel"] == ch, "responsiveness"].item()
-    resp_dprime_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "resp dprime ti"].item()
-    resp_dprime_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "resp dprime tr"].item()
-
-    # Parse that info:
-    if ch_responsiveness not in ["activated", "deactivated"]:
-        continue
-    ch_coords = ch_coords.append(pd.DataFrame({
-        "channel": ch,
-        "x": xyz[0],
-        "y": xyz[1],
-        "z": xyz[2],
-        "radius": 4
-    }, index=[0]), ignore_index=True)
-    ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
-        "channel": ch,
-        "r": activation_scalar_map.to_rgba(resp_dprime_ti)[0],
-        "g": activation_scalar_map.to_rgba(resp_dprime_ti)[1],
-        "b": activation_scalar_map.to_rgba(resp_dprime_ti)[2],
-        "dprime": resp_dprime_ti
-    }, index=[0]), ignore_index=True)
-    ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
-        "channel": ch,
-        "r": activation_scalar_map.to_rgba(resp_dprime_tr)[0],
-        "g": activation_scalar_map.to_rgba(resp_dprime_tr)[1],
-        "b": activation_scalar_map.to_rgba(resp_dprime_tr)[2],
-        "dprime": resp_dprime_tr
-    }, index=[0]), ignore_index=True)
-
-# Save the coordinate tables to csvs:
-ch_coords.to_csv("responsiveness_coords.csv")
-ch_colors_ti.to_csv("responsiveness_coords_colors_ti.csv")
-ch_colors_tr.to_csv("responsiveness_coords_colors_tr.csv")
+if catalog.is_stale(["vis_resp"], "responsiveness_cbar.png", "responsiveness_coords.csv",
+                    "responsiveness_coords_colors_ti.csv", "responsiveness_coords_colors_tr.csv",
+                    sources=coord_files + code_files):
+    ch_coords = pd.DataFrame()
+    ch_colors_ti = pd.DataFrame()
+    ch_colors_tr = pd.DataFrame()
+    # Get the dprime ranges for the channels radius:
+    min_dprime = np.nanmin(np.concatenate([channels_summary_table["resp dprime ti"].to_numpy(),
+                                           channels_summary_table["resp dprime tr"].to_numpy()], axis=0))
+    max_dprime = np.percentile(np.concatenate([channels_summary_table["resp dprime ti"].dropna().to_numpy(),
+                                               channels_summary_table["resp dprime tr"].dropna().to_numpy()],
+                                              axis=0), 90)
+    # Normalize the color bar:
+    norm = mpl.colors.TwoSlopeNorm(vmin=min_dprime, vcenter=0, vmax=max_dprime)
+    activation_scalar_map = cm.ScalarMappable(norm=norm, cmap=activation_cmap)
+
+    # Plot the activation color bar:
+    fig = plt.figure()
+    ax = fig.add_axes([0.05, 0.80, 0.1, 0.9])
+    cb = mpl.colorbar.ColorbarBase(ax, orientation='vertical',
+                                   cmap=activation_cmap, norm=norm)
+    cb.ax.set_yscale('linear')  # To make sure that the spacing is correct despite normalization
+    plt.savefig("responsiveness_cbar.png", bbox_inches='tight', transparent=True)
+    plt.savefig("responsiveness_cbar.svg", bbox_inches='tight', transparent=True)
+    plt.close()
+    # Loop through each channel:
+    for ch in channels_summary_table["channel"].to_list():
+        # Get the channel info:
+        xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
+        # Responsiveness:
+        ch_responsiveness = channels_summary_table.loc[channels_summary_table["channel"] == ch, "responsiveness"].item()
+        resp_dprime_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "resp dprime ti"].item()
+        resp_dprime_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "resp dprime tr"].item()
+
+        # Parse that info:
+        if ch_responsiveness not in ["activated", "deactivated"]:
+            continue
+        ch_coords = ch_coords.append(pd.DataFrame({
+            "channel": ch,
+            "x": xyz[0],
+            "y": xyz[1],
+            "z": xyz[2],
+            "radius": 4
+        }, index=[0]), ignore_index=True)
+        ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
+            "channel": ch,
+            "r": activation_scalar_map.to_rgba(resp_dprime_ti)[0],
+            "g": activation_scalar_map.to_rgba(resp_dprime_ti)[1],
+            "b": activation_scalar_map.to_rgba(resp_dprime_ti)[2],
+            "dprime": resp_dprime_ti
+        }, index=[0]), ignore_index=True)
+        ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
+            "channel": ch,
+            "r": activation_scalar_map.to_rgba(resp_dprime_tr)[0],
+            "g": activation_scalar_map.to_rgba(resp_dprime_tr)[1],
+            "b": activation_scalar_map.to_rgba(resp_dprime_tr)[2],
+            "dprime": resp_dprime_tr
+        }, index=[0]), ignore_index=True)
+
+    # Save the coordinate tables to csvs:
+    ch_coords.to_csv("responsiveness_coords.csv")
+    ch_colors_ti.to_csv("responsiveness_coords_colors_ti.csv")
+    ch_colors_tr.to_csv("responsiveness_coords_colors_tr.csv")
 
 # ===============================================
 # Category selectivity:
-ch_coords = pd.DataFrame()
-ch_colors_ti = pd.DataFrame()
-ch_colors_tr = pd.DataFrame()
-
-# Loop through each channel:
-for ch in channels_summary_table["channel"].to_list():
-    # Get the channel info:
-    xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
-    # Selectivity:
-    ch_selectivity = channels_summary_table.loc[channels_summary_table["channel"] == ch, "selectivity"].item()
-    sel_dprime_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "sel dprime ti"].item()
-    sel_dprime_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "sel dprime tr"].item()
-
-    # Parse that info:
-    if ch_selectivity is None:
-        continue
-    ti_color = selectivity_colors[ch_selectivity]
-    tr_color = selectivity_colors[ch_selectivity]
-    ch_coords = ch_coords.append(pd.DataFrame({
-        "channel": ch,
-        "x": xyz[0],
-        "y": xyz[1],
-        "z": xyz[2],
-        "radius": 3
-    }, index=[0]), ignore_index=True)
-    ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
-        "channel": ch,
-        "r": ti_color[0],
-        "g": ti_color[1],
-        "b": ti_color[2]
-    }, index=[0]), ignore_index=True)
-    ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
-        "channel": ch,
-        "r": tr_color[0],
-        "g": tr_color[1],
-        "b": tr_color[2]
-    }, index=[0]), ignore_index=True)
-
-# Save the coordinate tables to csvs:
-ch_coords.to_csv("category_selectivity_coords_ti.csv")
-ch_colors_ti.to_csv("category_selectivity_coords_colors_ti.csv")
-ch_colors_tr.to_csv("category_selectivity_coords_colors_tr.csv")
+if catalog.is_stale(catalog.select(analysis="category_selectivity"), "category_selectivity_coords_ti.csv",
+                    "category_selectivity_coords_colors_ti.csv", "category_selectivity_coords_colors_tr.csv",
+                    sources=coord_files + code_files):
+    ch_coords = pd.DataFrame()
+    ch_colors_ti = pd.DataFrame()
+    ch_colors_tr = pd.DataFrame()
+
+    # Loop through each channel:
+    for ch in channels_summary_table["channel"].to_list():
+        # Get the channel info:
+        xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
+        # Selectivity:
+        ch_selectivity = channels_summary_table.loc[channels_summary_table["channel"] == ch, "selectivity"].item()
+        sel_dprime_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "sel dprime ti"].item()
+        sel_dprime_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "sel dprime tr"].item()
+
+        # Parse that info:
+        if ch_selectivity is None:
+            continue
+        ti_color = selectivity_colors[ch_selectivity]
+        tr_color = selectivity_colors[ch_selectivity]
+        ch_coords = ch_coords.append(pd.DataFrame({
+            "channel": ch,
+            "x": xyz[0],
+            "y": xyz[1],
+            "z": xyz[2],
+            "radius": 3
+        }, index=[0]), ignore_index=True)
+        ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
+            "channel": ch,
+            "r": ti_color[0],
+            "g": ti_color[1],
+            "b": ti_color[2]
+        }, index=[0]), ignore_index=True)
+        ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
+            "channel": ch,
+            "r": tr_color[0],
+            "g": tr_color[1],
+            "b": tr_color[2]
+        }, index=[0]), ignore_index=True)
+
+    # Save the coordinate tables to csvs:
+    ch_coords.to_csv("category_selectivity_coords_ti.csv")
+    ch_colors_ti.to_csv("category_selectivity_coords_colors_ti.csv")
+    ch_colors_tr.to_csv("category_selectivity_coords_colors_tr.csv")
 
 # ======================================================================================================================
 # Duration decoding:
-# Set up the colors:
-accuracy_cmap = plt.get_cmap("Reds")
-norm = mpl.colors.Normalize(vmin=0.5, vmax=1)
-accuracy_scalar_map = cm.ScalarMappable(norm=norm, cmap=accuracy_cmap)
-ch_coords = pd.DataFrame()
-ch_colors_ti = pd.DataFrame()
-ch_colors_tr = pd.DataFrame()
-ch_rois = pd.DataFrame()
-# Loop through each channel:
-for ch in channels_summary_table["channel"].to_list():
-    # Locate the channel results in each table:
-    face_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_decoding_ti"].item()
-    face_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_decoding_tr"].item()
-    object_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "object_dur_decoding_ti"].item()
-    object_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "object_dur_decoding_tr"].item()
-    letter_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "letter_dur_decoding_ti"].item()
-    letter_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "letter_dur_decoding_tr"].item()
-    false_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "false_dur_decoding_ti"].item()
-    false_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "false_dur_decoding_tr"].item()
-
-    # Make the conjunction:
-    if not np.isnan(face_res_ti):
-        face_decoding = True
-        face_accuracy_ti = face_res_ti
-        face_accuracy_tr = face_res_tr
-    else:
-        face_decoding = False
-        face_accuracy_ti = 0
-        face_accuracy_tr = 0
-    if not np.isnan(object_res_ti):
-        object_decoding = True
-        object_accuracy_ti = object_res_ti
-        object_accuracy_tr = object_res_tr
-    else:
-        object_decoding = False
-        object_accuracy_ti = 0
-        object_accuracy_tr = 0
-
-    if not np.isnan(letter_res_ti):
-        letter_decoding = True
-        letter_accuracy_ti = letter_res_ti
-        letter_accuracy_tr = letter_res_tr
-    else:
-        letter_decoding = False
-        letter_accuracy_ti = 0
-        letter_accuracy_tr = 0
-
-    if not np.isnan(false_res_ti):
-        false_decoding = True
-        false_accuracy_ti = false_res_ti
-        false_accuracy_tr = false_res_tr
-    else:
-        false_decoding = False
-        false_accuracy_ti = 0
-        false_accuracy_tr = 0
-
-    # Check whether there are any conditions for which we have decoding
-    if any([face_decoding, object_decoding, letter_decoding, false_decoding]):
-        max_decoding_ti = max([face_accuracy_ti, object_accuracy_ti, letter_accuracy_ti,
-                               false_accuracy_ti])
-        max_decoding_tr = max([face_accuracy_tr, object_accuracy_tr, letter_accuracy_tr,
-                               false_accuracy_tr])
-    else:
-        continue
-    c_ti = accuracy_scalar_map.to_rgba(max_decoding_ti)
-    c_tr = accuracy_scalar_map.to_rgba(max_decoding_tr)
-    xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
-    ch_theory = channels_summary_table.loc[channels_summary_table["channel"] == ch, "Theory ROI"].item()
-    if ch_theory not in ["iit", "gnw"]:
-        continue
-    # Append to the table:
-    ch_coords = ch_coords.append(pd.DataFrame({
-        "channel": ch,
-        "x": xyz[0],
-        "y": xyz[1],
-        "z": xyz[2],
-        "radius": 3
-    }, index=[0]), ignore_index=True)
-    ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
-        "channel": ch,
-        "r": c_ti[0],
-        "g": c_ti[1],
-        "b": c_ti[2],
-    }, index=[0]), ignore_index=True)
-    ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
-        "channel": ch,
-        "r": c_tr[0],
-        "g": c_tr[1],
-        "b": c_tr[2],
-    }, index=[0]), ignore_index=True)
-    ch_rois = ch_rois.append(pd.DataFrame({
-        "channel": ch,
-        "roi": channels_summary_table.loc[channels_summary_table["channel"] == ch, "Destrieux label"].item()
-    }, index=[0]), ignore_index=True)
-
-# Save the data:
-if len(ch_coords) > 0:
-    ch_coords.to_csv("duration_decoding_coords.csv")
-    ch_colors_ti.to_csv("duration_decoding_coords_colors_ti.csv")
-    ch_colors_tr.to_csv("duration_decoding_coords_colors_tr.csv")
-    ch_rois.to_csv("duration_decoding_ch_roi.csv")
-
-# Plot the onset and offset color bars:
-fig = plt.figure()
-ax = fig.add_axes([0.05, 0.80, 0.1, 0.9])
-cb = mpl.colorbar.ColorbarBase(ax, orientation='vertical',
-                               cmap=accuracy_cmap, norm=norm)
-plt.savefig("duration_decoding_accuracy_cbar.png", bbox_inches='tight', transparent=True)
-plt.savefig("duration_decoding_accuracy_cbar.svg", bbox_inches='tight', transparent=True)
-plt.close()
+# The coordinates are only saved if any channel decodes the duration, the color bar is always saved:
+if catalog.is_stale(catalog.select(analysis="duration_decoding"), "duration_decoding_accuracy_cbar.png",
+                    sources=atlas_files + coord_files + code_files):
+    # Set up the colors:
+    accuracy_cmap = plt.get_cmap("Reds")
+    norm = mpl.colors.Normalize(vmin=0.5, vmax=1)
+    accuracy_scalar_map = cm.ScalarMappable(norm=norm, cmap=accuracy_cmap)
+    ch_coords = pd.DataFrame()
+    ch_colors_ti = pd.DataFrame()
+    ch_colors_tr = pd.DataFrame()
+    ch_rois = pd.DataFrame()
+    # Loop through each channel:
+    for ch in channels_summary_table["channel"].to_list():
+        # Locate the channel results in each table:
+        face_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_decoding_ti"].item()
+        face_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_decoding_tr"].item()
+        object_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "object_dur_decoding_ti"].item()
+        object_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "object_dur_decoding_tr"].item()
+        letter_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "letter_dur_decoding_ti"].item()
+        letter_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "letter_dur_decoding_tr"].item()
+        false_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                  "false_dur_decoding_ti"].item()
+        false_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                  "false_dur_decoding_tr"].item()
+
+        # Make the conjunction:
+        if not np.isnan(face_res_ti):
+            face_decoding = True
+            face_accuracy_ti = face_res_ti
+            face_accuracy_tr = face_res_tr
+        else:
+            face_decoding = False
+            face_accuracy_ti = 0
+            face_accuracy_tr = 0
+        if not np.isnan(object_res_ti):
+            object_decoding = True
+            object_accuracy_ti = object_res_ti
+            object_accuracy_tr = object_res_tr
+        else:
+            object_decoding = False
+            object_accuracy_ti = 0
+            object_accuracy_tr = 0
+
+        if not np.isnan(letter_res_ti):
+            letter_decoding = True
+            letter_accuracy_ti = letter_res_ti
+            letter_accuracy_tr = letter_res_tr
+        else:
+            letter_decoding = False
+            letter_accuracy_ti = 0
+            letter_accuracy_tr = 0
+
+        if not np.isnan(false_res_ti):
+            false_decoding = True
+            false_accuracy_ti = false_res_ti
+            false_accuracy_tr = false_res_tr
+        else:
+            false_decoding = False
+            false_accuracy_ti = 0
+            false_accuracy_tr = 0
+
+        # Check whether there are any conditions for which we have decoding
+        if any([face_decoding, object_decoding, letter_decoding, false_decoding]):
+            max_decoding_ti = max([face_accuracy_ti, object_accuracy_ti, letter_accuracy_ti,
+                                   false_accuracy_ti])
+            max_decoding_tr = max([face_accuracy_tr, object_accuracy_tr, letter_accuracy_tr,
+                                   false_accuracy_tr])
+        else:
+            continue
+        c_ti = accuracy_scalar_map.to_rgba(max_decoding_ti)
+        c_tr = accuracy_scalar_map.to_rgba(max_decoding_tr)
+        xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
+        ch_theory = channels_summary_table.loc[channels_summary_table["channel"] == ch, "Theory ROI"].item()
+        if ch_theory not in ["iit", "gnw"]:
+            continue
+        # Append to the table:
+        ch_coords = ch_coords.append(pd.DataFrame({
+            "channel": ch,
+            "x": xyz[0],
+            "y": xyz[1],
+            "z": xyz[2],
+            "radius": 3
+        }, index=[0]), ignore_index=True)
+        ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
+            "channel": ch,
+            "r": c_ti[0],
+            "g": c_ti[1],
+            "b": c_ti[2],
+        }, index=[0]), ignore_index=True)
+        ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
+            "channel": ch,
+            "r": c_tr[0],
+            "g": c_tr[1],
+            "b": c_tr[2],
+        }, index=[0]), ignore_index=True)
+        ch_rois = ch_rois.append(pd.DataFrame({
+            "channel": ch,
+            "roi": channels_summary_table.loc[channels_summary_table["channel"] == ch, "Destrieux label"].item()
+        }, index=[0]), ignore_index=True)
+
+    # Save the data:
+    if len(ch_coords) > 0:
+        ch_coords.to_csv("duration_decoding_coords.csv")
+        ch_colors_ti.to_csv("duration_decoding_coords_colors_ti.csv")
+        ch_colors_tr.to_csv("duration_decoding_coords_colors_tr.csv")
+        ch_rois.to_csv("duration_decoding_ch_roi.csv")
+
+    # Plot the onset and offset color bars:
+    fig = plt.figure()
+    ax = fig.add_axes([0.05, 0.80, 0.1, 0.9])
+    cb = mpl.colorbar.ColorbarBase(ax, orientation='vertical',
+                                   cmap=accuracy_cmap, norm=norm)
+    plt.savefig("duration_decoding_accuracy_cbar.png", bbox_inches='tight', transparent=True)
+    plt.savefig("duration_decoding_accuracy_cbar.svg", bbox_inches='tight', transparent=True)
+    plt.close()
 
 # ======================================================================================================================
 # Duration tracking:
-# Get the max and min values:
-min_track_prop = np.nanmin(np.abs(np.concatenate([channels_summary_table["face_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["face_dur_tracking_tr"].to_numpy(),
-                                                  channels_summary_table["object_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["object_dur_tracking_tr"].to_numpy(),
-                                                  channels_summary_table["letter_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["letter_dur_tracking_tr"].to_numpy(),
-                                                  channels_summary_table["false_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["false_dur_tracking_tr"].to_numpy()], axis=0)))
-max_track_prop = np.nanmax(np.abs(np.concatenate([channels_summary_table["face_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["face_dur_tracking_tr"].to_numpy(),
-                                                  channels_summary_table["object_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["object_dur_tracking_tr"].to_numpy(),
-                                                  channels_summary_table["letter_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["letter_dur_tracking_tr"].to_numpy(),
-                                                  channels_summary_table["false_dur_tracking_ti"].to_numpy(),
-                                                  channels_summary_table["false_dur_tracking_tr"].to_numpy()],
-                                                 axis=0)))
-# Set up the colors:
-accuracy_cmap = plt.get_cmap("Reds")
-norm = mpl.colors.Normalize(vmin=min_track_prop, vmax=max_track_prop)
-tracking_scalar_map = cm.ScalarMappable(norm=norm, cmap=accuracy_cmap)
-ch_coords = pd.DataFrame()
-ch_colors_ti = pd.DataFrame()
-ch_colors_tr = pd.DataFrame()
-# Loop through each channel:
-for ch in channels_summary_table["channel"].to_list():
-    # Locate the channel results in each table:
-    face_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_tracking_ti"].item()
-    face_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_tracking_tr"].item()
-    object_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "object_dur_tracking_ti"].item()
-    object_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "object_dur_tracking_tr"].item()
-    letter_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "letter_dur_tracking_ti"].item()
-    letter_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "letter_dur_tracking_tr"].item()
-    false_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "false_dur_tracking_ti"].item()
-    false_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "false_dur_tracking_tr"].item()
-
-    # Make the conjunction:
-    if not np.isnan(face_res_ti):
-        face_decoding = True
-        face_accuracy_ti = face_res_ti
-        face_accuracy_tr = face_res_tr
-    else:
-        face_decoding = False
-        face_accuracy_ti = 0
-        face_accuracy_tr = 0
-    if not np.isnan(object_res_ti):
-        object_decoding = True
-        object_accuracy_ti = object_res_ti
-        object_accuracy_tr = object_res_tr
-    else:
-        object_decoding = False
-        object_accuracy_ti = 0
-        object_accuracy_tr = 0
-
-    if not np.isnan(letter_res_ti):
-        letter_decoding = True
-        letter_accuracy_ti = letter_res_ti
-        letter_accuracy_tr = letter_res_tr
-    else:
-        letter_decoding = False
-        letter_accuracy_ti = 0
-        letter_accuracy_tr = 0
-
-    if not np.isnan(false_res_ti):
-        false_decoding = True
-        false_accuracy_ti = false_res_ti
-        false_accuracy_tr = false_res_tr
-    else:
-        false_decoding = False
-        false_accuracy_ti = 0
-        false_accuracy_tr = 0
-
-    # Check whether there are any conditions for which we have decoding
-    if any([face_decoding, object_decoding, letter_decoding, false_decoding]):
-        max_decoding_ti = max([face_accuracy_ti, object_accuracy_ti, letter_accuracy_ti,
-                               false_accuracy_ti])
-        max_decoding_tr = max([face_accuracy_tr, object_accuracy_tr, letter_accuracy_tr,
-                               false_accuracy_tr])
-    else:
-        continue
-    c_ti = tracking_scalar_map.to_rgba(max_decoding_ti)
-    c_tr = tracking_scalar_map.to_rgba(max_decoding_tr)
-    xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
-           channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
-    # Append to the table:
-    ch_coords = ch_coords.append(pd.DataFrame({
-        "channel": ch,
-        "x": xyz[0],
-        "y": xyz[1],
-        "z": xyz[2],
-        "radius": 3
-    }, index=[0]), ignore_index=True)
-    ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
-        "channel": ch,
-        "r": c_ti[0],
-        "g": c_ti[1],
-        "b": c_ti[2],
-    }, index=[0]), ignore_index=True)
-    ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
-        "channel": ch,
-        "r": c_tr[0],
-        "g": c_tr[1],
-        "b": c_tr[2],
-    }, index=[0]), ignore_index=True)
-
-# Save the data:
-if len(ch_coords) > 0:
-    ch_coords.to_csv("duration_tracking_coords.csv")
-    ch_colors_ti.to_csv("duration_tracking_coords_colors_ti.csv")
-    ch_colors_tr.to_csv("duration_tracking_coords_colors_tr.csv")
-
-# Plot the onset and offset color bars:
-fig = plt.figure()
-ax = fig.add_axes([0.05, 0.80, 0.1, 0.9])
-cb = mpl.colorbar.ColorbarBase(ax, orientation='vertical',
-                               cmap=accuracy_cmap, norm=norm)
-plt.savefig("duration_tracking_accuracy_cbar.png", bbox_inches='tight', transparent=True)
-plt.savefig("duration_tracking_accuracy_cbar.svg", bbox_inches='tight', transparent=True)
-plt.close()
+if catalog.is_stale(catalog.select(analysis="duration_tracking"), "duration_tracking_accuracy_cbar.png",
+                    sources=coord_files + code_files):
+    # Get the max and min values:
+    min_track_prop = np.nanmin(np.abs(np.concatenate([channels_summary_table["face_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["face_dur_tracking_tr"].to_numpy(),
+                                                      channels_summary_table["object_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["object_dur_tracking_tr"].to_numpy(),
+                                                      channels_summary_table["letter_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["letter_dur_tracking_tr"].to_numpy(),
+                                                      channels_summary_table["false_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["false_dur_tracking_tr"].to_numpy()],
+                                                     axis=0)))
+    max_track_prop = np.nanmax(np.abs(np.concatenate([channels_summary_table["face_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["face_dur_tracking_tr"].to_numpy(),
+                                                      channels_summary_table["object_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["object_dur_tracking_tr"].to_numpy(),
+                                                      channels_summary_table["letter_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["letter_dur_tracking_tr"].to_numpy(),
+                                                      channels_summary_table["false_dur_tracking_ti"].to_numpy(),
+                                                      channels_summary_table["false_dur_tracking_tr"].to_numpy()],
+                                                     axis=0)))
+    # Set up the colors:
+    accuracy_cmap = plt.get_cmap("Reds")
+    norm = mpl.colors.Normalize(vmin=min_track_prop, vmax=max_track_prop)
+    tracking_scalar_map = cm.ScalarMappable(norm=norm, cmap=accuracy_cmap)
+    ch_coords = pd.DataFrame()
+    ch_colors_ti = pd.DataFrame()
+    ch_colors_tr = pd.DataFrame()
+    # Loop through each channel:
+    for ch in channels_summary_table["channel"].to_list():
+        # Locate the channel results in each table:
+        face_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_tracking_ti"].item()
+        face_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch, "face_dur_tracking_tr"].item()
+        object_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "object_dur_tracking_ti"].item()
+        object_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "object_dur_tracking_tr"].item()
+        letter_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "letter_dur_tracking_ti"].item()
+        letter_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                   "letter_dur_tracking_tr"].item()
+        false_res_ti = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                  "false_dur_tracking_ti"].item()
+        false_res_tr = channels_summary_table.loc[channels_summary_table["channel"] == ch,
+                                                  "false_dur_tracking_tr"].item()
+
+        # Make the conjunction:
+        if not np.isnan(face_res_ti):
+            face_decoding = True
+            face_accuracy_ti = face_res_ti
+            face_accuracy_tr = face_res_tr
+        else:
+            face_decoding = False
+            face_accuracy_ti = 0
+            face_accuracy_tr = 0
+        if not np.isnan(object_res_ti):
+            object_decoding = True
+            object_accuracy_ti = object_res_ti
+            object_accuracy_tr = object_res_tr
+        else:
+            object_decoding = False
+            object_accuracy_ti = 0
+            object_accuracy_tr = 0
+
+        if not np.isnan(letter_res_ti):
+            letter_decoding = True
+            letter_accuracy_ti = letter_res_ti
+            letter_accuracy_tr = letter_res_tr
+        else:
+            letter_decoding = False
+            letter_accuracy_ti = 0
+            letter_accuracy_tr = 0
+
+        if not np.isnan(false_res_ti):
+            false_decoding = True
+            false_accuracy_ti = false_res_ti
+            false_accuracy_tr = false_res_tr
+        else:
+            false_decoding = False
+            false_accuracy_ti = 0
+            false_accuracy_tr = 0
+
+        # Check whether there are any conditions for which we have decoding
+        if any([face_decoding, object_decoding, letter_decoding, false_decoding]):
+            max_decoding_ti = max([face_accuracy_ti, object_accuracy_ti, letter_accuracy_ti,
+                                   false_accuracy_ti])
+            max_decoding_tr = max([face_accuracy_tr, object_accuracy_tr, letter_accuracy_tr,
+                                   false_accuracy_tr])
+        else:
+            continue
+        c_ti = tracking_scalar_map.to_rgba(max_decoding_ti)
+        c_tr = tracking_scalar_map.to_rgba(max_decoding_tr)
+        xyz = [channels_summary_table.loc[channels_summary_table["channel"] == ch, "x"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "y"].item(),
+               channels_summary_table.loc[channels_summary_table["channel"] == ch, "z"].item()]
+        # Append to the table:
+        ch_coords = ch_coords.append(pd.DataFrame({
+            "channel": ch,
+            "x": xyz[0],
+            "y": xyz[1],
+            "z": xyz[2],
+            "radius": 3
+        }, index=[0]), ignore_index=True)
+        ch_colors_ti = ch_colors_ti.append(pd.DataFrame({
+            "channel": ch,
+            "r": c_ti[0],
+            "g": c_ti[1],
+            "b": c_ti[2],
+        }, index=[0]), ignore_index=True)
+        ch_colors_tr = ch_colors_tr.append(pd.DataFrame({
+            "channel": ch,
+            "r": c_tr[0],
+            "g": c_tr[1],
+            "b": c_tr[2],
+        }, index=[0]), ignore_index=True)
+
+    # Save the data:
+    if len(ch_coords) > 0:
+        ch_coords.to_csv("duration_tracking_coords.csv")
+        ch_colors_ti.to_csv("duration_tracking_coords_colors_ti.csv")
+        ch_colors_tr.to_csv("duration_tracking_coords_colors_tr.csv")
+
+    # Plot the onset and offset color bars:
+    fig = plt.figure()
+    ax = fig.add_axes([0.05, 0.80, 0.1, 0.9])
+    cb = mpl.colorbar.ColorbarBase(ax, orientation='vertical',
+                                   cmap=accuracy_cmap, norm=norm)
+    plt.savefig("duration_tracking_accuracy_cbar.png", bbox_inches='tight', transparent=True)
+    plt.savefig("duration_tracking_accuracy_cbar.svg", bbox_inches='tight', transparent=True)
+    plt.close()
 
 # ======================================================================================================================
 # Activation analysis:
 
 # ==========================================================
 # HGP:
+activation_signals = {"HGP": "high_gamma", "alpha": "alpha", "ERP": "erp"}
+# HGP:
 for task in ["ti", "tr"]:
     for signal in ["HGP", "alpha", "ERP"]:
         # ============================
         # Task relevant:
+        # The theory ROI of each channel comes from the high gamma and ERP results:
+        activation_tables = set(catalog.select(analysis="activation_analysis", signal=activation_signals[signal],
+                                               task=task) +
+                                catalog.select(analysis="activation_analysis", signal="high_gamma") +
+                                catalog.select(analysis="activation_analysis", signal="erp"))
+        if not catalog.is_stale(activation_tables, "activation_{}_{}_coords.csv".format(signal, task),
+                                "activation_{}_{}_colors.csv".format(signal, task), sources=coord_files + code_files):
+            continue
         ch_coords = pd.DataFrame()
         ch_colors = pd.DataFrame()
         # Loop through each channel:
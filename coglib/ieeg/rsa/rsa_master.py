@@ -10,7 +10,7 @@ from pathlib import Path
 from tqdm import tqdm
 
 from general_helper_functions.pathHelperFunctions import find_files, path_generator, get_subjects_list
-from general_helper_functions.data_general_utilities import load_epochs
+from general_helper_functions.data_general_utilities import load_subjects_epochs
 from rsa.rsa_parameters_class import RsaParameters
 from rsa.rsa_super_subject_statistics import rsa_super_subject_statistics
 from rsa.theories_correlations import theories_correlations
@@ -79,31 +79,30 @@ def super_subject_rsa(subjects_list, save_folder="super"):
             # Looping through each ROI:
             for roi in param.rois:
                 print("Compute RSA in ROI {}".format(roi))
-                sub_epochs = {}
-                sub_mni_coords = {}
                 # Loading the data of each subject:
+                sub_epochs, sub_mni_coords = \
+                    load_subjects_epochs(param.BIDS_root, analysis_parameters["signal"],
+                                         subjects_list,
+                                         n_jobs=param.njobs,
+                                         session=param.session,
+                                         task_name=param.task_name,
+                                         preprocess_folder=param.preprocessing_folder,
+                                         preprocess_steps=param.preprocess_steps,
+                                         channel_types={"seeg": True, "ecog": True},
+                                         condition=analysis_parameters["conditions"],
+                                         baseline_method=analysis_parameters[
+                                             "baseline_correction"],
+                                         baseline_time=analysis_parameters[
+                                             "baseline_time"],
+                                         crop_time=analysis_parameters["crop_time"],
+                                         select_vis_resp=False,
+                                         vis_resp_folder=None,
+                                         aseg=param.aseg,
+                                         montage_space=param.montage_space,
+                                         get_mni_coord=True,
+                                         picks_roi=param.rois[roi],
+                                         filtering_parameters=None)
                 for subject in subjects_list:
-                    sub_epochs[subject], sub_mni_coords[subject] = \
-                        load_epochs(param.BIDS_root, analysis_parameters["signal"],
-                                    subject,
-                                    session=param.session,
-                                    task_name=param.task_name,
-                                    preprocess_folder=param.preprocessing_folder,
-                                    preprocess_steps=param.preprocess_steps,
-                                    channel_types={"seeg": True, "ecog": True},
-                                    condition=analysis_parameters["conditions"],
-                                    baseline_method=analysis_parameters[
-                                        "baseline_correction"],
-                                    baseline_time=analysis_parameters[
-                                        "baseline_time"],
-                                    crop_time=analysis_parameters["crop_time"],
-                                    select_vis_resp=False,
-                                    vis_resp_folder=None,
-                                    aseg=param.aseg,
-                                    montage_space=param.montage_space,
-                                    get_mni_coord=True,
-                                    picks_roi=param.rois[roi],
-                                    filtering_parameters=None)
                     if sub_epochs[subject] is None:
                         del sub_epochs[subject]
                 if len(sub_epochs) == 0:
@@ -8,6 +8,8 @@
 import mne
 import re
 import os
+import time
+import argparse
 import glob
 import shutil
 import tempfile
@@ -21,6 +23,9 @@ from pathlib import Path
 from nibabel.freesurfer.io import read_geometry, read_annot
 from general_helper_functions.data_general_utilities import moving_average
 from rsa.rsa_helper_functions import within_vs_between_cross_temp_rsa
+from simulations.simulation_helper_functions import (load_simulation_config, load_trials_parameters,
+                                                     generate_metadata, compile_simulation_parameters,
+                                                     simulate_data_cube, save_benchmark_subject)
 import warnings
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -65,18 +70,6 @@ def plot_channel_groups(epochs, subjects_dir, subject="fsaverage", save_path=Non
     return None
 
 
-def sine_wave_fun(amp, freq, phase, time):
-    """
-    This function generates a sine wave according to the parameters
-    :param amp: (float) amplitude of the sine wave
-    :param freq: (float) frequency of the sine wave
-    :param phase: (float) phase of the sine wave
-    :param time: (nd array) time over which to compute the sine wave
-    :return:
-    """
-    return amp * np.sin(2 * np.pi * freq * time + phase)
-
-
 def sim_channel_loc(roi, rois_dict, fs_path, ch_names):
     """
     This function generates random channels location within a given ROI
@@ -106,64 +99,11 @@ def sim_channel_loc(roi, rois_dict, fs_path, ch_names):
     return ch_loc_dict
 
 
-def sim_trial_data(pattern_vect, times, amp, freq, amp_offset, rise_time_samp, noise_loc, noise_factor,
-                   rand_phase=False):
-    """
-    This function generates single trials activation according to the passed parameters
-    :param pattern_vect: (nd array) for each time point, whether there should be anything (activation, MVP...)
-    :param times: (nd array) times axis of the trial
-    :param amp: (float) amplitude of the sine wave
-    :param freq: (float) frequency of the sine wave
-    :param amp_offset: (float) offset of the sine wave
-    :param rise_time_samp: (float) how long it should last to transition from no patterns to pattern. To avoid transient
-    :param noise_loc: (float) mean of the noise to add to the data
-    :param noise_factor: (float) noise standard deviation
-    :param rand_phase: (bool) whether or not to randomize the phase
-    :return: np array: activation in the trial to simulate
-    """
-    # Check whether the patterns is supposed to be on or not:
-    if rand_phase:
-        phase = np.random.uniform(low=-5, high=5, size=1)
-    else:
-        phase = 0
-    trial_data = np.multiply(sine_wave_fun(amp, freq, phase, times) + amp_offset, pattern_vect)
-    # Looping through the patterns onset:
-    patterns_onset = np.where(np.abs(np.diff(pattern_vect)) == 1)[0] + 1
-    # Adding 0 and last:
-    patterns_onset = np.insert(patterns_onset, 0, 0, axis=0)
-    patterns_onset = np.append(patterns_onset, pattern_vect.shape[0] + 1)
-    # Add a rise and drop at onset and offset:
-    # Loop through each time point:
-    for ind, onset in enumerate(patterns_onset):
-        if ind == patterns_onset.shape[0] - 1:
-            continue
-        else:
-            offset = patterns_onset[ind + 1] - 1
-        if offset + 1 > trial_data.shape[0]:
-            continue
-        trial_data[offset - rise_time_samp + 1:offset + 1] = \
-            np.linspace(trial_data[offset - rise_time_samp],
-                        trial_data[offset + 1],
-                        num=rise_time_samp,
-                        endpoint=False)
-    # Convert the noise scale to be in data units:
-    noise_scale = noise_factor * np.std(trial_data)
-    # Add noise:
-    return np.add(trial_data, np.random.normal(loc=noise_loc,
-                                               scale=noise_scale ** 2,
-                                               size=trial_data.shape[0]))
-
-
 def simulate_subjects(sub_list, plot_results=False, config_file="sim_config_highgamma.json",
                       trials_param="trials_param_category.csv"):
     # Load the simulation parameters files:
-    simulation_parameters = pd.read_csv(Path(os.getcwd(), trials_param))
-    # false are weirdly converted to FALSE, this puts it back into lower case as expected!
-    simulation_parameters["Category"] = simulation_parameters["Category"].str.lower()
-    simulation_parameters["identity"] = simulation_parameters["Category"].str.lower()
-    config = Path(os.getcwd(), "configs", config_file)
-    with open(config) as f:
-        param = json.load(f)
+    simulation_parameters = load_trials_parameters(Path(os.getcwd(), trials_param))
+    param = load_simulation_config(Path(os.getcwd(), "configs", config_file))
 
     # Set up parameters for channels loc:
     sample_path = mne.datasets.sample.data_path()
@@ -176,54 +116,8 @@ def simulate_subjects(sub_list, plot_results=False, config_file="sim_config_high
     # Time
     n_samples = int((param["tmax"] - param["t0"]) * param["sfreq"])
     times = np.linspace(param["t0"], param["tmax"], n_samples, endpoint=True)
-    # Convert the rise time to samples:
-    rise_time_samp = int(param["rise_time_s"] * param["sfreq"])
     # Events and metadata:
-    # Create unique condition pairs:
-    cond_combinations = \
-        list(zip(
-            simulation_parameters[
-                ["event type", 'Category', 'Duration', "task relevance", "identity", "orientation"]].drop_duplicates()[
-                "event type"].to_list(),
-            simulation_parameters[
-                ["event type", 'Category', 'Duration', "task relevance", "identity", "orientation"]].drop_duplicates()[
-                "Category"].to_list(),
-            simulation_parameters[
-                ["event type", 'Category', 'Duration', "task relevance", "identity", "orientation"]].drop_duplicates()[
-                "Duration"].to_list(),
-            simulation_parameters[
-                ["event type", 'Category', 'Duration', "task relevance", "identity", "orientation"]].drop_duplicates()[
-                "task relevance"].to_list(),
-            simulation_parameters[
-                ["event type", 'Category', 'Duration', "task relevance", "identity", "orientation"]].drop_duplicates()[
-                "identity"].to_list(),
-            simulation_parameters[
-                ["event type", 'Category', 'Duration', "task relevance", "identity", "orientation"]].drop_duplicates()[
-                "orientation"].to_list()))
-    # Generate the metadata:
-    metadata = pd.DataFrame(columns=param["metadata_col"])
-    events_dict = {}
-    time_ctr = 0
-    for ind, pair in enumerate(cond_combinations):
-        metadata = metadata.append(pd.DataFrame({
-            param["metadata_col"][0]: [pair[0]] * param["n_trials"],
-            param["metadata_col"][1]: [pair[1]] * param["n_trials"],
-            param["metadata_col"][2]: [pair[2]] * param["n_trials"],
-            param["metadata_col"][3]: [pair[3]] * param["n_trials"],
-            param["metadata_col"][4]: [pair[4]] * param["n_trials"],
-            param["metadata_col"][5]: [pair[5]] * param["n_trials"],
-            param["metadata_col"][6]: [ind] * param["n_trials"],
-            param["metadata_col"][7]: (np.linspace(time_ctr, time_ctr +
-                                                   (param["tmax"] - param["t0"]) * param["n_trials"],
-                                                   param["n_trials"], endpoint=False) + np.abs(param["t0"]))
-        }))
-        events_dict["/".join([pair[0], pair[1], pair[2], pair[3], pair[4], pair[5]])] = ind
-        time_ctr = metadata[param["metadata_col"][7]].to_list()[-1] + (param["tmax"] - param["t0"])
-    metadata = metadata.reset_index(drop=True)
-    # Double the number of trials for center orientation:
-    center_meta_data = metadata.loc[metadata["orientation"] == "Center"]
-    center_meta_data["onset"] = center_meta_data["onset"] + metadata["onset"].to_list()[-1]
-    metadata = pd.concat([metadata, center_meta_data]).reset_index(drop=True)
+    metadata, events_dict = generate_metadata(simulation_parameters, param)
     # Generate the channels names:
     ch_names = []
     for group in list(simulation_parameters["Group"].unique()):
@@ -238,72 +132,18 @@ def simulate_subjects(sub_list, plot_results=False, config_file="sim_config_high
 
     # ======================================================================================================================
     # Simulating the data:
+    # Compile the trials parameters into arrays once for all subjects:
+    compiled_param = compile_simulation_parameters(simulation_parameters, metadata, times, param)
     for sub_id in sub_list:
-        # Generate n sequences of random numbers for the groups that need it:
-        n_sequences = len(list(simulation_parameters["Amplitude_sequence"].unique()))
-        offset_seq = [np.random.normal(loc=param["activation_offset"],
-                                       scale=param["patterns_std"],
-                                       size=param["n_channels"]) for i in range(n_sequences)]
-        data = np.zeros([len(metadata), len(ch_names), times.shape[0]])
+        print("=" * 40)
+        print("Generating sub-{} data".format(sub_id))
+        data = simulate_data_cube(compiled_param, param["n_channels"], times, param,
+                                  chunk_size=param.get("chunk_size", None))
         channels_loc = {}
-        # Looping through each group:
-        for group in list(simulation_parameters["Group"].unique()):
-            print("=" * 40)
-            print("Generating {} data".format(group))
-            group_param = simulation_parameters.loc[simulation_parameters["Group"] == group]
-            # Generate the name of the channels of this group:
+        # Generating a dict of channels locs for each group:
+        for group, roi in zip(compiled_param["groups"], compiled_param["rois"]):
             group_channels = ["{}_ch-{}".format(group, i) for i in range(param["n_channels"])]
-            # Generating a dict of channels locs:
-            ch_loc = sim_channel_loc(group_param["ROI"].to_list()[0], param["rois"], fs_dir, group_channels)
-            channels_loc.update(ch_loc)
-
-            # Looping  through each channel in this group:
-            for ch_num in range(param["n_channels"]):
-                channel_name = "{}_ch-{}".format(group, ch_num)
-                channel_ind = np.where(np.array(ch_names) == channel_name)[0]
-                # Looping through each trial:
-                for trial_ind, trial_meta in metadata.iterrows():
-                    # Extract the parameters for this specific trial and group:
-                    ch_trial_param = group_param.loc[(group_param["event type"] == trial_meta["event type"]) &
-                                                     (group_param["Category"] == trial_meta["category"]) &
-                                                     (group_param["Duration"] == trial_meta["duration"]) &
-                                                     (group_param["task relevance"] == trial_meta["task_relevance"]) &
-                                                     (group_param["identity"] == trial_meta["identity"]) &
-                                                     (group_param["orientation"] == trial_meta["orientation"])]
-                    # Extract the relevant time window for this trial and parse it to convert to actual times:
-                    time_wins = [[float(val) for val in time_pairs.split("-")]
-                                 for time_pairs in ch_trial_param["MVP times"].item().replace("[", "").replace("]", "").
-                                     split(";")]
-                    # The config only specifies where the patterns are supposed to be on, not off. We need to infer
-                    # all the off times to feel them with data:
-                    pattern_vect = np.zeros(times.shape[0])
-                    for time_win in time_wins:
-                        onset = np.where(times >= time_win[0])[0][0]
-                        try:
-                            offset = np.where(times > time_win[1])[0][0]
-                        except IndexError:
-                            offset = times.shape[-1]
-                        pattern_vect[onset:offset] = 1
-                    # Parsing the config to get the different inputs to generate the different param:
-                    rand_phase = True if ch_trial_param["Random phase"].item() == "Yes" else False
-                    sine_amp = param["sine_amp_mean"] \
-                        if ch_trial_param["Amplitude_sequence"].item() != "None" \
-                        else param["sine_amp_mean"] * float(ch_trial_param["Activation"].item())
-                    sine_offset = offset_seq[int(ch_trial_param["Amplitude_sequence"].item())][ch_num] \
-                        if ch_trial_param["Amplitude_sequence"].item() != "None" \
-                        else np.random.normal(loc=param["activation_offset"] *
-                                                  float(ch_trial_param["Activation"].item()),
-                                              scale=param["selectivity_std"], size=1)
-                    # Generate the data:
-                    trial_data = sim_trial_data(pattern_vect, times, sine_amp, param["sine_freq"], sine_offset,
-                                                rise_time_samp, 0, 0,
-                                                rand_phase=rand_phase)
-                    data[trial_ind, channel_ind, :] = trial_data + param["baseline_offset"]
-        # Add the noise to the data:
-        noise_scale = param["noise_factor"] * np.std(data)
-        data = np.add(data, np.random.normal(loc=param["noise_mean"],
-                                             scale=noise_scale ** 2,
-                                             size=data.shape))
+            channels_loc.update(sim_channel_loc(roi, param["rois"], fs_dir, group_channels))
         # Convert the data to an mne epochs objects:
         epochs = mne.EpochsArray(data, info, events=events, event_id=events_dict, tmin=param["t0"])
         epochs.metadata = metadata
@@ -439,6 +279,56 @@ def simulate_subjects(sub_list, plot_results=False, config_file="sim_config_high
                 plt.close()
 
 
+def simulate_benchmark_subjects(preset, config_file="sim_config_highgamma.json",
+                                trials_param="trials_param_category.csv", save_root=None):
+    """
+    This function generates large synthetic cohorts to stress test the decoding, rsa and synchrony pipelines. The
+    number of subjects, channels and trials are set by the preset (see configs/benchmark_presets.json). Each subject's
+    trials x channels x time cube is written in chunks to a npy file, which can be loaded lazily with
+    np.load(..., mmap_mode="r"), along with the trials metadata and channels description. No montage or BIDS
+    conversion is performed, to avoid holding the data in memory.
+    :param preset: (string) name of the benchmark preset
+    :param config_file: (string) name of the config file in the configs folder, from which the presets file is found
+    :param trials_param: (string) name of the trials parameters table
+    :param save_root: (string or Path) where to save the data. If None, taken from the config "benchmark_root"
+    :return:
+    """
+    simulation_parameters = load_trials_parameters(Path(os.getcwd(), trials_param))
+    param = load_simulation_config(Path(os.getcwd(), "configs", config_file), preset=preset)
+    if save_root is None:
+        save_root = Path(param["benchmark_root"], preset)
+    n_samples = int((param["tmax"] - param["t0"]) * param["sfreq"])
+    times = np.linspace(param["t0"], param["tmax"], n_samples, endpoint=True)
+    metadata, _ = generate_metadata(simulation_parameters, param)
+    compiled_param = compile_simulation_parameters(simulation_parameters, metadata, times, param)
+    ch_names = ["{}_ch-{}".format(group, i) for group in compiled_param["groups"] for i in range(param["n_channels"])]
+    print("=" * 40)
+    print("Preset {}: {} subjects, {} trials x {} channels x {} samples per subject".format(
+        preset, param["n_subjects"], len(metadata), len(ch_names), n_samples))
+    for sub_ind in range(param["n_subjects"]):
+        sub_id = "sim{}".format(sub_ind + 1)
+        sub_root = Path(save_root, "sub-" + sub_id, "ses-" + param["session"], "ieeg")
+        if not os.path.isdir(sub_root):
+            os.makedirs(sub_root)
+        data_file = Path(sub_root, "sub-{}_ses-{}_task-{}_desc-simulation_ieeg.npy".format(
+            sub_id, param["session"], param["task_name"]))
+        start = time.time()
+        data = simulate_data_cube(compiled_param, param["n_channels"], times, param,
+                                  rng=param.get("seed", 0) + sub_ind, out_file=data_file,
+                                  chunk_size=param["chunk_size"], dtype=param["dtype"])
+        del data
+        save_benchmark_subject(sub_root, sub_id, data_file, metadata, ch_names, param)
+        print("sub-{} generated in {:.2f}s".format(sub_id, time.time() - start))
+
+
 if __name__ == "__main__":
-    simulate_subjects(["sim1", "sim2", "sim3"], plot_results=True, config_file="sim_config_highgamma.json",
-                      trials_param="trials_param_category.csv")
+    parser = argparse.ArgumentParser(description="Generates simulated iEEG data sets")
+    parser.add_argument('--preset', type=str, default=None,
+                        help="Name of the benchmark preset to generate (see configs/benchmark_presets.json)")
+    args = parser.parse_args()
+    if args.preset is None:
+        simulate_subjects(["sim1", "sim2", "sim3"], plot_results=True, config_file="sim_config_highgamma.json",
+                          trials_param="trials_param_category.csv")
+    else:
+        simulate_benchmark_subjects(args.preset, config_file="sim_config_highgamma.json",
+                                    trials_param="trials_param_category.csv")
@@ -0,0 +1,301 @@
+""" This script contains the vectorized simulation engine used to generate synthetic iEEG data sets
+    authors: Alex Lepauvre
+    alex.lepauvre@ae.mpg.de
+    contributors: Simon Henin
+    Simon.Henin@nyulangone.org
+"""
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Columns of the trials parameters table that uniquely identify a condition, in the same order as the first 6 entries
+# of the "metadata_col" config parameter:
+CONDITION_COLUMNS = ["event type", "Category", "Duration", "task relevance", "identity", "orientation"]
+
+
+def load_simulation_config(config_file, preset=None, presets_file="benchmark_presets.json"):
+    """
+    This function loads a simulation config. If a preset is passed, the preset is read from the presets file and its
+    parameters are used to override the parameters of the base config the preset points to. This enables scaling
+    the number of subjects, channels and trials without duplicating the whole config.
+    :param config_file: (string or Path) path to the json config file. Ignored if a preset is passed
+    :param preset: (string) name of the preset to use, as found in the presets file
+    :param presets_file: (string or Path) path to the json file containing the presets. If relative, it is considered
+    to be in the same directory as the config file
+    :return: param: (dict) simulation parameters
+    """
+    config_dir = Path(config_file).parent
+    if preset is None:
+        with open(config_file) as f:
+            return json.load(f)
+    presets_path = Path(presets_file) if Path(presets_file).is_absolute() else Path(config_dir, presets_file)
+    with open(presets_path) as f:
+        presets = json.load(f)
+    if preset not in presets:
+        raise ValueError("The preset {} was not found in {}! Available presets: {}".format(
+            preset, presets_path, list(presets.keys())))
+    preset_param = dict(presets[preset])
+    with open(Path(config_dir, preset_param.pop("base_config"))) as f:
+        param = json.load(f)
+    param.update(preset_param)
+    return param
+
+
+def load_trials_parameters(trials_param):
+    """
+    This function loads the trials parameters table, specifying for each group of channels and each condition the
+    patterns to simulate
+    :param trials_param: (string or Path) path to the csv table
+    :return: simulation_parameters: (pd dataframe) trials parameters table
+    """
+    simulation_parameters = pd.read_csv(trials_param)
+    # false are weirdly converted to FALSE, this puts it back into lower case as expected!
+    simulation_parameters["Category"] = simulation_parameters["Category"].str.lower()
+    simulation_parameters["identity"] = simulation_parameters["Category"].str.lower()
+    return simulation_parameters
+
+
+def parse_time_windows(time_windows_str):
+    """
+    This function parses the "MVP times" string of the trials parameters table, such as "[0.3-0.5; 0.8-1.0]".
+    :param time_windows_str: (string) time windows during which the pattern is on
+    :return: (np array) n_windows x 2 array of onset and offset of each window in seconds
+    """
+    return np.array([[float(val) for val in time_pairs.split("-")]
+                     for time_pairs in time_windows_str.replace("[", "").replace("]", "").split(";")])
+
+
+def time_windows_to_pattern(time_windows, times):
+    """
+    This function converts time windows to a binary vector of the length of the times vector, set to 1 wherever the
+    pattern is on. The onset is the first sample >= the window onset and the offset the first sample > the window
+    offset
+    :param time_windows: (np array) n_windows x 2 array of onset and offset in seconds
+    :param times: (np array) time vector of the trial
+    :return: pattern_vect: (np array) binary vector of the same length as times
+    """
+    pattern_vect = np.zeros(times.shape[0])
+    onsets = np.searchsorted(times, time_windows[:, 0], side="left")
+    offsets = np.searchsorted(times, time_windows[:, 1], side="right")
+    for onset, offset in zip(onsets, offsets):
+        pattern_vect[onset:offset] = 1
+    return pattern_vect
+
+
+def generate_metadata(simulation_parameters, param):
+    """
+    This function generates the metadata and events dictionary of the simulated epochs, with param["n_trials"] for
+    each unique condition found in the trials parameters table and twice as many trials for the center orientation
+    :param simulation_parameters: (pd dataframe) trials parameters table
+    :param param: (dict) simulation parameters
+    :return: metadata: (pd dataframe) one row per trial
+    events_dict: (dict) mapping between condition name and event id
+    """
+    cond_combinations = simulation_parameters[CONDITION_COLUMNS].drop_duplicates().to_numpy()
+    trial_dur = param["tmax"] - param["t0"]
+    n_trials = param["n_trials"]
+    cond_metadata = []
+    events_dict = {}
+    time_ctr = 0
+    for ind, pair in enumerate(cond_combinations):
+        cond_df = pd.DataFrame({col: [pair[col_ind]] * n_trials
+                                for col_ind, col in enumerate(param["metadata_col"][:6])})
+        cond_df[param["metadata_col"][6]] = ind
+        cond_df[param["metadata_col"][7]] = np.linspace(time_ctr, time_ctr + trial_dur * n_trials, n_trials,
+                                                        endpoint=False) + np.abs(param["t0"])
+        cond_metadata.append(cond_df)
+        events_dict["/".join(pair)] = ind
+        time_ctr = cond_df[param["metadata_col"][7]].to_list()[-1] + trial_dur
+    metadata = pd.concat(cond_metadata).reset_index(drop=True)
+    # Double the number of trials for center orientation:
+    center_meta_data = metadata.loc[metadata["orientation"] == "Center"].copy()
+    center_meta_data["onset"] = center_meta_data["onset"] + metadata["onset"].to_list()[-1]
+    metadata = pd.concat([metadata, center_meta_data]).reset_index(drop=True)
+    return metadata, events_dict
+
+
+def compile_simulation_parameters(simulation_parameters, metadata, times, param):
+    """
+    This function compiles the trials parameters table once into arrays, such that the parameters of every trial of
+    every group can be fetched by indexing instead of filtering the table trial by trial
+    :param simulation_parameters: (pd dataframe) trials parameters table, one row per group and condition
+    :param metadata: (pd dataframe) metadata of the trials to simulate
+    :param times: (np array) time vector of a trial
+    :param param: (dict) simulation parameters
+    :return: (dict) with the following keys:
+        groups: (list) name of each channels group
+        rois: (list) ROI of each channels group
+        trial_rows: (np array) n_groups x n_trials index of the compiled parameters row of each trial
+        pattern: (np array) n_rows x n_times binary pattern vector of each row
+        amp: (np array) sine amplitude of each row
+        rand_phase: (np array) whether the phase is randomized for each row
+        amp_sequence: (np array) amplitude sequence of each row, -1 if none
+        activation: (np array) activation factor of each row, nan if none
+    """
+    params_table = simulation_parameters.reset_index(drop=True)
+    # Trials keys, renamed to match the parameters table:
+    trials_keys = metadata[param["metadata_col"][:6]].copy()
+    trials_keys.columns = CONDITION_COLUMNS
+    trials_keys["trial"] = np.arange(len(metadata))
+    groups = list(params_table["Group"].unique())
+    trial_rows = np.zeros([len(groups), len(metadata)], dtype=int)
+    for group_ind, group in enumerate(groups):
+        group_table = params_table.loc[params_table["Group"] == group, CONDITION_COLUMNS]
+        group_table = group_table.assign(row=group_table.index.to_numpy())
+        matches = trials_keys.merge(group_table, on=CONDITION_COLUMNS, how="left")
+        if matches["row"].isna().any() or len(matches) != len(metadata):
+            raise ValueError("The trials parameters of group {} do not match each trial exactly once!".format(group))
+        trial_rows[group_ind, matches["trial"].to_numpy()] = matches["row"].to_numpy().astype(int)
+    # Parse each unique time windows string only once:
+    patterns = {mvp: time_windows_to_pattern(parse_time_windows(mvp), times)
+                for mvp in params_table["MVP times"].unique()}
+    # "None" entries are read either as strings or as NaN depending on the pandas version, both are coerced to NaN:
+    amp_sequence = pd.to_numeric(params_table["Amplitude_sequence"], errors="coerce").fillna(-1).to_numpy().astype(int)
+    activation = pd.to_numeric(params_table["Activation"], errors="coerce").to_numpy(dtype=float)
+    return {
+        "groups": groups,
+        "rois": [params_table.loc[params_table["Group"] == group, "ROI"].to_list()[0] for group in groups],
+        "trial_rows": trial_rows,
+        "pattern": np.stack([patterns[mvp] for mvp in params_table["MVP times"]]),
+        "amp": np.where(amp_sequence >= 0, param["sine_amp_mean"], param["sine_amp_mean"] * activation),
+        "rand_phase": (params_table["Random phase"] == "Yes").to_numpy(),
+        "amp_sequence": amp_sequence,
+        "activation": activation
+    }
+
+
+def apply_rise_ramps(data, pattern_vect, rise_time_samp):
+    """
+    This function replaces, in place, the rise_time_samp samples preceding each transition of the pattern vector by a
+    linear ramp, to avoid transients when the pattern switches on or off. Operates on the last dimension of the data,
+    such that all trials and channels sharing the same pattern are handled at once
+    :param data: (np array) ... x n_times data to modify in place
+    :param pattern_vect: (np array) binary pattern vector shared by all the data
+    :param rise_time_samp: (int) number of samples of the ramp
+    :return: data
+    """
+    if rise_time_samp <= 0:
+        return data
+    transitions = np.where(np.abs(np.diff(pattern_vect)) == 1)[0] + 1
+    ramp = np.arange(rise_time_samp) / rise_time_samp
+    # Transitions are handled sequentially, as each ramp starts from the (possibly already ramped) preceding sample:
+    for transition in transitions[transitions > rise_time_samp]:
+        start = data[..., transition - rise_time_samp - 1, None]
+        stop = data[..., transition, None]
+        data[..., transition - rise_time_samp:transition] = start + (stop - start) * ramp
+    return data
+
+
+def sim_group_trials(compiled, group_ind, trials, n_channels, times, param, offset_seq, rng):
+    """
+    This function generates the noise free data of a block of trials for all channels of one group at once
+    :param compiled: (dict) output of compile_simulation_parameters
+    :param group_ind: (int) index of the group of channels to simulate
+    :param trials: (np array or slice) trials to simulate
+    :param n_channels: (int) number of channels in the group
+    :param times: (np array) time vector of a trial
+    :param param: (dict) simulation parameters
+    :param offset_seq: (np array) n_sequences x n_channels offsets shared across conditions of the same sequence
+    :param rng: (np.random.Generator) random number generator
+    :return: data: (np array) n_trials x n_channels x n_times
+    """
+    rows = compiled["trial_rows"][group_ind, trials]
+    n_trials = rows.shape[0]
+    # Random phase for the rows that require it, 0 otherwise:
+    phase = np.where(compiled["rand_phase"][rows, None],
+                     rng.uniform(low=-5, high=5, size=[n_trials, n_channels]), 0)
+    # Offset: from the shared sequences when one is set, otherwise drawn for each trial and channel:
+    seq = compiled["amp_sequence"][rows]
+    offset = np.where(seq[:, None] >= 0, offset_seq[np.maximum(seq, 0)],
+                      rng.normal(loc=param["activation_offset"] * np.nan_to_num(compiled["activation"][rows])[:, None],
+                                 scale=param["selectivity_std"], size=[n_trials, n_channels]))
+    data = compiled["amp"][rows, None, None] * np.sin(2 * np.pi * param["sine_freq"] * times + phase[..., None])
+    data += offset[..., None]
+    data *= compiled["pattern"][rows, None, :]
+    # Add the ramps, for all the trials sharing the same pattern at once:
+    rise_time_samp = int(param["rise_time_s"] * param["sfreq"])
+    unique_patterns, pattern_inv = np.unique(compiled["pattern"][rows], axis=0, return_inverse=True)
+    for pattern_ind, pattern_vect in enumerate(unique_patterns):
+        pattern_trials = np.where(pattern_inv.ravel() == pattern_ind)[0]
+        data[pattern_trials] = apply_rise_ramps(data[pattern_trials], pattern_vect, rise_time_samp)
+    return data
+
+
+def simulate_data_cube(compiled, n_channels, times, param, rng=None, out_file=None, chunk_size=None,
+                       dtype="float64"):
+    """
+    This function generates the full trials x channels x time data cube of one subject. The data are generated in
+    blocks of trials and written directly to the output array, which can be a memory mapped npy file, such that data
+    sets larger than the RAM can be generated. The noise is scaled to the standard deviation of the noise free data,
+    which is accumulated over the blocks before adding the noise in a second pass.
+    :param compiled: (dict) output of compile_simulation_parameters
+    :param n_channels: (int) number of channels per group
+    :param times: (np array) time vector of a trial
+    :param param: (dict) simulation parameters
+    :param rng: (np.random.Generator or int or None) random number generator or seed
+    :param out_file: (string or Path or None) path of the npy file to write the data to. If None, the data are kept in
+    memory
+    :param chunk_size: (int or None) number of trials generated at once. If None, all trials at once
+    :param dtype: (string) data type of the output
+    :return: data: (np array or np memmap) n_trials x (n_groups * n_channels) x n_times
+    """
+    rng = np.random.default_rng(rng)
+    n_trials = compiled["trial_rows"].shape[1]
+    shape = (n_trials, len(compiled["groups"]) * n_channels, times.shape[0])
+    if out_file is not None:
+        data = np.lib.format.open_memmap(out_file, mode="w+", dtype=dtype, shape=shape)
+    else:
+        data = np.zeros(shape, dtype=dtype)
+    if chunk_size is None:
+        chunk_size = n_trials
+    # Generate the offsets shared by all conditions with the same amplitude sequence:
+    n_sequences = max(int(compiled["amp_sequence"].max()) + 1, 1)
+    offset_seq = rng.normal(loc=param["activation_offset"], scale=param["patterns_std"],
+                            size=[n_sequences, n_channels])
+    chunks = [slice(start, min(start + chunk_size, n_trials)) for start in range(0, n_trials, chunk_size)]
+    # First pass: noise free data, accumulating the moments to compute the std of the whole data:
+    data_sum, data_sum_sq = 0., 0.
+    for chunk in chunks:
+        for group_ind in range(len(compiled["groups"])):
+            group_data = sim_group_trials(compiled, group_ind, chunk, n_channels, times, param, offset_seq, rng)
+            group_data += param["baseline_offset"]
+            data_sum += group_data.sum()
+            data_sum_sq += np.square(group_data).sum()
+            data[chunk, group_ind * n_channels:(group_ind + 1) * n_channels, :] = group_data
+    n_values = np.prod(shape)
+    data_std = np.sqrt(max(data_sum_sq / n_values - (data_sum / n_values) ** 2, 0))
+    # Second pass: add the noise:
+    noise_scale = param["noise_factor"] * data_std
+    for chunk in chunks:
+        data[chunk] += rng.normal(loc=param["noise_mean"], scale=noise_scale ** 2,
+                                  size=data[chunk].shape).astype(dtype)
+    if out_file is not None:
+        data.flush()
+    return data
+
+
+def save_benchmark_subject(save_root, sub_id, data_file, metadata, ch_names, param):
+    """
+    This function saves the metadata and channels description along the simulated data cube of a benchmark subject
+    :param save_root: (string or Path) directory where the subject data are saved
+    :param sub_id: (string) subject ID
+    :param data_file: (string or Path) path to the npy file of the data cube
+    :param metadata: (pd dataframe) trials metadata
+    :param ch_names: (list) name of each channel
+    :param param: (dict) simulation parameters
+    :return:
+    """
+    if not os.path.isdir(save_root):
+        os.makedirs(save_root)
+    metadata.to_csv(Path(save_root, "sub-{}_ses-{}_task-{}_desc-metadata.tsv".format(
+        sub_id, param["session"], param["task_name"])), sep="\t", index=False)
+    pd.DataFrame({"name": ch_names, "group": [ch.split("_ch-")[0] for ch in ch_names]}).to_csv(
+        Path(save_root, "sub-{}_ses-{}_task-{}_channels.tsv".format(sub_id, param["session"], param["task_name"])),
+        sep="\t", index=False)
+    with open(Path(save_root, "sub-{}_ses-{}_task-{}_desc-simulation.json".format(
+            sub_id, param["session"], param["task_name"])), "w") as f:
+        json.dump({"data_file": Path(data_file).name, "sfreq": param["sfreq"], "t0": param["t0"],
+                   "tmax": param["tmax"], "dims": ["trials", "channels", "times"]}, f, indent=2)
@@ -0,0 +1,78 @@
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+import numpy as np
+from numpy.testing import assert_array_equal
+from simulations.simulation_helper_functions import (load_simulation_config, load_trials_parameters,
+                                                     parse_time_windows, time_windows_to_pattern, generate_metadata,
+                                                     compile_simulation_parameters, simulate_data_cube)
+
+SIMULATIONS_ROOT = Path(__file__).parent.parent
+
+
+class TestSimulationEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.simulation_parameters = load_trials_parameters(Path(SIMULATIONS_ROOT, "trials_param_category.csv"))
+        self.param = load_simulation_config(Path(SIMULATIONS_ROOT, "configs", "sim_config_highgamma.json"),
+                                            preset="small")
+        self.param.update({"n_channels": 2, "n_trials": 1})
+        self.metadata, self.events_dict = generate_metadata(self.simulation_parameters, self.param)
+        n_samples = int((self.param["tmax"] - self.param["t0"]) * self.param["sfreq"])
+        self.times = np.linspace(self.param["t0"], self.param["tmax"], n_samples, endpoint=True)
+        self.compiled = compile_simulation_parameters(self.simulation_parameters, self.metadata, self.times,
+                                                      self.param)
+
+    def test_time_windows(self):
+        time_windows = parse_time_windows("[0.3-0.5; 0.8-1.0]")
+        assert_array_equal(time_windows, [[0.3, 0.5], [0.8, 1.0]])
+        pattern_vect = time_windows_to_pattern(time_windows, np.round(np.arange(0, 1.2, 0.1), 1))
+        assert_array_equal(pattern_vect, [0, 0, 0, 1, 1, 1, 0, 0, 1, 1, 1, 0])
+
+    def test_shapes(self):
+        # One trial per condition, and twice as many for the center orientation:
+        n_conditions = len(self.events_dict)
+        n_center = np.sum(["/Center" in cond for cond in self.events_dict])
+        self.assertEqual(len(self.metadata), n_conditions + n_center)
+        n_groups = self.simulation_parameters["Group"].nunique()
+        self.assertEqual(len(self.compiled["groups"]), n_groups)
+        self.assertEqual(self.compiled["trial_rows"].shape, (n_groups, len(self.metadata)))
+        self.assertEqual(self.compiled["pattern"].shape, (len(self.simulation_parameters), len(self.times)))
+        data = simulate_data_cube(self.compiled, self.param["n_channels"], self.times, self.param, rng=0,
+                                  chunk_size=50, dtype=self.param["dtype"])
+        self.assertEqual(data.shape, (len(self.metadata), n_groups * self.param["n_channels"], len(self.times)))
+        self.assertEqual(data.dtype, np.float32)
+
+    def test_noise_free_baseline(self):
+        # Without noise, the data are at the baseline offset until the ramp preceding the first pattern onset:
+        self.param["noise_factor"] = 0
+        data = simulate_data_cube(self.compiled, self.param["n_channels"], self.times, self.param, rng=0)
+        rise_time_samp = int(self.param["rise_time_s"] * self.param["sfreq"])
+        ramp_onset = np.argmax(self.compiled["pattern"].any(axis=0)) - rise_time_samp
+        self.assertGreater(ramp_onset, 0)
+        assert_array_equal(data[..., :ramp_onset], self.param["baseline_offset"])
+        self.assertTrue(np.any(data[..., ramp_onset:] != self.param["baseline_offset"]))
+
+    def test_seed(self):
+        save_root = tempfile.mkdtemp()
+        try:
+            data = simulate_data_cube(self.compiled, self.param["n_channels"], self.times, self.param, rng=0,
+                                      chunk_size=50)
+            # Same seed and chunks, in memory or on disk:
+            out_file = os.path.join(save_root, "data.npy")
+            disk_data = simulate_data_cube(self.compiled, self.param["n_channels"], self.times, self.param,
+                                           rng=np.random.default_rng(0), out_file=out_file, chunk_size=50)
+            assert_array_equal(disk_data, data)
+            del disk_data
+            assert_array_equal(np.load(out_file), data)
+            other_data = simulate_data_cube(self.compiled, self.param["n_channels"], self.times, self.param, rng=1,
+                                            chunk_size=50)
+            self.assertFalse(np.array_equal(other_data, data))
+        finally:
+            shutil.rmtree(save_root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,7 +22,7 @@ from nice.algorithms.connectivity import epochs_compute_wsmi
 from general_helper_functions.data_general_utilities import load_epochs, cluster_test, find_channels_in_roi, \
     moving_average
 from general_helper_functions.pathHelperFunctions import find_files, path_generator, get_subjects_list
-from freesurfer.wang_labels import get_montage_volume_labels_wang
+from general_helper_functions.spatial_index import get_montage_volume_labels
 
 from synchrony.synchrony_analysis_parameters_class import SynchronyAnalysisParameters
 from synchrony.synchrony_helper_functions import *
@@ -173,14 +173,14 @@ def synchrony_analysis(subjects_list, save_folder="super"):
                                                      metadata=epochs.metadata)
                     # get labels & roi_picks for this analysis
                     if roi == "gnw":
-                        labels, _ = mne.get_montage_volume_labels(
-                            epochs.get_montage(), "sub-" + subject,
-                            subjects_dir=Path(param.BIDS_root, "derivatives", "fs"), aseg="aparc.a2009s+aseg")
+                        labels = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject,
+                                                           Path(param.BIDS_root, "derivatives", "fs"),
+                                                           aseg="aparc.a2009s+aseg")
                         roi_picks = find_channels_in_roi(param.rois[roi], labels)
                     else:
-                        labels, _ = get_montage_volume_labels_wang(
-                            epochs.get_montage(), "sub-" + subject,
-                            subjects_dir=Path(param.BIDS_root, "derivatives", "fs"), aseg='wang15_mplbl')
+                        labels = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject,
+                                                           Path(param.BIDS_root, "derivatives", "fs"),
+                                                           aseg='wang15_mplbl')
                         roi_picks = find_channels_in_roi(param.rois[roi], labels)
 
                     # figure out which categories we are comparing based on unique categories in epochs data
@@ -202,13 +202,12 @@ def synchrony_analysis(subjects_list, save_folder="super"):
                     
                     #%
                     # identify electrodes in either GNW and/or IIT rois. These electrodes need to be removed from category selectivity if they reside in these ROIS
-                    labels, _ = mne.get_montage_volume_labels(
-                        epochs.get_montage(), "sub-" + subject,
-                        subjects_dir=Path(param.BIDS_root, "derivatives", "fs"), aseg="aparc.a2009s+aseg")
+                    labels = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject,
+                                                       Path(param.BIDS_root, "derivatives", "fs"),
+                                                       aseg="aparc.a2009s+aseg")
                     gnw_picks = find_channels_in_roi(param.rois["gnw"], labels)
-                    labels, _ = get_montage_volume_labels_wang(
-                        epochs.get_montage(), "sub-" + subject,
-                        subjects_dir=Path(param.BIDS_root, "derivatives", "fs"), aseg='wang15_mplbl')
+                    labels = get_montage_volume_labels(epochs.get_montage(), "sub-" + subject,
+                                                       Path(param.BIDS_root, "derivatives", "fs"), aseg='wang15_mplbl')
                     iit_picks = find_channels_in_roi(param.rois["iit"], labels)
                     
                     # create a set of object/face selectve electrodes that are not found in either of the theory rois
@@ -17,6 +17,7 @@ import matplotlib
 from general_helper_functions.plotters import sort_epochs, MidpointNormalize
 from general_helper_functions.pathHelperFunctions import path_generator, find_files
 from general_helper_functions.data_general_utilities import stack_evoked, mean_confidence_interval
+from general_helper_functions.spatial_index import get_montage_volume_labels
 
 from visual_responsiveness_analysis.visual_responsivness_parameters_class import VisualResponsivnessAnalysisParameters
 from visual_responsiveness_analysis.visual_responsiveness_helper_functions import load_epochs
@@ -102,9 +103,8 @@ def plot_single_electrodes(configs, save_folder="super"):
             channels_labels = pd.DataFrame()
             for subject in epochs.keys():
                 # Get the labels of these channels:
-                labels, _ = mne.get_montage_volume_labels(
-                    epochs[subject].get_montage(), "sub-" + subject,
-                    subjects_dir=Path(param.BIDS_root, "derivatives", "fs"), aseg=param.aseg)
+                labels = get_montage_volume_labels(epochs[subject].get_montage(), "sub-" + subject,
+                                                   Path(param.BIDS_root, "derivatives", "fs"), aseg=param.aseg)
                 # Convert the labels to a dataframe:
                 subjects_label_df = pd.DataFrame()
                 for ind, channel in enumerate(labels.keys()):
@@ -6,10 +6,9 @@
     Simon.Henin@nyulangone.org
 """
 
-import math
 import numpy as np
 import pandas as pd
-from scipy.stats import ttest_1samp, ttest_rel, ranksums, wilcoxon
+from scipy.stats import ttest_1samp
 
 import pingouin as pg
 
@@ -19,6 +18,7 @@ from general_helper_functions.pathHelperFunctions import find_files
 from general_helper_functions.data_general_utilities import (baseline_scaling,
                                                              compute_dependent_variable,
                                                              load_epochs)
+from general_helper_functions.batch_stats import pivot_trials, ranksums_batch, ttest_rel_batch, wilcoxon_batch
 
 
 def test_sustained_zscore(y, threshold=2.5, window_sec=0.050, sr=512, alternative="two_tailed"):
@@ -125,54 +125,50 @@ def aggregated_stat_test(data_df, twin, groups="channel", test="wilcoxon", alter
     """
     print("=" * 40)
     print("Welcome to aggregated_stat_test")
-    # Looping through each group:
-    results_df = pd.DataFrame()
-    for group in data_df[groups].unique():
-        print("Performing test for group: {}".format(group))
-        # Extract the data of this group:
-        group_data = data_df.loc[data_df[groups] == group]
-        # Extract the two conditions:
-        y_data = [group_data.loc[group_data["condition"] == cond, "value"].to_list()
-                  for cond in ["onset", "baseline"]]
-        if test.lower() == "t-test" or test.lower() == "t_test" or test.lower() == "t test":
-            statistic, pvalue = ttest_rel(*y_data, alternative=alternative)
-        elif test.lower() == "wilcoxon_rank_sum":
-            statistic, pvalue = ranksums(*y_data, alternative=alternative)
-        elif test.lower() == "wilcoxon_signed_rank":
-            x = np.array(y_data[0]) - np.array(y_data[1])
-            statistic, pvalue = wilcoxon(x, alternative=alternative)
-        elif test.lower() == "bayes_t_test":
-            t_val, pvalue = ttest_rel(*y_data, alternative=alternative)
-            # Call the bayes factor the statistics to be consistent with the rest:
-            statistic = pg.bayesfactor_ttest(t_val, len(y_data[0]),
-                                             paired=True, alternative=alternative,
-                                             r=0.7071)
-            # Set the pvalue to 0.01 if the bayes factor is more than 3 as our threshold is significance.
-            # This is more for backward compatibility than anything else:
-            pvalue = 0.01 if statistic > 3 else 0.5
-        else:
-            raise Exception("This test is not supported!")
-        # Compute the effect size if the test wasn't the bayes t-test:
-        if test.lower() != "bayes_t_test":
-            # https://en.wikipedia.org/wiki/Effect_size
-            effect_strength = ((np.mean(y_data[0]) - np.mean(y_data[1])) / np.mean(y_data[1])) * 100
-        else:
-            # Otherwise, set the effect strength as the posterior probability. Not exactly correct,
-            # but keeps things consistent with down the line
-            effect_strength = 1 / (1 + math.exp(-math.log(statistic)))
-        h0 = True if pvalue > p_val else False
-        results_df = results_df.append(pd.DataFrame({
-            "subject": group.split("-")[0],
-            "channel": group,
-            "metric": None,
-            "reject": not h0,
-            "stat": statistic,
-            "pval": pvalue,
-            "onset": twin[0] if not h0 else None,
-            "offset": twin[1] if not h0 else None,
-            "effect_strength": effect_strength
-        }, index=[0]))
-    return results_df.reset_index(drop=True)
+    # Pivot the data to groups * trials * [onset, baseline]:
+    values, group_names, conditions = pivot_trials(data_df.loc[data_df["condition"].isin(["onset", "baseline"])],
+                                                   groups=groups)
+    onset_val = values[:, :, list(conditions).index("onset")]
+    baseline_val = values[:, :, list(conditions).index("baseline")]
+    if test.lower() == "t-test" or test.lower() == "t_test" or test.lower() == "t test":
+        statistic, pvalue = ttest_rel_batch(onset_val, baseline_val, alternative=alternative)
+    elif test.lower() == "wilcoxon_rank_sum":
+        statistic, pvalue = ranksums_batch(onset_val, baseline_val, alternative=alternative)
+    elif test.lower() == "wilcoxon_signed_rank":
+        statistic, pvalue = wilcoxon_batch(onset_val - baseline_val, alternative=alternative)
+    elif test.lower() == "bayes_t_test":
+        t_val, _ = ttest_rel_batch(onset_val, baseline_val, alternative=alternative)
+        n_trials = np.sum(~np.isnan(onset_val), axis=1)
+        # Call the bayes factor the statistics to be consistent with the rest:
+        statistic = np.array([pg.bayesfactor_ttest(t, n, paired=True, alternative=alternative, r=0.7071)
+                              for t, n in zip(t_val, n_trials)])
+        # Set the pvalue to 0.01 if the bayes factor is more than 3 as our threshold is significance.
+        # This is more for backward compatibility than anything else:
+        pvalue = np.where(statistic > 3, 0.01, 0.5)
+    else:
+        raise Exception("This test is not supported!")
+    # Compute the effect size if the test wasn't the bayes t-test:
+    if test.lower() != "bayes_t_test":
+        # https://en.wikipedia.org/wiki/Effect_size
+        baseline_mean = np.nanmean(baseline_val, axis=1)
+        effect_strength = ((np.nanmean(onset_val, axis=1) - baseline_mean) / baseline_mean) * 100
+    else:
+        # Otherwise, set the effect strength as the posterior probability. Not exactly correct,
+        # but keeps things consistent with down the line
+        effect_strength = 1 / (1 + np.exp(-np.log(statistic)))
+    reject = pvalue <= p_val
+    results_df = pd.DataFrame({
+        "subject": [group.split("-")[0] for group in group_names],
+        "channel": group_names,
+        "metric": None,
+        "reject": reject,
+        "stat": statistic,
+        "pval": pvalue,
+        "onset": np.where(reject, twin[0], None),
+        "offset": np.where(reject, twin[1], None),
+        "effect_strength": effect_strength
+    })
+    return results_df
 
 
 def sustained_zscore_test(data_df, onset, groups="channel", z_thresh=2.5, dur_thresh=0.050,
@@ -23,6 +23,162 @@ import mne_bids
 import sys
 sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 
+#########################
+# Event-sequence decoders
+#########################
+# Each decoder takes the events array of a run and returns the events to save, the trial metadata table (one row per
+# stimulus event kept in the events) and a validity report (one row per stimulus event, with a column per check).
+# Trials failing any check are dropped from both the events and the metadata, such that they stay aligned.
+
+def _first_in_segment(positions, starts, stops):
+    """
+    Returns, for each segment [start, stop), the first of the (sorted) event positions found in it, -1 if none
+    """
+    first = np.append(positions, -1)[np.searchsorted(positions, starts)]
+    return np.where((first >= 0) & (first < stops), first, -1)
+
+
+def _lookup(values, indices, valid):
+    """
+    Returns values[indices], with NaN where the index is not valid
+    """
+    out = np.full(len(indices), np.nan, dtype=object)
+    out[valid] = np.asarray(values, dtype=object)[indices[valid]]
+    return out
+
+
+def _samples(values, valid):
+    """
+    Returns the values as a nullable integer array, missing where not valid
+    """
+    return pd.arrays.IntegerArray(np.where(valid, values, 0).astype('int64'), ~np.asarray(valid, dtype=bool))
+
+
+def _validity_report(eve, stim, checks):
+    report = pd.DataFrame({'Event_index': stim, 'Stim_trigger': eve[stim, 2], **checks})
+    report['Valid'] = report[list(checks.keys())].all(axis=1)
+    return report
+
+
+def decode_dur_events(eve):
+    """
+    Decodes the trials of the duration task (V1). Each trial starts with the stimulus trigger (< 81) and ends with the
+    trigger 97 within the next 9 events. In between are the orientation (101-103), duration (151-153), task relevance
+    (201-203), trial ID (111-148) and response (255) triggers
+    """
+    codes = eve[:, 2]
+    stim = np.flatnonzero(codes < 81)
+    # End of each trial:
+    stops = _first_in_segment(np.flatnonzero(codes == 97), stim, stim + 9)
+    has_end = stops >= 0
+    stops = np.where(has_end, stops, stim)
+    # First trigger of each family within each trial:
+    orientation = _first_in_segment(np.flatnonzero((codes >= 101) & (codes <= 103)), stim, stops)
+    duration = _first_in_segment(np.flatnonzero((codes >= 151) & (codes <= 153)), stim, stops)
+    relevance = _first_in_segment(np.flatnonzero((codes >= 201) & (codes <= 203)), stim, stops)
+    trial_id = _first_in_segment(np.flatnonzero((codes > 110) & (codes < 149)), stim, stops)
+    response = _first_in_segment(np.flatnonzero(codes == 255), stim, stops)
+
+    report = _validity_report(eve, stim, {'Trial_end': has_end,
+                                          'Orientation': orientation >= 0,
+                                          'Duration': duration >= 0,
+                                          'Task_relevance': relevance >= 0,
+                                          'Trial_ID': trial_id >= 0})
+    valid = report['Valid'].to_numpy()
+    metadata = pd.DataFrame({
+        'Stim_trigger': codes[stim],
+        'Category': np.array(['face', 'object', 'letter', 'false'])[(codes[stim] - 1) // 20],
+        'Orientation': _lookup(['Center', 'Left', 'Right'], codes[orientation] - 101, orientation >= 0),
+        'Duration': _lookup(['500ms', '1000ms', '1500ms'], codes[duration] - 151, duration >= 0),
+        'Task_relevance': _lookup(['Relevant target', 'Relevant non-target', 'Irrelevant'],
+                                  codes[relevance] - 201, relevance >= 0),
+        'Trial_ID': codes[trial_id],
+        'Response': response >= 0,
+        'Response_time(s)': _samples(eve[response, 0] - eve[stim, 0], response >= 0)})
+
+    return eve[stim][valid], metadata[valid].reset_index(drop=True), report
+
+
+def decode_vg_events(eve):
+    """
+    Decodes the trials of the video game task (V2). The stimulus trigger (< 51, 50 for blanks) is followed by the
+    trigger coding the location (tens) and the trial type (units: 0 filler, 1 probe). For probes, the response trigger
+    (98 seen, 99 unseen) is the fourth event after the stimulus
+    """
+    codes = eve[:, 2]
+    n = len(codes)
+    stim = np.flatnonzero(codes < 51)
+    nxt = codes[np.minimum(stim + 1, n - 1)]
+    has_next = stim + 1 < n
+    trial_type = nxt % 10
+    blank = codes[stim] == 50
+    location = nxt // 10 - 6
+    probe = has_next & (trial_type == 1)
+    resp_ind = np.minimum(stim + 4, n - 1)
+    response = codes[resp_ind] - 98
+    has_response = (stim + 4 < n) & ((response == 0) | (response == 1))
+
+    report = _validity_report(eve, stim, {'Trial_type': has_next & ((trial_type == 0) | (trial_type == 1)),
+                                          'Location': blank | (has_next & (location >= 0) & (location <= 3)),
+                                          'Response': ~probe | has_response})
+    valid = report['Valid'].to_numpy()
+    probe = probe & has_response
+    metadata = pd.DataFrame({
+        'Trial_type': _lookup(['Filler', 'Probe'], trial_type, has_next & (trial_type <= 1)),
+        'Stim_trigger': codes[stim],
+        'Stimuli_type': np.array(['Face', 'Object', 'Blank'])[np.where(blank, 2, codes[stim] // 20)],
+        'Location': _lookup(['Upper Left', 'Upper Right', 'Lower Right', 'Lower Left'], location,
+                            ~blank & has_next & (location >= 0) & (location <= 3)),
+        'Response': _lookup(['Seen', 'Unseen'], response, probe),
+        'Response_time': _samples(eve[resp_ind, 0] - eve[resp_ind - 1, 0], probe)})
+
+    return np.delete(eve, stim[~valid], axis=0), metadata[valid].reset_index(drop=True), report
+
+
+def decode_replay_events(eve):
+    """
+    Decodes the trials of the replay task (V2). The stimulus trigger (101-150 and 201-250) codes the stimulus type and
+    whether it is a target, and is followed by the trigger coding the location (tens). Targets are seen if the trigger
+    198 is found within the stimulus and the three next events
+    """
+    codes = eve[:, 2]
+    n = len(codes)
+    stim = np.flatnonzero(((codes >= 101) & (codes <= 150)) | ((codes >= 201) & (codes <= 250)))
+    stim_codes = codes[stim]
+    has_next = stim + 1 < n
+    location = codes[np.minimum(stim + 1, n - 1)] // 10 - 6
+    # Stimulus type and trial type of each range of triggers:
+    stimuli_type = np.full(len(stim), np.nan, dtype=object)
+    trial_type = np.full(len(stim), np.nan, dtype=object)
+    for (low, high), s_type, t_type in [((101, 110), 'Face', 'Target'), ((121, 130), 'Object', 'Non-Target'),
+                                        ((150, 150), 'Black', np.nan), ((221, 230), 'Object', 'Target'),
+                                        ((201, 210), 'Face', 'Non-Target'), ((250, 250), 'Black', np.nan)]:
+        in_range = (stim_codes >= low) & (stim_codes <= high)
+        stimuli_type[in_range] = s_type
+        trial_type[in_range] = t_type
+    target = trial_type == 'Target'
+    windows = np.lib.stride_tricks.sliding_window_view(np.append(codes, np.zeros(3, dtype=codes.dtype)), 4)[stim]
+    seen = target & (windows == 198).any(axis=1)
+
+    report = _validity_report(eve, stim, {'Location': has_next & (location >= 0) & (location <= 3),
+                                          'Response': ~seen | (stim + 4 < n)})
+    valid = report['Valid'].to_numpy()
+    seen = seen & (stim + 4 < n)
+    resp_ind = np.minimum(stim + 4, n - 1)
+    response = np.full(len(stim), np.nan, dtype=object)
+    response[target] = np.where(seen[target], 'Seen', 'Unseen')
+    metadata = pd.DataFrame({
+        'Stim_trigger': stim_codes,
+        'Stimuli_type': stimuli_type,
+        'Trial_type': trial_type,
+        'Location': _lookup(['Upper Left', 'Upper Right', 'Lower Right', 'Lower Left'], location,
+                            has_next & (location >= 0) & (location <= 3)),
+        'Response': response,
+        'Response_time': _samples(eve[resp_ind, 0] - eve[resp_ind - 1, 0], seen)})
+
+    return np.delete(eve, stim[~valid], axis=0), metadata[valid].reset_index(drop=True), report
+
+
 def run_events(subject_id, visit_id, bids_root):
     
     # Prepare PDF report
@@ -126,126 +282,23 @@ def run_events(subject_id, visit_id, bids_root):
             
             # # Generate metadata table
             if visit_id == '1':
-                eve = events.copy()
-                events = eve[eve[:, 2] < 81].copy()
-                metadata = {}
-                metadata = pd.DataFrame(metadata, index=np.arange(len(events)),
-                                        columns=['Stim_trigger', 'Category',
-                                                 'Orientation', 'Duration',
-                                                 'Task_relevance', 'Trial_ID',
-                                                 'Response', 'Response_time(s)'])
-                Category = ['face', 'object', 'letter', 'false']
-                Orientation = ['Center', 'Left', 'Right']
-                Duration = ['500ms', '1000ms', '1500ms']
-                Relevance = ['Relevant target', 'Relevant non-target', 'Irrelevant']
-                k = 0
-                for i in range(eve.shape[0]):
-                    if eve[i, 2] < 81:
-                        try:
-                        ##find the end of each trial (trigger 97)
-                            t = [t for t, j in enumerate(eve[i:i + 9, 2]) if j == 97][0]
-                            metadata.loc[k]['Stim_trigger'] = eve[i,2]
-                            metadata.loc[k]['Category'] = Category[int((eve[i,2]-1)//20)]
-                            metadata.loc[k]['Orientation'] = Orientation[[j-100 for j in eve[i:i+t,2]
-                                                                        if j in [101,102,103]][0]-1]
-                            metadata.loc[k]['Duration'] = Duration[[j-150 for j in eve[i:i+t,2]
-                                                                    if j in [151,152,153]][0]-1]
-                            metadata.loc[k]['Task_relevance'] = Relevance[[j-200 for j in eve[i:i+t,2]
-                                                                        if j in [201,202,203]][0]-1]
-                            metadata.loc[k]['Trial_ID'] = [j for j in eve[i:i+t,2]
-                                                        if (j>110) and (j<149)][0]
-                            metadata.loc[k]['Response'] = True if any(eve[i:i+t,2] == 255) else False
-                            if metadata.loc[k]['Response'] == True:
-                                r = [r for r,j in enumerate(eve[i:i+t,2]) if j == 255][0]
-                                metadata.loc[k]['Response_time(s)'] = (eve[i+r,0] - eve[i,0])
-                            k += 1
-                        except:
-                            print('Error in trial %s; skipping' % i)
-                            
-                # Find indices where 'Category' is NaN in metadata, drop those row(s) in both metadata and events
-                nan_indices = metadata[metadata['Category'].isnull()].index
-                metadata = metadata.drop(nan_indices) 
-
-                # Drop the index from the events column too
-                events = np.delete(events, nan_indices, axis=0)
-
+                events, metadata, report = decode_dur_events(events)
             elif visit_id == '2':
                 if bids_task == "vg":
-                    eve = events.copy()
-                    metadata = {}
-                    metadata = pd.DataFrame(metadata, index=np.arange(np.sum(events[:, 2] < 51)),
-                                            columns=['Trial_type', 
-                                                     'Stim_trigger',
-                                                     'Stimuli_type',
-                                                     'Location', 
-                                                     'Response',
-                                                     'Response_time'])
-                    types0 = ['Filler', 'Probe']
-                    type1 = ['Face', 'Object', 'Blank']
-                    location = ['Upper Left', 'Upper Right', 'Lower Right', 'Lower Left']
-                    response = ['Seen', 'Unseen']
-                    k = 0
-                    for i in range(eve.shape[0]):
-                        if eve[i, 2] < 51:
-                            metadata.loc[k]['Stim_trigger'] = eve[i, 2]
-                            t = int(eve[i + 1, 2] % 10)
-                            metadata.loc[k]['Trial_type'] = types0[t]
-                            if eve[i, 2] == 50:
-                                metadata.loc[k]['Stimuli_type'] = type1[2]
-                            else:
-                                metadata.loc[k]['Stimuli_type'] = type1[eve[i, 2] // 20]
-                                metadata.loc[k]['Location'] = location[eve[i + 1, 2] // 10 - 6]
-                            if t == 1:
-                                metadata.loc[k]['Response'] = response[int(eve[i + 4, 2] - 98)]
-                                metadata.loc[k]['Response_time(s)'] = (eve[i + 4, 0] - eve[i + 3, 0]) #/ sfreq
-                            k += 1
+                    events, metadata, report = decode_vg_events(events)
                 elif bids_task == "replay":
-                    eve = events.copy()
-                    metadata = {}
-                    metadata = pd.DataFrame(metadata, 
-                                            index=np.arange(np.size(
-                                                [i for i in events[:, 2] if i in list(range(101,151)) + list(range(201,251))])),
-                                            columns=['Stim_trigger', 
-                                                     'Stimuli_type',
-                                                     'Trial_type', 
-                                                     'Location', 
-                                                     'Response',
-                                                     'Response_time'])
-                    types0 = ['Non-Target', 'Target']
-                    type1 = ['Face', 'Object', 'Black']
-                    location = ['Upper Left', 'Upper Right', 'Lower Right', 'Lower Left']
-                    response = ['Seen', 'Unseen']
-                    k = 0
-                    for i in range(eve.shape[0]):
-                        if eve[i, 2] in list(range(101,151)) + list(range(201,251)):
-                            metadata.loc[k]['Stim_trigger'] = eve[i, 2]
-                            # t = int(eve[i + 1, 2] % 10)
-                            if eve[i, 2] in range(101,111):
-                                metadata.loc[k]['Stimuli_type'] = type1[0]
-                                metadata.loc[k]['Trial_type'] = types0[1]
-                            elif eve[i, 2] in range(121,131):
-                                metadata.loc[k]['Stimuli_type'] = type1[1]
-                                metadata.loc[k]['Trial_type'] = types0[0]
-                            elif eve[i, 2] == 150:
-                                metadata.loc[k]['Stimuli_type'] = type1[2]
-                            elif eve[i, 2] in range(221,231):
-                                metadata.loc[k]['Stimuli_type'] = type1[1]
-                                metadata.loc[k]['Trial_type'] = types0[1]
-                            elif eve[i, 2] in range(201,211):
-                                metadata.loc[k]['Stimuli_type'] = type1[0]
-                                metadata.loc[k]['Trial_type'] = types0[0]
-                            elif eve[i, 2] == 250:
-                                metadata.loc[k]['Stimuli_type'] = type1[2]
-                            metadata.loc[k]['Location'] = location[eve[i + 1, 2] // 10 - 6]
-                            if metadata.loc[k]['Trial_type'] == 'Target':
-                                if 198 in eve[i:i + 4, 2]:
-                                    print(eve[i:i + 4, 2])
-                                    metadata.loc[k]['Response'] = response[0]
-                                    metadata.loc[k]['Response_time'] = (eve[i + 4, 0] - eve[i + 3, 0]) #/ sfreq
-                                else:
-                                    metadata.loc[k]['Response'] = response[1]
-                            k += 1
-            
+                    events, metadata, report = decode_replay_events(events)
+
+            # Report the trials dropped because of missing or unexpected triggers
+            invalid = report[~report['Valid']]
+            print("  %d of %d trials dropped because of invalid triggers" % (len(invalid), len(report)))
+            if len(invalid) > 0:
+                print(invalid.to_string(index=False))
+            pdf.set_y(-30)
+            pdf.set_font('helvetica', '', 10)
+            pdf.cell(0, 10, '%d of %d trials dropped because of invalid triggers' % (len(invalid), len(report)),
+                     ln=1)
+
             # Save event array
             bids_path_eve = bids_path_annot.copy().update(
                 suffix="eve",
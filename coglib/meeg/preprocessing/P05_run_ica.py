@@ -13,7 +13,9 @@ import os.path as op
 import os
 import matplotlib.pyplot as plt
 import shutil
+import tempfile
 
+import numpy as np
 from fpdf import FPDF
 import mne
 from mne.preprocessing import ICA
@@ -22,6 +24,181 @@ import mne_bids
 import sys
 sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 
+
+##############################
+# Out-of-core ICA estimation #
+##############################
+# The filtered and downsampled runs are never concatenated: the good samples of
+# each run are appended to a buffer on disk, along with the running sums needed
+# for the pre-whitening and the PCA. The FastICA iterations then read the
+# PCA-whitened data chunk by chunk, such that the memory needed is that of one
+# run, whatever the number of runs.
+
+def init_ica_buffer(buffer_dir, name):
+    """Creates an empty buffer, to which the runs are appended with
+    append_run_to_buffer."""
+    return {"fname": op.join(buffer_dir, name + "_data.dat"),
+            "info": None,
+            "n_samples": 0,
+            "sum": None,
+            "cross": None}
+
+
+def append_run_to_buffer(buffer, raw, ch_type, reject_by_annotation=True):
+    """Appends the samples of one run to the buffer (samples x channels, on
+    disk) and updates the sums of the data and of its cross-products.
+    ch_type is either 'meg' or 'eeg'."""
+    picks = mne.pick_types(raw.info, meg=ch_type == 'meg', eeg=ch_type == 'eeg',
+                           exclude='bads')
+    data = raw.get_data(picks=picks,
+                        reject_by_annotation='omit' if reject_by_annotation else None)
+    if buffer["info"] is None:
+        buffer["info"] = mne.pick_info(raw.info, picks)
+        buffer["sum"] = np.zeros(data.shape[0])
+        buffer["cross"] = np.zeros((data.shape[0], data.shape[0]))
+    elif buffer["info"]["ch_names"] != [raw.ch_names[i] for i in picks]:
+        raise ValueError("The channels of the runs differ, they can't be combined for the ICA")
+    with open(buffer["fname"], "ab") as f:
+        np.ascontiguousarray(data.T, dtype=np.float64).tofile(f)
+    buffer["n_samples"] += data.shape[1]
+    buffer["sum"] += data.sum(axis=1)
+    buffer["cross"] += data @ data.T
+
+
+def _read_buffer(fname, n_channels):
+    return np.memmap(fname, dtype=np.float64, mode="r").reshape(-1, n_channels)
+
+
+def _fastica_par(fname, n_components, w_init, max_iter=200, tol=1e-04,
+                 alpha=1.0, chunk_size=100000):
+    """Parallel FastICA with the logcosh contrast (as in scikit-learn) on the
+    whitened data of the buffer, which is read chunk by chunk at each
+    iteration."""
+    data = _read_buffer(fname, n_components)
+    n_samples = data.shape[0]
+
+    def sym_decorrelation(w):
+        s, u = np.linalg.eigh(w @ w.T)
+        s = np.clip(s, a_min=np.finfo(w.dtype).tiny, a_max=None)
+        return (u * (1. / np.sqrt(s))) @ u.T @ w
+
+    w = sym_decorrelation(w_init)
+    for n_iter in range(1, max_iter + 1):
+        gwtx_x = np.zeros((n_components, n_components))
+        g_wtx = np.zeros(n_components)
+        for start in range(0, n_samples, chunk_size):
+            x = np.asarray(data[start:start + chunk_size]).T
+            gwtx = np.tanh(alpha * (w @ x))
+            gwtx_x += gwtx @ x.T
+            g_wtx += (alpha * (1 - gwtx ** 2)).sum(axis=1)
+        w1 = sym_decorrelation(gwtx_x / n_samples - (g_wtx / n_samples)[:, np.newaxis] * w)
+        lim = np.max(np.abs(np.abs(np.einsum("ij,ij->i", w1, w)) - 1))
+        w = w1
+        if lim < tol:
+            break
+    else:
+        print("WARNING: FastICA did not converge, consider increasing "
+              "the maximum number of iterations")
+    return w, n_iter
+
+
+def fit_ica_from_buffer(ica, buffer, chunk_size=100000):
+    """Fits the ICA to the data of the buffer, same as ICA.fit on the
+    concatenated runs: the data are z-scored by channel type, reduced to the
+    PCA components explaining ica.n_components of the variance and unmixed with
+    FastICA. The ICA components are sorted by explained variance."""
+    if ica.method != "fastica":
+        raise ValueError("Only the fastica method can be fitted out of core")
+    if ica.noise_cov is not None:
+        raise ValueError("The out of core ICA only supports the z-scoring pre-whitener")
+    info = buffer["info"]
+    n_samples = buffer["n_samples"]
+    n_channels = len(info["ch_names"])
+
+    # Pre-whitener: standard deviation of each channel type
+    mean = buffer["sum"] / n_samples
+    sq_mean = np.diag(buffer["cross"]) / n_samples
+    ch_types = np.array(info.get_channel_types())
+    pre_whitener = np.empty([n_channels, 1])
+    for ch_type in np.unique(ch_types):
+        picks = ch_types == ch_type
+        pre_whitener[picks] = np.sqrt(np.mean(sq_mean[picks]) - np.mean(mean[picks]) ** 2)
+
+    # PCA of the pre-whitened data, from its covariance
+    pca_mean = mean / pre_whitener[:, 0]
+    cov = (buffer["cross"] / np.outer(pre_whitener, pre_whitener)
+           - n_samples * np.outer(pca_mean, pca_mean)) / (n_samples - 1)
+    explained_variance, pca_components = np.linalg.eigh(cov)
+    order = explained_variance.argsort()[::-1]
+    explained_variance = np.clip(explained_variance[order], 0, None)
+    pca_components = pca_components[:, order].T
+    # Sign of the components: largest loading positive
+    signs = np.sign(pca_components[np.arange(n_channels),
+                                   np.abs(pca_components).argmax(axis=1)])
+    pca_components *= signs[:, np.newaxis]
+
+    if ica.n_components is None:
+        n_components = n_channels
+    elif isinstance(ica.n_components, float):
+        cum_var = np.cumsum(explained_variance) / np.sum(explained_variance)
+        n_components = min(int(np.sum(cum_var <= ica.n_components)) + 1, n_channels)
+    else:
+        n_components = int(ica.n_components)
+    print("Selected %d PCA components" % n_components)
+    norms = np.sqrt(explained_variance[:n_components])
+    norms[norms == 0] = 1.
+
+    # Whitened data, written to a second buffer
+    projector = (pca_components[:n_components] / norms[:, np.newaxis]) / pre_whitener[:, 0]
+    offset = projector @ mean
+    data = _read_buffer(buffer["fname"], n_channels)
+    fname_white = buffer["fname"].replace("_data.dat", "_white.dat")
+    white = np.memmap(fname_white, dtype=np.float64, mode="w+",
+                      shape=(n_samples, n_components))
+    for start in range(0, n_samples, chunk_size):
+        white[start:start + chunk_size] = np.asarray(data[start:start + chunk_size]) @ projector.T - offset
+    white.flush()
+    del white, data
+
+    # FastICA, with the same random initialization as scikit-learn
+    rng = np.random.RandomState(ica.random_state)
+    w_init = rng.normal(size=(n_components, n_components))
+    unmixing, n_iter = _fastica_par(fname_white, n_components, w_init,
+                                    max_iter=ica.fit_params.get("max_iter", 200),
+                                    tol=ica.fit_params.get("tol", 1e-04),
+                                    alpha=(ica.fit_params.get("fun_args") or {}).get("alpha", 1.0),
+                                    chunk_size=chunk_size)
+
+    # Fill the ICA object as ICA.fit does
+    ica.info = info
+    ica.ch_names = info["ch_names"]
+    ica.n_samples_ = n_samples
+    ica.reject_ = None
+    ica.pre_whitener_ = pre_whitener
+    ica.pca_mean_ = pca_mean
+    ica.pca_components_ = pca_components
+    ica.pca_explained_variance_ = explained_variance
+    ica.n_components_ = n_components
+    ica._update_ica_names()
+    ica.unmixing_matrix_ = unmixing / norms
+    ica.n_iter_ = n_iter
+    ica._update_mixing_matrix()
+    ica.current_fit = "raw"
+
+    # Sort the ICA components by explained variance
+    white = _read_buffer(fname_white, n_components)
+    sources_sq = np.zeros(n_components)
+    for start in range(0, n_samples, chunk_size):
+        sources_sq += ((unmixing @ np.asarray(white[start:start + chunk_size]).T) ** 2).sum(axis=1)
+    del white
+    var = np.sum(ica.mixing_matrix_ ** 2, axis=0) * sources_sq
+    order = var.argsort()[::-1]
+    ica.unmixing_matrix_ = ica.unmixing_matrix_[order]
+    ica._update_mixing_matrix()
+    os.remove(fname_white)
+
+    return ica
+
 def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
     
     # Set path to preprocessing derivatives
@@ -41,56 +218,82 @@ def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
     # Loop over runs
     data_path = os.path.join(bids_root,f"sub-{subject_id}",f"ses-{visit_id}","meg")
 
-    # Initialize raw_all list
-    # raw_all = []
+    # Initialize the buffers of the runs data, in the derivatives as they hold
+    # the whole session
+    buffer_dir = tempfile.mkdtemp(prefix="ica_buffer_",
+                                  dir=op.dirname(prep_figure_root))
+    try:
+        meg_buffer = init_ica_buffer(buffer_dir, "meg")
+        eeg_buffer = init_ica_buffer(buffer_dir, "eeg")
+        raw_plot = None
     
-    for fname in sorted(os.listdir(data_path)):
-        if fname.endswith(".json") and "run" in fname:
+        for fname in sorted(os.listdir(data_path)):
+            if fname.endswith(".json") and "run" in fname:
             
-            # Set run
-            run = fname.split("run-")[1].split("_")[0]
-            print("  Run: %s" % run)
+                # Set run
+                run = fname.split("run-")[1].split("_")[0]
+                print("  Run: %s" % run)
         
-            # Set task
-            if 'dur' in fname:
-                bids_task = 'dur'
-            elif 'vg' in fname:
-                bids_task = 'vg'
-            elif 'replay' in fname:
-                bids_task = 'replay'
-            else:
-                raise ValueError("Error: could not find the task for %s" % fname)
-
-            # Set BIDS path
-            bids_path_annot = mne_bids.BIDSPath(
-                root=prep_deriv_root, 
-                subject=subject_id,  
-                datatype='meg',  
-                task=bids_task,
-                run=run,
-                session=visit_id, 
-                suffix='annot', 
-                extension='.fif',
-                check=False)
+                # Set task
+                if 'dur' in fname:
+                    bids_task = 'dur'
+                elif 'vg' in fname:
+                    bids_task = 'vg'
+                elif 'replay' in fname:
+                    bids_task = 'replay'
+                else:
+                    raise ValueError("Error: could not find the task for %s" % fname)
+
+                # Set BIDS path
+                bids_path_annot = mne_bids.BIDSPath(
+                    root=prep_deriv_root, 
+                    subject=subject_id,  
+                    datatype='meg',  
+                    task=bids_task,
+                    run=run,
+                    session=visit_id, 
+                    suffix='annot', 
+                    extension='.fif',
+                    check=False)
             
-            # Read raw data
-            raw = mne_bids.read_raw_bids(bids_path_annot).load_data()
-            raw.info['bads'] = []
+                # Read raw data
+                raw = mne_bids.read_raw_bids(bids_path_annot).load_data()
+                raw.info['bads'] = []
         
-            # Band-pass filter raw between 1 and 40 Hz
-            raw.filter(1, 40)
+                # Band-pass filter raw between 1 and 40 Hz
+                raw.filter(1, 40)
             
-            # Downsample raw to 200 Hz
-            raw.resample(200)
+                # Downsample raw to 200 Hz
+                raw.resample(200)
             
-            # Concatenate raw copies
-            if run in [1, "1", "01"]:
-                raw_all = mne.io.concatenate_raws([raw])
-            else:
-                raw_all = mne.io.concatenate_raws([raw_all, raw])
+                # Append the run to the buffers
+                append_run_to_buffer(meg_buffer, raw, 'meg')
+                if has_eeg:
+                    append_run_to_buffer(eeg_buffer, raw, 'eeg')
             
-            del raw
-        
+                # Keep the first run for plotting the ICs timecourse
+                if raw_plot is None:
+                    raw_plot = raw
+                else:
+                    del raw
+
+        # Run ICA on filtered raw data: the MEG and EEG ICAs are both fitted
+        # before the buffers are removed
+        ica = ICA(method='fastica',
+                  random_state=1688,
+                  n_components=0.99,
+                  verbose=True)
+        fit_ica_from_buffer(ica, meg_buffer)
+        if has_eeg:
+            ica_eeg = ICA(method='fastica',
+                          random_state=1688,
+                          n_components=0.99,
+                          verbose=True)
+            fit_ica_from_buffer(ica_eeg, eeg_buffer)
+    finally:
+        # Remove the buffers, also when reading the runs or fitting fails
+        shutil.rmtree(buffer_dir)
+
     ###################
     # ICA on MEG data #
     ###################
@@ -98,18 +301,6 @@ def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
     # Prepare PDF report
     pdf = FPDF(orientation="P", unit="mm", format="A4")
     
-    # Define ICA settings
-    ica = ICA(method='fastica',
-              random_state=1688,
-              n_components=0.99,
-              verbose=True)
-    
-    # Run ICA on filtered raw data    
-    ica.fit(raw_all,
-            picks='meg',
-            reject_by_annotation=True,
-            verbose=True)
-    
     # Plot timecourse and topography of the ICs
     # before, get the total number of ICs and divide them into n sets of 20
     n_comp_list = range(ica.n_components_)
@@ -118,7 +309,7 @@ def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
     for i in range(len(plot_comp_list)):
         
         # Plot timecourse
-        fig = ica.plot_sources(raw_all,
+        fig = ica.plot_sources(raw_plot,
                                picks=plot_comp_list[i],
                                start=100,
                                show_scrollbars=False,
@@ -177,16 +368,8 @@ def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
         # Prepare PDF report
         pdf = FPDF(orientation="P", unit="mm", format="A4")
         
-        # Define ICA settings
-        ica = ICA(method='fastica',
-              random_state=1688,
-              n_components=0.99,
-              verbose=True)
-        
-        # Run ICA on filtered raw data
-        ica.fit(raw_all,
-                picks='eeg',
-                verbose=True)
+        # ICA fitted on filtered raw data
+        ica = ica_eeg
         
         # Plot timecourse and topography of the ICs
         # Get the total number of ICs and divide them into sets of 20 ICs
@@ -195,7 +378,7 @@ def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
     
         for i in range(len(plot_comp_list)):
             # Plot timecourse
-            fig = ica.plot_sources(raw_all,
+            fig = ica.plot_sources(raw_plot,
                                    picks=plot_comp_list[i],
                                    start=100,
                                    show_scrollbars=False,
@@ -246,6 +429,7 @@ def run_ica(subject_id, visit_id, bids_root, has_eeg=False):
         # Save report
         pdf.output(op.join(prep_report_root,
                            os.path.basename(__file__) + 'EEG-report.pdf'))
+    
     # Save code
     shutil.copy(__file__, prep_code_root)
 
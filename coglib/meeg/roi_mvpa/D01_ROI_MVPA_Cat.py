@@ -16,7 +16,6 @@ feature selection methods test
 
 import os.path as op
 
-import pickle
 
 import matplotlib.pyplot as plt
 import mne
@@ -51,8 +50,10 @@ import matplotlib.patheffects as path_effects
 
 from config import bids_root
 
-from D_MEG_function import set_path_ROI_MVPA, ATdata,sensor_data_for_ROI_MVPA
-from D_MEG_function import source_data_for_ROI_MVPA,sub_ROI_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_MVPA, ATdata,sensor_data_for_ROI_MVPA, set_path_ROI_cache
+from D_MEG_function import sub_ROI_for_ROI_MVPA, pseudotrials_average, run_pseudotrials_repeats
+from D_MEG_function import cached_sensor_data_for_ROI_MVPA, cached_source_data_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_store, save_ROI_results, clear_pseudotrials_repeats
 
 ####if need pop-up figures
 # %matplotlib qt5
@@ -94,6 +95,10 @@ parser.add_argument('--nPCA',
                     type=float,
                     default=0.95,
                     help='percentile of PCA selected for source decoding')
+parser.add_argument('--n_jobs',
+                    type=int,
+                    default=-1,
+                    help='number of pseudotrials repeats run in parallel')
 # parser.add_argument('--coreg_path',
 #                     type=str,
 #                     default='/mnt/beegfs/XNAT/COGITATE/MEG/phase_2/processed/bids/derivatives/coreg',
@@ -107,6 +112,7 @@ con_T = opt.cT
 select_F = opt.nF
 n_trials = opt.nT
 nPCA = opt.nPCA
+n_jobs = opt.n_jobs
 
 
 # =============================================================================
@@ -124,7 +130,27 @@ subjects_dir = opt.fs_path
 
     # Now we define a function to decoding condition for one subject
     # Category_CCD, train on condition A, test on condition B
-def Category_CCD(epochs_rs,stcs,conditions_C,conditions_D,select_F,n_trials,roi_name,score_methods,fname_fig):
+def Category_CCD_repeat(rng,group_xa,group_ya,group_xb,group_yb,n_trials,sliding):
+    # One pseudotrials repeat: do the average trial
+    new_xa, new_ya = pseudotrials_average(group_xa, group_ya, n_trials, rng)
+    new_xb, new_yb = pseudotrials_average(group_xb, group_yb, n_trials, rng)
+
+    # First: train condition a (cond_a) and Test on condition b (cond_b) cross condition decoding
+    # Fit
+    sliding.fit(X=new_xa, y=new_ya)
+    # Test
+    scores_ab = sliding.score(X=new_xb, y=new_yb)
+
+    # Then: train condition b (cond_b) and Test on condition a (cond_a) cross condition decoding
+    # Fit
+    sliding.fit(X=new_xb, y=new_yb)
+    # Test
+    scores_ba = sliding.score(X=new_xa, y=new_ya)
+
+    return np.stack([scores_ab, scores_ba])
+
+def Category_CCD(epochs_rs,stcs,conditions_C,conditions_D,select_F,n_trials,roi_name,score_methods,fname_fig,
+                 n_jobs=1,fpath_repeats=None):
     # setup SVM classifier
     clf = make_pipeline(
         Vectorizer(),
@@ -174,86 +200,15 @@ def Category_CCD(epochs_rs,stcs,conditions_C,conditions_D,select_F,n_trials,roi_
     group_xb=X[cond_b]
     group_yb=y[cond_b]
     
-    scores_ab_per=np.zeros([100,group_xa.shape[2]])
-    scores_ba_per=np.zeros([100,group_xb.shape[2]])
-    for num_per in range(100):
-        # do the average trial
-        new_xa = []
-        new_ya = []
-        new_xb = []
-        new_yb = []
-        for label in range(2):
-            # Extract the data:
-            data_a = group_xa[np.where(group_ya == label+1)]
-            data_a = np.take(data_a, np.random.permutation(data_a.shape[0]), axis=0)
-            avg_xa = block_reduce(data_a, block_size=tuple([n_trials, *[1] * len(data_a.shape[1:])]),
-                                 func=np.nanmean, cval=np.nan)
-            #block_size
-            #array_like or int
-            #Array containing down-sampling integer factor along each axis. Default block_size is 2.
-            
-            # funccallable
-            # Function object which is used to calculate the return value for each local block. This function must implement an axis parameter. Primary functions are numpy.sum, numpy.min, numpy.max, numpy.mean and numpy.median. See also func_kwargs.
-            
-            # cvalfloat
-            # Constant padding value if image is not perfectly divisible by the block size.
-            
-            # Now generating the labels and group:
-            new_xa.append(avg_xa)
-            new_ya += [label] * avg_xa.shape[0]
-            
-            # Extract the data:
-            data_b = group_xb[np.where(group_yb == label+1)]
-            data_b = np.take(data_b, np.random.permutation(data_b.shape[0]), axis=0)
-            avg_xb = block_reduce(data_b, block_size=tuple([n_trials, *[1] * len(data_b.shape[1:])]),
-                                 func=np.nanmean, cval=np.nan)
-            #block_size
-            #array_like or int
-            #Array containing down-sampling integer factor along each axis. Default block_size is 2.
-            
-            # funccallable
-            # Function object which is used to calculate the return value for each local block. This function must implement an axis parameter. Primary functions are numpy.sum, numpy.min, numpy.max, numpy.mean and numpy.median. See also func_kwargs.
-            
-            # cvalfloat
-            # Constant padding value if image is not perfectly divisible by the block size.
-            
-            # Now generating the labels and group:
-            new_xb.append(avg_xb)
-            new_yb += [label] * avg_xb.shape[0]
-
-        new_xa = np.concatenate((new_xa[0],new_xa[1]),axis=0)
-        new_ya = np.array(new_ya)
-        
-        # average temporal feature (5 point average)
-        new_xa=ATdata(new_xa)
-        
-        new_xb = np.concatenate((new_xb[0],new_xb[1]),axis=0)
-        new_yb = np.array(new_yb)
-        
-        # average temporal feature (5 point average)
-        new_xb=ATdata(new_xb)
-        
-        # First: train condition a (cond_a) and Test on condition b (cond_b) cross condition decoding
-        # Fit
-        sliding.fit(X=new_xa, y=new_ya)
-        # Test
-        scores_ab = sliding.score(X=new_xb, y=new_yb)
+    # Run the pseudotrials repeats in parallel:
+    scores_per = run_pseudotrials_repeats(Category_CCD_repeat, n_repeats=100, n_jobs=n_jobs,
+                                          fpath_repeats=fpath_repeats,
+                                          group_xa=group_xa, group_ya=group_ya,
+                                          group_xb=group_xb, group_yb=group_yb,
+                                          n_trials=n_trials, sliding=sliding)
+    scores_ab_per=scores_per[:,0,:]
+    scores_ba_per=scores_per[:,1,:]
 
-
-        scores_ab_per[num_per,:]=scores_ab
-        
-        # Then: train condition b (cond_b) and Test on condition a (cond_a) cross condition decoding
-        # Fit
-        sliding.fit(X=new_xb, y=new_yb)
-        # Test
-        scores_ba = sliding.score(X=new_xa, y=new_ya)
-
-
-        scores_ba_per[num_per,:]=scores_ba
-
-    
-
-    
     # ccd['IR'] = np.mean(scores_a, axis=0)
     # ccd['RE'] = np.mean(scores_b, axis=0)
     ccd['IR2RE'] = np.mean(scores_ab_per, axis=0)
@@ -277,12 +232,20 @@ def Category_CCD(epochs_rs,stcs,conditions_C,conditions_D,select_F,n_trials,roi_
 
     return ccd
 
+def Category_WCD_repeat(rng,group_x,group_y,n_trials,sliding):
+    # One pseudotrials repeat: do the average trial
+    new_x, new_y = pseudotrials_average(group_x, group_y, n_trials, rng)
+
+    scores= cross_val_multiscore(sliding, X=new_x, y=new_y, cv=5, n_jobs=1)
+    return np.mean(scores, axis=0)
+
 def Category_WCD(epochs_rs,stcs,
                  conditions_C,conditions_D,
                  select_F,
                  n_trials,
  #                nPCA,
-                 roi_name,score_methods,fname_fig):
+                 roi_name,score_methods,fname_fig,
+                 n_jobs=1,fpath_repeats=None):
     # setup SVM classifier
     clf = make_pipeline(
         Vectorizer(),
@@ -321,39 +284,12 @@ def Category_WCD(epochs_rs,stcs,
         group_x=X[con_index]
         group_y=y[con_index]
         
-        scores_per=np.zeros([100,group_x.shape[2]])
-        for num_per in range(100):
-        # do the average trial
-            new_x = []
-            new_y = []
-            for label in range(2):
-                # Extract the data:
-                data = group_x[np.where(group_y == label+1)]
-                data = np.take(data, np.random.permutation(data.shape[0]), axis=0)
-                avg_x = block_reduce(data, block_size=tuple([n_trials, *[1] * len(data.shape[1:])]),
-                                     func=np.nanmean, cval=np.nan)
-                #block_size
-                #array_like or int
-                #Array containing down-sampling integer factor along each axis. Default block_size is 2.
-                
-                # funccallable
-                # Function object which is used to calculate the return value for each local block. This function must implement an axis parameter. Primary functions are numpy.sum, numpy.min, numpy.max, numpy.mean and numpy.median. See also func_kwargs.
-                
-                # cvalfloat
-                # Constant padding value if image is not perfectly divisible by the block size.
-                
-                # Now generating the labels and group:
-                new_x.append(avg_x)
-                new_y += [label] * avg_x.shape[0]
-
-            new_x = np.concatenate((new_x[0],new_x[1]),axis=0)
-            new_y = np.array(new_y)
-            
-            # average temporal feature (5 point average)
-            new_x=ATdata(new_x)
-            
-            scores= cross_val_multiscore(sliding, X=new_x, y=new_y, cv=5, n_jobs=1)
-            scores_per[num_per,:]=np.mean(scores, axis=0)
+        # Run the pseudotrials repeats in parallel:
+        scores_per = run_pseudotrials_repeats(Category_WCD_repeat, n_repeats=100, n_jobs=n_jobs,
+                                              fpath_repeats=None if fpath_repeats is None
+                                              else op.join(fpath_repeats, conditions_D[condi]),
+                                              group_x=group_x, group_y=group_y,
+                                              n_trials=n_trials, sliding=sliding)
             
         wcd[conditions_D[condi]]=np.mean(scores_per, axis=0)       
             
@@ -421,6 +357,8 @@ if __name__ == "__main__":
                                                                       subject_id,
                                                                       visit_id,
                                                                       analysis_name)
+    fpath_cache = set_path_ROI_cache(bids_root, subject_id, visit_id)
+    fpath_store = set_path_ROI_store(bids_root, analysis_name)
 
     # 2 Get Sub ROI
     surf_label_list, ROI_Name = sub_ROI_for_ROI_MVPA(fpath_fs, subject_id,analysis_name)
@@ -428,11 +366,12 @@ if __name__ == "__main__":
     # 3 prepare the sensor data
     epochs_rs, \
     rank, common_cov, \
-    conditions_C, conditions_D, conditions_T, task_info = sensor_data_for_ROI_MVPA(fpath_epo,
-                                                                                   sub_info,
-                                                                                   con_T,
-                                                                                   con_C,
-                                                                                   con_D)
+    conditions_C, conditions_D, conditions_T, task_info = cached_sensor_data_for_ROI_MVPA(fpath_epo,
+                                                                                          sub_info,
+                                                                                          con_T,
+                                                                                          con_C,
+                                                                                          con_D,
+                                                                                          fpath_cache)
 
     roi_ccd_acc = dict()
     #roi_ccd_auc = dict()
@@ -444,7 +383,7 @@ if __name__ == "__main__":
 
         # 4 Get Source Data for each ROI
         stcs = []
-        stcs = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[nroi])
+        stcs = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[nroi], fpath_cache)
         
         
         fname_fig_acc = op.join(roi_figure_root, 
@@ -459,7 +398,12 @@ if __name__ == "__main__":
                                         n_trials,
                                         # nPCA,
                                         roi_name, score_methods, 
-                                        fname_fig_acc)
+                                        fname_fig_acc,
+                                        n_jobs=n_jobs,
+                                        fpath_repeats=op.join(roi_data_root, "repeats",
+                                                              sub_info + task_info + '_' + roi_name
+                                                              + '_nF' + str(select_F) + '_nT' + str(n_trials)
+                                                              + "_acc_CCD"))
 
         roi_ccd_acc[roi_name] = ccd_acc
 
@@ -478,7 +422,12 @@ if __name__ == "__main__":
                               n_trials,
                               # nPCA,
                               roi_name, score_methods,
-                              fname_fig_acc)
+                              fname_fig_acc,
+                              n_jobs=n_jobs,
+                              fpath_repeats=op.join(roi_data_root, "repeats",
+                                                    sub_info + task_info + '_' + roi_name
+                                                    + '_nF' + str(select_F) + '_nT' + str(n_trials)
+                                                    + "_acc_WCD"))
 
         roi_wcd_acc[roi_name] = wcd_acc
         
@@ -492,10 +441,9 @@ if __name__ == "__main__":
     
 
 
-    fname_data=op.join(roi_data_root, sub_info + '_' + task_info +"_ROIs_data_Cat" + '.pickle')
-    fw = open(fname_data,'wb')
-    pickle.dump(roi_data,fw)
-    fw.close()
+    save_ROI_results(fpath_store, sub_info, task_info, roi_data)
+    # The repeats are only kept to resume a killed job:
+    clear_pseudotrials_repeats(op.join(roi_data_root, "repeats"), prefix=sub_info + task_info + '_')
 
 
 # Save code
@@ -17,7 +17,6 @@ compare the decodeing performance of postior region with or without prefrontal r
 """
 import warnings
 import os.path as op
-import pickle
 
 import matplotlib.pyplot as plt
 import mne
@@ -58,8 +57,10 @@ sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 
 from config.config import bids_root, plot_param
 
-from D_MEG_function import set_path_ROI_MVPA, ATdata, sensor_data_for_ROI_MVPA
-from D_MEG_function import source_data_for_ROI_MVPA, sub_ROI_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_MVPA, ATdata, sensor_data_for_ROI_MVPA, set_path_ROI_cache
+from D_MEG_function import sub_ROI_for_ROI_MVPA
+from D_MEG_function import cached_sensor_data_for_ROI_MVPA, cached_source_data_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_store, save_ROI_results
 
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter(action='ignore', category=DeprecationWarning)
@@ -155,11 +156,11 @@ cmap = "RdYlBu_r"
 
 
 def Category_PFC(fpath_fw,rank,common_cov,sub_info,surf_label_list,
-                 epochs_rs,conditions_C,conditions_D,conditions_T,task_info):
+                 epochs_rs,conditions_C,conditions_D,conditions_T,task_info,fpath_cache):
     #get data
-    stcs_PFC = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[0])
-    stcs_IIT = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[1])
-    stcs_IITPFC = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[2])
+    stcs_PFC = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[0], fpath_cache)
+    stcs_IIT = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[1], fpath_cache)
+    stcs_IITPFC = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[2], fpath_cache)
   
     
     
@@ -396,6 +397,8 @@ if __name__ == "__main__":
                                                                       subject_id,
                                                                       visit_id,
                                                                       analysis_name)
+    fpath_cache = set_path_ROI_cache(bids_root, subject_id, visit_id)
+    fpath_store = set_path_ROI_store(bids_root, analysis_name)
 
     # 2 Get Sub ROI
     surf_label_list, ROI_Name = sub_ROI_for_ROI_MVPA(fpath_fs, subject_id,analysis_name)
@@ -405,11 +408,12 @@ if __name__ == "__main__":
     # 3 prepare the sensor data
     epochs_rs, \
     rank, common_cov, \
-    conditions_C, conditions_D, conditions_T, task_info = sensor_data_for_ROI_MVPA(fpath_epo,
-                                                                                   sub_info,
-                                                                                   con_T,
-                                                                                   con_C,
-                                                                                   con_D)
+    conditions_C, conditions_D, conditions_T, task_info = cached_sensor_data_for_ROI_MVPA(fpath_epo,
+                                                                                          sub_info,
+                                                                                          con_T,
+                                                                                          con_C,
+                                                                                          con_D,
+                                                                                          fpath_cache)
 
     roi_ccd_acc = dict()
     #roi_ccd_auc = dict()
@@ -419,14 +423,11 @@ if __name__ == "__main__":
     fname_fig = op.join(roi_figure_root,sub_info  + task_info + '_'  + "IITPFC_acc_WCD" + '.png')
     
     wcd_acc=Category_PFC(fpath_fw,rank,common_cov,sub_info,surf_label_list,
-                         epochs_rs,conditions_C,conditions_D,conditions_T,task_info)
+                         epochs_rs,conditions_C,conditions_D,conditions_T,task_info,fpath_cache)
     
 
 
-    fname_data=op.join(roi_data_root, sub_info + '_' + task_info +"_IITPFC_data_Cat" + '.pickle')
-    fw = open(fname_data,'wb')
-    pickle.dump(wcd_acc,fw)
-    fw.close()
+    save_ROI_results(fpath_store, sub_info, task_info, wcd_acc)
     
     
        
@@ -17,7 +17,6 @@ feature selection methods test
 #import os
 import os.path as op
 
-import pickle
 
 
 import argparse
@@ -29,8 +28,10 @@ from sklearn.metrics import accuracy_score
 
 
 from config import bids_root
-from D_MEG_function import set_path_ROI_MVPA, sensor_data_for_ROI_MVPA
-from D_MEG_function import source_data_for_ROI_MVPA,sub_ROI_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_MVPA, sensor_data_for_ROI_MVPA, set_path_ROI_cache
+from D_MEG_function import sub_ROI_for_ROI_MVPA
+from D_MEG_function import cached_sensor_data_for_ROI_MVPA, cached_source_data_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_store, save_ROI_results
 
 from D01_ROI_MVPA_Cat import Category_WCD
 
@@ -141,6 +142,8 @@ if __name__ == "__main__":
                                                                           subject_id,
                                                                           visit_id,
                                                                           analysis_name)
+        fpath_cache = set_path_ROI_cache(bids_root, subject_id, visit_id)
+        fpath_store = set_path_ROI_store(bids_root, analysis_name)
     
         # 2 Get Sub ROI
         surf_label_list, ROI_Name = sub_ROI_for_ROI_MVPA(fpath_fs, subject_id,analysis_name)
@@ -148,11 +151,12 @@ if __name__ == "__main__":
         # 3 prepare the sensor data
         epochs_rs, \
         rank, common_cov, \
-        conditions_C, conditions_D, conditions_T, task_info = sensor_data_for_ROI_MVPA(fpath_epo,
-                                                                                       sub_info,
-                                                                                       con_T,
-                                                                                       con_C,
-                                                                                       con_D)
+        conditions_C, conditions_D, conditions_T, task_info = cached_sensor_data_for_ROI_MVPA(fpath_epo,
+                                                                                              sub_info,
+                                                                                              con_T,
+                                                                                              con_C,
+                                                                                              con_D,
+                                                                                              fpath_cache)
     
         #roi_ccd_acc = dict()
         #roi_ccd_auc = dict()
@@ -164,7 +168,7 @@ if __name__ == "__main__":
     
             # 4 Get Source Data for each ROI
             stcs = []
-            stcs = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[nroi])
+            stcs = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[nroi], fpath_cache)
             
             
             # fname_fig_acc = op.join(roi_figure_root, 
@@ -212,10 +216,7 @@ if __name__ == "__main__":
         
     
     
-        fname_data=op.join(roi_data_root, sub_info + '_' + task_info +"_ROIs_data_" + analysis_name + '.pickle')
-        fw = open(fname_data,'wb')
-        pickle.dump(roi_data,fw)
-        fw.close()
+        save_ROI_results(fpath_store, sub_info, task_info, roi_data)
 
     # #load
     # fr=open(fname_data,'rb')
@@ -16,7 +16,6 @@ feature selection methods test
 
 import os.path as op
 
-import pickle
 
 import matplotlib.pyplot as plt
 
@@ -58,8 +57,10 @@ import sys
 sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 
 from config.config import bids_root
-from D_MEG_function import set_path_ROI_MVPA, ATdata,sensor_data_for_ROI_MVPA
-from D_MEG_function import source_data_for_ROI_MVPA,sub_ROI_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_MVPA, ATdata,sensor_data_for_ROI_MVPA, set_path_ROI_cache
+from D_MEG_function import sub_ROI_for_ROI_MVPA, pseudotrials_average, run_pseudotrials_repeats
+from D_MEG_function import cached_sensor_data_for_ROI_MVPA, cached_source_data_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_store, save_ROI_results, clear_pseudotrials_repeats
 
 ####if need pop-up figures
 # %matplotlib qt5
@@ -101,6 +102,10 @@ parser.add_argument('--nPCA',
                     type=float,
                     default=0.95,
                     help='percentile of PCA selected for source decoding')
+parser.add_argument('--n_jobs',
+                    type=int,
+                    default=-1,
+                    help='number of pseudotrials repeats run in parallel')
 # parser.add_argument('--coreg_path',
 #                     type=str,
 #                     default='/mnt/beegfs/XNAT/COGITATE/MEG/phase_2/processed/bids/derivatives/coreg',
@@ -114,6 +119,7 @@ con_T = opt.cT
 select_F = opt.nF
 n_trials = opt.nT
 nPCA = opt.nPCA
+n_jobs = opt.n_jobs
 
 
 # =============================================================================
@@ -131,7 +137,15 @@ subjects_dir = opt.fs_path
 
 
 
-def Orientation_CTWCD(epochs_rs,stcs,conditions_C,select_F,n_trials,roi_name,score_methods,fname_fig):
+def Orientation_CTWCD_repeat(rng,group_x,group_y,n_trials,sliding,labels):
+    # One pseudotrials repeat: do the average trial
+    new_x, new_y = pseudotrials_average(group_x, group_y, n_trials, rng, labels=labels)
+
+    scores= cross_val_multiscore(sliding, X=new_x, y=new_y, cv=5, n_jobs=1)
+    return np.mean(scores, axis=0)
+
+def Orientation_CTWCD(epochs_rs,stcs,conditions_C,select_F,n_trials,roi_name,score_methods,fname_fig,
+                      n_jobs=1,fpath_repeats=None):
     # setup SVM classifier
     clf = make_pipeline(
         Vectorizer(),
@@ -150,7 +164,7 @@ def Orientation_CTWCD(epochs_rs,stcs,conditions_C,select_F,n_trials,roi_name,sco
     # For multivariable decoding(e,g, 1,2,3, could not use roc_auc),
     # deal with unbalanced trial number, score should use make_scorer(balanced_accuracy_score)
 
-    sliding = GeneralizingEstimator(clf, scoring=score_methods, n_jobs=-1)
+    sliding = GeneralizingEstimator(clf, scoring=score_methods, n_jobs=1)
 
 
     print(' Creating evoked datasets')
@@ -188,39 +202,12 @@ def Orientation_CTWCD(epochs_rs,stcs,conditions_C,select_F,n_trials,roi_name,sco
         group_x=X[con_index]
         group_y=y[con_index]
         
-        scores_per=np.zeros([100,group_x.shape[2],group_x.shape[2]])
-        for num_per in range(100):
-            # do the average trial
-            new_x = []
-            new_y = []
-            for label in range(len(conditions_O)):
-                # Extract the data:
-                data = group_x[np.where(group_y == label+1)]
-                data = np.take(data, np.random.permutation(data.shape[0]), axis=0)
-                avg_x = block_reduce(data, block_size=tuple([n_trials, *[1] * len(data.shape[1:])]),
-                                     func=np.nanmean, cval=np.nan)
-                #block_size
-                #array_like or int
-                #Array containing down-sampling integer factor along each axis. Default block_size is 2.
-                
-                # funccallable
-                # Function object which is used to calculate the return value for each local block. This function must implement an axis parameter. Primary functions are numpy.sum, numpy.min, numpy.max, numpy.mean and numpy.median. See also func_kwargs.
-                
-                # cvalfloat
-                # Constant padding value if image is not perfectly divisible by the block size.
-                
-                # Now generating the labels and group:
-                new_x.append(avg_x)
-                new_y += [label] * avg_x.shape[0]
-
-            new_x = np.concatenate((new_x[0],new_x[1],new_x[2]),axis=0)
-            new_y = np.array(new_y)
-            
-            # average temporal feature (5 point average)
-            new_x=ATdata(new_x)
-            
-            scores= cross_val_multiscore(sliding, X=new_x, y=new_y, cv=5, n_jobs=-1)
-            scores_per[num_per,:,:]=np.mean(scores, axis=0)
+        # Run the pseudotrials repeats in parallel:
+        scores_per = run_pseudotrials_repeats(Orientation_CTWCD_repeat, n_repeats=100, n_jobs=n_jobs,
+                                              fpath_repeats=None if fpath_repeats is None
+                                              else op.join(fpath_repeats, conditions_C[condi]),
+                                              group_x=group_x, group_y=group_y,
+                                              n_trials=n_trials, sliding=sliding, labels=(1, 2, 3))
             
         ctwcd[conditions_C[condi]]=np.mean(scores_per, axis=0)       
     
@@ -289,6 +276,8 @@ if __name__ == "__main__":
                                                                       subject_id,
                                                                       visit_id,
                                                                       analysis_name)
+    fpath_cache = set_path_ROI_cache(bids_root, subject_id, visit_id)
+    fpath_store = set_path_ROI_store(bids_root, analysis_name)
 
     # 2 Get Sub ROI
     surf_label_list, ROI_Name = sub_ROI_for_ROI_MVPA(fpath_fs, subject_id, analysis_name)
@@ -296,11 +285,12 @@ if __name__ == "__main__":
     # 3 prepare the sensor data
     epochs_rs, \
     rank, common_cov, \
-    conditions_C, conditions_D, conditions_T, task_info = sensor_data_for_ROI_MVPA(fpath_epo,
-                                                                                   sub_info,
-                                                                                   con_T,
-                                                                                   con_C,
-                                                                                   con_D)
+    conditions_C, conditions_D, conditions_T, task_info = cached_sensor_data_for_ROI_MVPA(fpath_epo,
+                                                                                          sub_info,
+                                                                                          con_T,
+                                                                                          con_C,
+                                                                                          con_D,
+                                                                                          fpath_cache)
 
     roi_ctwcd_ori_acc = dict()
 
@@ -308,9 +298,9 @@ if __name__ == "__main__":
 
         # 4 Get Source Data for each ROI
         stcs = []
-        stcs = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, 
+        stcs = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, 
                                         rank, common_cov, 
-                                        sub_info, surf_label_list[nroi])
+                                        sub_info, surf_label_list[nroi], fpath_cache)
         
        
         ### wcd_orientation
@@ -326,7 +316,12 @@ if __name__ == "__main__":
                                       n_trials,
                                       # nPCA,
                                       roi_name, score_methods,
-                                      fname_fig_acc)
+                                      fname_fig_acc,
+                                      n_jobs=n_jobs,
+                                      fpath_repeats=op.join(roi_data_root, "repeats",
+                                                            sub_info + task_info + '_' + roi_name
+                                                            + '_nF' + str(select_F) + '_nT' + str(n_trials)
+                                                            + "_acc_CTWCD_ori"))
 
         roi_ctwcd_ori_acc[roi_name] = ctwcd_ori_acc
         
@@ -334,10 +329,9 @@ if __name__ == "__main__":
     
     roi_data['ctwcd_ori_acc']=roi_ctwcd_ori_acc
 
-    fname_data=op.join(roi_data_root, sub_info + '_' + task_info +"_ROIs_data_GAT_Ori" + '.pickle')
-    fw = open(fname_data,'wb')
-    pickle.dump(roi_data,fw)
-    fw.close()
+    save_ROI_results(fpath_store, sub_info, task_info, roi_data)
+    # The repeats are only kept to resume a killed job:
+    clear_pseudotrials_repeats(op.join(roi_data_root, "repeats"), prefix=sub_info + task_info + '_')
 
     # #load
     # fr=open(fname_data,'rb')
@@ -13,7 +13,6 @@ feature: spatial pattern (S)
 """
 
 import os.path as op
-import pickle
 
 
 import matplotlib.pyplot as plt
@@ -35,8 +34,10 @@ from scipy.ndimage import gaussian_filter
 
 from rsa_helper_functions_meg import all_to_all_within_class_dist
 
-from D_MEG_function import set_path_ROI_MVPA, ATdata,sensor_data_for_ROI_MVPA_ID
-from D_MEG_function import source_data_for_ROI_MVPA,sub_ROI_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_MVPA, ATdata,sensor_data_for_ROI_MVPA_ID, set_path_ROI_cache
+from D_MEG_function import sub_ROI_for_ROI_MVPA
+from D_MEG_function import cached_sensor_data_for_ROI_MVPA, cached_source_data_for_ROI_MVPA
+from D_MEG_function import set_path_ROI_store, save_ROI_results
 
 
 
@@ -234,6 +235,8 @@ if __name__ == "__main__":
                                                                       subject_id,
                                                                       visit_id,
                                                                       analysis_name)
+    fpath_cache = set_path_ROI_cache(bids_root, subject_id, visit_id)
+    fpath_store = set_path_ROI_store(bids_root, analysis_name)
 
     # 2 Get Sub ROI
     surf_label_list, ROI_Name = sub_ROI_for_ROI_MVPA(fpath_fs, subject_id,analysis_name)
@@ -241,12 +244,14 @@ if __name__ == "__main__":
     # 3 prepare the sensor data
     epochs_rs, \
     rank, common_cov, \
-    conditions_C, conditions_D, conditions_T, task_info = sensor_data_for_ROI_MVPA_ID(fpath_epo,
-                                                                                   sub_info,
-                                                                                   con_T,
-                                                                                   con_C,
-                                                                                   con_D,
-                                                                                   remove_too_few_trials=True)
+    conditions_C, conditions_D, conditions_T, task_info = cached_sensor_data_for_ROI_MVPA(fpath_epo,
+                                                                                          sub_info,
+                                                                                          con_T,
+                                                                                          con_C,
+                                                                                          con_D,
+                                                                                          fpath_cache,
+                                                                                          sensor_fun=sensor_data_for_ROI_MVPA_ID,
+                                                                                          remove_too_few_trials=True)
 
 
     
@@ -259,7 +264,7 @@ if __name__ == "__main__":
 
         # 4 Get Source Data for each ROI
         stcs = []
-        stcs = source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[nroi])
+        stcs = cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label_list[nroi], fpath_cache)
         
         ### CTCCD
         
@@ -288,10 +293,7 @@ if __name__ == "__main__":
         roi_data['feature']=roi_feature
         
 
-        fname_data=op.join(roi_data_root, sub_info + '_' + task_info + roi_name + "_ROIs_data_RSA_ID" + '.pickle')
-        fw = open(fname_data,'wb')
-        pickle.dump(roi_data,fw)
-        fw.close()
+        save_ROI_results(fpath_store, sub_info, task_info, {roi_name: roi_data})
         
         #pot results
         # #1 scoring methods with accuracy score
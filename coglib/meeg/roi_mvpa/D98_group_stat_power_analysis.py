@@ -0,0 +1,114 @@
+"""
+====================
+D98. Power analysis of the group statistics
+====================
+Simulate cohorts of decoding accuracies (time resolved or temporal generalization) for a range of effect sizes and
+numbers of subjects, and measure the sensitivity and throughput of the group statistics:
+- Bayes factors of the binomial test on the trials pooled across subjects (compute_bf_batch)
+- cluster based sign flip permutation tests of the accuracy against chance (permutation_cluster_1samp_batch), all the
+simulated cohorts of a condition being tested in one batch
+
+@author: Ling Liu  ling.liu@pku.edu.cn
+
+"""
+import os.path as op
+import os
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from scipy import stats as stats
+
+from config import bids_root
+
+from bayes_factor_fun import compute_bf_batch
+from decoding_simulation import sim_decoding_cohort
+from grid_cluster_stats import permutation_cluster_1samp_batch
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--effect-sizes', type=float, nargs='*', default=[0, 0.02, 0.05, 0.1],
+                    help='peak decoding accuracy above chance of the simulated effects')
+parser.add_argument('--subjects', type=int, nargs='*', default=[10, 20, 30, 40],
+                    help='number of subjects of the simulated cohorts')
+parser.add_argument('--n-sim', type=int, default=100,
+                    help='number of simulated cohorts per effect size and number of subjects')
+parser.add_argument('--ntrials', type=int, default=100,
+                    help='number of trials of each subject')
+parser.add_argument('--sfreq', type=int, default=50,
+                    help='sampling frequency of the simulated accuracies')
+parser.add_argument('--gat', action='store_true',
+                    help='simulate temporal generalization matrices instead of time series')
+parser.add_argument('--n-perm', type=int, default=1000,
+                    help='number of permutations of the cluster tests')
+parser.add_argument('--seed', type=int, default=0,
+                    help='seed of the simulations')
+
+opt = parser.parse_args()
+
+
+def power_analysis(effect_sizes, subject_counts, n_sim=100, sim_kwargs=None, n_permutations=1000, alpha=0.05,
+                   bf_threshold=3, chance=0.5, ntrials=100, seed=None, batch_size=50):
+    # One row per effect size x number of subjects: proportion of the simulations with a detected effect (power),
+    # proportion of the effect points detected (sensitivity), proportion of the points without effect detected
+    # (false_positive) and time spent in each engine
+    sim_kwargs = dict() if sim_kwargs is None else sim_kwargs
+    seeds = np.random.SeedSequence(seed).spawn(len(effect_sizes) * len(subject_counts) * n_sim)
+    rows = []
+    for ei, effect_size in enumerate(effect_sizes):
+        for si, n_subjects in enumerate(subject_counts):
+            sim_seeds = seeds[(ei * len(subject_counts) + si) * n_sim:(ei * len(subject_counts) + si + 1) * n_sim]
+            # One binomial draw per simulated cohort, simulations x subjects x time (x time):
+            cohorts = [sim_decoding_cohort(n_subjects, effect_size=effect_size, ntrials=ntrials, chance=chance,
+                                           seed=np.random.default_rng(sim_seed), **sim_kwargs)
+                       for sim_seed in sim_seeds]
+            k = np.stack([cohort[0] for cohort in cohorts])
+            accuracy = np.stack([cohort[1] for cohort in cohorts])
+            # Points where the population effect is above 1% of its peak (none without effect):
+            effect_mask = (np.mean(accuracy, axis=1) - chance > 0.01 * effect_size) & (effect_size > 0)
+
+            # Bayes factors of the trials pooled across subjects, with a uniform prior (the p-values aren't used):
+            t_start = time.perf_counter()
+            bf = compute_bf_batch(np.sum(k, axis=1), ntrials * n_subjects, 1, 1, p=chance)
+            bf_time = time.perf_counter() - t_start
+            bf_detected = (bf > bf_threshold) & (np.sum(k, axis=1) > chance * ntrials * n_subjects)
+
+            # Cluster tests of all the simulations at once, subjects x simulations x time (x time):
+            t_start = time.perf_counter()
+            thresh = stats.t.ppf(1 - alpha, n_subjects - 1)
+            x = np.swapaxes(k / ntrials - chance, 0, 1)
+            results = permutation_cluster_1samp_batch(x, threshold=thresh, n_permutations=n_permutations, tail=1,
+                                                      seed=seed, batch_size=batch_size)
+            cluster_time = time.perf_counter() - t_start
+            cluster_detected = np.stack([
+                np.any([c for c, p in zip(res['cluster'], res['cluster_p']) if p < alpha] +
+                       [np.zeros(x.shape[2:], dtype=bool)], axis=0) for res in results])
+
+            row = dict(effect_size=effect_size, n_subjects=n_subjects, n_sim=n_sim)
+            for engine, detected, duration in [('bf', bf_detected, bf_time), ('cluster', cluster_detected,
+                                                                             cluster_time)]:
+                grid_axes = tuple(range(1, detected.ndim))
+                row[engine + '_power'] = np.mean(np.any(detected & effect_mask, axis=grid_axes))
+                with np.errstate(invalid='ignore'):
+                    row[engine + '_sensitivity'] = np.sum(detected & effect_mask) / np.sum(effect_mask)
+                    row[engine + '_false_positive'] = np.sum(detected & ~effect_mask) / np.sum(~effect_mask)
+                row[engine + '_time'] = duration
+                row[engine + '_tests_per_s'] = detected.size / duration
+            print(row)
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    power_data_root = op.join(bids_root, "derivatives", 'decoding', 'roi_mvpa', 'BF', 'power_analysis')
+    if not op.exists(power_data_root):
+        os.makedirs(power_data_root)
+
+    sim_kwargs = dict(t0=-0.2, tmax=1, sfreq=opt.sfreq, onset=0.05, offset=0.8, shape='gamma', width=0.1,
+                      effect_jitter=0.01, onset_jitter=0.05, generalization=opt.gat)
+    power_table = power_analysis(opt.effect_sizes, opt.subjects, n_sim=opt.n_sim, sim_kwargs=sim_kwargs,
+                                 n_permutations=opt.n_perm, ntrials=opt.ntrials, seed=opt.seed)
+
+    csv_fname = op.join(power_data_root, 'power_analysis_' + ('GAT' if opt.gat else 'time') + '.csv')
+    power_table.to_csv(csv_fname, sep=',', index=False, header=True, na_rep='NaN')
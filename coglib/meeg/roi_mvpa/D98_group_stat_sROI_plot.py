@@ -11,7 +11,6 @@ import os.path as op
 import os
 import argparse
 
-import pickle
 import mne
 
 
@@ -36,6 +35,8 @@ sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 
 from config.config import bids_root,plot_param
 from sublist import sub_list
+from D_MEG_function import set_path_ROI_store, open_ROI_results, close_ROI_results
+from grid_cluster_stats import group_cluster_table, cluster_stat_from_table
 
 
 parser = argparse.ArgumentParser()
@@ -433,41 +434,31 @@ def gc2df(gc_mean,test_win_on,test_win_off,task_index,chance_index):
     
     return ts_df,T1,pval1,T2,pval2
 
-def stat_cluster_1sample(gc_mean,test_win_on,test_win_off,task_index,chance_index):
+def cluster_threshold(n_observations):
     # define theresh
     pval = 0.05  # arbitrary
-    tail = 0 # two-tailed
-    n_observations=gc_mean.shape[1]
-    stat_time_points=gc_mean[:,:,test_win_on:test_win_off].shape[2]
     df = n_observations - 1  # degrees of freedom for the test
     thresh = stats.t.ppf(1 - pval / 2, df)  # two-tailed, t distribution
+    return thresh
+
+def stat_cluster_1sample(gc_mean,test_win_on,test_win_off,task_index,chance_index,C_stats=None):
+    tail = 0 # two-tailed
+    n_observations=gc_mean.shape[1]
+    
+    if C_stats is None:
+        cluster_table=group_cluster_table({(task_index[ci],):gc_mean[ci,:,test_win_on:test_win_off]-chance_index for ci in range(2)},
+                                          ['condition'],threshold=cluster_threshold(n_observations),n_permutations=10000,tail=tail)
+        C_stats=[cluster_stat_from_table(cluster_table,condition=task_index[ci]) for ci in range(2)]
+    C1_stat,C2_stat=C_stats
     
     df1 = pd.DataFrame(gc_mean[0,:,30:251], columns=time_point)
     df1.insert(loc=0, column='SUBID', value=sub_list)
     df1.insert(loc=0, column='Task',value=task_index[0])
     
-    T_obs_1, clusters_1, cluster_p_values_1, H0_1 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[0,:,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=10000, tail=tail, out_type='indices',verbose=None)
-    
-    C1_stat=dict()
-    C1_stat['T_obs']=T_obs_1
-    C1_stat['cluster']=clusters_1
-    C1_stat['cluster_p']=cluster_p_values_1
-    
     df2 = pd.DataFrame(gc_mean[1,:,30:251], columns=time_point)
     df2.insert(loc=0, column='SUBID', value=sub_list)
     df2.insert(loc=0, column='Task',value=task_index[1])
     
-    T_obs_2, clusters_2, cluster_p_values_2, H0_2 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[1,:,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=10000, tail=tail, out_type='indices',verbose=None)
-    
-    C2_stat=dict()
-    C2_stat['T_obs']=T_obs_2
-    C2_stat['cluster']=clusters_2
-    C2_stat['cluster_p']=cluster_p_values_2
-    
     
     df=df1.append(df2)
     
@@ -475,33 +466,45 @@ def stat_cluster_1sample(gc_mean,test_win_on,test_win_off,task_index,chance_inde
     
     return ts_df,C1_stat,C2_stat
 
-def stat_cluster_1sample_ori(gc_mean,test_win_on,test_win_off,task_index,chance_index):
-    # define theresh
-    pval = 0.05  # arbitrary
+def stat_cluster_1sample_ori(gc_mean,test_win_on,test_win_off,task_index,chance_index,C_stats=None):
     tail = 0 # two-tailed
     n_observations=gc_mean.shape[1]
-    stat_time_points=gc_mean[:,:,test_win_on:test_win_off].shape[2]
-    df = n_observations - 1  # degrees of freedom for the test
-    thresh = stats.t.ppf(1 - pval / 2, df)  # two-tailed, t distribution
+    
+    if C_stats is None:
+        cluster_table=group_cluster_table({(task_index[0],):gc_mean[0,:,test_win_on:test_win_off]-chance_index},
+                                          ['condition'],threshold=cluster_threshold(n_observations),n_permutations=10000,tail=tail)
+        C_stats=[cluster_stat_from_table(cluster_table,condition=task_index[0])]
+    C1_stat=C_stats[0]
     
     df1 = pd.DataFrame(gc_mean[0,:,30:251], columns=time_point)
     df1.insert(loc=0, column='SUBID', value=sub_list)
     df1.insert(loc=0, column='Task',value=task_index[0])
     
-    T_obs_1, clusters_1, cluster_p_values_1, H0_1 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[0,:,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=10000, tail=tail, out_type='indices',verbose=None)
-    
-    C1_stat=dict()
-    C1_stat['T_obs']=T_obs_1
-    C1_stat['cluster']=clusters_1
-    C1_stat['cluster_p']=cluster_p_values_1
-    
     
     ts_df = pd.melt(df1, id_vars=['SUBID','Task'], var_name='time(s)', value_name='decoding accuracy(%)', value_vars=time_point)
     
     return ts_df,C1_stat
 
+def cluster_table_1sample(group_data,roi_names,decodings,test_win_on,test_win_off,chance_index):
+    # All the ROI x decoding x condition tests share the same sign flips, their clusters are gathered in one table
+    tests=dict()
+    for roi_name in roi_names:
+        for decoding_name, cond_name in decodings:
+            if len(cond_name)==1:
+                roi_g=dat2g_ori(group_data,roi_name,cond_name=cond_name[0],decoding_name=decoding_name)
+            else:
+                roi_g=dat2g(group_data,roi_name,cond_name=cond_name,decoding_name=decoding_name)
+            for ci, cond in enumerate(cond_name):
+                tests[(roi_name,decoding_name,cond)]=roi_g[ci,:,test_win_on:test_win_off]-chance_index
+    
+    cluster_table=group_cluster_table(tests,['roi','decoding','condition'],threshold=cluster_threshold(len(sub_list)),
+                                      n_permutations=10000,tail=0)
+    
+    csv_fname=op.join(stat_data_root, str(test_win_on) + '_' + str(test_win_off)+"_acc_cluster_table" + '.csv')
+    cluster_table.drop(columns='indices').to_csv(csv_fname,sep=',',index=False,header=True)
+    
+    return cluster_table
+
 
 def stat_cluster_1sample_roi(ROI1_data,ROI2_data,test_win_on,test_win_off,ROI_name):
     
@@ -598,7 +601,7 @@ def dat2gat2(dat,roi_name,cond_name,decoding_name):
     return roi_ccd_g   
 
 
-def ccd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=15):
+def ccd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=15,cluster_table=None):
 
 
     time_point = np.array(range(-200,2001, 10))/1000
@@ -626,7 +629,11 @@ def ccd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_in
     #cluster based methods
     
     #stat
-    ts_df_cluster,C1_stat,C2_stat=stat_cluster_1sample(ROI_ccd_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    if cluster_table is None:
+        C_stats=None
+    else:
+        C_stats=[cluster_stat_from_table(cluster_table,roi=roi_name,decoding='ccd_acc',condition=cond) for cond in ['RE2IR','IR2RE']]
+    ts_df_cluster,C1_stat,C2_stat=stat_cluster_1sample(ROI_ccd_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index,C_stats=C_stats)
     
     fname_cluster_fig= op.join(stat_figure_root, roi_name + '_'+str(test_win_on) + '_' + str(test_win_off)+"_acc_CCD_cluster" + '.svg')
     
@@ -646,7 +653,7 @@ def ccd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_in
     df2csv(ROI_ccd_g_dat,task_index,csv_fname)
     
 
-def wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=15):
+def wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=15,cluster_table=None):
 
 
     time_point = np.array(range(-200,2001, 10))/1000
@@ -673,7 +680,11 @@ def wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_in
     #cluster based methods
     
     #stat
-    ts_df_cluster,C1_stat,C2_stat=stat_cluster_1sample(ROI_wcd_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    if cluster_table is None:
+        C_stats=None
+    else:
+        C_stats=[cluster_stat_from_table(cluster_table,roi=roi_name,decoding='wcd_acc',condition=cond) for cond in ['Irrelevant','Relevant non-target']]
+    ts_df_cluster,C1_stat,C2_stat=stat_cluster_1sample(ROI_wcd_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index,C_stats=C_stats)
     
     fname_cluster_fig= op.join(stat_figure_root, roi_name + '_'+str(test_win_on) + '_' + str(test_win_off)+"_acc_WCD_cluster" + '.svg')
     
@@ -773,7 +784,7 @@ def ROI_ccd_plt(group_data,decoding_method ='ccd', test_win_on=50, test_win_off=
 
 
 
-def wcd_ori_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=15):
+def wcd_ori_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=15,cluster_table=None):
 
 
     time_point = np.array(range(-200,2001, 10))/1000
@@ -800,7 +811,11 @@ def wcd_ori_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chanc
     #cluster based methods
     
     #stat
-    ts_df_cluster,C1_stat=stat_cluster_1sample_ori(ROI_ori_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    if cluster_table is None:
+        C_stats=None
+    else:
+        C_stats=[cluster_stat_from_table(cluster_table,roi=roi_name,decoding='wcd_ori_acc',condition=cond) for cond in conditions_C[:1]]
+    ts_df_cluster,C1_stat=stat_cluster_1sample_ori(ROI_ori_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index,C_stats=C_stats)
     
     fname_cluster_fig= op.join(stat_figure_root, roi_name + '_'+str(test_win_on) + '_' + str(test_win_off)+"_acc_WCD_ori_cluster" + '.svg')
     
@@ -878,176 +893,181 @@ task_info = "_" + "".join(con_Tname) + "_" + "".join(con_C[0])
 print(task_info)
 
 
-fname_data=op.join(group_deriv_root, task_info +"_data_group_" + analysis_name +
-                   '.pickle')
-
-fr=open(fname_data,'rb')
-group_data=pickle.load(fr)
-
-
-
-if analysis_name=='Cat' or analysis_name=='Cat_offset_control':
-    #CCD: cross condition decoding
-    #GNW
+# The results of each subject are read from the result store, only when they are indexed
+group_data=open_ROI_results(set_path_ROI_store(bids_root, analysis_name), task_info, sub_list, visit_id)
+try:
+    if analysis_name=='Cat' or analysis_name=='Cat_offset_control':
+        # All the ROI x decoding x condition tests are computed at once, with the same sign flips
+        cluster_table=cluster_table_1sample(group_data,['GNW','IIT'],[('ccd_acc',['RE2IR','IR2RE']),('wcd_acc',['Irrelevant','Relevant non-target'])],test_win_on=50,test_win_off=200,chance_index=50)
+        #CCD: cross condition decoding
+        #GNW
     
-    # # 300ms to 500ms
-    # ccd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
+        # # 300ms to 500ms
+        # ccd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
     
-    # 0ms to 1500ms
-    ccd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        ccd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
     
-    #IIT
+        #IIT
     
-    # # 300ms to 500ms
-    # ccd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=251,chance_index=50,y_index=40)
+        # # 300ms to 500ms
+        # ccd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=251,chance_index=50,y_index=40)
     
-    # 0ms to 1500ms
-    ccd_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        ccd_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
     
     
-    #WCD: within condition decoding
-    #GNW
+        #WCD: within condition decoding
+        #GNW
     
-    # # 300ms to 500ms
-    # wcd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
+        # # 300ms to 500ms
+        # wcd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
     
-    # 0ms to 1500ms
-    wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
     
-    #IIT
+        #IIT
     
-    # # 300ms to 500ms
-    # wcd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=251,chance_index=50,y_index=40)
+        # # 300ms to 500ms
+        # wcd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=251,chance_index=50,y_index=40)
     
-    # 0ms to 1500ms
-    wcd_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        wcd_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
 
-    #compare IIT with IIT+GNW(FP)
-    ROI_ccd_plt(group_data,decoding_method ='ccd', test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
+        #compare IIT with IIT+GNW(FP)
+        ROI_ccd_plt(group_data,decoding_method ='ccd', test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
     
-    ROI_wcd_plt(group_data,decoding_method ='wcd', test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
+        ROI_wcd_plt(group_data,decoding_method ='wcd', test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
 
 
-elif analysis_name=='Cat_MT_control':
-    ccd_plt(group_data,roi_name='MT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
-    wcd_plt(group_data,roi_name='MT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40) 
+    elif analysis_name=='Cat_MT_control':
+        # All the ROI x decoding x condition tests are computed at once, with the same sign flips
+        cluster_table=cluster_table_1sample(group_data,['MT'],[('ccd_acc',['RE2IR','IR2RE']),('wcd_acc',['Irrelevant','Relevant non-target'])],test_win_on=50,test_win_off=200,chance_index=50)
+        ccd_plt(group_data,roi_name='MT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
+        wcd_plt(group_data,roi_name='MT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table) 
     
-elif analysis_name=='Cat_baseline':
+    elif analysis_name=='Cat_baseline':
+        # All the ROI x decoding x condition tests are computed at once, with the same sign flips
+        cluster_table=cluster_table_1sample(group_data,['GNW','IIT'],[('wcd_acc',['Irrelevant','Relevant non-target'])],test_win_on=50,test_win_off=200,chance_index=50)
         
-    wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
-    wcd_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40)
-
-elif analysis_name=='Ori':
-    
-    wcd_ori_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=40)
-    wcd_ori_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=40)
-    
-elif analysis_name=='Cat_PFC':
-    cond_name=['IIT','IITPFC_f','IITPFC_m']
-    colors = {
-        "IIT": [1,0,0
-        ],
-        "IITPFC_f": [0,0,1
-        ],    
-        "IITPFC_m": [0,0,1
-            ]}
-    decoding_method=analysis_name
-    #task_index=['Irrelevant','Relevant non-target']
-    #get decoding data
-    PFC_data=dat2g_PFC(group_data,cond_name)   
-    
-    
-    time_point = np.array(range(-200,2001, 10))/1000
+        wcd_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
+        wcd_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=40,cluster_table=cluster_table)
+
+    elif analysis_name=='Ori':
+        # All the ROI x decoding x condition tests are computed at once, with the same sign flips
+        cluster_table=cluster_table_1sample(group_data,['GNW','IIT'],[('wcd_ori_acc',conditions_C[:1])],test_win_on=50,test_win_off=200,chance_index=33.3)
+    
+        wcd_ori_plt(group_data,roi_name='GNW',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=40,cluster_table=cluster_table)
+        wcd_ori_plt(group_data,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=40,cluster_table=cluster_table)
+    
+    elif analysis_name=='Cat_PFC':
+        cond_name=['IIT','IITPFC_f','IITPFC_m']
+        colors = {
+            "IIT": [1,0,0
+            ],
+            "IITPFC_f": [0,0,1
+            ],    
+            "IITPFC_m": [0,0,1
+                ]}
+        decoding_method=analysis_name
+        #task_index=['Irrelevant','Relevant non-target']
+        #get decoding data
+        PFC_data=dat2g_PFC(group_data,cond_name)   
+    
+    
+        time_point = np.array(range(-200,2001, 10))/1000
    
-    #cluster based methods
-    test_win_on=50
-    test_win_off=200
-    #stat
-    ts1_df_cluster,C1_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[1,:,:],test_win_on,test_win_off,['IIT','IITPFC_f'])
-    
-    fname_cluster_fig= op.join(stat_figure_root, decoding_method + 
-                               '_'+str(test_win_on) + '_' + str(test_win_off) +
-                               '_IITPFC_feature_diff_acc_cluster.svg')
-    
-    # fname_cluster_fig= op.join(data_path, decoding_method + 
-    #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
-    #                            '_IITPFC_feature_diff_acc_cluster.svg')
-    
-    #plot
-    sig1_cluster=df_plot_ROI_cluster(ts1_df_cluster,C1_stat,time_point,
-                                              test_win_on,test_win_off,
-                                              chance_index=50,y_index=50,
-                                              fname_fig=fname_cluster_fig)
-    
-    #stat
-    ts2_df_cluster,C2_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[2,:,:],test_win_on,test_win_off,['IIT','IITPFC_m'])
-    
-    fname_cluster_fig2= op.join(stat_figure_root, decoding_method + 
-                               '_'+str(test_win_on) + '_' + str(test_win_off) +
-                               '_IITPFC_model_diff_acc_cluster.svg')
-    
-    # fname_cluster_fig2= op.join(data_path, decoding_method + 
-    #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
-    #                            '_IITPFC_model_diff_acc_cluster.svg')
-    
-    #plot
-    sig1_cluster=df_plot_ROI_cluster(ts2_df_cluster,C2_stat,time_point,
-                                              test_win_on,test_win_off,
-                                              chance_index=50,y_index=50,
-                                              fname_fig=fname_cluster_fig2)
-
-
-elif analysis_name=='Ori_PFC':
-    cond_name=['IIT','IITPFC_f','IITPFC_m']
-    colors = {
-        "IIT": [1,0,0
-        ],
-        "IITPFC_f": [0,0,1
-        ],    
-        "IITPFC_m": [0,0,1
-            ]}
-    decoding_method=analysis_name
-    #task_index=['Irrelevant','Relevant non-target']
-    #get decoding data
-    PFC_data=dat2g_PFC(group_data,cond_name)   
-    
-    
-    time_point = np.array(range(-200,2001, 10))/1000
+        #cluster based methods
+        test_win_on=50
+        test_win_off=200
+        #stat
+        ts1_df_cluster,C1_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[1,:,:],test_win_on,test_win_off,['IIT','IITPFC_f'])
+    
+        fname_cluster_fig= op.join(stat_figure_root, decoding_method + 
+                                   '_'+str(test_win_on) + '_' + str(test_win_off) +
+                                   '_IITPFC_feature_diff_acc_cluster.svg')
+    
+        # fname_cluster_fig= op.join(data_path, decoding_method + 
+        #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
+        #                            '_IITPFC_feature_diff_acc_cluster.svg')
+    
+        #plot
+        sig1_cluster=df_plot_ROI_cluster(ts1_df_cluster,C1_stat,time_point,
+                                                  test_win_on,test_win_off,
+                                                  chance_index=50,y_index=50,
+                                                  fname_fig=fname_cluster_fig)
+    
+        #stat
+        ts2_df_cluster,C2_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[2,:,:],test_win_on,test_win_off,['IIT','IITPFC_m'])
+    
+        fname_cluster_fig2= op.join(stat_figure_root, decoding_method + 
+                                   '_'+str(test_win_on) + '_' + str(test_win_off) +
+                                   '_IITPFC_model_diff_acc_cluster.svg')
+    
+        # fname_cluster_fig2= op.join(data_path, decoding_method + 
+        #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
+        #                            '_IITPFC_model_diff_acc_cluster.svg')
+    
+        #plot
+        sig1_cluster=df_plot_ROI_cluster(ts2_df_cluster,C2_stat,time_point,
+                                                  test_win_on,test_win_off,
+                                                  chance_index=50,y_index=50,
+                                                  fname_fig=fname_cluster_fig2)
+
+
+    elif analysis_name=='Ori_PFC':
+        cond_name=['IIT','IITPFC_f','IITPFC_m']
+        colors = {
+            "IIT": [1,0,0
+            ],
+            "IITPFC_f": [0,0,1
+            ],    
+            "IITPFC_m": [0,0,1
+                ]}
+        decoding_method=analysis_name
+        #task_index=['Irrelevant','Relevant non-target']
+        #get decoding data
+        PFC_data=dat2g_PFC(group_data,cond_name)   
+    
+    
+        time_point = np.array(range(-200,2001, 10))/1000
    
-    #cluster based methods
-    test_win_on=50
-    test_win_off=200
-    #stat
-    ts1_df_cluster,C1_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[1,:,:],test_win_on,test_win_off,['IIT','IITPFC_f'])
-    
-    fname_cluster_fig= op.join(stat_figure_root, decoding_method + 
-                               '_'+str(test_win_on) + '_' + str(test_win_off) +
-                               '_IITPFC_feature_diff_acc_cluster.svg')
-    
-    # fname_cluster_fig= op.join(data_path, decoding_method + 
-    #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
-    #                            '_IITPFC_feature_diff_acc_cluster.svg')
-    
-    #plot
-    sig1_cluster=df_plot_ROI_cluster(ts1_df_cluster,C1_stat,time_point,
-                                              test_win_on,test_win_off,
-                                              chance_index=33.3,y_index=50,
-                                              fname_fig=fname_cluster_fig)
-    
-    #stat
-    ts2_df_cluster,C2_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[2,:,:],test_win_on,test_win_off,['IIT','IITPFC_m'])
-    
-    fname_cluster_fig2= op.join(stat_figure_root, decoding_method + 
-                               '_'+str(test_win_on) + '_' + str(test_win_off) +
-                               '_IITPFC_model_diff_acc_cluster.svg')
-    
-    # fname_cluster_fig2= op.join(data_path, decoding_method + 
-    #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
-    #                            '_IITPFC_model_diff_acc_cluster.svg')
-    
-    #plot
-    sig1_cluster=df_plot_ROI_cluster(ts2_df_cluster,C2_stat,time_point,
-                                              test_win_on,test_win_off,
-                                              chance_index=33.3,y_index=50,
-                                              fname_fig=fname_cluster_fig2)       
-    #ROI_wcd_ori_plt(group_data,decoding_method ='wcd', test_win_on=50, test_win_off=200,chance_index=33.3,y_index=40)    
+        #cluster based methods
+        test_win_on=50
+        test_win_off=200
+        #stat
+        ts1_df_cluster,C1_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[1,:,:],test_win_on,test_win_off,['IIT','IITPFC_f'])
+    
+        fname_cluster_fig= op.join(stat_figure_root, decoding_method + 
+                                   '_'+str(test_win_on) + '_' + str(test_win_off) +
+                                   '_IITPFC_feature_diff_acc_cluster.svg')
+    
+        # fname_cluster_fig= op.join(data_path, decoding_method + 
+        #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
+        #                            '_IITPFC_feature_diff_acc_cluster.svg')
+    
+        #plot
+        sig1_cluster=df_plot_ROI_cluster(ts1_df_cluster,C1_stat,time_point,
+                                                  test_win_on,test_win_off,
+                                                  chance_index=33.3,y_index=50,
+                                                  fname_fig=fname_cluster_fig)
+    
+        #stat
+        ts2_df_cluster,C2_stat=stat_cluster_1sample_roi(PFC_data[0,:,:],PFC_data[2,:,:],test_win_on,test_win_off,['IIT','IITPFC_m'])
+    
+        fname_cluster_fig2= op.join(stat_figure_root, decoding_method + 
+                                   '_'+str(test_win_on) + '_' + str(test_win_off) +
+                                   '_IITPFC_model_diff_acc_cluster.svg')
+    
+        # fname_cluster_fig2= op.join(data_path, decoding_method + 
+        #                            '_'+str(test_win_on) + '_' + str(test_win_off) +
+        #                            '_IITPFC_model_diff_acc_cluster.svg')
+    
+        #plot
+        sig1_cluster=df_plot_ROI_cluster(ts2_df_cluster,C2_stat,time_point,
+                                                  test_win_on,test_win_off,
+                                                  chance_index=33.3,y_index=50,
+                                                  fname_fig=fname_cluster_fig2)       
+        #ROI_wcd_ori_plt(group_data,decoding_method ='wcd', test_win_on=50, test_win_off=200,chance_index=33.3,y_index=40)    
+finally:
+    close_ROI_results(group_data)
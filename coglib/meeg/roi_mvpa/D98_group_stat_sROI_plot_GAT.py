@@ -12,7 +12,6 @@ import os.path as op
 import os
 import argparse
 
-import pickle
 import mne
 
 
@@ -38,6 +37,8 @@ sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 from config.config import bids_root
 
 from sublist import sub_list
+from D_MEG_function import set_path_ROI_store, open_ROI_results, close_ROI_results
+from grid_cluster_stats import permutation_cluster_1samp_batch
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--visit',
@@ -67,6 +68,8 @@ parser.add_argument('--analysis',
                     type=str,
                     default='GAT_Cat',
                     help='the name for anlaysis, e.g. Tall for 3 durations combined analysis')
+parser.add_argument('--tfce', action='store_true',
+                    help='threshold free cluster enhancement instead of a fixed cluster forming threshold')
 
 
 opt = parser.parse_args()
@@ -342,58 +345,37 @@ def df_plot_cluster_GAT_ori(gc_mean,C1_stat,time_point,test_win_on,test_win_off,
 
 
 
-def stat_cluster_1sample_GAT(gc_mean,test_win_on,test_win_off,task_index,chance_index):
-    # define theresh
+def stat_cluster_1sample_GAT_batch(roi_gats,test_win_on,test_win_off,chance_index,tfce=False):
+    # All the ROI x condition GAT maps are tested at once, with the same sign flips
     pval = 0.05  # arbitrary
     tail = 0 # two-tailed
-    n_observations=gc_mean.shape[1]
-    stat_time_points=gc_mean[:,:,test_win_on:test_win_off,test_win_on:test_win_off].shape[2]
+    n_observations=roi_gats[0].shape[1]
     df = n_observations - 1  # degrees of freedom for the test
-    thresh = stats.t.ppf(1 - pval / 2, df)  # two-tailed, t distribution
-    
-    
+    if tfce:
+        thresh = dict(start=0, step=0.2)
+    else:
+        thresh = stats.t.ppf(1 - pval / 2, df)  # two-tailed, t distribution
     
-    T_obs_1, clusters_1, cluster_p_values_1, H0_1 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[0,:,test_win_on:test_win_off,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=1000, tail=tail, out_type='mask',verbose=None)
+    # subjects x tests x time x time:
+    X = np.concatenate([gc_mean[:,:,test_win_on:test_win_off,test_win_on:test_win_off] for gc_mean in roi_gats],
+                       axis=0).transpose(1,0,2,3)-chance_index
+    results = permutation_cluster_1samp_batch(X, threshold=thresh, n_permutations=1000, tail=tail)
     
-    C1_stat=dict()
-    C1_stat['T_obs']=T_obs_1
-    C1_stat['cluster']=clusters_1
-    C1_stat['cluster_p']=cluster_p_values_1
-    
-   
-    T_obs_2, clusters_2, cluster_p_values_2, H0_2 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[1,:,test_win_on:test_win_off,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=1000, tail=tail, out_type='indices',verbose=None)
+    C_stats=[]
+    for gc_mean in roi_gats:
+        C_stats.append([dict(T_obs=res['T_obs'],cluster=res['cluster'],cluster_p=res['cluster_p'])
+                        for res in results[:gc_mean.shape[0]]])
+        results=results[gc_mean.shape[0]:]
     
-    C2_stat=dict()
-    C2_stat['T_obs']=T_obs_2
-    C2_stat['cluster']=clusters_2
-    C2_stat['cluster_p']=cluster_p_values_2
+    return C_stats
 
+def stat_cluster_1sample_GAT(gc_mean,test_win_on,test_win_off,task_index,chance_index):
+    C1_stat,C2_stat=stat_cluster_1sample_GAT_batch([gc_mean],test_win_on,test_win_off,chance_index,tfce=opt.tfce)[0]
     
     return C1_stat,C2_stat
 
 def stat_cluster_1sample_GAT_ori(gc_mean,test_win_on,test_win_off,task_index,chance_index):
-    # define theresh
-    pval = 0.05  # arbitrary
-    tail = 0 # two-tailed
-    n_observations=gc_mean.shape[1]
-    stat_time_points=gc_mean[:,:,test_win_on:test_win_off,test_win_on:test_win_off].shape[2]
-    df = n_observations - 1  # degrees of freedom for the test
-    thresh = stats.t.ppf(1 - pval / 2, df)  # two-tailed, t distribution
-    
-    
-    
-    T_obs_1, clusters_1, cluster_p_values_1, H0_1 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[0,:,test_win_on:test_win_off,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=1000, tail=tail, out_type='mask',verbose=None)
-    
-    C1_stat=dict()
-    C1_stat['T_obs']=T_obs_1
-    C1_stat['cluster']=clusters_1
-    C1_stat['cluster_p']=cluster_p_values_1
+    C1_stat=stat_cluster_1sample_GAT_batch([gc_mean],test_win_on,test_win_off,chance_index,tfce=opt.tfce)[0][0]
     
     return C1_stat
 
@@ -425,7 +407,7 @@ def dat2gat_ori(dat,roi_name,cond_name,decoding_name):
     return roi_gat   
 
 
-def ctccd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=15):
+def ctccd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=15,C_stats=None):
 
 
     time_point = np.array(range(-200,2001, 10))/1000
@@ -437,7 +419,10 @@ def ctccd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=20
     #cluster based methods
     
     #stat
-    C1_stat,C2_stat=stat_cluster_1sample_GAT(ROI_gat_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    if C_stats is None:
+        C1_stat,C2_stat=stat_cluster_1sample_GAT(ROI_gat_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    else:
+        C1_stat,C2_stat=C_stats
     
     fname_cluster_fig_index= op.join(stat_figure_root, roi_name + '_'+str(con_name)+"_acc_CTCCD_cluster" )
     
@@ -449,7 +434,7 @@ def ctccd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=20
                                               fname_fig=fname_cluster_fig_index)
     
 
-def ctwcd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=15):
+def ctwcd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=50,y_index=15,C_stats=None):
 
 
     time_point = np.array(range(-200,2001, 10))/1000
@@ -462,7 +447,10 @@ def ctwcd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=20
     #cluster based methods
     
     #stat
-    C1_stat,C2_stat=stat_cluster_1sample_GAT(ROI_gat_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    if C_stats is None:
+        C1_stat,C2_stat=stat_cluster_1sample_GAT(ROI_gat_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    else:
+        C1_stat,C2_stat=C_stats
     
     fname_cluster_fig= op.join(stat_figure_root, roi_name + '_'+str(con_name)+"_acc_CTWCD_cluster")
     
@@ -478,7 +466,7 @@ def ctwcd_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=20
 
 
 
-def ctwcd_ori_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=15):
+def ctwcd_ori_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_off=200,chance_index=33.3,y_index=15,C_stats=None):
 
 
     time_point = np.array(range(-200,2001, 10))/1000
@@ -505,7 +493,10 @@ def ctwcd_ori_plt(group_data,con_name,roi_name='IIT',test_win_on=50, test_win_of
     #cluster based methods
     
     #stat
-    C1_stat=stat_cluster_1sample_GAT_ori(ROI_ori_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    if C_stats is None:
+        C1_stat=stat_cluster_1sample_GAT_ori(ROI_ori_g,test_win_on,test_win_off,task_index=task_index,chance_index=chance_index)
+    else:
+        C1_stat=C_stats[0]
     
     fname_cluster_fig= op.join(stat_figure_root, roi_name + '_'+str(con_name)+"_acc_CTWCD_ori_cluster" + '.svg')
     
@@ -551,53 +542,59 @@ task_info = "_" + "".join(con_Tname) + "_" + "".join(con_C[0])
 print(task_info)
 
 
-fname_data=op.join(group_deriv_root, task_info +"_data_group_" + analysis_name +
-                   '.pickle')
-
-fr=open(fname_data,'rb')
-group_data=pickle.load(fr)
-
-
-
-if analysis_name=='GAT_Cat': 
-    #CCD: cross condition decoding
-    #GNW
+# The results of each subject are read from the result store, only when they are indexed
+group_data=open_ROI_results(set_path_ROI_store(bids_root, analysis_name), task_info, sub_list, visit_id)
+try:
+    if analysis_name=='GAT_Cat': 
+        # All the ROI x condition tests of the 0ms to 1500ms window are computed in one batch, with the same sign flips
+        C_stats=stat_cluster_1sample_GAT_batch(
+            [dat2gat(group_data,roi_name,cond_name=cond_name,decoding_name=decoding_name)
+             for decoding_name,cond_name in [('ctccd_acc',['RE2IR','IR2RE']),('ctwcd_acc',['Irrelevant','Relevant non-target'])]
+             for roi_name in ['GNW','IIT']],
+            test_win_on=30,test_win_off=251,chance_index=50,tfce=opt.tfce)
+    
+        #CCD: cross condition decoding
+        #GNW
     
-    # # 300ms to 500ms
-    # ccd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
+        # # 300ms to 500ms
+        # ccd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
     
-    # 0ms to 1500ms
-    ctccd_plt(group_data,con_Tname,roi_name='GNW',test_win_on=30, test_win_off=251,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        ctccd_plt(group_data,con_Tname,roi_name='GNW',test_win_on=30, test_win_off=251,chance_index=50,y_index=40,C_stats=C_stats[0])
     
-    #IIT
+        #IIT
     
-    # # 300ms to 500ms
-    # ccd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=250,chance_index=50,y_index=40)
+        # # 300ms to 500ms
+        # ccd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=250,chance_index=50,y_index=40)
     
-    # 0ms to 1500ms
-    ctccd_plt(group_data,con_Tname,roi_name='IIT',test_win_on=30, test_win_off=251,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        ctccd_plt(group_data,con_Tname,roi_name='IIT',test_win_on=30, test_win_off=251,chance_index=50,y_index=40,C_stats=C_stats[1])
     
     
-    #WCD: within condition decoding
-    #GNW
+        #WCD: within condition decoding
+        #GNW
     
-    # # 300ms to 500ms
-    # wcd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
+        # # 300ms to 500ms
+        # wcd_plt(group_data2,roi_name='GNW',test_win_on=130, test_win_off=150,chance_index=50,y_index=15)
     
-    # 0ms to 1500ms
-    ctwcd_plt(group_data,con_Tname,roi_name='GNW',test_win_on=30, test_win_off=251,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        ctwcd_plt(group_data,con_Tname,roi_name='GNW',test_win_on=30, test_win_off=251,chance_index=50,y_index=40,C_stats=C_stats[2])
     
-    #IIT
+        #IIT
     
-    # # 300ms to 500ms
-    # wcd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=250,chance_index=50,y_index=40)
+        # # 300ms to 500ms
+        # wcd_plt(group_data2,roi_name='IIT',test_win_on=130, test_win_off=250,chance_index=50,y_index=40)
     
-    # 0ms to 1500ms
-    ctwcd_plt(group_data,con_Tname,roi_name='IIT',test_win_on=30, test_win_off=251,chance_index=50,y_index=40)
+        # 0ms to 1500ms
+        ctwcd_plt(group_data,con_Tname,roi_name='IIT',test_win_on=30, test_win_off=251,chance_index=50,y_index=40,C_stats=C_stats[3])
 
    
-elif analysis_name=='GAT_Ori':
-    
-    ctwcd_ori_plt(group_data,con_Tname,roi_name='GNW',test_win_on=30, test_win_off=251,chance_index=33.3,y_index=40)
-    ctwcd_ori_plt(group_data,con_Tname,roi_name='IIT',test_win_on=30, test_win_off=251,chance_index=33.3,y_index=40)
-        
+    elif analysis_name=='GAT_Ori':
+        C_stats=stat_cluster_1sample_GAT_batch(
+            [dat2gat_ori(group_data,roi_name,conditions_C[0],decoding_name='ctwcd_ori_acc') for roi_name in ['GNW','IIT']],
+            test_win_on=30,test_win_off=251,chance_index=33.3,tfce=opt.tfce)
+    
+        ctwcd_ori_plt(group_data,con_Tname,roi_name='GNW',test_win_on=30, test_win_off=251,chance_index=33.3,y_index=40,C_stats=C_stats[0])
+        ctwcd_ori_plt(group_data,con_Tname,roi_name='IIT',test_win_on=30, test_win_off=251,chance_index=33.3,y_index=40,C_stats=C_stats[1])
+finally:
+    close_ROI_results(group_data)
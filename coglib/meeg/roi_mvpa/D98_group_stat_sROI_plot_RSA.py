@@ -11,7 +11,6 @@ import os.path as op
 import os
 import argparse
 
-import pickle
 import mne
 
 import numpy as np
@@ -28,6 +27,7 @@ import matplotlib as mpl
 from matplotlib.patches import Rectangle
 
 from rsa_helper_functions_meg import subsample_matrices,compute_correlation_theories
+from grid_cluster_stats import permutation_cluster_1samp_batch
 
 import ptitprince as pt
 
@@ -36,6 +36,7 @@ sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 
 from config.config import bids_root,plot_param
 from sublist import sub_list
+from D_MEG_function import set_path_ROI_store, open_ROI_results, close_ROI_results
 
 
 parser = argparse.ArgumentParser()
@@ -390,17 +391,8 @@ def corr_theory(rsa_subsample,analysis_name,decoding_name):
     #1:generated theory_rdm
     theory_rdm_matrix=theory_rdm(analysis_name)
     
-    #2:correlate the theories matrices with the observed matrices for each subjects
-    for n in range(len(sub_list)):
-        observed_matrix=rsa_subsample[n,:,:]
-        if n==0:
-            correlation_results, correlation_results_corrected=compute_correlation_theories([observed_matrix], theory_rdm_matrix, method="kendall")
-            group_corr_corrected=correlation_results_corrected
-            group_corr=correlation_results
-        else:
-            correlation_results, correlation_results_corrected=compute_correlation_theories([observed_matrix], theory_rdm_matrix, method="kendall")
-            group_corr_corrected=group_corr_corrected.append(correlation_results_corrected,ignore_index=True)
-            group_corr=group_corr.append(correlation_results,ignore_index=True)
+    #2:correlate the theories matrices with the observed matrices of all subjects at once
+    group_corr, group_corr_corrected=compute_correlation_theories([rsa_subsample[n,:,:] for n in range(len(sub_list))], theory_rdm_matrix, method="kendall")
        
     #stat
     
@@ -542,14 +534,14 @@ def stat_cluster_1sample_RDM(gc_mean,test_win_on,test_win_off,chance_index):
     
     
     
-    T_obs_1, clusters_1, cluster_p_values_1, H0_1 = mne.stats.permutation_cluster_1samp_test(
-        gc_mean[:,test_win_on:test_win_off,test_win_on:test_win_off]-np.ones([n_observations,stat_time_points,stat_time_points])*chance_index, 
-        threshold=thresh, n_permutations=1000, tail=tail, out_type='mask',verbose=None)
+    # subjects x 1 test x time x time, same sign flip engine as the decoding group tests
+    X=gc_mean[:,None,test_win_on:test_win_off,test_win_on:test_win_off]-np.ones([n_observations,1,stat_time_points,stat_time_points])*chance_index
+    res = permutation_cluster_1samp_batch(X, threshold=thresh, n_permutations=1000, tail=tail)[0]
     
     C1_stat=dict()
-    C1_stat['T_obs']=T_obs_1
-    C1_stat['cluster']=clusters_1
-    C1_stat['cluster_p']=cluster_p_values_1
+    C1_stat['T_obs']=res['T_obs']
+    C1_stat['cluster']=res['cluster']
+    C1_stat['cluster_p']=res['cluster_p']
     
     return C1_stat
 
@@ -574,53 +566,46 @@ else:
 task_info = "_" + "".join(con_Tname) + "_" + "".join(con_C[0])
 print(task_info)
 
-fname_data=op.join(group_deriv_root, task_info +"_data_group_" + analysis_name +
-                   '.pickle')
-
-fr=open(fname_data,'rb')
-group_data=pickle.load(fr)
-
-
-
-
-if analysis_name=='RSA_ID':
-    #sub_list.remove('SB006')
-    #sub_list.remove('SB003')
-    # GNW ROI
-    roi_name='GNW' 
-    RSA_ID_plot(roi_name)
-    
-    # IIT ROI
-    roi_name='IIT' 
-    RSA_ID_plot(roi_name)
-    
-elif analysis_name=='RSA_Cat':
-    #sub_list.remove('SB006')
-    #sub_list.remove('SB003')
-    # GNW ROI
-    roi_name='GNW'
-    condition='Irrelevant'
-    RSA_Cat_plot(roi_name,condition)
-    condition='Relevant non-target'
-    RSA_Cat_plot(roi_name,condition)
-    
-    # IIT ROI
-    roi_name='IIT' 
-    condition='Irrelevant'
-    RSA_Cat_plot(roi_name,condition)
-    condition='Relevant non-target'
-    RSA_Cat_plot(roi_name,condition)
-
-elif analysis_name=='RSA_Ori':
-    #sub_list.remove('SB006')
-    #sub_list.remove('SB003')
-    # GNW ROI
-    roi_name='GNW' 
-    RSA_Ori_plot(roi_name)
-    
-    # IIT ROI
-    roi_name='IIT' 
-    RSA_Ori_plot(roi_name)
-
-
-
+# The results of each subject are read from the result store, only when they are indexed
+group_data=open_ROI_results(set_path_ROI_store(bids_root, analysis_name), task_info, sub_list, visit_id)
+try:
+    if analysis_name=='RSA_ID':
+        #sub_list.remove('SB006')
+        #sub_list.remove('SB003')
+        # GNW ROI
+        roi_name='GNW' 
+        RSA_ID_plot(roi_name)
+    
+        # IIT ROI
+        roi_name='IIT' 
+        RSA_ID_plot(roi_name)
+    
+    elif analysis_name=='RSA_Cat':
+        #sub_list.remove('SB006')
+        #sub_list.remove('SB003')
+        # GNW ROI
+        roi_name='GNW'
+        condition='Irrelevant'
+        RSA_Cat_plot(roi_name,condition)
+        condition='Relevant non-target'
+        RSA_Cat_plot(roi_name,condition)
+    
+        # IIT ROI
+        roi_name='IIT' 
+        condition='Irrelevant'
+        RSA_Cat_plot(roi_name,condition)
+        condition='Relevant non-target'
+        RSA_Cat_plot(roi_name,condition)
+
+    elif analysis_name=='RSA_Ori':
+        #sub_list.remove('SB006')
+        #sub_list.remove('SB003')
+        # GNW ROI
+        roi_name='GNW' 
+        RSA_Ori_plot(roi_name)
+    
+        # IIT ROI
+        roi_name='IIT' 
+        RSA_Ori_plot(roi_name)
+finally:
+    close_ROI_results(group_data)
@@ -22,6 +22,7 @@ sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
 from config.config import bids_root
 
 from sublist_phase2 import sub_list
+from D_MEG_function import set_path_ROI_store, open_ROI_results, read_ROI_results, close_ROI_results
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--visit',
@@ -150,54 +151,12 @@ else:
 task_info = "_" + "".join(con_Tname) + "_" + "".join(con_C[0])
 print(task_info)
 
+# The group pickle is read from the result store, for the scripts that load the group data at once
+store_data=open_ROI_results(set_path_ROI_store(bids_root, analysis_name), task_info, sb_list, visit_id)
 group_data=dict()
 for i, sbn in enumerate(sb_list):
-    # if 'SB' in sbn:
-    # sub and visit info
-    sub_info = 'sub-' + sbn + '_ses-' + visit_id
-    
-    sub_data_root = op.join(data_path,
-                            f"sub-{sbn}", f"ses-{visit_id}", "meg",
-                            "data")
-    # if analysis_name=='Cat':
-    #     pkl_name = "_ROIs_data_Cat"
-    # elif analysis_name=='Ori':
-    #     pkl_name = "_ROIs_data_Ori"
-    # elif analysis_name=='GAT_Cat':
-    #     pkl_name = "_ROIs_data_GAT_Cat"
-    # elif analysis_name=='GAT_Ori':
-    #     pkl_name = "_ROIs_data_GAT_Cat"
-    # elif analysis_name=='RSA_Cat':
-    #     pkl_name = "_ROIs_RSA_Cat"
-    # elif analysis_name=='RSA_Ori':
-    #     pkl_name = "_ROIs_RSA_Ori"
-    # elif analysis_name=='RSA_ID':
-    #     pkl_name = "_ROIs_RSA_ID"
-    rsa_data=dict()
-    if analysis_name == "RSA_Cat" or analysis_name=="RSA_Ori" or analysis_name=="RSA_ID":
-        for ri,roi_name in enumerate(['GNW','IIT']):
-            fname_data=op.join(sub_data_root, sub_info + '_' + task_info + roi_name +'_ROIs_data_'+ analysis_name +'.pickle')
-            fr=open(fname_data,'rb')
-            rsa_data[roi_name]=pickle.load(fr)
-        group_data[sbn]=rsa_data
-        
-    elif analysis_name == "Cat_PFC":
-        fname_data=op.join(sub_data_root, sub_info + '_' + task_info +'_IITPFC_data_Cat.pickle')
-        fr=open(fname_data,'rb')
-        roi_data=pickle.load(fr)
-        group_data[sbn]=roi_data
-        
-    elif analysis_name == "Ori_PFC":
-        fname_data=op.join(sub_data_root, sub_info + '_' + task_info +'_IITPFC_data_Ori.pickle')
-        fr=open(fname_data,'rb')
-        roi_data=pickle.load(fr)
-        group_data[sbn]=roi_data
-            
-    else:       
-        fname_data=op.join(sub_data_root, sub_info + '_' + task_info +'_ROIs_data_'+analysis_name +'.pickle')
-        fr=open(fname_data,'rb')
-        roi_data=pickle.load(fr)
-        group_data[sbn]=roi_data
+    group_data[sbn]=read_ROI_results(store_data[sbn])
+close_ROI_results(store_data)
 
 fname_data=op.join(group_deriv_root, task_info +"_data_group_" + analysis_name +
                    '.pickle')
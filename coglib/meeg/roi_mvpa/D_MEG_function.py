@@ -10,10 +10,17 @@ Functions for MEG decoding
 
 import os
 import os.path as op
+import json
+import shutil
+import hashlib
+import functools
 
 
 import mne
 import numpy as np
+import h5py
+from joblib import Parallel, delayed, parallel_backend
+from skimage.measure import block_reduce
 
 import sys
 sys.path.insert(1, op.dirname(op.dirname(os.path.abspath(__file__))))
@@ -82,41 +89,52 @@ def set_path_ROI_MVPA(bids_root,subject_id, visit_id, analysis_name):
 
     return sub_info,fpath_epo,fpath_fw,fpath_fs, roi_data_root,roi_figure_root, roi_code_root
 
+# set the path of the ROI MVPA derived data cache, shared by all analyses
+def set_path_ROI_cache(bids_root, subject_id, visit_id):
+    fpath_cache = op.join(bids_root, "derivatives", "decoding", "roi_mvpa", "cache",
+                          f"sub-{subject_id}", f"ses-{visit_id}", "meg")
+    if not op.exists(fpath_cache):
+        os.makedirs(fpath_cache)
+
+    return fpath_cache
+
+# zero-copy view of the twd last time points at each time point, from the latest to the earliest
+def lagged_view(Xraw, twd=5):
+    # Xraw: trials x features x times, returns trials x features x (times - twd + 1) x twd, where [..., t, k] is the
+    # time point t + twd - 1 - k of Xraw
+    return np.lib.stride_tricks.sliding_window_view(Xraw, twd, axis=-1)[..., ::-1]
+
 # functions for use both spatial and temporal feature as the decoding feature
-def STdata(Xraw):
+def STdata(Xraw, twd=5, dtype=None):
     #spatial + temporal decoding
     # temporal feature window
     #Xraw=epochs_cd.get_data()
-    twd=5  # how many time points will used as temporal feature
-    Xtemp=[];
-    for twd_index in range(twd):
-        if twd_index==0:
-            #Xtemp1=np.append(Xraw[:,:,:1],Xraw[:,:,:-1],axis=2)
-            Xtemp = Xraw
-        else:
-            Xtemp1=np.append(Xraw[:,:,:twd_index],Xraw[:,:,:-twd_index],axis=2)
-            Xtemp=np.append(Xtemp,Xtemp1,axis=1)
-    
-    return Xtemp
+    # twd: how many time points will used as temporal feature
+    # The features at lag k are the data k time points earlier, and the data themselves for the first k time points.
+    # The output is allocated once and filled from a zero-copy view of the lagged data
+    [t1,t2,t3]=Xraw.shape
+    Xtemp=np.empty([t1,twd,t2,t3], dtype=Xraw.dtype if dtype is None else dtype)
+    if t3>=twd:
+        Xtemp[:,:,:,twd-1:]=np.moveaxis(lagged_view(Xraw, twd), -1, 1)
+    for t in range(min(twd-1, t3)):
+        for twd_index in range(twd):
+            Xtemp[:,twd_index,:,t]=Xraw[:,:,t-twd_index if t>=twd_index else t]
+
+    return Xtemp.reshape([t1,twd*t2,t3])
 
 # sliding windows (twd,) for MEG data
-def ATdata(Xraw):
+def ATdata(Xraw, twd=5, dtype=np.float64):
 
     #Xraw=epochs_cd.get_data()
-    twd=5  # how many time points will be used as sliding windows
-    [t1,t2,t3]=Xraw.shape
-    Xtemp=np.zeros([5,t1,t2,t3]);
-    for twd_index in range(twd):
-        if twd_index==0:
-            #Xtemp1=np.append(Xraw[:,:,:1],Xraw[:,:,:-1],axis=2)
-            #Xtemp = np.expand_dims(Xraw, axis=0)
-            Xtemp[twd_index,:,:,:] = Xraw
-        else:
-            Xtemp1=np.append(Xraw[:,:,:twd_index],Xraw[:,:,:-twd_index],axis=2)
-            Xtemp[twd_index,:,:,:] = Xtemp1
-    
-    Xnew=np.mean(Xtemp,axis=0)
-    
+    # twd: how many time points will be used as sliding windows
+    # Average of the data and of its twd-1 lagged copies (the lagged copies start with the data themselves). The lags
+    # are summed in place into a single output array, in the same order as averaging the stacked copies
+    Xnew=np.array(Xraw, dtype=dtype)
+    for twd_index in range(1, twd):
+        Xnew[:,:,twd_index:]+=Xraw[:,:,:-twd_index]
+        Xnew[:,:,:twd_index]+=Xraw[:,:,:twd_index]
+    Xnew/=twd
+
     return Xnew
 
 
@@ -937,3 +955,337 @@ def sub_ROI_for_ROI_MVPA(fpath_fs,subject_id,analysis_name):
         ROI_Name = ['GNW', 'IIT']
 
     return surf_label_list, ROI_Name
+
+
+# =============================================================================
+# Derived data cache, shared across the D0x scripts
+# =============================================================================
+# The sensor data (resampled, filtered epochs, rank and covariance) and the source data of each ROI are saved the first
+# time they are computed. The file names are hashes of everything the data depend on, such that any change in the
+# epochs, conditions, filter parameters, forward solution or ROI labels leads to a new entry rather than a stale one.
+
+def _json_default(value):
+    # Deterministic form of the values json can't serialize. str() can't be used, as the string of functions and most
+    # objects contains their memory address, which changes in every process
+    if isinstance(value, functools.partial):
+        return [_json_default(value.func), list(value.args), value.keywords]
+    if isinstance(value, type) or (callable(value) and hasattr(value, '__qualname__')):
+        return '{}.{}'.format(value.__module__, value.__qualname__)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError('Can not hash an object of type {}'.format(type(value).__name__))
+
+
+def _hash_dict(d):
+    return hashlib.sha1(json.dumps(d, sort_keys=True, default=_json_default).encode()).hexdigest()[:16]
+
+
+def _file_signature(fname):
+    stat = os.stat(fname)
+    return [op.abspath(fname), stat.st_size, stat.st_mtime]
+
+
+def _label_signature(label):
+    # BiHemiLabel do not have vertices, but their two hemispheres do:
+    hemi_labels = [label.lh, label.rh] if hasattr(label, 'lh') else [label]
+    return [[hemi_label.name, hemi_label.hemi, hashlib.sha1(np.asarray(hemi_label.vertices).tobytes()).hexdigest()]
+            for hemi_label in hemi_labels]
+
+
+def _hash_sensor_data(epochs_rs, rank, common_cov):
+    # Content hash of the sensor data, so that the same epochs, recomputed or loaded from the cache, give the same key
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(epochs_rs.get_data()).tobytes())
+    h.update(np.ascontiguousarray(epochs_rs.events, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(common_cov.data).tobytes())
+    h.update(json.dumps([epochs_rs.ch_names, float(epochs_rs.tmin), float(epochs_rs.info['sfreq']),
+                         {ch_type: int(r) for ch_type, r in rank.items()}], sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+def cached_sensor_data_for_ROI_MVPA(fpath_epo, sub_info, con_T, con_C, con_D, fpath_cache,
+                                    sensor_fun=sensor_data_for_ROI_MVPA, **kwargs):
+    """
+    Same as sensor_fun (sensor_data_for_ROI_MVPA or one of its variants), but the outputs are loaded from the cache if
+    they were already computed for the same epochs file, conditions and resampling/filtering parameters
+    """
+    fname_epo = op.join(fpath_epo, sub_info + '_task-dur_epo.fif')
+    key = _hash_dict({"sensor_fun": sensor_fun.__name__, "epochs": _file_signature(fname_epo),
+                      "con_T": con_T, "con_C": con_C, "con_D": con_D, "kwargs": kwargs,
+                      "l_freq": l_freq, "h_freq": h_freq, "sfreq": sfreq})
+    fname_info = op.join(fpath_cache, sub_info + '_sensor-' + key + '.json')
+    fname_epo_rs = op.join(fpath_cache, sub_info + '_sensor-' + key + '-epo.fif')
+    fname_cov = op.join(fpath_cache, sub_info + '_sensor-' + key + '-cov.fif')
+
+    if op.exists(fname_info):
+        print('Loading the sensor data from the cache: ' + fname_epo_rs)
+        with open(fname_info) as f:
+            info = json.load(f)
+        epochs_rs = mne.read_epochs(fname_epo_rs, preload=True, verbose=False)
+        common_cov = mne.read_cov(fname_cov, verbose=False)
+        return epochs_rs, info["rank"], common_cov, info["conditions_C"], info["conditions_D"], \
+            info["conditions_T"], info["task_info"]
+
+    epochs_rs, rank, common_cov, conditions_C, conditions_D, conditions_T, task_info = \
+        sensor_fun(fpath_epo, sub_info, con_T, con_C, con_D, **kwargs)
+    # Each file is saved under a temporary name first, for a killed job to never leave a partial file behind:
+    tmp_prefix = op.join(fpath_cache, sub_info + '_sensor-' + key + '_' + str(os.getpid()))
+    # Saved in double precision, for the cached epochs to be identical to the computed ones:
+    epochs_rs.save(tmp_prefix + '-epo.fif', fmt='double', overwrite=True)
+    os.replace(tmp_prefix + '-epo.fif', fname_epo_rs)
+    common_cov.save(tmp_prefix + '-cov.fif', overwrite=True)
+    os.replace(tmp_prefix + '-cov.fif', fname_cov)
+    rank = {ch_type: int(r) for ch_type, r in rank.items()}
+    # The info file is written last, it marks the entry as complete:
+    with open(tmp_prefix + '.json', 'w') as f:
+        json.dump({"rank": rank, "conditions_C": conditions_C, "conditions_D": conditions_D,
+                   "conditions_T": conditions_T, "task_info": task_info}, f)
+    os.replace(tmp_prefix + '.json', fname_info)
+
+    return epochs_rs, rank, common_cov, conditions_C, conditions_D, conditions_T, task_info
+
+
+def cached_source_data_for_ROI_MVPA(epochs_rs, fpath_fw, rank, common_cov, sub_info, surf_label, fpath_cache):
+    """
+    Same as source_data_for_ROI_MVPA, but the source data of the ROI are loaded from the cache if they were already
+    computed for the same sensor data, forward solution and label. The source data are stored as a trials x vertices
+    x times .npy file, memory mapped when loaded
+    """
+    fname_fwd = op.join(fpath_fw, sub_info + "_surface_fwd.fif")
+    key = _hash_dict({"sensor_data": _hash_sensor_data(epochs_rs, rank, common_cov),
+                      "fwd": _file_signature(fname_fwd), "label": _label_signature(surf_label),
+                      "inverse": {"loose": .2, "depth": .8, "snr": 3.0, "method": "dSPM", "pick_ori": "normal"}})
+    fname_info = op.join(fpath_cache, sub_info + '_source-' + key + '.json')
+    fname_data = op.join(fpath_cache, sub_info + '_source-' + key + '.npy')
+
+    if not op.exists(fname_info):
+        fwd = mne.read_forward_solution(fname_fwd)
+        inv = mne.minimum_norm.make_inverse_operator(epochs_rs.info, fwd, common_cov,
+                                                     loose=.2, depth=.8, fixed=False,
+                                                     rank=rank, use_cps=True)
+        snr = 3.0
+        lambda2 = 1.0 / snr ** 2
+        stcs_gen = apply_inverse_epochs(epochs_rs, inv, 1. / lambda2, 'dSPM', pick_ori="normal", label=surf_label,
+                                        return_generator=True)
+        # Writing the source data trial by trial, to never hold all of them in memory. The files are written under a
+        # temporary name first, for a killed job to never leave a partial file behind:
+        tmp_prefix = op.join(fpath_cache, sub_info + '_source-' + key + '_' + str(os.getpid()))
+        data = None
+        for i, stc in enumerate(stcs_gen):
+            if data is None:
+                data = np.lib.format.open_memmap(tmp_prefix + '.npy', mode='w+', dtype=stc.data.dtype,
+                                                 shape=(len(epochs_rs),) + stc.data.shape)
+                stc_info = {"vertices": [v.tolist() for v in stc.vertices], "tmin": stc.tmin,
+                            "tstep": stc.tstep, "subject": stc.subject}
+            data[i] = stc.data
+        data.flush()
+        del data
+        os.replace(tmp_prefix + '.npy', fname_data)
+        with open(tmp_prefix + '.json', 'w') as f:
+            json.dump(stc_info, f)
+        os.replace(tmp_prefix + '.json', fname_info)
+    else:
+        print('Loading the source data from the cache: ' + fname_data)
+
+    with open(fname_info) as f:
+        stc_info = json.load(f)
+    data = np.load(fname_data, mmap_mode='r')
+    vertices = [np.array(v, dtype=int) for v in stc_info["vertices"]]
+    stcs = [mne.SourceEstimate(data[i], vertices, stc_info["tmin"], stc_info["tstep"], subject=stc_info["subject"])
+            for i in range(data.shape[0])]
+
+    return stcs
+
+
+# =============================================================================
+# Pseudotrials repeats
+# =============================================================================
+
+def pseudotrials_average(group_x, group_y, n_trials, rng, labels=(1, 2)):
+    """
+    Shuffles the trials of each label and averages them by blocks of n_trials, then averages the temporal features
+    (5 points sliding window). The labels of the pseudotrials are 0, 1... in the order of labels
+    """
+    new_x = []
+    new_y = []
+    for ind, label in enumerate(labels):
+        # Extract the data:
+        data = group_x[np.where(group_y == label)]
+        data = np.take(data, rng.permutation(data.shape[0]), axis=0)
+        avg_x = block_reduce(data, block_size=tuple([n_trials, *[1] * len(data.shape[1:])]),
+                             func=np.nanmean, cval=np.nan)
+        # Now generating the labels and group:
+        new_x.append(avg_x)
+        new_y += [ind] * avg_x.shape[0]
+
+    # average temporal feature (5 point average)
+    return ATdata(np.concatenate(new_x, axis=0)), np.array(new_y)
+
+
+def _run_repeat(repeat_fun, num_per, seed, fpath_repeats, kwargs):
+    scores = repeat_fun(np.random.default_rng(seed), **kwargs)
+    if fpath_repeats is not None:
+        # Written under a temporary name first, for a killed job to never leave a partial file behind:
+        fname = op.join(fpath_repeats, 'repeat-{:04d}.npy'.format(num_per))
+        np.save(fname + '.tmp.npy', scores)
+        os.replace(fname + '.tmp.npy', fname)
+    return scores
+
+
+def _repeats_input_signature(value):
+    # Content of the arrays and parameters of the estimators, for a change in the inputs to change the signature
+    if isinstance(value, np.ndarray):
+        return [list(value.shape), str(value.dtype),
+                hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()]
+    if hasattr(value, 'get_params'):
+        return [_json_default(type(value)), {key: _repeats_input_signature(val)
+                                             for key, val in value.get_params(deep=True).items()}]
+    if isinstance(value, np.random.RandomState):
+        return _repeats_input_signature(value.get_state(legacy=False))
+    if isinstance(value, np.random.Generator):
+        return _repeats_input_signature(value.bit_generator.state)
+    if isinstance(value, (list, tuple)):
+        return [_repeats_input_signature(val) for val in value]
+    if isinstance(value, dict):
+        return {str(key): _repeats_input_signature(val) for key, val in value.items()}
+    return value
+
+
+def run_pseudotrials_repeats(repeat_fun, n_repeats=100, n_jobs=1, seed=None, fpath_repeats=None, **kwargs):
+    """
+    Runs repeat_fun(rng, **kwargs) n_repeats times across a pool of processes and returns the stacked scores
+    (n_repeats x scores shape). Each repeat gets its own random generator, spawned from the seed. The arrays in kwargs
+    are shared read-only with the workers (memory mapped by joblib), and the workers are limited to one BLAS/joblib
+    thread, which avoids oversubscribing the cores with nested parallelism.
+    If fpath_repeats is given, the scores of each repeat are saved in it as soon as they are computed, together with
+    the seed and a hash of the inputs (repeat_fun, n_repeats, arrays content and parameters in kwargs). Running again
+    with the same fpath_repeats and inputs only runs the missing repeats, such that a killed job resumes where it
+    stopped. The repeats of different inputs are discarded, and a seed different from the stored one raises an error.
+    The directory is removed with clear_pseudotrials_repeats once the results are saved
+    """
+    todo = list(range(n_repeats))
+    if fpath_repeats is not None:
+        fname_seed = op.join(fpath_repeats, 'seed.json')
+        fname_inputs = op.join(fpath_repeats, 'inputs.json')
+        inputs_hash = _hash_dict({"repeat_fun": repeat_fun, "n_repeats": n_repeats,
+                                  "kwargs": _repeats_input_signature(kwargs)})
+        if op.exists(fpath_repeats):
+            stored_hash = None
+            if op.exists(fname_inputs):
+                with open(fname_inputs) as f:
+                    stored_hash = json.load(f)["hash"]
+            if stored_hash != inputs_hash:
+                print('Discarding the repeats of different inputs in ' + fpath_repeats)
+                shutil.rmtree(fpath_repeats)
+        if not op.exists(fpath_repeats):
+            os.makedirs(fpath_repeats)
+            with open(fname_inputs, 'w') as f:
+                json.dump({"hash": inputs_hash}, f)
+        # The seed of a previous run is reused, for the repeats to be the same whether or not the job was resumed:
+        if op.exists(fname_seed):
+            with open(fname_seed) as f:
+                stored_seed = json.load(f)["seed"]
+            if seed is not None and seed != stored_seed:
+                raise ValueError('The seed {} differs from the seed {} of the repeats in {}, remove them with '
+                                 'clear_pseudotrials_repeats to run with a new seed'.format(seed, stored_seed,
+                                                                                            fpath_repeats))
+            seed = stored_seed
+        else:
+            if seed is None:
+                seed = np.random.SeedSequence().entropy
+            with open(fname_seed, 'w') as f:
+                json.dump({"seed": seed}, f)
+        todo = [num_per for num_per in todo
+                if not op.exists(op.join(fpath_repeats, 'repeat-{:04d}.npy'.format(num_per)))]
+        if len(todo) < n_repeats:
+            print('Resuming: {} of {} repeats already computed'.format(n_repeats - len(todo), n_repeats))
+    seeds = np.random.SeedSequence(seed).spawn(n_repeats)
+
+    with parallel_backend('loky', inner_max_num_threads=1):
+        results = Parallel(n_jobs=n_jobs)(delayed(_run_repeat)(repeat_fun, num_per, seeds[num_per],
+                                                               fpath_repeats, kwargs)
+                                          for num_per in todo)
+    if fpath_repeats is None:
+        return np.stack(results)
+    return np.stack([np.load(op.join(fpath_repeats, 'repeat-{:04d}.npy'.format(num_per)))
+                     for num_per in range(n_repeats)])
+
+
+def clear_pseudotrials_repeats(fpath_repeats, prefix=''):
+    """
+    Removes the repeats saved by run_pseudotrials_repeats in the subdirectories of fpath_repeats starting with prefix
+    (i.e. the ones of a subject and task), to be called once the results are saved in the result store
+    """
+    if not op.isdir(fpath_repeats):
+        return
+    for dname in os.listdir(fpath_repeats):
+        if dname.startswith(prefix):
+            shutil.rmtree(op.join(fpath_repeats, dname))
+
+
+# =============================================================================
+# Result store
+# =============================================================================
+# The decoding and RSA results of each subject are saved in one HDF5 file per subject and visit, under a group named
+# after the task info. The nested dictionaries of results map to nested HDF5 groups, the arrays to chunked datasets.
+# Each subject job only ever writes to its own file, such that the jobs can run concurrently, and the group analysis
+# reads the files of all subjects directly, loading only the datasets it indexes.
+
+def set_path_ROI_store(bids_root, analysis_name):
+    fpath_store = op.join(bids_root, "derivatives", "decoding", "roi_mvpa", analysis_name, "store")
+    if not op.exists(fpath_store):
+        os.makedirs(fpath_store)
+
+    return fpath_store
+
+
+def _write_results(group, results):
+    for key, value in results.items():
+        key = str(key)
+        if isinstance(value, dict):
+            _write_results(group.require_group(key), value)
+            continue
+        # Results computed again replace the stored ones:
+        if key in group:
+            del group[key]
+        value = np.asarray(value)
+        group.create_dataset(key, data=value, chunks=True if value.ndim > 0 else None)
+
+
+def save_ROI_results(fpath_store, sub_info, task_info, results):
+    """
+    Saves a (nested) dictionary of results in the store file of the subject, under task_info. The results already
+    stored under task_info and not in the dictionary are kept, such that results can be added one ROI at a time
+    """
+    with h5py.File(op.join(fpath_store, sub_info + '.h5'), 'a') as f:
+        _write_results(f.require_group(task_info), results)
+
+
+def open_ROI_results(fpath_store, task_info, sub_list, visit_id):
+    """
+    Opens the store files of the subjects read only. Returns a dictionary of the HDF5 group of each subject, that is
+    indexed like the group pickles (group_data[sbn][decoding_name][roi_name][cond]) but only reads the data of the
+    datasets that are accessed
+    """
+    group_data = dict()
+    for sbn in sub_list:
+        f = h5py.File(op.join(fpath_store, 'sub-' + sbn + '_ses-' + visit_id + '.h5'), 'r')
+        group_data[sbn] = f[task_info]
+
+    return group_data
+
+
+def close_ROI_results(group_data):
+    for group in group_data.values():
+        group.file.close()
+
+
+def read_ROI_results(group):
+    """
+    Reads a whole HDF5 group of results into a nested dictionary of arrays
+    """
+    if isinstance(group, h5py.Dataset):
+        return group[()]
+    return {key: read_ROI_results(value) for key, value in group.items()}
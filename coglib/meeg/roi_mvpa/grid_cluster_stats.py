@@ -0,0 +1,285 @@
+"""
+=================================
+Cluster and TFCE statistics on regular grids
+=================================
+Sign flip permutation tests of many one sample tests at once (i.e. all the ROIs x conditions of a group analysis), on
+time courses, temporal generalization (GAT) maps or 3D grids. The sign flips are shared by all the tests: the t maps of
+a batch of permutations are a single matrix product, and the clusters of all the permuted maps of the batch are
+labelled in a single call. The clusters are defined on the lattice adjacency of the grid (no diagonals), same as
+mne.stats.permutation_cluster_1samp_test with adjacency=None. group_cluster_table runs all the tests of a group analysis
+with one sign flip matrix and gathers their clusters in a tidy table, one row per cluster.
+
+@author: Ling Liu  ling.liu@pku.edu.cn
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+
+def _stack_structure(n_stack_dims, grid_ndim):
+    # Lattice adjacency within each map, and no adjacency between the maps stacked in the first dimensions:
+    structure = np.zeros((3,) * (n_stack_dims + grid_ndim), dtype=bool)
+    structure[(1,) * n_stack_dims] = ndimage.generate_binary_structure(grid_ndim, 1)
+    return structure
+
+
+def label_maps(masks, grid_ndim):
+    """
+    This function labels the connected components of a stack of boolean maps in a single call
+    :param masks: (np array of bool, stack dims x grid dims) maps to label, i.e. permutations x tests x time x time
+    :param grid_ndim: (int) number of grid dimensions, the last ones of masks
+    :return:
+    labels: (np array of int) label of each point, 0 outside the components. The labels are unique across the maps
+    map_index: (np array of int) flat index of the map (over the stack dims) of each label, map_index[0] is meaningless
+    """
+    masks = np.asarray(masks, dtype=bool)
+    labels, n_labels = ndimage.label(masks, structure=_stack_structure(masks.ndim - grid_ndim, grid_ndim))
+    # The components are numbered in scan order, such that the labels of each map follow the ones of the previous map:
+    grid_size = int(np.prod(masks.shape[masks.ndim - grid_ndim:]))
+    last_label = np.maximum.accumulate(labels.reshape(-1, grid_size).max(axis=1))
+    map_index = np.searchsorted(last_label, np.arange(n_labels + 1), side="left")
+    return labels, map_index
+
+
+def _max_per_map(values, map_index, n_maps):
+    max_values = np.zeros(n_maps)
+    np.maximum.at(max_values, map_index[1:], values[1:])
+    return max_values
+
+
+def cluster_maxima(stat_maps, threshold, tail=0, grid_ndim=2, t_power=1):
+    """
+    This function computes the maximal cluster statistic (sum of the statistics in the cluster) of each map of a stack
+    :param stat_maps: (np array, stack dims x grid dims) statistic maps, i.e. permutations x tests x time x time
+    :param threshold: (float) cluster forming threshold, positive
+    :param tail: (int) 1 for upper tail, -1 lower tail, 0 two tailed
+    :param grid_ndim: (int) number of grid dimensions
+    :param t_power: (float) power to which the statistics are raised before summing them
+    :return: (np array, stack dims) maximal cluster statistic of each map, in absolute value for the two tailed and
+    lower tail tests. 0 if a map has no cluster
+    """
+    stack_shape = stat_maps.shape[:stat_maps.ndim - grid_ndim]
+    n_maps = int(np.prod(stack_shape))
+    maxima = np.zeros(n_maps)
+    for sign in [1, -1]:
+        if tail == -sign:
+            continue
+        masks = sign * stat_maps > threshold
+        labels, map_index = label_maps(masks, grid_ndim)
+        # Only the points above threshold are summed:
+        sums = np.bincount(labels[masks], weights=np.abs(stat_maps[masks]) ** t_power, minlength=map_index.shape[0])
+        maxima = np.maximum(maxima, _max_per_map(sums, map_index, n_maps))
+    return maxima.reshape(stack_shape)
+
+
+def find_clusters(stat_map, threshold, tail=0, t_power=1):
+    """
+    This function finds the clusters of a single statistic map
+    :param stat_map: (np array) statistic map, i.e. time x time
+    :param threshold: (float) cluster forming threshold, positive
+    :param tail: (int) 1 for upper tail, -1 lower tail, 0 two tailed
+    :param t_power: (float) power to which the statistics are raised before summing them
+    :return:
+    clusters: (list of np arrays of bool) mask of each cluster, positive clusters first
+    sums: (np array) signed cluster statistic of each cluster
+    """
+    weights = np.sign(stat_map) * np.abs(stat_map) ** t_power
+    clusters, sums = [], []
+    for sign in [1, -1]:
+        if tail == -sign:
+            continue
+        labels, n_labels = ndimage.label(sign * stat_map > threshold)
+        clusters.extend([labels == label for label in range(1, n_labels + 1)])
+        sums.extend(ndimage.sum(weights, labels, index=range(1, n_labels + 1)))
+    return clusters, np.array(sums)
+
+
+def tfce_maps(stat_maps, grid_ndim=2, start=0, step=0.1, h_power=2, e_power=0.5, tail=0):
+    """
+    This function computes the threshold free cluster enhancement (TFCE, Smith and Nichols 2009) of a stack of maps,
+    same as mne.stats.permutation_cluster_1samp_test with threshold=dict(start=start, step=step). The TFCE integral is
+    accumulated threshold by threshold, each threshold labelling the clusters of all the maps of the stack at once
+    :param stat_maps: (np array, stack dims x grid dims) statistic maps, i.e. permutations x tests x time x time
+    :param grid_ndim: (int) number of grid dimensions
+    :param start: (float) first threshold of the integral, positive
+    :param step: (float) step between the thresholds, positive
+    :param h_power: (float) power of the height
+    :param e_power: (float) power of the cluster extent
+    :param tail: (int) 1 for upper tail, -1 lower tail, 0 two tailed
+    :return: (np array, same shape as stat_maps) TFCE score of each point, with the sign of the statistic
+    """
+    grid_shape = stat_maps.shape[stat_maps.ndim - grid_ndim:]
+    n_maps = int(np.prod(stat_maps.shape[:stat_maps.ndim - grid_ndim]))
+    scores = np.zeros((n_maps,) + grid_shape)
+    for sign in [1, -1]:
+        if tail == -sign:
+            continue
+        signed_maps = sign * stat_maps.reshape(scores.shape)
+        maps_max = np.max(signed_maps.reshape(n_maps, -1), axis=1)
+        thresholds = np.arange(start, np.max(maps_max), step)
+        for ti, thresh in enumerate(thresholds):
+            dh = thresh if ti == 0 else thresh - thresholds[ti - 1]
+            # Only the maps reaching the threshold are labelled:
+            active = np.where(maps_max > thresh)[0]
+            masks = signed_maps[active] > thresh
+            labels, _ = label_maps(masks, grid_ndim)
+            labels = labels[masks]
+            extent = np.bincount(labels).astype(float)
+            active_scores = scores[active]
+            active_scores[masks] += sign * thresh ** h_power * dh * extent[labels] ** e_power
+            scores[active] = active_scores
+    return scores.reshape(stat_maps.shape)
+
+
+def sign_flips(n_subjects, n_permutations=1024, tail=0, seed=None):
+    """
+    This function draws the sign flips of the permutations, the first one being the observed data (no flip). When there
+    are fewer possible sign flips than permutations, all of them are used (exact test). In the two tailed test, the sign
+    of the last subject is never flipped, as a sign flip and its opposite give the same maps up to the sign
+    :param n_subjects: (int) number of subjects
+    :param n_permutations: (int) number of permutations, including the observed data
+    :param tail: (int) 1 for upper tail, -1 lower tail, 0 two tailed
+    :param seed: (None or int) seed of the random generator
+    :return: (np array of +/-1, permutations x subjects) sign flips
+    """
+    n_free = n_subjects - (tail == 0)
+    if 2 ** n_free <= n_permutations:
+        flips = (np.arange(2 ** n_free)[:, None] >> np.arange(n_free)[None, :]) & 1
+    else:
+        # Unique random sign flips, the observed data (no flip) sorting first:
+        rng = np.random.default_rng(seed)
+        flips = np.zeros((1, n_free), dtype=int)
+        while flips.shape[0] < n_permutations:
+            new_flips = rng.integers(0, 2, size=(n_permutations - flips.shape[0], n_free))
+            flips = np.unique(np.concatenate([flips, new_flips], axis=0), axis=0)
+    signs = np.ones((flips.shape[0], n_subjects))
+    signs[:, :n_free] = 1 - 2 * flips
+    return signs
+
+
+def ttest_1samp_flips(x, signs):
+    """
+    This function computes the one sample t statistic of the data for each sign flip, as a single matrix product (the
+    sum of squares doesn't depend on the signs)
+    :param x: (np array, subjects x anything) data
+    :param signs: (np array of +/-1, permutations x subjects) sign flips
+    :return: (np array, permutations x anything) t statistic of each permutation
+    """
+    n = x.shape[0]
+    x_flat = x.reshape(n, -1)
+    mean = (signs @ x_flat) / n
+    sum_squares = np.sum(x_flat ** 2, axis=0)
+    var = (sum_squares - n * mean ** 2) / (n - 1)
+    return (mean / np.sqrt(var / n)).reshape((signs.shape[0],) + x.shape[1:])
+
+
+def permutation_cluster_1samp_batch(x, threshold, n_permutations=1024, tail=0, grid_ndim=None, t_power=1, seed=None,
+                                    batch_size=50, p_threshold=0.05, signs=None):
+    """
+    This function performs the cluster based (or TFCE) sign flip permutation tests of several one sample tests at once,
+    for instance all the ROIs x conditions of a group analysis. All the tests share the same sign flips. The p-values
+    of each test are corrected within the test (max statistic over the map), as in
+    mne.stats.permutation_cluster_1samp_test
+    :param x: (np array, subjects x tests x grid dims) data of each test, i.e. decoding accuracy minus chance
+    :param threshold: (float or dict) cluster forming threshold, or dict(start=, step=) (and optionally h_power,
+    e_power) for the TFCE
+    :param n_permutations: (int) number of permutations, including the observed data
+    :param tail: (int) 1 for upper tail, -1 lower tail, 0 two tailed
+    :param grid_ndim: (int or None) number of grid dimensions, all the dimensions after the tests by default
+    :param t_power: (float) power to which the t statistics are raised before summing them in the clusters
+    :param seed: (None or int) seed of the sign flips
+    :param batch_size: (int) number of permutations computed at once
+    :param p_threshold: (float) for the TFCE, significance level of the points gathered in the returned clusters
+    :param signs: (None or np array of +/-1, permutations x subjects) sign flips to use, the first one being the
+    observed data. Drawn with sign_flips if None
+    :return: (list of dict) results of each test: T_obs the t map (TFCE scores for the TFCE), cluster the clusters
+    masks, cluster_p the p-value of each cluster, H0 the maximal statistic of each permutation, and for the TFCE
+    p_values the p-value of each point. The TFCE clusters are the connected components of the significant points, their
+    p-value the largest p-value of their points
+    """
+    grid_ndim = x.ndim - 2 if grid_ndim is None else grid_ndim
+    tfce = isinstance(threshold, dict)
+    if signs is None:
+        signs = sign_flips(x.shape[0], n_permutations=n_permutations, tail=tail, seed=seed)
+    reduce_axes = tuple(range(2, 2 + grid_ndim))
+
+    def max_stat(t_maps):
+        if tfce:
+            scores = tfce_maps(t_maps, grid_ndim=grid_ndim, tail=tail, **threshold)
+            return scores, np.max(np.abs(scores) if tail == 0 else tail * scores, axis=reduce_axes)
+        return t_maps, cluster_maxima(t_maps, threshold, tail=tail, grid_ndim=grid_ndim, t_power=t_power)
+
+    # The first permutation is the observed data:
+    h0 = []
+    for start in range(0, signs.shape[0], batch_size):
+        stat_maps, batch_h0 = max_stat(ttest_1samp_flips(x, signs[start:start + batch_size]))
+        if start == 0:
+            obs_maps = stat_maps[0]
+        h0.append(batch_h0)
+    h0 = np.concatenate(h0, axis=0)
+
+    results = []
+    for ti in range(x.shape[1]):
+        if tfce:
+            obs = np.abs(obs_maps[ti]) if tail == 0 else tail * obs_maps[ti]
+            p_values = np.mean(h0[:, ti].reshape((-1,) + (1,) * grid_ndim) >= obs[None], axis=0)
+            labels, n_labels = ndimage.label(p_values <= p_threshold)
+            clusters = [labels == label for label in range(1, n_labels + 1)]
+            cluster_p = np.array([np.max(p_values[c]) for c in clusters])
+            results.append({"T_obs": obs_maps[ti], "cluster": clusters, "cluster_p": cluster_p, "H0": h0[:, ti],
+                            "p_values": p_values})
+        else:
+            clusters, sums = find_clusters(obs_maps[ti], threshold, tail=tail, t_power=t_power)
+            cluster_p = np.array([np.mean(h0[:, ti] >= (abs(s) if tail == 0 else tail * s)) for s in sums])
+            results.append({"T_obs": obs_maps[ti], "cluster": clusters, "cluster_p": cluster_p, "H0": h0[:, ti]})
+    return results
+
+
+def group_cluster_table(tests, key_names, threshold, n_permutations=1024, tail=0, t_power=1, seed=None, batch_size=50):
+    """
+    This function performs the cluster based sign flip permutation tests of all the tests of a group analysis with the
+    same sign flips, the tests of same shape (i.e. all the time courses, all the GAT maps) being computed in one batch
+    :param tests: (dict of np arrays, subjects x grid dims) data of each test (i.e. decoding accuracy minus chance),
+    the keys are tuples of the values of key_names, for instance (roi, decoding, condition)
+    :param key_names: (list of strings) names of the keys of the tests, the first columns of the table
+    :param threshold: (float) cluster forming threshold, positive
+    :param n_permutations: (int) number of permutations, including the observed data
+    :param tail: (int) 1 for upper tail, -1 lower tail, 0 two tailed
+    :param t_power: (float) power to which the t statistics are raised before summing them in the clusters
+    :param seed: (None or int) seed of the sign flips
+    :param batch_size: (int) number of permutations computed at once
+    :return: (pandas data frame) one row per cluster: the keys of the test, cluster (index of the cluster in the test),
+    cluster_stat (sum of the t statistics), cluster_p, start and stop (first and last + 1 index of the cluster along the
+    first grid dimension) and indices (indices of the cluster points, same as out_type='indices' in mne)
+    """
+    keys = list(tests.keys())
+    n_subjects = tests[keys[0]].shape[0]
+    signs = sign_flips(n_subjects, n_permutations=n_permutations, tail=tail, seed=seed)
+    rows = []
+    for shape in pd.unique(pd.Series([tests[key].shape for key in keys])):
+        shape_keys = [key for key in keys if tests[key].shape == shape]
+        # subjects x tests x grid dims:
+        x = np.stack([tests[key] for key in shape_keys], axis=1)
+        results = permutation_cluster_1samp_batch(x, threshold, tail=tail, t_power=t_power, batch_size=batch_size,
+                                                  signs=signs)
+        for key, res in zip(shape_keys, results):
+            for ci, (cluster, p) in enumerate(zip(res["cluster"], res["cluster_p"])):
+                indices = np.nonzero(cluster)
+                rows.append(dict(zip(key_names, key), cluster=ci, cluster_stat=np.sum(res["T_obs"][cluster]),
+                                 cluster_p=p, start=indices[0].min(), stop=indices[0].max() + 1, indices=indices))
+    return pd.DataFrame(rows, columns=list(key_names) + ["cluster", "cluster_stat", "cluster_p", "start", "stop",
+                                                         "indices"])
+
+
+def cluster_stat_from_table(cluster_table, **keys):
+    """
+    This function returns the clusters of one test of a cluster table, in the format of the plotting functions
+    :param cluster_table: (pandas data frame) table returned by group_cluster_table
+    :param keys: values of the keys of the test, i.e. roi="GNW", decoding="wcd_acc", condition="Irrelevant"
+    :return: (dict) cluster: indices of the points of each cluster, cluster_p: p-value of each cluster
+    """
+    test_table = cluster_table
+    for key, val in keys.items():
+        test_table = test_table.loc[test_table[key] == val]
+    return {"cluster": test_table["indices"].to_list(), "cluster_p": test_table["cluster_p"].to_numpy()}
@@ -8,6 +8,7 @@ revised by Ling
 
 import random
 import numpy as np
+from scipy import stats
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import StratifiedKFold, KFold
 from sklearn.feature_selection import SelectKBest, f_classif
@@ -19,7 +20,6 @@ import statsmodels.api as sm
 import pandas as pd
 from statsmodels.stats import multitest
 import mne.stats
-import pingouin as pg
 from mne.stats.cluster_level import _pval_from_histogram
 
 from D_MEG_function import ATdata
@@ -743,6 +743,100 @@ def rdm_regress_groups(rdm, groups_1, groups_2):
     return rdm_regress_flat.reshape(rdm.shape)
 
 
+def pearson_rows(x, y):
+    """
+    This function computes the pearson correlation between each row of x and the vector y
+    :param x: (np array) data, n_matrices * n_cells
+    :param y: (np array) predictor, n_cells
+    :return: (np array) correlation of each row, n_matrices
+    """
+    x = x - np.mean(x, axis=1, keepdims=True)
+    y = y - np.mean(y)
+    return (x @ y) / (np.sqrt(np.sum(x ** 2, axis=1)) * np.sqrt(np.sum(y ** 2)))
+
+
+def kendall_rows(x, y):
+    """
+    This function computes the kendall tau-b between each row of x and the vector y. When y is binary, as the theories
+    predicted matrices are, the difference between concordant and discordant pairs is given by the rank sum of the
+    cells predicted high (Mann-Whitney U), such that all rows are handled with one ranking and one product. Otherwise,
+    scipy merge sort kendall tau is computed on each row
+    :param x: (np array) data, n_matrices * n_cells
+    :param y: (np array) predictor, n_cells
+    :return: (np array) kendall tau-b of each row, n_matrices
+    """
+    levels = np.unique(y)
+    if len(levels) != 2:
+        return np.array([stats.kendalltau(row, y)[0] for row in x])
+    n = x.shape[1]
+    high = y == levels[1]
+    n_high, n_low = np.sum(high), np.sum(~high)
+    ranks = stats.rankdata(x, axis=1)
+    # Rank sum of the high cells minus its minimum, counting ties as half:
+    u = np.sum(ranks[:, high], axis=1) - n_high * (n_high + 1) / 2
+    concordance = 2 * u - n_high * n_low
+    # Pairs tied in x, from the size of each group of tied values:
+    sorted_x = np.sort(x, axis=1)
+    ties_x = np.zeros(x.shape[0])
+    for ind, row in enumerate(sorted_x):
+        _, counts = np.unique(row, return_counts=True)
+        ties_x[ind] = np.sum(counts * (counts - 1) / 2)
+    n_pairs = n * (n - 1) / 2
+    ties_y = n_high * (n_high - 1) / 2 + n_low * (n_low - 1) / 2
+    return concordance / np.sqrt((n_pairs - ties_x) * (n_pairs - ties_y))
+
+
+def batch_correlation(x, predictors, method="pearson"):
+    """
+    This function computes the correlation between each row of x (flattened observed or shuffled matrices) and each
+    predictor at once. For partial and semi-partial correlations, there must be two predictors and each is correlated
+    with the data while the other one is partialled out (from both or from the predictor only respectively). Rows with
+    NaN are correlated on their valid cells only
+    :param x: (np array) data, n_matrices * n_cells
+    :param predictors: (dict of np arrays) predictor vectors, n_cells each
+    :param method: (string) pearson, spearman, kendall, partial or semi-partial
+    :return: (pd data frame) correlation of each row (index) with each predictor (columns)
+    """
+    supported_method = ["pearson", "spearman", "partial", "semi-partial", "kendall"]
+    method = method.lower()
+    if method not in supported_method:
+        raise Exception("You have passed {0} as correlation method, but only {1} supported".format(method,
+                                                                                                   supported_method))
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    predictors = {name: np.asarray(predictor, dtype=float) for name, predictor in predictors.items()}
+    names = list(predictors.keys())
+    if method in ["partial", "semi-partial"] and len(names) != 2:
+        raise Exception("The {0} correlation requires exactly two predictors!".format(method))
+    nan_rows = np.any(np.isnan(x), axis=1)
+    if np.any(nan_rows):
+        results = pd.DataFrame(np.nan, index=range(x.shape[0]), columns=names)
+        if np.any(~nan_rows):
+            results.loc[~nan_rows] = batch_correlation(x[~nan_rows], predictors, method=method).to_numpy()
+        for ind in np.where(nan_rows)[0]:
+            valid = ~np.isnan(x[ind])
+            results.loc[ind] = batch_correlation(x[ind, valid],
+                                                 {name: predictors[name][valid] for name in names},
+                                                 method=method).to_numpy()[0]
+        return results
+    if method == "kendall":
+        return pd.DataFrame({name: kendall_rows(x, predictors[name]) for name in names})
+    if method == "spearman":
+        x = stats.rankdata(x, axis=1)
+        predictors = {name: stats.rankdata(predictors[name]) for name in names}
+    r_xy = {name: pearson_rows(x, predictors[name]) for name in names}
+    if method in ["pearson", "spearman"]:
+        return pd.DataFrame(r_xy)
+    r_yz = pearson_rows(predictors[names[0]][np.newaxis, :], predictors[names[1]])[0]
+    results = {}
+    for ind, name in enumerate(names):
+        r_xz = r_xy[names[ind - 1]]
+        if method == "partial":
+            results[name] = (r_xy[name] - r_xz * r_yz) / np.sqrt((1 - r_xz ** 2) * (1 - r_yz ** 2))
+        else:
+            results[name] = (r_xy[name] - r_xz * r_yz) / np.sqrt(1 - r_yz ** 2)
+    return pd.DataFrame(results)
+
+
 def compute_correlation_theories(observed_matrix, theories_matrices, method="kendall"):
     """
     Compute the correlation between the predicted and obtained matrices
@@ -757,56 +851,13 @@ def compute_correlation_theories(observed_matrix, theories_matrices, method="ken
     print("Computing {0} correlation between data and {1} predicted matrices".
           format(method.lower(),
                  list(theories_matrices.keys())))
-    supported_method = ["kendall", "spearman", "partial", "semi-partial"]
     # Flatten the decoding scores and theory matrices:
     observed_matrix_flat = [observed_matrix[i].flatten()
                             for i in range(0, len(observed_matrix))]
     theory_matrices_flat = {theory: theories_matrices[theory].flatten(
     ) for theory in theories_matrices.keys()}
-    if method.lower() == "kendall" or method.lower() == "spearman":
-        # Computing the correlation coefficient between the matrices of each cross validation folds:
-        correlation_results = pd.DataFrame({
-            theory: [pg.corr(observed_matrix_flat[i], theory_matrices_flat[theory],
-                             method=method.lower())["r"].item()
-                     for i in range(0, len(observed_matrix_flat))]
-            for theory in theories_matrices.keys()
-        })
-    elif method.lower() == "partial":
-        # For partial correlation, we need to convert the data to data frames:
-        theories = list(theories_matrices.keys())
-        data_dfs = [pd.DataFrame({
-            "scores": observed_matrix_flat[i],
-            theories[0]: theory_matrices_flat[theories[0]],
-            theories[1]: theory_matrices_flat[theories[1]]})
-            for i in range(0, len(observed_matrix))]
-        # We now perform the partial correlation always holding one theory constant while checking the other:
-        correlation_results = {}
-        for ind, theory in enumerate(theories):
-            correlation_results[theory] = [pg.partial_corr(data=data_dfs[i], x='scores', y=theory,
-                                                           covar=theories[ind - 1])["r"].item()
-                                           for i in range(len(data_dfs))]
-        # Convert the dict to a dataframe to keep things consistent:
-        correlation_results = pd.DataFrame(correlation_results)
-    elif method.lower() == "semi-partial":
-        # For partial correlation, we need to convert the data to data frames:
-        theories = list(theories_matrices.keys())
-        data_dfs = [pd.DataFrame({
-            "scores": observed_matrix_flat[i],
-            theories[0]: theory_matrices_flat[theories[0]],
-            theories[1]: theory_matrices_flat[theories[1]]})
-            for i in range(0, len(observed_matrix))]
-        # We now perform the partial correlation always holding one theory constant while checking the other:
-        correlation_results = {}
-        for ind, theory in enumerate(theories):
-            correlation_results[theory] = [pg.partial_corr(data=data_dfs[i], x='scores', y=theory,
-                                                           y_covar=theories[ind - 1])["r"].item()
-                                           for i in range(len(data_dfs))]
-        # Convert the dict to a dataframe to keep things consistent:
-        correlation_results = pd.DataFrame(correlation_results)
-    else:
-        raise Exception("You have passed {0} as correlation method, but only {1} supported".format(method.lower(),
-                                                                                                   supported_method))
-
+    # All the matrices are correlated with each theory at once:
+    correlation_results = batch_correlation(np.stack(observed_matrix_flat), theory_matrices_flat, method=method)
     # Correct the correlation results to be positively defined between 0 and 1:
     correlation_results_corrected = correlation_results.apply(lambda x: (x + 1) / 2)
 
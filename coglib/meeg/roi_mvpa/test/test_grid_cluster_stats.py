@@ -0,0 +1,128 @@
+import unittest
+import numpy as np
+from numpy.testing import assert_allclose, assert_array_equal
+from mne.stats import permutation_cluster_1samp_test
+from grid_cluster_stats import label_maps, permutation_cluster_1samp_batch, sign_flips
+
+
+def mne_signs(n_subjects, tail):
+    """
+    Sign flips of the exact test of mne: all the flips of the first subjects in the two tailed test. In the one tailed
+    tests, mne doesn't flip every subject and computes the observed data a second time instead
+    """
+    signs = sign_flips(n_subjects, n_permutations=2 ** n_subjects, tail=tail)
+    if tail != 0:
+        signs[-1] = 1
+    return signs
+
+
+def sorted_clusters(clusters, cluster_p, shape):
+    # The clusters of mne and of the batch function aren't found in the same order, and mne returns slices for the
+    # time courses:
+    points = []
+    for cluster in clusters:
+        mask = np.zeros(shape, dtype=bool)
+        mask[cluster] = True
+        points.append(tuple(np.flatnonzero(mask)))
+    order = sorted(range(len(points)), key=lambda i: points[i])
+    return [np.array(points[i]) for i in order], np.asarray(cluster_p)[order]
+
+
+class TestPermutationClusterVsMNE(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.n_subjects = 8
+        # Time courses and GAT maps of 3 tests, with positive and negative effects:
+        self.x_1d = rng.normal(size=(self.n_subjects, 3, 20))
+        self.x_1d[:, :, 5:12] += 1
+        self.x_1d[:, 1, 14:18] -= 1.2
+        self.x_2d = rng.normal(size=(self.n_subjects, 3, 6, 7))
+        self.x_2d[:, :, 1:4, 2:6] += 1
+        self.x_2d[:, 2, 4:, :2] -= 1.2
+
+    def _mne_test(self, x, threshold, tail):
+        if not isinstance(threshold, dict) and tail == -1:
+            threshold = -threshold
+        n_permutations = 2 ** (self.n_subjects - 1) if tail == 0 else 2 ** self.n_subjects
+        return permutation_cluster_1samp_test(x, threshold=threshold, tail=tail, n_permutations=n_permutations,
+                                              out_type="mask", verbose=False)
+
+    def test_clusters(self):
+        for x in [self.x_1d, self.x_2d]:
+            for tail in [0, 1, -1]:
+                results = permutation_cluster_1samp_batch(x, 2.0, tail=tail, batch_size=7,
+                                                          signs=mne_signs(self.n_subjects, tail))
+                for ti, res in enumerate(results):
+                    t_obs, clusters, cluster_p, h0 = self._mne_test(x[:, ti], 2.0, tail)
+                    assert_allclose(res["T_obs"], t_obs)
+                    if len(h0) == 0:
+                        # mne doesn't permute the tests without any cluster:
+                        self.assertEqual(len(res["cluster"]), 0)
+                        continue
+                    # The maxima are in absolute value, mne keeps the sign of the clusters:
+                    assert_allclose(np.sort(res["H0"]), np.sort(np.abs(h0)))
+                    expected_clusters, expected_p = sorted_clusters(clusters, cluster_p, t_obs.shape)
+                    observed_clusters, observed_p = sorted_clusters(res["cluster"], res["cluster_p"],
+                                                                     t_obs.shape)
+                    self.assertEqual(len(observed_clusters), len(expected_clusters))
+                    for observed, expected in zip(observed_clusters, expected_clusters):
+                        assert_array_equal(observed, expected)
+                    # In the one tailed tests, the second copy of the observed data in mne is computed again, and is
+                    # counted or not in the p-values depending on the rounding errors:
+                    assert_allclose(observed_p, expected_p, atol=0 if tail == 0 else 1 / 2 ** self.n_subjects)
+
+    def test_tfce(self):
+        threshold = dict(start=0, step=0.2)
+        for x in [self.x_1d, self.x_2d]:
+            for tail in [0, 1]:
+                results = permutation_cluster_1samp_batch(x, threshold, tail=tail, batch_size=7,
+                                                          signs=mne_signs(self.n_subjects, tail))
+                for ti, res in enumerate(results):
+                    t_obs, _, p_values, h0 = self._mne_test(x[:, ti], threshold, tail)
+                    assert_allclose(res["T_obs"], t_obs)
+                    assert_allclose(np.sort(res["H0"]), np.sort(h0))
+                    assert_allclose(res["p_values"].ravel(), p_values)
+
+    def test_exact_flips(self):
+        # With fewer possible flips than permutations, the test is the same as the exact test of mne:
+        signs = sign_flips(self.n_subjects, n_permutations=1000, tail=0)
+        self.assertEqual(signs.shape, (2 ** (self.n_subjects - 1), self.n_subjects))
+        assert_array_equal(signs[0], 1)
+        self.assertEqual(np.unique(signs, axis=0).shape[0], signs.shape[0])
+        results = permutation_cluster_1samp_batch(self.x_1d, 2.0, n_permutations=1000, tail=0)
+        _, _, cluster_p, _ = self._mne_test(self.x_1d[:, 0], 2.0, 0)
+        assert_allclose(np.sort(results[0]["cluster_p"]), np.sort(cluster_p))
+
+
+class TestLabelMaps(unittest.TestCase):
+
+    def test_maps_isolation(self):
+        # Identical maps stacked next to each other must not share any label:
+        mask = np.zeros((4, 5), dtype=bool)
+        mask[0, :] = True
+        mask[-1, :] = True
+        mask[1:3, 2] = True
+        masks = np.stack([np.stack([mask, ~mask]), np.stack([mask, np.zeros_like(mask)])])
+        labels, map_index = label_maps(masks, grid_ndim=2)
+        for map_i, (i, j) in enumerate(np.ndindex(masks.shape[:2])):
+            map_labels = np.unique(labels[i, j][masks[i, j]])
+            # Each map has its own labels, and the map index points back to it:
+            assert_array_equal(map_index[map_labels], map_i)
+            self.assertFalse(np.any(np.isin(map_labels, labels[np.arange(2)[:, None] * 2 + np.arange(2) != map_i])))
+        # The first map has a single component (the rows joined through the column), the second one two:
+        self.assertEqual(np.unique(labels[0, 0][mask]).shape[0], 1)
+        self.assertEqual(np.unique(labels[0, 1][~mask]).shape[0], 2)
+        self.assertEqual(labels.max(), 1 + 2 + 1)
+        assert_array_equal(labels[~masks], 0)
+
+    def test_lattice_adjacency(self):
+        # Diagonal neighbours aren't connected, as in mne with adjacency=None:
+        mask = np.eye(3, dtype=bool)[None]
+        labels, map_index = label_maps(mask, grid_ndim=2)
+        self.assertEqual(labels.max(), 3)
+        assert_array_equal(map_index[1:], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import os.path as op
+import sys
+import signal
+import subprocess
+import tempfile
+import unittest
+import numpy as np
+from numpy.testing import assert_array_equal
+from sklearn.feature_selection import SelectKBest, f_classif
+from D_MEG_function import _hash_dict, _repeats_input_signature
+
+# Job running the repeats of a pipeline with a score function, killed once KILL_AFTER repeats are saved as a job
+# reaching its time limit:
+REPEATS_SCRIPT = '''
+import os
+import sys
+import signal
+import numpy as np
+from sklearn.base import clone
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.feature_selection import SelectKBest, f_classif
+from sklearn.linear_model import LogisticRegression
+from D_MEG_function import run_pseudotrials_repeats
+
+
+def repeat_fun(rng, x, y, clf):
+    kill_after = os.environ.get("KILL_AFTER")
+    if kill_after is not None and len([fname for fname in os.listdir(sys.argv[1])
+                                       if fname.startswith("repeat-")]) >= int(kill_after):
+        os.kill(os.getpid(), signal.SIGKILL)
+    train = rng.permutation(y.shape[0])[:30]
+    return clone(clf).fit(x[train], y[train]).predict_proba(x)[:, 1]
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    x = rng.normal(size=(40, 6))
+    y = np.repeat([0, 1], 20)
+    clf = make_pipeline(StandardScaler(), SelectKBest(f_classif, k=3), LogisticRegression())
+    scores = run_pseudotrials_repeats(repeat_fun, n_repeats=6, n_jobs=1, seed=42, fpath_repeats=sys.argv[1],
+                                      x=x, y=y, clf=clf)
+    np.save(sys.argv[2], scores)
+'''
+
+
+class TestInputsHash(unittest.TestCase):
+
+    def test_functions(self):
+        # Functions and classes are hashed by name, not by their address in the process:
+        self.assertEqual(_hash_dict({"score_func": f_classif}),
+                         _hash_dict({"score_func": "sklearn.feature_selection._univariate_selection.f_classif"}))
+        signature = _repeats_input_signature(SelectKBest(f_classif, k=3))
+        self.assertEqual(signature[0], "sklearn.feature_selection._univariate_selection.SelectKBest")
+        self.assertNotEqual(_hash_dict(signature), _hash_dict(_repeats_input_signature(SelectKBest(f_classif, k=4))))
+        # The other objects can't be hashed:
+        with self.assertRaises(TypeError):
+            _hash_dict({"value": object()})
+
+
+class TestRunPseudotrialsRepeats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.script = op.join(self.tmp_dir.name, "repeats_job.py")
+        with open(self.script, "w") as f:
+            f.write(REPEATS_SCRIPT)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _run_job(self, fpath_repeats, fname_scores, kill_after=None):
+        # Each job is a new process, with the import paths of the tests:
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        env.pop("KILL_AFTER", None)
+        if kill_after is not None:
+            env["KILL_AFTER"] = str(kill_after)
+        return subprocess.run([sys.executable, self.script, fpath_repeats, fname_scores], env=env,
+                              capture_output=True, text=True, cwd=self.tmp_dir.name)
+
+    def test_resume_killed_job(self):
+        fpath_repeats = op.join(self.tmp_dir.name, "repeats")
+        fname_scores = op.join(self.tmp_dir.name, "scores.npy")
+        job = self._run_job(fpath_repeats, fname_scores, kill_after=3)
+        self.assertEqual(job.returncode, -signal.SIGKILL, job.stderr)
+        self.assertFalse(op.exists(fname_scores))
+        stored = sorted(fname for fname in os.listdir(fpath_repeats) if fname.startswith("repeat-"))
+        self.assertEqual(stored, ["repeat-0000.npy", "repeat-0001.npy", "repeat-0002.npy"])
+        stored_mtime = [os.stat(op.join(fpath_repeats, fname)).st_mtime_ns for fname in stored]
+
+        # The second job only runs the missing repeats:
+        job = self._run_job(fpath_repeats, fname_scores)
+        self.assertEqual(job.returncode, 0, job.stderr)
+        self.assertIn("Resuming: 3 of 6 repeats already computed", job.stdout)
+        self.assertNotIn("Discarding", job.stdout)
+        self.assertEqual([os.stat(op.join(fpath_repeats, fname)).st_mtime_ns for fname in stored], stored_mtime)
+
+        # Same results as a job that was never killed:
+        fname_expected = op.join(self.tmp_dir.name, "expected.npy")
+        job = self._run_job(op.join(self.tmp_dir.name, "repeats_expected"), fname_expected)
+        self.assertEqual(job.returncode, 0, job.stderr)
+        scores = np.load(fname_scores)
+        self.assertEqual(scores.shape, (6, 40))
+        assert_array_equal(scores, np.load(fname_expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
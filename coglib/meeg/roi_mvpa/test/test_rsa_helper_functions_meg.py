@@ -0,0 +1,80 @@
+import unittest
+import numpy as np
+import pandas as pd
+import pingouin as pg
+from numpy.testing import assert_allclose
+from scipy import stats
+from rsa_helper_functions_meg import pearson_rows, kendall_rows, batch_correlation
+
+
+def scipy_correlation(row, predictors, method):
+    # Correlation of a single row with each predictor, with scipy and pingouin:
+    names = list(predictors.keys())
+    results = {}
+    for ind, name in enumerate(names):
+        if method == "pearson":
+            results[name] = stats.pearsonr(row, predictors[name])[0]
+        elif method == "spearman":
+            results[name] = stats.spearmanr(row, predictors[name])[0]
+        elif method == "kendall":
+            results[name] = stats.kendalltau(row, predictors[name])[0]
+        else:
+            data = pd.DataFrame({"x": row, "y": predictors[name], "z": predictors[names[ind - 1]]})
+            if method == "partial":
+                results[name] = pg.partial_corr(data, x="x", y="y", covar="z")["r"].iloc[0]
+            else:
+                results[name] = pg.partial_corr(data, x="x", y="y", y_covar="z")["r"].iloc[0]
+    return results
+
+
+class TestBatchCorrelation(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        # Binary predictors, as the theories predicted matrices, and a continuous one:
+        n_cells = 45
+        self.predictors = {"IIT": (rng.uniform(size=n_cells) > 0.5).astype(float),
+                           "GNW": (rng.uniform(size=n_cells) > 0.7).astype(float)}
+        self.continuous = {"IIT": self.predictors["IIT"] + rng.normal(size=n_cells),
+                           "GNW": np.round(rng.normal(size=n_cells), 1)}
+        self.x = rng.normal(size=(20, n_cells)) + self.predictors["IIT"]
+        # Rows with ties:
+        self.x[:5] = np.round(self.x[:5])
+        self.x[5] = 1.
+        self.x[5, :10] = 0.
+        # Rows with NaNs:
+        self.x[6, [3, 17]] = np.nan
+        self.x[7, :20] = np.nan
+
+    def _check(self, x, predictors, method):
+        results = batch_correlation(x, predictors, method=method)
+        self.assertEqual(list(results.columns), list(predictors.keys()))
+        for ind, row in enumerate(x):
+            valid = ~np.isnan(row)
+            expected = scipy_correlation(row[valid], {name: predictor[valid]
+                                                      for name, predictor in predictors.items()}, method)
+            for name in predictors:
+                assert_allclose(results.loc[ind, name], expected[name], rtol=1e-10, atol=1e-12,
+                                err_msg="{} {} row {}".format(method, name, ind))
+
+    def test_methods(self):
+        for method in ["pearson", "spearman", "kendall", "partial", "semi-partial"]:
+            self._check(self.x, self.predictors, method)
+            self._check(self.x, self.continuous, method)
+
+    def test_rows(self):
+        # The row functions directly, for the rows without NaN:
+        x = self.x[:6]
+        for name, predictor in {**self.predictors, "continuous": self.continuous["GNW"]}.items():
+            assert_allclose(pearson_rows(x, predictor), [stats.pearsonr(row, predictor)[0] for row in x])
+            assert_allclose(kendall_rows(x, predictor), [stats.kendalltau(row, predictor)[0] for row in x])
+
+    def test_errors(self):
+        with self.assertRaises(Exception):
+            batch_correlation(self.x, self.predictors, method="distance")
+        with self.assertRaises(Exception):
+            batch_correlation(self.x, {"IIT": self.predictors["IIT"]}, method="partial")
+
+
+if __name__ == '__main__':
+    unittest.main()
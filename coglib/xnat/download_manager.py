@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# author: Praveen Sripad <praveen.sripad@ae.mpg.de>
+
+"""Parallel, resumable download of the resources of an XNAT project.
+
+The files of the project, subjects and experiments resources (and optionally
+of the scans) are listed through the XNAT REST API and downloaded by a pool of
+workers. Each file is first written to a ``.part`` file, which is resumed with
+an HTTP range request if the download is interrupted, and is checked against
+the size and MD5 digest reported by the server before being moved in place.
+
+A manifest of the downloaded files is kept in the download directory, such
+that re-runs only fetch the files that are missing or changed on the server.
+Each downloaded file is appended to a log, which is merged into the manifest
+at the end of the downloads, or when the next run reads the manifest if the
+downloads were interrupted.
+
+"""
+
+import os
+import os.path as op
+import json
+import time
+import hashlib
+import netrc
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+MANIFEST_FNAME = '.xnat_manifest.json'
+MANIFEST_LOG_FNAME = '.xnat_manifest.log'
+
+
+def connect(host, netrc_file=None):
+    """Create a requests session to the XNAT host.
+
+    The credentials of the host are read from the netrc file, if any.
+
+    """
+    session = requests.Session()
+    if netrc_file is not None and op.isfile(netrc_file):
+        auth = netrc.netrc(netrc_file).authenticators(urlparse(host).hostname)
+        if auth is not None:
+            session.auth = (auth[0], auth[2])
+    return session
+
+
+def _md5sum(fname, chunk_size=2 ** 20):
+    """Compute the MD5 hex digest of a file."""
+    md5 = hashlib.md5()
+    with open(fname, 'rb') as fid:
+        for chunk in iter(lambda: fid.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class XNATDownloadManager(object):
+    """Download the resources of an XNAT project in parallel.
+
+    Parameters
+    ----------
+    host : str
+        URL of the XNAT server, e.g. https://xnat-curate.ae.mpg.de
+    download_dir : str
+        Directory in which the project is downloaded.
+    session : requests.Session | None
+        Session to the server (see ``connect``). A new session without
+        credentials is created if None.
+    n_workers : int
+        Number of files downloaded in parallel.
+    n_retries : int
+        Number of attempts for each file before giving up on it.
+    chunk_size : int
+        Size in bytes of the chunks in which the files are streamed.
+    timeout : float
+        Timeout in seconds of the requests to the server.
+
+    """
+
+    def __init__(self, host, download_dir, session=None, n_workers=4,
+                 n_retries=5, chunk_size=2 ** 18, timeout=60):
+        self.host = host.rstrip('/')
+        self.download_dir = download_dir
+        self.session = session if session is not None else requests.Session()
+        self.n_workers = n_workers
+        self.n_retries = n_retries
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.manifest_fname = op.join(download_dir, MANIFEST_FNAME)
+        self.manifest_log_fname = op.join(download_dir, MANIFEST_LOG_FNAME)
+        self._manifest_lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    # Manifest
+    def _read_manifest(self):
+        manifest = dict()
+        if op.isfile(self.manifest_fname):
+            with open(self.manifest_fname) as fid:
+                manifest = json.load(fid)
+        # Files downloaded since the manifest was last written:
+        if op.isfile(self.manifest_log_fname):
+            with open(self.manifest_log_fname) as fid:
+                for line in fid:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Line truncated by an interruption:
+                        continue
+                    manifest[record['path']] = record['entry']
+        return manifest
+
+    def _update_manifest(self, path, entry):
+        # Only appended to the log, the whole manifest is written once by
+        # _write_manifest:
+        with self._manifest_lock:
+            self.manifest[path] = entry
+            with open(self.manifest_log_fname, 'a') as fid:
+                fid.write(json.dumps(dict(path=path, entry=entry)) + '\n')
+
+    def _write_manifest(self):
+        # Written to a temporary file first, for an interruption to never
+        # leave a truncated manifest, and the log removed once merged:
+        with self._manifest_lock:
+            if not op.isfile(self.manifest_log_fname):
+                # Nothing downloaded since the manifest was written:
+                return
+            tmp_fname = self.manifest_fname + '.tmp'
+            with open(tmp_fname, 'w') as fid:
+                json.dump(self.manifest, fid, indent=1, sort_keys=True)
+            os.replace(tmp_fname, self.manifest_fname)
+            os.remove(self.manifest_log_fname)
+
+    # Listing
+    def _get_results(self, uri):
+        response = self.session.get(self.host + uri,
+                                    params={'format': 'json'},
+                                    timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['ResultSet']['Result']
+
+    def _list_resources_files(self, uri, local_dir):
+        """List the files of all the resources of an XNAT object."""
+        files = list()
+        for res in self._get_results(uri + '/resources'):
+            label = res.get('label') or res['xnat_abstractresource_id']
+            res_uri = '%s/resources/%s/files' % (
+                uri, res['xnat_abstractresource_id'])
+            for fdesc in self._get_results(res_uri):
+                # path of the file within the resource:
+                rel_path = fdesc['URI'].split('/files/', 1)[1]
+                files.append(dict(
+                    uri=fdesc['URI'],
+                    path=op.join(local_dir, label, *rel_path.split('/')),
+                    size=int(fdesc['Size']) if fdesc.get('Size') else None,
+                    digest=fdesc.get('digest') or None))
+        return files
+
+    def list_files(self, project, subjects=None, include_scans=False):
+        """List the resources files of the project, subjects and experiments.
+
+        Parameters
+        ----------
+        project : str
+            ID of the project.
+        subjects : list of str | None
+            Labels of the subjects to list, all of them if None.
+        include_scans : bool
+            Whether to also list the resources of the scans.
+
+        Returns
+        -------
+        files : list of dict
+            URI, local path (relative to the download directory), size and
+            MD5 digest of each file.
+
+        """
+        project_uri = '/data/projects/%s' % project
+        files = self._list_resources_files(project_uri, project)
+        for subj in self._get_results(project_uri + '/subjects'):
+            if subjects is not None and subj['label'] not in subjects:
+                continue
+            subj_uri = '%s/subjects/%s' % (project_uri, subj['ID'])
+            subj_dir = op.join(project, subj['label'])
+            files += self._list_resources_files(subj_uri, subj_dir)
+            for exp in self._get_results(subj_uri + '/experiments'):
+                exp_uri = '/data/experiments/%s' % exp['ID']
+                exp_dir = op.join(subj_dir, exp['label'])
+                files += self._list_resources_files(exp_uri, exp_dir)
+                if not include_scans:
+                    continue
+                for scan in self._get_results(exp_uri + '/scans'):
+                    files += self._list_resources_files(
+                        '%s/scans/%s' % (exp_uri, scan['ID']),
+                        op.join(exp_dir, 'scans', scan['ID']))
+        return files
+
+    # Download
+    def is_up_to_date(self, fdesc):
+        """Whether a file was downloaded and is unchanged on the server."""
+        entry = self.manifest.get(fdesc['path'])
+        fname = op.join(self.download_dir, fdesc['path'])
+        return (entry is not None and op.isfile(fname) and
+                entry['size'] == fdesc['size'] and
+                entry['digest'] == fdesc['digest'] and
+                (fdesc['size'] is None or op.getsize(fname) == fdesc['size']))
+
+    def _fetch(self, fdesc, part_fname):
+        """Download a file into the part file, resuming it if it exists."""
+        offset = op.getsize(part_fname) if op.isfile(part_fname) else 0
+        if fdesc['size'] is not None and offset > fdesc['size']:
+            offset = 0
+        headers = {'Range': 'bytes=%d-' % offset} if offset > 0 else {}
+        with self.session.get(self.host + fdesc['uri'], headers=headers,
+                              stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416:
+                # The part file is already complete:
+                return
+            response.raise_for_status()
+            # The server may ignore the range and send the whole file:
+            mode = 'ab' if response.status_code == 206 else 'wb'
+            with open(part_fname, mode) as fid:
+                for chunk in response.iter_content(self.chunk_size):
+                    fid.write(chunk)
+
+    def _verify(self, fdesc, fname):
+        if fdesc['size'] is not None and op.getsize(fname) != fdesc['size']:
+            return False
+        if fdesc['digest'] is not None and _md5sum(fname) != fdesc['digest']:
+            return False
+        return True
+
+    def download_file(self, fdesc):
+        """Download a single file, retrying with a backoff on failures.
+
+        Returns
+        -------
+        status : str
+            'skipped' if the file was up to date, 'downloaded' otherwise.
+
+        """
+        if self.is_up_to_date(fdesc):
+            return 'skipped'
+        fname = op.join(self.download_dir, fdesc['path'])
+        part_fname = fname + '.part'
+        os.makedirs(op.dirname(fname), exist_ok=True)
+        # A part file of an older version of the file can't be resumed:
+        entry = self.manifest.get(fdesc['path'])
+        if entry is not None and entry['digest'] != fdesc['digest'] and \
+                op.isfile(part_fname):
+            os.remove(part_fname)
+        for attempt in range(self.n_retries):
+            try:
+                self._fetch(fdesc, part_fname)
+            except requests.HTTPError as err:
+                # Only the server errors are worth retrying:
+                if err.response is None or err.response.status_code < 500:
+                    raise
+                print('Download of %s failed (%s), retrying'
+                      % (fdesc['path'], err))
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            except (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as err:
+                print('Download of %s interrupted (%s), resuming'
+                      % (fdesc['path'], err))
+                time.sleep(min(2 ** attempt, 30))
+                continue
+            if self._verify(fdesc, part_fname):
+                os.replace(part_fname, fname)
+                self._update_manifest(fdesc['path'], dict(
+                    uri=fdesc['uri'], size=fdesc['size'],
+                    digest=fdesc['digest']))
+                return 'downloaded'
+            # A corrupted file is downloaded again from scratch:
+            print('Checksum mismatch for %s, downloading it again'
+                  % fdesc['path'])
+            os.remove(part_fname)
+        raise RuntimeError('Failed to download %s after %d attempts'
+                           % (fdesc['path'], self.n_retries))
+
+    def download(self, files):
+        """Download the files with a pool of workers.
+
+        Parameters
+        ----------
+        files : list of dict
+            Files to download, as returned by ``list_files``.
+
+        Returns
+        -------
+        summary : dict
+            Paths of the downloaded, skipped and failed files.
+
+        """
+        summary = dict(downloaded=list(), skipped=list(), failed=list())
+        try:
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                futures = {executor.submit(self.download_file, fdesc): fdesc
+                           for fdesc in files}
+                for future in as_completed(futures):
+                    path = futures[future]['path']
+                    try:
+                        summary[future.result()].append(path)
+                    except Exception as err:
+                        print('Download of %s failed: %s' % (path, err))
+                        summary['failed'].append(path)
+        finally:
+            self._write_manifest()
+        print('Downloaded %d files, %d up to date, %d failed'
+              % (len(summary['downloaded']), len(summary['skipped']),
+                 len(summary['failed'])))
+        return summary
+
+    def download_project(self, project, subjects=None, include_scans=False):
+        """List and download the resources of a project.
+
+        See ``list_files`` for the parameters.
+
+        """
+        files = self.list_files(project, subjects=subjects,
+                                include_scans=include_scans)
+        return self.download(files)
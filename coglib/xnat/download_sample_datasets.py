@@ -12,43 +12,8 @@ ECOG - SE107, SE110, SF102, SF104
 
 """
 
-import os
 import os.path as op
-import xnat
-
-
-def _download_resources_recursively(xnat_object, download_dir):
-    """Download xnat resources recursively for projects, subjects and experiments.
-
-    Scan level data/resources are not downloaded.
-
-    """
-    print('Downloaded data for %s into directory %s'
-          % (xnat_object, download_dir))
-
-    if not op.isdir(download_dir):
-        os.mkdir(download_dir)
-
-    resources_list = xnat_object.resources.listing
-
-    if len(resources_list) != 0:
-        for res in resources_list:
-            print(res)
-            res.download_dir(download_dir)
-
-    # if xnat object is project, recurse
-    if type(xnat_object).__name__ == 'ProjectData':
-        for subj in xnat_object.subjects.listing:
-            _download_resources_recursively(subj,
-                                            op.join(download_dir, subj.label))
-
-    # if xnat object is subject, recurse
-    if type(xnat_object).__name__ == 'SubjectData':
-        for exp in xnat_object.experiments.listing:
-            _download_resources_recursively(exp, op.join(download_dir,
-                                            xnat_object.label, exp.label))
-
-    return
+from download_manager import connect, XNATDownloadManager
 
 
 # CONFIG
@@ -57,20 +22,22 @@ netrc_file = op.join(op.expanduser('~'), '.xnat_curate_netrc')
 
 myproject = 'cogitate_sample_dataset'
 download_dir = op.join(op.expanduser('~'), 'Downloads')
+n_workers = 4
 # CONFIG
 
 # start connection to XNAT
-connection = xnat.connect(xnat_host, netrc_file=netrc_file)
-
-# choose the project
-project = connection.projects[myproject]
+session = connect(xnat_host, netrc_file=netrc_file)
+manager = XNATDownloadManager(xnat_host, download_dir, session=session,
+                              n_workers=n_workers)
 
-# download everything under the project
-project.download_dir(download_dir)
+# download everything under the project, re-runs only download the files
+# that are missing or changed on the server
+manager.download_project(myproject, include_scans=True)
 
 # download all the data for a subject
 # mysubject = 'SA124'
-# project.subjects[mysubject].download_dir(download_dir)
+# manager.download_project(myproject, subjects=[mysubject],
+#                          include_scans=True)
 
 # download all the resources only (excluding the scans)
-# _download_resources_recursively(project, download_dir)
+# manager.download_project(myproject)
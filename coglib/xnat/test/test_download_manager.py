@@ -0,0 +1,190 @@
+import os
+import os.path as op
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from download_manager import (XNATDownloadManager, MANIFEST_FNAME,
+                              MANIFEST_LOG_FNAME)
+
+PROJECT = 'proj'
+FILES_URI = '/data/projects/%s/resources/1/files' % PROJECT
+FILE_URI = FILES_URI + '/sub/data.bin'
+
+
+class FakeXNATHandler(BaseHTTPRequestHandler):
+    """Serve the listing and the body of a single project resource file."""
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for key, val in (headers or dict()).items():
+            self.send_header(key, val)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, results):
+        body = json.dumps(dict(ResultSet=dict(Result=results))).encode()
+        self._send(200, body, {'Content-Type': 'application/json'})
+
+    def do_GET(self):
+        server = self.server
+        path = self.path.split('?', 1)[0]
+        if path == '/data/projects/%s/resources' % PROJECT:
+            self._send_json([dict(label='RES', xnat_abstractresource_id='1')])
+        elif path == FILES_URI:
+            self._send_json([dict(URI=FILE_URI, Size=str(len(server.body)),
+                                  digest=hashlib.md5(server.body).hexdigest())])
+        elif path == '/data/projects/%s/subjects' % PROJECT:
+            self._send_json([])
+        elif path == FILE_URI:
+            server.requests.append(self.headers.get('Range'))
+            body = server.body
+            if server.n_corrupted > 0:
+                server.n_corrupted -= 1
+                body = bytes(len(body))
+            range_header = self.headers.get('Range')
+            if range_header is not None and not server.ignore_range:
+                offset = int(range_header.split('=')[1].rstrip('-'))
+                if offset >= len(body):
+                    self._send(416, b'')
+                    return
+                server.sent.append(len(body) - offset)
+                self._send(206, body[offset:], {
+                    'Content-Range': 'bytes %d-%d/%d'
+                    % (offset, len(body) - 1, len(body))})
+            else:
+                server.sent.append(len(body))
+                self._send(200, body)
+        else:
+            self._send(404, b'')
+
+
+class TestXNATDownloadManager(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeXNATHandler)
+        self.server.body = os.urandom(10000)
+        self.server.ignore_range = False
+        self.server.n_corrupted = 0
+        self.server.requests = list()
+        self.server.sent = list()
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        self.host = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.download_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.download_dir)
+
+    def _manager(self):
+        return XNATDownloadManager(self.host, self.download_dir, n_workers=2,
+                                   n_retries=3, chunk_size=1024)
+
+    def _fname(self):
+        return op.join(self.download_dir, PROJECT, 'RES', 'sub', 'data.bin')
+
+    def _read(self):
+        with open(self._fname(), 'rb') as fid:
+            return fid.read()
+
+    def test_list_files(self):
+        files = self._manager().list_files(PROJECT)
+        self.assertEqual(files, [dict(
+            uri=FILE_URI, path=op.join(PROJECT, 'RES', 'sub', 'data.bin'),
+            size=10000, digest=hashlib.md5(self.server.body).hexdigest())])
+
+    def test_resume_part_file(self):
+        manager = self._manager()
+        fdesc = manager.list_files(PROJECT)[0]
+        os.makedirs(op.dirname(self._fname()))
+        with open(self._fname() + '.part', 'wb') as fid:
+            fid.write(self.server.body[:4000])
+        self.assertEqual(manager.download_file(fdesc), 'downloaded')
+        # Only the rest of the file was requested and sent:
+        self.assertEqual(self.server.requests, ['bytes=4000-'])
+        self.assertEqual(self.server.sent, [6000])
+        self.assertEqual(self._read(), self.server.body)
+        self.assertFalse(op.exists(self._fname() + '.part'))
+
+    def test_server_ignores_range(self):
+        self.server.ignore_range = True
+        manager = self._manager()
+        fdesc = manager.list_files(PROJECT)[0]
+        os.makedirs(op.dirname(self._fname()))
+        with open(self._fname() + '.part', 'wb') as fid:
+            fid.write(self.server.body[:4000])
+        # The whole file is sent with a 200 and must replace the part file:
+        self.assertEqual(manager.download_file(fdesc), 'downloaded')
+        self.assertEqual(self.server.requests, ['bytes=4000-'])
+        self.assertEqual(self.server.sent, [10000])
+        self.assertEqual(self._read(), self.server.body)
+
+    def test_checksum_mismatch(self):
+        self.server.n_corrupted = 1
+        manager = self._manager()
+        summary = manager.download(manager.list_files(PROJECT))
+        self.assertEqual(summary['downloaded'], [op.join(PROJECT, 'RES', 'sub',
+                                                         'data.bin')])
+        # The corrupted file is downloaded again from scratch:
+        self.assertEqual(self.server.requests, [None, None])
+        self.assertEqual(self._read(), self.server.body)
+
+    def test_manifest_skip(self):
+        manager = self._manager()
+        manager.download(manager.list_files(PROJECT))
+        self.assertTrue(op.isfile(op.join(self.download_dir, MANIFEST_FNAME)))
+        # A new manager reads the manifest and doesn't fetch the file again:
+        manager = self._manager()
+        summary = manager.download(manager.list_files(PROJECT))
+        self.assertEqual(summary['skipped'], [op.join(PROJECT, 'RES', 'sub',
+                                                      'data.bin')])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_manifest_log(self):
+        manager = self._manager()
+        fdesc = manager.list_files(PROJECT)[0]
+        manager.download_file(fdesc)
+        # Interrupted before the manifest is written, with a truncated line:
+        log_fname = op.join(self.download_dir, MANIFEST_LOG_FNAME)
+        with open(log_fname, 'a') as fid:
+            fid.write('{"path": "other')
+        self.assertFalse(op.exists(op.join(self.download_dir, MANIFEST_FNAME)))
+        # The next run reads the log and merges it into the manifest:
+        manager = self._manager()
+        self.assertEqual(list(manager.manifest), [fdesc['path']])
+        summary = manager.download([fdesc])
+        self.assertEqual(summary['skipped'], [fdesc['path']])
+        self.assertFalse(op.exists(log_fname))
+        with open(op.join(self.download_dir, MANIFEST_FNAME)) as fid:
+            self.assertEqual(json.load(fid), manager.manifest)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_digest_changed(self):
+        manager = self._manager()
+        manager.download(manager.list_files(PROJECT))
+        # The file is updated on the server, with the same size:
+        self.server.body = os.urandom(10000)
+        manager = self._manager()
+        fdesc = manager.list_files(PROJECT)[0]
+        self.assertFalse(manager.is_up_to_date(fdesc))
+        self.assertEqual(manager.download_file(fdesc), 'downloaded')
+        self.assertEqual(self.server.requests, [None, None])
+        self.assertEqual(self._read(), self.server.body)
+        self.assertEqual(manager.manifest[fdesc['path']]['digest'],
+                         hashlib.md5(self.server.body).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()